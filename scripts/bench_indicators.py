@@ -0,0 +1,90 @@
+"""
+技术指标内核基准测试。
+
+对比 src.strategy_engine.indicators (numpy 数组内核) 与 pandas_ta 计算 CompositeStrategy 所用的
+MACD(12,26,9) / RSI(14) / 布林带(20,2) 的耗时:
+1. 单只股票 (--bars 根K线): 两者都逐只计算
+2. 全市场 (--symbols 只股票): pandas_ta 只能逐只构造 DataFrame 计算，内核对 (T, N) 面板一次计算
+并核对两者结果的最大差异。未安装 pandas_ta 时只报告内核的耗时。
+
+用法:
+    python scripts/bench_indicators.py [--bars 320] [--symbols 1 5000] [--rounds 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.strategy_engine import indicators
+
+try:
+    import pandas_ta  # noqa: F401  (注册 DataFrame.ta)
+except ImportError:
+    pandas_ta = None
+
+
+def timeit(fn, rounds: int):
+    samples = []
+    result = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), result
+
+
+def native(close: np.ndarray):
+    line, signal, _ = indicators.macd(close, 12, 26, 9)
+    _, _, upper = indicators.bbands(close, 20, 2.0)
+    return line, signal, indicators.rsi(close, 14), upper
+
+
+def with_pandas_ta(close: np.ndarray):
+    columns = []
+    for j in range(close.shape[1]):
+        df = pd.DataFrame({'close': close[:, j]})
+        macd = df.ta.macd(fast=12, slow=26, signal=9)
+        bb = df.ta.bbands(length=20, std=2)
+        columns.append((macd.iloc[:, 0].to_numpy(), macd.iloc[:, 2].to_numpy(),
+                        df.ta.rsi(length=14).to_numpy(), bb.filter(like='BBU_').iloc[:, 0].to_numpy()))
+    return tuple(np.column_stack(arrays) for arrays in zip(*columns))
+
+
+def run(bars: int, symbols: int, rounds: int):
+    rng = np.random.default_rng(0)
+    close = 20 + np.cumsum(rng.normal(0, 0.3, (bars, symbols)), axis=0)
+
+    native_t, native_out = timeit(lambda: native(close), rounds)
+    print(f"[{symbols} 只 x {bars} 根] indicators: {native_t * 1000:.1f}ms")
+    if pandas_ta is None:
+        return
+    ta_t, ta_out = timeit(lambda: with_pandas_ta(close), max(1, rounds // 5) if symbols > 100 else rounds)
+    diff = max(float(np.nanmax(np.abs(a - b))) for a, b in zip(native_out, ta_out))
+    print(f"[{symbols} 只 x {bars} 根] pandas_ta : {ta_t * 1000:.1f}ms, "
+          f"加速 {ta_t / native_t:.1f}x, 最大差异 {diff:.2e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="技术指标内核基准测试")
+    parser.add_argument('--bars', type=int, default=320)
+    parser.add_argument('--symbols', type=int, nargs='+', default=[1, 5000])
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    if pandas_ta is None:
+        print("未安装 pandas_ta，只测试 indicators 内核 (pip install pandas-ta 后可对比)。")
+    print(f"--- 指标内核基准 ({args.rounds} 轮取中位数) ---")
+    for n in args.symbols:
+        run(args.bars, n, args.rounds)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""
+日K线批量写入基准测试。
+
+对比
+1. 旧方案: pg_insert(StockDailyKline).values(list_of_dicts) + ON CONFLICT，一条巨大的 INSERT
+2. 新方案: crud.copy_load_daily_kline (COPY -> 临时表 -> INSERT ... SELECT ... ON CONFLICT，自动分块)
+在 10k / 100k / 1M 行下的首次写入与全量冲突 Upsert 耗时。
+
+测试数据使用 'bench' 开头的股票代码，运行前后都会清理，不影响已有数据。
+旧方案在大数据量下会生成数百 MB 的 SQL，默认只在 <= 100k 行时运行 (见 --legacy-max-rows)。
+
+用法:
+    python scripts/bench_kline_loader.py [--dsn postgresql://...] [--rows 10000 100000 1000000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config import config
+from src.data_storage import crud, models
+from src.data_storage.database import Base
+
+BENCH_PREFIX = 'bench'
+BARS_PER_CODE = 1000
+
+
+def build_rows(n: int) -> pd.DataFrame:
+    """生成 n 行K线: 每只股票 1000 个交易日"""
+    n_codes = -(-n // BARS_PER_CODE)
+    days = pd.bdate_range('2000-01-03', periods=BARS_PER_CODE)
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'time': np.tile(days.values, n_codes)[:n],
+        'code': np.repeat([f"{BENCH_PREFIX}{i:06d}" for i in range(n_codes)], BARS_PER_CODE)[:n],
+    })
+    close = rng.uniform(5, 100, n)
+    df['open'] = close * 0.99
+    df['high'] = close * 1.02
+    df['low'] = close * 0.98
+    df['close'] = close
+    df['volume'] = rng.integers(1_000, 10_000_000, n).astype(float)
+    df['turnover'] = df['volume'] * close
+    return df
+
+
+def legacy_load(db, records, upsert: bool):
+    """旧版 bulk_save_daily_kline / bulk_upsert_daily_kline 的写入方式"""
+    stmt = pg_insert(models.StockDailyKline).values(records)
+    if upsert:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['time', 'code'],
+            set_={c: stmt.excluded[c] for c in crud.KLINE_UPDATE_COLUMNS},
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=['time', 'code'])
+    db.execute(stmt)
+    db.commit()
+
+
+def cleanup(db):
+    db.execute(text(f"DELETE FROM stock_daily_kline WHERE code LIKE '{BENCH_PREFIX}%'"))
+    db.commit()
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="日K线批量写入基准测试")
+    parser.add_argument('--dsn', default=config.DATABASE_URI, help="数据库连接串，默认使用项目配置")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--legacy-max-rows', type=int, default=100_000, help="旧方案只在不超过该行数时运行")
+    args = parser.parse_args()
+
+    engine = create_engine(args.dsn)
+    Base.metadata.create_all(bind=engine, tables=[models.StockDailyKline.__table__])
+    Session = sessionmaker(bind=engine)
+
+    print(f"--- 日K线批量写入基准 ({engine.url.render_as_string(hide_password=True)}) ---")
+    print(f"{'行数':>10} | {'方案':<8} | {'首次写入':>10} | {'冲突Upsert':>10}")
+    with Session() as db:
+        cleanup(db)
+        try:
+            for n in args.rows:
+                df = build_rows(n)
+
+                if n <= args.legacy_max_rows:
+                    records = df.to_dict(orient='records')
+                    try:
+                        insert_s = timed(lambda: legacy_load(db, records, upsert=False))
+                        upsert_s = timed(lambda: legacy_load(db, records, upsert=True))
+                        print(f"{n:>10} | {'INSERT':<8} | {insert_s:>9.2f}s | {upsert_s:>9.2f}s")
+                    except Exception as e:
+                        # psycopg3 服务端绑定参数上限为 65535 (约 8k 行 x 8 列)
+                        db.rollback()
+                        print(f"{n:>10} | {'INSERT':<8} | 失败: {str(e).splitlines()[0][:60]}")
+                    cleanup(db)
+                else:
+                    print(f"{n:>10} | {'INSERT':<8} | {'跳过':>10} | {'跳过':>10}")
+
+                insert_s = timed(lambda: crud.copy_load_daily_kline(db, df, upsert=False))
+                upsert_s = timed(lambda: crud.copy_load_daily_kline(db, df, upsert=True))
+                print(f"{n:>10} | {'COPY':<8} | {insert_s:>9.2f}s | {upsert_s:>9.2f}s")
+                cleanup(db)
+        finally:
+            cleanup(db)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
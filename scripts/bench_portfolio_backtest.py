@@ -0,0 +1,74 @@
+"""
+组合回测基准测试。
+
+用随机游走生成 --symbols 只股票 x --years 年的日K线面板 (不读数据库)，
+分别统计 strategy_signals (策略信号) 和 backtest_panel (逐日撮合) 的耗时。
+--per-stock 时额外用逐只 apply 的方式计算前 200 只的信号，折算全市场耗时作对比。
+
+用法:
+    python scripts/bench_portfolio_backtest.py [--symbols 5000] [--years 5] [--strategy composite|dma] [--per-stock]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.data_storage.kline_panel import KlinePanel
+from src.strategy_engine.composite_strategy import CompositeStrategy
+from src.strategy_engine.dma_strategy import DmaStrategy
+from src.strategy_engine.portfolio_backtest import PortfolioConfig, backtest_panel, strategy_signals
+
+
+def build_panel(symbols: int, days: int) -> KlinePanel:
+    rng = np.random.default_rng(0)
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, (days, symbols)), axis=0))
+    opens = close * np.exp(rng.normal(0, 0.005, (days, symbols)))
+    codes = [f"{'sh6' if i % 2 else 'sz0'}{i:05d}" for i in range(symbols)]
+    fields = {'open': opens, 'high': np.maximum(opens, close), 'low': np.minimum(opens, close), 'close': close,
+              'volume': np.full((days, symbols), 1e6), 'turnover': np.full((days, symbols), 1e7)}
+    return KlinePanel(codes=codes, index=pd.bdate_range('2020-01-02', periods=days), fields=fields)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="组合回测基准测试")
+    parser.add_argument('--symbols', type=int, default=5000)
+    parser.add_argument('--years', type=float, default=5)
+    parser.add_argument('--strategy', choices=['composite', 'dma'], default='composite')
+    parser.add_argument('--per-stock', action='store_true')
+    args = parser.parse_args()
+
+    days = int(args.years * 252)
+    panel = build_panel(args.symbols, days)
+    strategy = CompositeStrategy() if args.strategy == 'composite' else DmaStrategy()
+    print(f"--- 组合回测基准: {args.symbols} 只 x {days} 个交易日, {strategy.name} ---")
+
+    start = time.perf_counter()
+    signal, rank = strategy_signals(strategy, panel)
+    signal_t = time.perf_counter() - start
+    start = time.perf_counter()
+    result = backtest_panel(panel, signal, rank, PortfolioConfig(max_positions=20, max_weight=0.05))
+    replay_t = time.perf_counter() - start
+
+    print(f"strategy_signals: {signal_t:.2f}s")
+    print(f"backtest_panel  : {replay_t:.2f}s ({result.stats['trade_count']} 笔成交, "
+          f"收益 {result.stats['return_pct']:.1f}%, 最大回撤 {result.stats['max_drawdown']:.1f}%)")
+
+    if args.per_stock:
+        sample = min(200, args.symbols)
+        frames = panel.select(panel.codes[:sample]).to_frames()
+        start = time.perf_counter()
+        for frame in frames.values():
+            strategy.apply(frame)
+        per_stock_t = (time.perf_counter() - start) / sample * args.symbols
+        print(f"逐只 apply (按 {sample} 只折算): {per_stock_t:.2f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""
+行情报文解析基准测试。
+
+构造 5000 只股票的腾讯 / 新浪批量行情报文，分别用
+1. 旧方案: 逐行 split + 每只股票一个 dict + 逐字段 float()，最后 pd.DataFrame(list_of_dicts)
+2. 新方案: quote_parser 列式解析 (一次正则扫描 + NumPy 整体转换)
+解析为 DataFrame，对比耗时。
+
+用法:
+    python scripts/bench_quote_parser.py [--codes 5000] [--rounds 20]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import pandas as pd
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.data_acquisition import quote_parser
+from src.data_acquisition.quote_source import SNAPSHOT_COLUMNS
+
+
+def build_codes(n: int):
+    half = n // 2
+    return [f"sh{600000 + i}" for i in range(half)] + [f"sz{i + 1:06d}" for i in range(n - half)]
+
+
+def build_tencent_body(codes) -> bytes:
+    lines = []
+    for i, code in enumerate(codes):
+        fields = [str(i % 100 / 10 + 1)] * 50
+        fields[0] = '1'
+        fields[1] = f"股票{code[-4:]}"
+        fields[2] = code[2:]
+        fields[30] = '20251017150000'
+        lines.append(f'v_{code}="{"~".join(fields)}";')
+    return '\n'.join(lines).encode('gbk')
+
+
+def build_sina_body(codes) -> bytes:
+    lines = []
+    for i, code in enumerate(codes):
+        fields = [str(i % 100 / 10 + 1)] * 32
+        fields[0] = f"股票{code[-4:]}"
+        fields[30] = '2025-10-17'
+        fields[31] = '15:00:00'
+        lines.append(f'var hq_str_{code}="{",".join(fields)}";')
+    return '\n'.join(lines).encode('gbk')
+
+
+def legacy_parse_tencent(body: bytes) -> pd.DataFrame:
+    """旧版 fetch_chunk 的解析逻辑"""
+    results = []
+    for line in body.decode('gbk', errors='ignore').split(';'):
+        if '="' not in line:
+            continue
+        try:
+            data = line.split('="')[1].strip('"').split('~')
+            if len(data) < 40:
+                continue
+            results.append({
+                'code': data[2],
+                'name': data[1],
+                'price': float(data[3]),
+                'pct_change': float(data[32]),
+                'volume': float(data[36]) * 100,
+                'turnover_rate': float(data[38]) if data[38] else 0.0,
+                'volume_ratio': float(data[49]) if len(data) > 49 and data[49] else 0.0,
+            })
+        except (ValueError, IndexError):
+            continue
+    return pd.DataFrame(results)
+
+
+def legacy_parse_sina(body: bytes) -> pd.DataFrame:
+    """旧版 RealtimeDataFetcher._fetch_batch_sina 的解析逻辑"""
+    results = []
+    for line in body.decode('gbk', errors='ignore').strip().split('\n'):
+        if not line or '=""' in line:
+            continue
+        try:
+            eq_idx = line.find('=')
+            code_with_prefix = line[11:eq_idx]
+            data_str = line[eq_idx + 2:-2]
+            data = data_str.split(',')
+            if len(data) < 30:
+                continue
+            code = code_with_prefix[2:] + ('.SH' if code_with_prefix.startswith('sh') else '.SZ')
+            item = {
+                'code': code,
+                'name': data[0],
+                'price': float(data[3]),
+                'open': float(data[1]),
+                'pre_close': float(data[2]),
+                'high': float(data[4]),
+                'low': float(data[5]),
+                'volume': float(data[8]),
+                'turnover': float(data[9]),
+                'time': f"{data[30]} {data[31]}",
+            }
+            for level in range(5):
+                item[f'bid{level + 1}_vol'] = float(data[10 + level * 2])
+                item[f'bid{level + 1}'] = float(data[11 + level * 2])
+                item[f'ask{level + 1}_vol'] = float(data[20 + level * 2])
+                item[f'ask{level + 1}'] = float(data[21 + level * 2])
+            pre_close = item['pre_close']
+            item['change_pct'] = round((item['price'] - pre_close) / pre_close * 100, 2) if pre_close > 0 else 0.0
+            results.append(item)
+        except Exception:
+            continue
+    return pd.DataFrame(results)
+
+
+def timeit(fn, rounds: int):
+    samples = []
+    result = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return samples, result
+
+
+def report(label: str, legacy, columnar):
+    legacy_samples, legacy_df = legacy
+    new_samples, new_df = columnar
+    legacy_median = statistics.median(legacy_samples)
+    new_median = statistics.median(new_samples)
+    print(f"[{label}] 旧方案 dict/行 : 中位数 {legacy_median * 1000:.1f}ms, 行数 {len(legacy_df)}")
+    print(f"[{label}] 新方案 列式    : 中位数 {new_median * 1000:.1f}ms, 行数 {len(new_df)}, "
+          f"加速 {legacy_median / new_median:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="行情报文解析基准测试")
+    parser.add_argument('--codes', type=int, default=5000)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    codes = build_codes(args.codes)
+    tencent_body = build_tencent_body(codes)
+    sina_body = build_sina_body(codes)
+
+    print(f"--- 报文解析基准 ({args.codes} 只股票, {args.rounds} 轮) ---")
+    report('腾讯',
+           timeit(lambda: legacy_parse_tencent(tencent_body), args.rounds),
+           timeit(lambda: quote_parser.parse_tencent(tencent_body, SNAPSHOT_COLUMNS).to_frame(SNAPSHOT_COLUMNS),
+                  args.rounds))
+    report('新浪',
+           timeit(lambda: legacy_parse_sina(sina_body), args.rounds),
+           timeit(lambda: quote_parser.parse_sina(sina_body).to_frame(), args.rounds))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Redis 行情存储布局基准测试。
+
+在配置的 Redis 中 (使用独立的键前缀，结束后清理) 写入 N 只股票的行情，分别用
+1. 旧布局: 每只股票一个 quote:<code> 键 (SETEX)，读全市场 KEYS quote:* + MGET
+2. 新布局: QuoteStore 哈希 (HSET)，读全市场 pipeline HGETALL
+3. 紧凑快照: 全市场 Arrow IPC 二进制块，读全市场一次 GET
+对比写入和读取 (到 DataFrame) 的耗时。旧布局的 KEYS 扫描的是整个库，库里的其它键也会拖慢它，
+这里额外写入 --noise 个无关键模拟真实库。
+
+用法:
+    python scripts/bench_quote_store.py [--codes 5000 50000] [--shards 1] [--rounds 5] [--noise 20000]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import pandas as pd
+import redis
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config import config
+from src.data_storage.quote_store import QuoteStore, encode_documents, encode_snapshot
+
+PREFIX = 'bench'
+
+
+def build_records(n: int):
+    return [{
+        'code': f"{i:06d}.{'SH' if i % 2 else 'SZ'}", 'name': f"股票{i}", 'time': '2025-10-17 15:00:00',
+        'price': 10.0 + i % 100 / 10, 'open': 10.0, 'high': 11.0, 'low': 9.0, 'volume': 123456.0,
+        'turnover': 1234567.0, 'change_pct': 1.23,
+    } for i in range(n)]
+
+
+def legacy_write(client, records):
+    pipe = client.pipeline()
+    for record in records:
+        pipe.setex(f"{PREFIX}:quote:{record['code']}", 60, json.dumps(record))
+    pipe.execute()
+
+
+def legacy_read(client):
+    keys = client.keys(f"{PREFIX}:quote:*")
+    return [json.loads(v) for v in client.mget(keys) if v] if keys else []
+
+
+def legacy_encode(df):
+    """旧版 _push_to_redis 的逐行编码"""
+    return [json.dumps(row.to_dict()) for _, row in df.iterrows()]
+
+
+def timeit(fn, rounds: int):
+    samples = []
+    result = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), result
+
+
+def write_noise(client, n: int):
+    pipe = client.pipeline()
+    for i in range(n):
+        pipe.setex(f"{PREFIX}:noise:{i}", 600, '1')
+    pipe.execute()
+
+
+def cleanup(client):
+    for key in client.scan_iter(f"{PREFIX}:*", count=5000):
+        client.delete(key)
+
+
+def run(client, n: int, shards: int, rounds: int):
+    records = build_records(n)
+    frame = pd.DataFrame(records)
+    store = QuoteStore(client, key_prefix=f"{PREFIX}:quotes", shards=shards, ttl=60, snapshot_format='none')
+    arrow_store = QuoteStore(client, key_prefix=f"{PREFIX}:arrow", shards=shards, ttl=60, snapshot_format='arrow')
+
+    legacy_w, _ = timeit(lambda: legacy_write(client, records), rounds)
+    legacy_r, legacy_rows = timeit(lambda: pd.DataFrame(legacy_read(client)), rounds)
+    hash_w, _ = timeit(lambda: store.replace_all(frame), rounds)
+    hash_r, hash_rows = timeit(store.get_all, rounds)
+    arrow_w, _ = timeit(lambda: arrow_store.replace_all(frame), rounds)
+    arrow_r, arrow_rows = timeit(arrow_store.get_snapshot, rounds)
+    blob_size = len(encode_snapshot(frame))
+    legacy_enc, _ = timeit(lambda: legacy_encode(frame), rounds)
+    new_enc, _ = timeit(lambda: encode_documents(frame), rounds)
+
+    print(f"[{n} 只] 编码 iterrows+json.dumps: {legacy_enc * 1000:.1f}ms")
+    print(f"[{n} 只] 编码 按列 to_json       : {new_enc * 1000:.1f}ms, 加速 {legacy_enc / new_enc:.1f}x")
+
+    print(f"[{n} 只] 旧布局 SETEX    : 写入 {legacy_w * 1000:.1f}ms")
+    print(f"[{n} 只] 新布局 HSET     : 写入 {hash_w * 1000:.1f}ms, 加速 {legacy_w / hash_w:.1f}x")
+    print(f"[{n} 只] HSET + Arrow快照: 写入 {arrow_w * 1000:.1f}ms, 快照 {blob_size / 1024:.0f}KB")
+    print(f"[{n} 只] 旧布局 KEYS+MGET: 读取 {legacy_r * 1000:.1f}ms, 行数 {len(legacy_rows)}")
+    print(f"[{n} 只] 新布局 HGETALL  : 读取 {hash_r * 1000:.1f}ms, 行数 {len(hash_rows)}, "
+          f"加速 {legacy_r / hash_r:.1f}x")
+    print(f"[{n} 只] Arrow快照 GET   : 读取 {arrow_r * 1000:.1f}ms, 行数 {len(arrow_rows)}, "
+          f"加速 {legacy_r / arrow_r:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Redis 行情存储布局基准测试")
+    parser.add_argument('--codes', type=int, nargs='+', default=[5000, 50000])
+    parser.add_argument('--shards', type=int, default=1)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--noise', type=int, default=20000, help="库中无关键的数量")
+    args = parser.parse_args()
+
+    client = redis.Redis(host=config.REDIS_HOST, port=config.REDIS_PORT, db=config.REDIS_DB,
+                         decode_responses=True)
+    try:
+        client.ping()
+    except redis.exceptions.ConnectionError as e:
+        print(f"无法连接 Redis ({config.REDIS_HOST}:{config.REDIS_PORT}): {e}")
+        return 1
+
+    try:
+        print(f"--- 行情存储基准 (分片 {args.shards}, 无关键 {args.noise}, {args.rounds} 轮) ---")
+        for n in args.codes:
+            write_noise(client, args.noise)
+            run(client, n, args.shards, args.rounds)
+            cleanup(client)
+    finally:
+        cleanup(client)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -14,6 +14,8 @@ class Config:
     # --- 核心配置 ---
     # DEBUG 模式，开发环境下建议开启
     DEBUG = os.environ.get('DEBUG', 'False').lower() in ('true', '1', 't')
+    # 交易所所在时区，分钟级时间戳按该时区写入和读出
+    MARKET_TIMEZONE = os.environ.get('MARKET_TIMEZONE', 'Asia/Shanghai')
 
     # --- 数据库配置 (PostgreSQL) ---
     # 从环境变量获取数据库连接信息，提供默认值以备本地开发使用
@@ -35,10 +37,97 @@ class Config:
     REDIS_PORT = int(os.environ.get('REDIS_PORT', 16380))
     REDIS_DB = int(os.environ.get('REDIS_DB', 0))
 
+    # --- 实时行情流式发布配置 ---
+    # 流式模式下只发布发生变化的股票，增量同时写入 Redis Stream 并通过 Pub/Sub 广播
+    QUOTE_TTL = int(os.environ.get('QUOTE_TTL', 60))                                # 行情哈希的过期时间 (秒)
+    QUOTE_HASH_KEY = os.environ.get('QUOTE_HASH_KEY', 'quotes:latest')              # 行情哈希键前缀 (<前缀>:<分片号>)
+    QUOTE_HASH_SHARDS = int(os.environ.get('QUOTE_HASH_SHARDS', 1))                 # 行情哈希分片数 (5 万只以上可调大)
+    QUOTE_SNAPSHOT_FORMAT = os.environ.get('QUOTE_SNAPSHOT_FORMAT', 'arrow')         # 全市场紧凑快照格式: arrow / none
+    QUOTE_SNAPSHOT_INTERVAL = float(os.environ.get('QUOTE_SNAPSHOT_INTERVAL', 15))  # 流式模式下重写全市场快照的最短间隔 (秒)
+    QUOTE_PUSH_CHUNK = int(os.environ.get('QUOTE_PUSH_CHUNK', 1000))                  # 单条 HSET 写入的股票数上限
+    QUOTE_STREAM_KEY = os.environ.get('QUOTE_STREAM_KEY', 'stream:quotes')          # 增量 Redis Stream
+    QUOTE_STREAM_MAXLEN = int(os.environ.get('QUOTE_STREAM_MAXLEN', 10000))         # Stream 保留的最大 tick 数 (近似裁剪)
+    QUOTE_CHANNEL = os.environ.get('QUOTE_CHANNEL', 'channel:quotes')               # 增量 Pub/Sub 频道
+    QUOTE_KEYFRAME_INTERVAL = int(os.environ.get('QUOTE_KEYFRAME_INTERVAL', 30))    # 未变化键的 TTL 续期间隔 (秒)
+
     # --- 数据源 API 配置 ---
     # 将来需要用到的API Key等，可以从环境变量获取
     # TUSHARE_API_KEY = os.environ.get('TUSHARE_API_KEY', 'your_tushare_api_key_here')
 
+    # --- HTTP 客户端配置 (腾讯/新浪/东方财富共享的连接池) ---
+    HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', 32))          # 每个 Host 的最大 keep-alive 连接数
+    HTTP_TIMEOUT = float(os.environ.get('HTTP_TIMEOUT', 5))                   # 默认超时 (秒)
+    HTTP_MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', 2))             # 连接错误 / 429 / 5xx 的重试次数
+    HTTP_BACKOFF_FACTOR = float(os.environ.get('HTTP_BACKOFF_FACTOR', 0.2))   # 重试指数退避系数 (秒)
+
+    # --- 多数据源实时行情配置 (故障转移 + 对冲请求) ---
+    QUOTE_SOURCE_VENDORS = os.environ.get('QUOTE_SOURCE_VENDORS', 'tencent,sina')   # 数据源及默认优先级
+    QUOTE_SOURCE_BATCH_SIZE = int(os.environ.get('QUOTE_SOURCE_BATCH_SIZE', 80))     # 每个请求的股票数量
+    QUOTE_SOURCE_MAX_WORKERS = int(os.environ.get('QUOTE_SOURCE_MAX_WORKERS', 16))   # 单个数据源的在途请求数上限
+    QUOTE_SOURCE_TIMEOUT = float(os.environ.get('QUOTE_SOURCE_TIMEOUT', 3))          # 单个请求的超时 (秒)
+    QUOTE_SOURCE_HEDGE = os.environ.get('QUOTE_SOURCE_HEDGE', 'True').lower() in ('true', '1', 't')  # 超过 p95 时对冲请求
+    QUOTE_HEDGE_MIN_SAMPLES = int(os.environ.get('QUOTE_HEDGE_MIN_SAMPLES', 20))     # 耗时样本少于该数时不对冲
+    QUOTE_VENDOR_FAILURE_THRESHOLD = int(os.environ.get('QUOTE_VENDOR_FAILURE_THRESHOLD', 3))  # 连续失败次数达到后熔断
+    QUOTE_VENDOR_COOLDOWN = float(os.environ.get('QUOTE_VENDOR_COOLDOWN', 30))       # 熔断持续时间 (秒)
+    # 批次大小与在途请求数按数据源自适应调节 (AIMD)，QUOTE_SOURCE_BATCH_SIZE 为初始批次
+    QUOTE_BATCH_MIN = int(os.environ.get('QUOTE_BATCH_MIN', 20))                     # 批次下限
+    QUOTE_BATCH_MAX = int(os.environ.get('QUOTE_BATCH_MAX', 200))                    # 批次上限 (URL 长度)
+    QUOTE_INITIAL_CONCURRENCY = int(os.environ.get('QUOTE_INITIAL_CONCURRENCY', 4))  # 初始在途请求数
+    QUOTE_TARGET_LATENCY_MS = float(os.environ.get('QUOTE_TARGET_LATENCY_MS', 800))  # 单个请求的目标耗时 (毫秒)
+    QUOTE_TUNING_PATH = os.environ.get('QUOTE_TUNING_PATH', 'data/quote_tuning.json')  # 学到的流控参数
+
+    # --- 全市场日K线同步流水线配置 ---
+    SYNC_FETCH_WORKERS = int(os.environ.get('SYNC_FETCH_WORKERS', 16))            # 抓取阶段的并发线程数
+    SYNC_WRITE_BATCH_ROWS = int(os.environ.get('SYNC_WRITE_BATCH_ROWS', 5000))    # 写入阶段每批的K线行数
+    SYNC_CHECKPOINT_PATH = os.environ.get('SYNC_CHECKPOINT_PATH', 'data/sync_checkpoint.json')  # 断点续传文件
+    SYNC_PROGRESS_INTERVAL = float(os.environ.get('SYNC_PROGRESS_INTERVAL', 10))  # 进度日志间隔 (秒)
+
+    # --- 日K线批量写入配置 ---
+    KLINE_COPY_THRESHOLD = int(os.environ.get('KLINE_COPY_THRESHOLD', 1000))      # 达到该行数时改用 COPY 写入
+    KLINE_COPY_CHUNK_ROWS = int(os.environ.get('KLINE_COPY_CHUNK_ROWS', 200000))  # COPY 每个分块 (事务) 的行数
+
+    # --- 本地日K线缓存配置 ---
+    KLINE_CACHE_ENABLED = os.environ.get('KLINE_CACHE_ENABLED', 'True').lower() in ('true', '1', 't')
+    KLINE_CACHE_DIR = os.environ.get('KLINE_CACHE_DIR', 'data/kline_cache')   # 每只股票一个 Parquet 文件
+    KLINE_CACHE_TTL = float(os.environ.get('KLINE_CACHE_TTL', 60))            # 交易时段内缓存的有效期 (秒)
+
+    # --- 交易日历与采集节奏 ---
+    TRADING_HOLIDAYS_PATH = os.environ.get('TRADING_HOLIDAYS_PATH', 'data/trading_holidays.txt')  # 休市日文件
+    SESSION_WAKE_LEAD = float(os.environ.get('SESSION_WAKE_LEAD', 60))              # 开盘前提前唤醒采集的秒数
+    SESSION_CLOSE_GRACE = float(os.environ.get('SESSION_CLOSE_GRACE', 120))         # 收盘后继续采集的秒数 (补齐收盘行情)
+    SESSION_EDGE_MINUTES = float(os.environ.get('SESSION_EDGE_MINUTES', 5))         # 开盘 / 收盘前后加密轮询的窗口 (分钟)
+    SESSION_EDGE_INTERVAL = float(os.environ.get('SESSION_EDGE_INTERVAL', 1))       # 加密窗口内的轮询间隔上限 (秒)
+
+    # --- 分钟K线存储配置 ---
+    MINUTE_COMPRESS_AFTER_DAYS = int(os.environ.get('MINUTE_COMPRESS_AFTER_DAYS', 7))   # 超过该天数的分块自动压缩
+    MINUTE_REFRESH_TTL = float(os.environ.get('MINUTE_REFRESH_TTL', 30))                # 盘中同一只股票两次网络补齐的最短间隔 (秒)
+    MINUTE_COLLECT_INTERVAL = int(os.environ.get('MINUTE_COLLECT_INTERVAL', 60))        # 分钟采集器的轮询间隔 (秒)
+    MINUTE_COLLECT_WORKERS = int(os.environ.get('MINUTE_COLLECT_WORKERS', 8))           # 分钟采集器的并发请求数
+
+    # --- 实时行情聚合K线配置 (消费 QUOTE_STREAM_KEY) ---
+    BAR_PERIODS = os.environ.get('BAR_PERIODS', '1,5,15,60')                        # 聚合周期 (分钟)
+    BAR_RING_CAPACITY = int(os.environ.get('BAR_RING_CAPACITY', 240))               # 每只股票在内存中保留的 1 分钟K线数 (其他周期按时间跨度折算)
+    BAR_FLUSH_ROWS = int(os.environ.get('BAR_FLUSH_ROWS', 5000))                    # 待写入K线达到该数量时立即写库
+    BAR_FLUSH_INTERVAL = float(os.environ.get('BAR_FLUSH_INTERVAL', 10))            # 最长写库间隔 (秒)
+
+    # --- 日K线缺口扫描与修复 ---
+    GAP_SCAN_LOOKBACK_DAYS = int(os.environ.get('GAP_SCAN_LOOKBACK_DAYS', 120))     # 缺口扫描回看的交易日数
+    GAP_REPAIR_CHECKPOINT_PATH = os.environ.get('GAP_REPAIR_CHECKPOINT_PATH', 'data/gap_repair_checkpoint.json')  # 缺口修复的断点文件
+    SETTLE_RECENT_DAYS = int(os.environ.get('SETTLE_RECENT_DAYS', 5))               # 缺口修复后按收盘数据覆盖写入的最近交易日数 (修正盘中写入的未定型K线)
+
+    # --- 股票池 (代码格式转换与名称查询) ---
+    STOCK_UNIVERSE_PATH = os.environ.get('STOCK_UNIVERSE_PATH', 'data/stock_universe.npy')  # 股票池文件 (各进程内存映射共享)
+    STOCK_UNIVERSE_TTL = int(os.environ.get('STOCK_UNIVERSE_TTL', 86400))             # 股票池文件超过该秒数从数据库重建
+    STOCK_UNIVERSE_RETRY_INTERVAL = int(os.environ.get('STOCK_UNIVERSE_RETRY_INTERVAL', 300))  # 重建失败 (数据库不可用) 后再次尝试的间隔 (秒)
+
+    # --- 技术指标缓存 (策略与页面共享) ---
+    INDICATOR_CACHE_MAX_ENTRIES = int(os.environ.get('INDICATOR_CACHE_MAX_ENTRIES', 50000))  # 最多缓存的 (股票, 指标) 序列数
+    INDICATOR_CACHE_MAX_MB = float(os.environ.get('INDICATOR_CACHE_MAX_MB', 256))            # 缓存数组占用的内存上限 (MB)
+    COMPOSITE_STATE_CACHE_MAX_ENTRIES = int(os.environ.get('COMPOSITE_STATE_CACHE_MAX_ENTRIES', 6000))  # 最多缓存的股票增量评分状态数
+
+    # --- 日K线读取层配置 (数据库优先) ---
+    KLINE_REPOSITORY_FETCH_WORKERS = int(os.environ.get('KLINE_REPOSITORY_FETCH_WORKERS', 8))  # 数据库缺口补齐的并发请求数
+
     # --- 日志配置 ---
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
     LOG_FILE_PATH = os.environ.get('LOG_FILE_PATH', 'logs/app.log')
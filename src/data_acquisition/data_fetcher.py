@@ -1,14 +1,15 @@
 import pandas as pd
 import akshare as ak
 import baostock as bs
-import requests
 import json
 import time
 import os
 from datetime import datetime, timedelta
-import concurrent.futures
+from src.config import config
 from src.logger import logger
-from src.data_storage import database, crud
+from src.data_storage import database, crud, stock_universe
+from src.data_acquisition import http_clients, quote_source
+from src.data_acquisition.kline_cache import KlineCache
 
 def update_stock_list_to_db():
     """
@@ -90,6 +91,8 @@ def update_stock_list_to_db():
             
             crud.bulk_save_stocks(db, stocks_data)
             logger.info("数据库股票列表更新完成。")
+            # 股票列表变化后重建共享的股票池文件，其他进程下次访问时重新映射
+            stock_universe.rebuild()
         except Exception as e:
             logger.error(f"更新数据库失败: {e}")
         finally:
@@ -131,13 +134,9 @@ def fetch_stock_spot_realtime(stock_code: str) -> dict:
     直接调用腾讯接口。
     """
     try:
-        clean_code = stock_code.lower().replace('.sh', '').replace('.sz', '')
-        if not (clean_code.startswith('sh') or clean_code.startswith('sz')):
-            if stock_code.startswith('6'): clean_code = f"sh{clean_code}"
-            else: clean_code = f"sz{clean_code}"
-            
+        clean_code = stock_universe.to_tencent(stock_code)
         url = f"http://qt.gtimg.cn/q={clean_code}"
-        resp = requests.get(url, timeout=3)
+        resp = http_clients.tencent.get(url, timeout=3)
         if resp.status_code == 200:
             content = resp.content.decode('gbk', errors='ignore')
             if '="' in content:
@@ -178,7 +177,7 @@ def fetch_all_stock_spot_realtime() -> pd.DataFrame:
     获取全市场实时行情快照。
     流程: 
     1. 使用 fetch_all_stock_list (Database) 获取代码表。
-    2. 分批请求腾讯批量接口 (qt.gtimg.cn) 获取实时数据。
+    2. 通过多数据源 QuoteSource 分批并发请求 (腾讯优先，失败或超时的批次由新浪补上)。
     """
     # 1. 获取代码
     stock_list_df = fetch_all_stock_list()
@@ -189,181 +188,209 @@ def fetch_all_stock_spot_realtime() -> pd.DataFrame:
     all_codes = stock_list_df['code'].tolist()
     # 关键修复：腾讯接口不支持带点的代码 (sh.600000 -> sh600000)
     all_codes = [code.replace('.', '') for code in all_codes]
-    logger.info(f"准备扫描 {len(all_codes)} 只股票的实时行情 (腾讯接口)...")
-    
-    # 2. 分批请求腾讯接口
-    # 腾讯接口 url: http://qt.gtimg.cn/q=sh600519,sz000001,...
-    # 每批建议 80 个
-    batch_size = 80
-    chunks = [all_codes[i:i + batch_size] for i in range(0, len(all_codes), batch_size)]
+    logger.info(f"准备扫描 {len(all_codes)} 只股票的实时行情...")
     
-    realtime_data = []
+    # 2. 健康度排序、按批次故障转移与对冲请求均由 QuoteSource 负责
+    quotes = quote_source.default_source.fetch(all_codes)
+    if quotes.empty:
+        logger.error("实时行情扫描未返回任何有效数据。")
+        return pd.DataFrame()
+
+    # 与旧版输出保持一致: 关键字段无法解析的记录丢弃，换手率/量比缺失 (新浪源) 记为 0
+    realtime_df = quotes.rename(columns={'change_pct': 'pct_change'})[quote_source.SNAPSHOT_COLUMNS]
+    realtime_df = realtime_df.dropna(subset=['price', 'pct_change', 'volume'])
+    realtime_df[['turnover_rate', 'volume_ratio']] = realtime_df[['turnover_rate', 'volume_ratio']].fillna(0.0)
+    return realtime_df.reset_index(drop=True)
+
+def _to_tencent_code(stock_code: str) -> str:
+    """处理代码格式 (腾讯需要 sh600519 格式)，任意格式均可，见 stock_universe.parse_code"""
+    return stock_universe.to_tencent(stock_code)
+
+def fetch_daily_kline_payload(stock_code: str, count: int = 320, session=None):
+    """
+    请求腾讯日K接口，返回原始 JSON (不做解析)，供同步流水线的抓取阶段使用。
+
+    :param stock_code: 股票代码, 例如 "sh600519" 或 "000001.SZ"
+    :param count: 获取最近的K线条数
+    :param session: 可选的 VendorClient (或 requests.Session)，默认使用共享的腾讯客户端 (http_clients.tencent)
+    :return: 解析后的 JSON 字典，请求失败返回 None
+    """
+    clean_code = _to_tencent_code(stock_code)
+    logger.debug(f"正在从腾讯源为股票 {clean_code} 获取日K线数据...")
+
+    # 请求腾讯日K接口 (默认获取最近 320 天，也可设更大)
+    # param=code,day,,,count,qfq
+    url = f"http://web.ifzq.gtimg.cn/appstock/app/fqkline/get?param={clean_code},day,,,{count},qfq"
+    resp = (session or http_clients.tencent).get(url, timeout=5)
     
-    def fetch_chunk(chunk_codes):
-        try:
-            codes_str = ','.join(chunk_codes)
-            url = f"http://qt.gtimg.cn/q={codes_str}"
-            # 腾讯简易接口不需要复杂 Header
-            resp = requests.get(url, timeout=5)
-            if resp.status_code == 200:
-                # 解析返回文本 (GBK 编码)
-                content = resp.content.decode('gbk', errors='ignore')
-                # v_sh600519="1~贵州茅台~600519~1700.00~..."
-                lines = content.strip().split(';')
-                chunk_results = []
-                for line in lines:
-                    line = line.strip()
-                    if not line: continue
-                    if '="' in line:
-                        parts = line.split('="')
-                        if len(parts) < 2: continue
-                        
-                        data_str = parts[1].strip('"')
-                        fields = data_str.split('~')
-                        if len(fields) < 40: continue
-                        
-                        # 解析字段
-                        # 1: name, 2: code(无前缀), 3: price, 
-                        # 31: change, 32: pct, 36: vol(手), 38: turnover_rate(%)
-                        
-                        raw_code = fields[2]
-                        # 根据原始请求的前缀来补全，或者简单判断
-                        # 这里 fields[2] 是纯数字 600519
-                        if raw_code.startswith('6'): full_code = f"sh{raw_code}"
-                        else: full_code = f"sz{raw_code}"
-                        
-                        try:
-                            price = float(fields[3])
-                            pct = float(fields[32])
-                            vol = float(fields[36]) * 100 # 手 -> 股
-                            turnover_rate = float(fields[38]) if fields[38] else 0.0
-                            volume_ratio = float(fields[49]) if len(fields) > 49 and fields[49] else 0.0
-                            
-                            chunk_results.append({
-                                'code': full_code,
-                                'name': fields[1],
-                                'price': price,
-                                'pct_change': pct,
-                                'volume': vol,
-                                'turnover_rate': turnover_rate,
-                                'volume_ratio': volume_ratio
-                            })
-                        except:
-                            continue
-                return chunk_results
-        except Exception as e:
-            # logger.debug(f"Chunk fetch failed: {e}")
-            pass
-        return []
+    if resp.status_code != 200:
+        logger.warning(f"腾讯接口请求失败: {resp.status_code}")
+        return None
 
-    # 并发请求
-    with concurrent.futures.ThreadPoolExecutor(max_workers=20) as executor:
-        futures = [executor.submit(fetch_chunk, chunk) for chunk in chunks]
-        for future in concurrent.futures.as_completed(futures):
-            res = future.result()
-            if res:
-                realtime_data.extend(res)
-                
-    if not realtime_data:
-        logger.error("腾讯接口扫描未返回任何有效数据。")
+    return resp.json()
+
+def parse_daily_kline_payload(payload: dict, stock_code: str, start_date: str = "19900101",
+                              end_date: str = "20991231") -> pd.DataFrame:
+    """
+    将腾讯日K接口的原始 JSON 转换为 DataFrame，并按日期区间筛选。
+
+    :return: DataFrame ['time', 'code', 'open', 'high', 'low', 'close', 'volume', 'turnover']
+    """
+    clean_code = _to_tencent_code(stock_code)
+    if not payload or 'data' not in payload or clean_code not in payload['data']:
+        logger.warning(f"腾讯接口返回数据中未找到 {clean_code}")
         return pd.DataFrame()
         
-    return pd.DataFrame(realtime_data)
+    # 优先获取前复权数据 'qfqday'，如果没有则取 'day'
+    stock_data = payload['data'][clean_code]
+    kline_list = stock_data.get('qfqday', stock_data.get('day', []))
+    
+    if not kline_list:
+         logger.warning(f"未获取到 {clean_code} 的K线数据列表")
+         return pd.DataFrame()
+
+    # 腾讯数据格式: ['2023-01-03', '1727.000', '1730.010', '1738.000', '1708.000', '25342.000', ...]
+    # Index: 0:Date, 1:Open, 2:Close, 3:High, 4:Low, 5:Volume
+    records = []
+    for item in kline_list:
+        if len(item) < 6: continue
+        
+        records.append({
+            'time': item[0],
+            'open': float(item[1]),
+            'close': float(item[2]),
+            'high': float(item[3]),
+            'low': float(item[4]),
+            'volume': float(item[5]),
+            'turnover': 0.0 # 腾讯接口此处不直接提供成交额，设为0或后续计算
+        })
+        
+    df = pd.DataFrame(records)
+    df['time'] = pd.to_datetime(df['time'])
+    
+    # 增加 code 字段
+    df['code'] = stock_code
+    
+    # 按日期筛选 (虽然接口是取最近N条，但我们可以进一步过滤)
+    s_date = pd.to_datetime(start_date)
+    e_date = pd.to_datetime(end_date)
+    mask = (df['time'] >= s_date) & (df['time'] <= e_date)
+    df = df.loc[mask]
+    
+    # 估算 turnover (可选，为了兼容性)
+    # 简单的 close * volume * 100 (如果 volume 是手) 或者 close * volume (如果 volume 是股)
+    # 腾讯的 volume 通常是手？不，根据之前测试 781552.000 对于平安银行日量，应该是手。
+    # 但数据库模型期望 turnover 是金额。
+    # 暂时只保证字段存在。
+    
+    logger.debug(f"成功获取并处理了 {len(df)} 条股票 {stock_code} 的K线数据。")
+    
+    required_columns = ['time', 'code', 'open', 'high', 'low', 'close', 'volume', 'turnover']
+    return df[required_columns]
+
+def _fetch_daily_kline_remote(clean_code: str, count: int) -> pd.DataFrame:
+    """KlineCache 的远程拉取函数: 请求最近 count 根K线，不筛选日期；请求失败返回 None"""
+    payload = fetch_daily_kline_payload(clean_code, count=count)
+    if payload is None:
+        return None
+    return parse_daily_kline_payload(payload, clean_code)
+
+# 进程内共享的本地K线缓存 (磁盘文件在进程之间共享)
+kline_cache = KlineCache(fetch=_fetch_daily_kline_remote)
 
-def fetch_stock_daily_kline(stock_code: str, start_date: str = "19900101", end_date: str = "20991231") -> pd.DataFrame:
+def fetch_stock_daily_kline(stock_code: str, start_date: str = "19900101", end_date: str = "20991231",
+                            count: int = 320, use_cache: bool = True) -> pd.DataFrame:
     """
     使用腾讯接口获取单个股票的历史日K线数据 (前复权)。
+    默认经由本地K线缓存 (KlineCache) 读取，只向腾讯请求缓存之后缺失的K线。
     
     :param stock_code: 股票代码, 例如 "sh600519" 或 "000001.SZ"
     :param start_date: 开始日期, 格式 'YYYYMMDD' (腾讯接口主要按条数取，这里作为筛选条件)
     :param end_date: 结束日期, 格式 'YYYYMMDD'
+    :param count: 获取最近的K线条数，增量同步时只需取缺口部分
+    :param use_cache: 是否使用本地K线缓存 (同时受 config.KLINE_CACHE_ENABLED 控制)
     :return: DataFrame ['time', 'code', 'open', 'high', 'low', 'close', 'volume', 'turnover']
     """
     try:
-        # 1. 处理代码格式 (腾讯需要 sh600519 格式)
-        clean_code = stock_code.lower().replace('.sz', '').replace('.sh', '')
-        if not (clean_code.startswith('sh') or clean_code.startswith('sz')):
-            # 尝试推断
-            if stock_code.startswith('6'): clean_code = f"sh{clean_code}"
-            else: clean_code = f"sz{clean_code}"
-            
-        logger.debug(f"正在从腾讯源为股票 {clean_code} 获取日K线数据...")
+        if use_cache and config.KLINE_CACHE_ENABLED:
+            df = kline_cache.get(_to_tencent_code(stock_code), start_date, end_date, count=count)
+            if not df.empty:
+                df['code'] = stock_code
+            return df
 
-        # 2. 请求腾讯日K接口 (默认获取最近 320 天，也可设更大)
-        # param=code,day,,,count,qfq
-        count = 320 
-        url = f"http://web.ifzq.gtimg.cn/appstock/app/fqkline/get?param={clean_code},day,,,{count},qfq"
-        
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
-        
-        resp = requests.get(url, headers=headers, timeout=5)
-        
-        if resp.status_code != 200:
-            logger.warning(f"腾讯接口请求失败: {resp.status_code}")
+        payload = fetch_daily_kline_payload(stock_code, count=count)
+        if payload is None:
             return pd.DataFrame()
+        return parse_daily_kline_payload(payload, stock_code, start_date, end_date)
 
-        data = resp.json()
-        if 'data' not in data or clean_code not in data['data']:
-            logger.warning(f"腾讯接口返回数据中未找到 {clean_code}")
-            return pd.DataFrame()
-            
-        # 优先获取前复权数据 'qfqday'，如果没有则取 'day'
-        stock_data = data['data'][clean_code]
-        kline_list = stock_data.get('qfqday', stock_data.get('day', []))
-        
-        if not kline_list:
-             logger.warning(f"未获取到 {clean_code} 的K线数据列表")
-             return pd.DataFrame()
+    except Exception as e:
+        logger.error(f"为股票 {stock_code} 获取K线数据时发生错误: {e}")
+        return pd.DataFrame()
 
-        # 3. 转换为 DataFrame
-        # 腾讯数据格式: ['2023-01-03', '1727.000', '1730.010', '1738.000', '1708.000', '25342.000', ...]
-        # Index: 0:Date, 1:Open, 2:Close, 3:High, 4:Low, 5:Volume
-        records = []
-        for item in kline_list:
-            if len(item) < 6: continue
+def parse_minute_payload(payload: dict, clean_code: str) -> pd.DataFrame:
+    """
+    解析腾讯分时接口的报文。
+
+    :param payload: 接口返回的 JSON
+    :param clean_code: 腾讯格式的股票代码 (e.g., 'sh600519')
+    :return: DataFrame ['time', 'open', 'high', 'low', 'close', 'volume']
+    """
+    # 解析路径: data -> [code] -> data -> data
+    if clean_code not in payload['data']:
+        return pd.DataFrame()
+
+    day_data = payload['data'][clean_code]['data']
+    minute_data = day_data['data']
+
+    # 报文自带交易日 (例如 20251124)，缺失时按今天处理
+    trade_date = day_data.get('date')
+    if trade_date:
+        day_str = f"{trade_date[:4]}-{trade_date[4:6]}-{trade_date[6:8]}"
+    else:
+        day_str = datetime.now().strftime('%Y-%m-%d')
+
+    records = []
+    prev_vol = 0
+    
+    for item in minute_data:
+        # 兼容性处理: 腾讯接口返回的 item 可能是字符串 "0930 10.55 100 ..." 也可能是列表
+        if isinstance(item, str):
+            fields = item.split(' ')
+        else:
+            fields = item
             
-            records.append({
-                'time': item[0],
-                'open': float(item[1]),
-                'close': float(item[2]),
-                'high': float(item[3]),
-                'low': float(item[4]),
-                'volume': float(item[5]),
-                'turnover': 0.0 # 腾讯接口此处不直接提供成交额，设为0或后续计算
-            })
+        if len(fields) < 3:
+            continue
             
-        df = pd.DataFrame(records)
-        df['time'] = pd.to_datetime(df['time'])
+        time_str = fields[0] # HHMM
+        price = float(fields[1])
+        cum_vol = float(fields[2]) # 累计成交量 (手)
         
-        # 4. 增加 code 字段
-        df['code'] = stock_code
+        # 转换时间 "0930" -> "2025-11-24 09:30:00"
+        full_time_str = f"{day_str} {time_str[:2]}:{time_str[2:]}:00"
         
-        # 5. 按日期筛选 (虽然接口是取最近N条，但我们可以进一步过滤)
-        s_date = pd.to_datetime(start_date)
-        e_date = pd.to_datetime(end_date)
-        mask = (df['time'] >= s_date) & (df['time'] <= e_date)
-        df = df.loc[mask]
+        # 计算当前分钟成交量
+        vol = cum_vol - prev_vol
+        prev_vol = cum_vol
         
-        # 6. 估算 turnover (可选，为了兼容性)
-        # 简单的 close * volume * 100 (如果 volume 是手) 或者 close * volume (如果 volume 是股)
-        # 腾讯的 volume 通常是手？不，根据之前测试 781552.000 对于平安银行日量，应该是手。
-        # 但数据库模型期望 turnover 是金额。
-        # 暂时只保证字段存在。
+        records.append({
+            'time': full_time_str,
+            'open': price,
+            'high': price,
+            'low': price,
+            'close': price,
+            'volume': vol * 100 # 转换为股数
+        })
         
-        logger.debug(f"成功获取并处理了 {len(df)} 条股票 {stock_code} 的K线数据。")
-        
-        required_columns = ['time', 'code', 'open', 'high', 'low', 'close', 'volume', 'turnover']
-        return df[required_columns]
-
-    except Exception as e:
-        logger.error(f"为股票 {stock_code} 获取K线数据时发生错误: {e}")
-        return pd.DataFrame()
+    df = pd.DataFrame(records)
+    if not df.empty:
+        df['time'] = pd.to_datetime(df['time'])
+    return df
 
 def fetch_stock_minute_data(stock_code: str, period: str = '1') -> pd.DataFrame:
     """
-    获取股票的分时数据 (分钟级)，直接调用腾讯/新浪接口以确保实时性和真实性。
+    获取股票当日的分时数据 (分钟级)，直接调用腾讯接口以确保实时性和真实性。
+    历史分钟数据请使用 minute_store.history，它会优先读取分钟K线库，只在缺少当日最新数据时调用本函数。
     
     :param stock_code: 股票代码 (e.g., 'sh600519')
     :param period: 周期，目前仅支持 '1' (分时)
@@ -371,73 +398,21 @@ def fetch_stock_minute_data(stock_code: str, period: str = '1') -> pd.DataFrame:
     """
     try:
         # 1. 处理代码格式
-        clean_code = stock_code.lower().replace('.sh', '').replace('.sz', '')
-        if not (clean_code.startswith('sh') or clean_code.startswith('sz')):
-            if stock_code.startswith('6'): clean_code = f"sh{clean_code}"
-            else: clean_code = f"sz{clean_code}"
+        clean_code = _to_tencent_code(stock_code)
             
         logger.debug(f"正在从腾讯源获取 {clean_code} 的实时分时数据...")
         
         # 2. 请求腾讯分时接口 (非常稳定且包含今日实时数据)
         # 格式: ["HHMM price cum_volume avg_price", ...] 或者是列表形式，需兼容处理
         url = f"http://web.ifzq.gtimg.cn/appstock/app/minute/query?code={clean_code}"
-        
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
-        
-        resp = requests.get(url, headers=headers, timeout=3)
+        resp = http_clients.tencent.get(url, timeout=3)
         
         if resp.status_code != 200:
             logger.warning(f"腾讯接口请求失败: {resp.status_code}")
             return pd.DataFrame()
             
-        data = resp.json()
-        # 解析路径: data -> [code] -> data -> data
-        if clean_code not in data['data']:
-             return pd.DataFrame()
-             
-        minute_data = data['data'][clean_code]['data']['data']
-        
         # 3. 转换为 DataFrame
-        records = []
-        today_str = datetime.now().strftime('%Y-%m-%d')
-        prev_vol = 0
-        
-        for item in minute_data:
-            # 兼容性处理: 腾讯接口返回的 item 可能是字符串 "0930 10.55 100 ..." 也可能是列表
-            if isinstance(item, str):
-                fields = item.split(' ')
-            else:
-                fields = item
-                
-            if len(fields) < 3:
-                continue
-                
-            time_str = fields[0] # HHMM
-            price = float(fields[1])
-            cum_vol = float(fields[2]) # 累计成交量 (手)
-            
-            # 转换时间 "0930" -> "2025-11-24 09:30:00"
-            full_time_str = f"{today_str} {time_str[:2]}:{time_str[2:]}:00"
-            
-            # 计算当前分钟成交量
-            vol = cum_vol - prev_vol
-            prev_vol = cum_vol
-            
-            records.append({
-                'time': full_time_str,
-                'open': price,
-                'high': price,
-                'low': price,
-                'close': price,
-                'volume': vol * 100 # 转换为股数
-            })
-            
-        df = pd.DataFrame(records)
-        df['time'] = pd.to_datetime(df['time'])
-        
-        return df
+        return parse_minute_payload(resp.json(), clean_code)
 
     except Exception as e:
         logger.error(f"获取分时数据失败: {e}")
@@ -453,11 +428,7 @@ def fetch_stock_money_flow_realtime(stock_code: str) -> dict:
     """
     try:
         # 1. 转换代码格式为东财 secid
-        clean_code = stock_code.lower().replace('sh', '').replace('sz', '').replace('.', '')
-        if stock_code.startswith('sh') or stock_code.startswith('6'):
-            secid = f"1.{clean_code}"
-        else:
-            secid = f"0.{clean_code}"
+        secid = stock_universe.to_secid(stock_code)
             
         logger.debug(f"正在从东方财富 fflow 接口获取 {stock_code} ({secid}) 的实时资金流向...")
         
@@ -472,11 +443,7 @@ def fetch_stock_money_flow_realtime(stock_code: str) -> dict:
             "secid": secid
         }
         
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
-        
-        resp = requests.get(url, params=params, headers=headers, timeout=3)
+        resp = http_clients.eastmoney.get(url, params=params, timeout=3)
         
         if resp.status_code != 200:
             return {}
@@ -1,54 +1,47 @@
 import akshare as ak
 import pandas as pd
-import requests
+from src.data_acquisition import http_clients
+from src.data_storage import stock_universe
 import baostock as bs
 import json
 from src.logger import logger
 from datetime import datetime
 
 # --- 核心工具：代码格式转换工厂 ---
+# 统一由 stock_universe 解析，这里保留各数据源专用的名称
+
 def get_clean_code(stock_code):
-    """返回纯数字代码: 300434"""
+    """返回纯数字代码: 300434；无法识别的代码 (指数、手工输入的符号等) 返回空串"""
     if not stock_code: return ""
-    return stock_code.lower().replace('sh', '').replace('sz', '').replace('.', '')
+    try:
+        return stock_universe.to_digits(stock_code)
+    except ValueError as e:
+        logger.warning(f"无法识别的股票代码 {stock_code!r}，跳过深度数据请求: {e}")
+        return ""
 
 def get_market_type(clean_code):
     """判断市场类型: sh/sz/bj"""
-    if clean_code.startswith('6'): return 'sh'
-    if clean_code.startswith('0') or clean_code.startswith('3'): return 'sz'
-    if clean_code.startswith('8') or clean_code.startswith('4'): return 'bj'
-    return 'sz'
+    return stock_universe.infer_market(clean_code)
 
 def to_baostock_code(stock_code):
     """转为 Baostock 格式: sz.300434"""
-    clean = get_clean_code(stock_code)
-    mkt = get_market_type(clean)
-    return f"{mkt}.{clean}"
+    return stock_universe.to_baostock(stock_code)
 
 def to_tencent_code(stock_code):
     """转为 Tencent 格式: sz300434"""
-    clean = get_clean_code(stock_code)
-    mkt = get_market_type(clean)
-    return f"{mkt}{clean}"
+    return stock_universe.to_tencent(stock_code)
 
 def to_eastmoney_web_code(stock_code):
     """转为 Eastmoney Web 格式: SZ300434 (必须大写)"""
-    clean = get_clean_code(stock_code)
-    mkt = get_market_type(clean)
-    return f"{mkt.upper()}{clean}"
+    return stock_universe.to_em_web(stock_code)
 
 def to_eastmoney_secid(stock_code):
     """转为 Eastmoney SecID: 0.300434"""
-    clean = get_clean_code(stock_code)
-    mkt = get_market_type(clean)
-    prefix = "1" if mkt == 'sh' else "0"
-    return f"{prefix}.{clean}"
+    return stock_universe.to_secid(stock_code)
 
 def to_eastmoney_code(stock_code):
     """转为 Eastmoney 格式: 300434.SZ"""
-    clean = get_clean_code(stock_code)
-    mkt = get_market_type(clean)
-    return f"{clean}.{mkt.upper()}"
+    return stock_universe.to_exchange(stock_code)
 
 # --- 数据获取函数 ---
 
@@ -59,6 +52,8 @@ def fetch_individual_info(stock_code):
     """
     clean_code = get_clean_code(stock_code)
     info = {}
+    if not clean_code:
+        return info
     
     # 1. Akshare
     try:
@@ -88,7 +83,7 @@ def fetch_individual_info(stock_code):
         try:
             tx_code = to_tencent_code(stock_code) # sz300434
             url = f"http://qt.gtimg.cn/q={tx_code}"
-            resp = requests.get(url, timeout=3)
+            resp = http_clients.tencent.get(url, timeout=3)
             if resp.status_code == 200:
                 content = resp.content.decode('gbk', errors='ignore')
                 if '="' in content:
@@ -113,6 +108,8 @@ def fetch_stock_news(stock_code, limit=10):
     """
     clean_code = get_clean_code(stock_code)
     news_list = []
+    if not clean_code:
+        return news_list
     
     # 1. Akshare
     try:
@@ -141,7 +138,7 @@ def fetch_stock_news(stock_code, limit=10):
             "ann_type": "A", "client_source": "web", 
             "stock_list": clean_code 
         }
-        resp = requests.get(url, params=params, headers=headers, timeout=5)
+        resp = http_clients.eastmoney.get(url, params=params, headers=headers, timeout=5)
         data = resp.json()
         
         if data.get('data') and data.get('data').get('list'):
@@ -167,6 +164,8 @@ def fetch_top_holders(stock_code):
     策略：Akshare -> Eastmoney Web HTTP (Ajax with Headers)
     """
     clean_code = get_clean_code(stock_code)
+    if not clean_code:
+        return pd.DataFrame()
     
     # 1. Akshare
     try:
@@ -191,7 +190,7 @@ def fetch_top_holders(stock_code):
         url = "http://emweb.securities.eastmoney.com/PC_HSF10/ShareholderResearch/ShareholderResearchAjax"
         params = {"code": em_code}
         
-        resp = requests.get(url, params=params, headers=headers, timeout=5)
+        resp = http_clients.eastmoney.get(url, params=params, headers=headers, timeout=5)
         data = resp.json()
         
         # Use Top 10 Circulating (sdltgd)
@@ -222,6 +221,8 @@ def fetch_capital_flow_history(stock_code):
     策略：Akshare -> Eastmoney HTTP (Push2)
     """
     clean_code = get_clean_code(stock_code)
+    if not clean_code:
+        return pd.DataFrame()
     
     # 1. Akshare
     try:
@@ -247,7 +248,7 @@ def fetch_capital_flow_history(stock_code):
             "fields1": "f1", "fields2": "f51,f52,f53,f54,f55,f56",
             "secid": secid
         }
-        resp = requests.get(url, params=params, timeout=3)
+        resp = http_clients.eastmoney.get(url, params=params, timeout=3)
         data = resp.json()
         if data.get('data') and data['data'].get('klines'):
             records = []
@@ -0,0 +1,169 @@
+"""
+数据源请求的自适应流控 (AIMD)。
+
+每个数据源一个 AimdController，同时调节两个参数:
+- batch_size: 每个请求包含的股票数量
+- concurrency: 同时在途的请求数
+
+调节规则与 TCP 拥塞控制类似:
+1. 加性增: 连续成功且耗时低于目标时，每满一个窗口 (= 当前并发数个请求)，并发 +1、批次 +BATCH_STEP。
+2. 乘性减: 请求失败时，并发和批次都乘以 DECREASE_FACTOR；被限流 (429/403/456) 时再减半。
+   耗时超过目标时只缩小批次，因为单个请求的耗时主要由批次大小决定。
+3. 一次拥塞往往让同一窗口内的多个在途请求一起失败，在 DECREASE_HOLDOFF 秒内只减一次。
+
+学到的参数由 TuningStore 保存到 JSON 文件，下次启动时直接从上次收敛的位置开始。
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from src.config import config
+from src.logger import logger
+
+# 加性增的批次步长
+BATCH_STEP = 10
+# 乘性减系数
+DECREASE_FACTOR = 0.7
+# 两次乘性减之间的最短间隔 (秒)
+DECREASE_HOLDOFF = 1.0
+
+
+class AimdController:
+    """单个数据源的批次大小与并发数控制器 (线程安全)，同时充当在途请求数的闸门"""
+
+    def __init__(self, vendor: str,
+                 batch_size: Optional[int] = None,
+                 concurrency: Optional[float] = None,
+                 min_batch: Optional[int] = None,
+                 max_batch: Optional[int] = None,
+                 max_concurrency: Optional[int] = None,
+                 target_latency_ms: Optional[float] = None):
+        """
+        :param vendor: 数据源名称
+        :param batch_size: 初始批次大小
+        :param concurrency: 初始并发数
+        :param min_batch: 批次下限
+        :param max_batch: 批次上限 (受 URL 长度限制)
+        :param max_concurrency: 并发上限
+        :param target_latency_ms: 单个请求的目标耗时 (毫秒)
+        """
+        self.vendor = vendor
+        self.min_batch = min_batch or config.QUOTE_BATCH_MIN
+        self.max_batch = max_batch or config.QUOTE_BATCH_MAX
+        self.max_concurrency = max_concurrency or config.QUOTE_SOURCE_MAX_WORKERS
+        self.target_latency_ms = target_latency_ms or config.QUOTE_TARGET_LATENCY_MS
+        self.batch_size = float(batch_size or config.QUOTE_SOURCE_BATCH_SIZE)
+        self.concurrency = float(concurrency or config.QUOTE_INITIAL_CONCURRENCY)
+        self._clamp()
+
+        self.in_flight = 0
+        self.quotes = 0
+        self.busy_seconds = 0.0
+        self._successes = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def _clamp(self):
+        self.batch_size = min(max(self.batch_size, self.min_batch), self.max_batch)
+        self.concurrency = min(max(self.concurrency, 1.0), self.max_concurrency)
+
+    @property
+    def limit(self) -> int:
+        """当前允许的在途请求数"""
+        return int(self.concurrency)
+
+    @property
+    def batch(self) -> int:
+        """当前的批次大小"""
+        return int(self.batch_size)
+
+    # --- 闸门 ---
+    def acquire(self):
+        """在途请求数达到上限时阻塞"""
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    # --- 反馈 ---
+    def on_success(self, elapsed_ms: float, n_codes: int):
+        with self._cond:
+            self.quotes += n_codes
+            self.busy_seconds += elapsed_ms / 1000.0
+            if elapsed_ms > self.target_latency_ms:
+                self._decrease(batch_only=True)
+                return
+            self._successes += 1
+            if self._successes >= self.limit:
+                # 一个窗口内全部成功且不慢，加性增
+                self._successes = 0
+                self.concurrency += 1
+                self.batch_size += BATCH_STEP
+                self._clamp()
+            self._cond.notify_all()
+
+    def on_failure(self, throttled: bool = False):
+        with self._cond:
+            self._decrease(factor=DECREASE_FACTOR / 2 if throttled else DECREASE_FACTOR)
+            if throttled:
+                logger.info(f"数据源 {self.vendor} 触发限流，降至 批次 {self.batch} / 并发 {self.limit}")
+
+    def _decrease(self, factor: float = DECREASE_FACTOR, batch_only: bool = False):
+        now = time.monotonic()
+        self._successes = 0
+        if now - self._last_decrease < DECREASE_HOLDOFF:
+            return
+        self._last_decrease = now
+        self.batch_size *= factor
+        if not batch_only:
+            self.concurrency *= factor
+        self._clamp()
+
+    # --- 持久化 ---
+    def state(self) -> dict:
+        with self._cond:
+            return {'batch_size': self.batch, 'concurrency': self.limit}
+
+    def stats(self) -> dict:
+        """当前参数与累计吞吐 (条/秒，按单个请求的平均耗时折算到当前并发数)"""
+        with self._cond:
+            per_request = self.quotes / self.busy_seconds if self.busy_seconds else 0.0
+            return {'batch_size': self.batch, 'concurrency': self.limit,
+                    'quotes_per_sec': round(per_request * self.limit, 1)}
+
+
+class TuningStore:
+    """把各数据源学到的 (批次, 并发) 保存到 JSON 文件，写入时先写临时文件再替换"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Dict[str, dict]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"读取流控参数 {self.path} 失败，使用默认参数: {e}")
+            return {}
+
+    def save(self, controllers: Dict[str, AimdController]):
+        data = {name: dict(ctrl.state(), updated_at=datetime.now().isoformat())
+                for name, ctrl in controllers.items()}
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            logger.warning(f"保存流控参数 {self.path} 失败: {e}")
@@ -0,0 +1,174 @@
+"""
+按数据源 (腾讯 / 新浪 / 东方财富) 划分的 HTTP 客户端。
+
+每个 VendorClient 持有一个进程内共享的 requests.Session:
+- HTTPAdapter 连接池开启 keep-alive，线程之间共用 (pool_maxsize 控制每个 Host 的最大连接数)。
+- 统一的默认请求头、超时和重试策略 (连接失败 / 429 / 5xx 按指数退避重试)。
+- 按接口 (Host + 路径) 记录耗时直方图，便于观察各接口的 p50/p95/p99。
+
+用法:
+    resp = http_clients.tencent.get("http://qt.gtimg.cn/q=sh600519", timeout=3)
+    logger.info(http_clients.tencent.latency_summary())
+"""
+import bisect
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from src.config import config
+from src.logger import logger
+
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36")
+
+# 耗时直方图的桶上界 (毫秒)，最后一个桶收纳超过 5 秒的请求
+LATENCY_BUCKETS_MS = (5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float('inf'))
+
+# 触发重试的 HTTP 状态码
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class LatencyHistogram:
+    """固定分桶的耗时直方图 (线程安全)，分位数按桶上界估算"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.total = 0
+        self.errors = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, elapsed_ms: float, error: bool = False):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, elapsed_ms)] += 1
+            self.total += 1
+            self.errors += int(error)
+            self.sum_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def percentile(self, q: float) -> float:
+        """
+        估算分位数 (毫秒)，返回所在桶的上界；最后一个桶返回观测到的最大值。
+
+        :param q: 0-100
+        """
+        with self._lock:
+            if not self.total:
+                return 0.0
+            target = self.total * q / 100.0
+            seen = 0
+            for bound, count in zip(self.buckets, self.counts):
+                seen += count
+                if seen >= target and count:
+                    return min(bound, self.max_ms)
+            return self.max_ms
+
+    def snapshot(self) -> dict:
+        return {
+            'count': self.total,
+            'errors': self.errors,
+            'mean_ms': self.sum_ms / self.total if self.total else 0.0,
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'max_ms': self.max_ms,
+        }
+
+
+class VendorClient:
+    """
+    单个数据源的 HTTP 客户端。get() 的用法与 requests.Session.get 相同，可以直接替换。
+    """
+
+    def __init__(self, vendor: str, headers: Optional[dict] = None, timeout: Optional[float] = None,
+                 pool_maxsize: Optional[int] = None, max_retries: Optional[int] = None,
+                 backoff_factor: Optional[float] = None):
+        """
+        :param vendor: 数据源名称，用于日志
+        :param headers: 默认请求头 (单次请求传入的 headers 会与之合并)
+        :param timeout: 默认超时 (秒)
+        :param pool_maxsize: 每个 Host 的最大连接数
+        :param max_retries: 连接错误 / 429 / 5xx 的最大重试次数
+        :param backoff_factor: 重试的指数退避系数 (秒)
+        """
+        self.vendor = vendor
+        self.timeout = config.HTTP_TIMEOUT if timeout is None else timeout
+        retry = Retry(
+            total=config.HTTP_MAX_RETRIES if max_retries is None else max_retries,
+            backoff_factor=config.HTTP_BACKOFF_FACTOR if backoff_factor is None else backoff_factor,
+            status_forcelist=RETRY_STATUS,
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize or config.HTTP_POOL_MAXSIZE,
+                              max_retries=retry)
+        self.session = requests.Session()
+        self.session.headers.update({'User-Agent': USER_AGENT, **(headers or {})})
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def _histogram(self, endpoint: str) -> LatencyHistogram:
+        with self._lock:
+            hist = self._histograms.get(endpoint)
+            if hist is None:
+                hist = self._histograms[endpoint] = LatencyHistogram()
+            return hist
+
+    def get(self, url: str, endpoint: Optional[str] = None, **kwargs) -> requests.Response:
+        """
+        发送 GET 请求并记录耗时 (含重试)。
+
+        :param endpoint: 直方图的接口名，默认取 URL 的 Host + 路径
+                         (腾讯/新浪把代码写在路径里，如 /q=sh600519、/list=...，截掉 '=' 之后的部分)
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        if endpoint is None:
+            parts = urlsplit(url)
+            endpoint = parts.netloc + parts.path.split('=', 1)[0]
+        start = time.perf_counter()
+        error = True
+        try:
+            resp = self.session.get(url, **kwargs)
+            error = resp.status_code >= 400
+            return resp
+        finally:
+            self._histogram(endpoint).observe((time.perf_counter() - start) * 1000, error=error)
+
+    def latency_stats(self) -> Dict[str, dict]:
+        """返回 {接口: 耗时统计}"""
+        with self._lock:
+            items = list(self._histograms.items())
+        return {endpoint: hist.snapshot() for endpoint, hist in items}
+
+    def latency_summary(self) -> str:
+        """单行文本形式的耗时统计，用于日志"""
+        parts = [f"{endpoint} n={s['count']} err={s['errors']} p50={s['p50_ms']:.0f}ms "
+                 f"p95={s['p95_ms']:.0f}ms p99={s['p99_ms']:.0f}ms"
+                 for endpoint, s in self.latency_stats().items()]
+        return f"[{self.vendor}] " + ('; '.join(parts) if parts else '暂无请求')
+
+    def close(self):
+        self.session.close()
+
+
+# 进程内共享的各数据源客户端
+tencent = VendorClient('tencent')
+sina = VendorClient('sina', headers={'Referer': 'http://finance.sina.com.cn/'})
+eastmoney = VendorClient('eastmoney')
+
+ALL_CLIENTS = (tencent, sina, eastmoney)
+
+
+def log_latency_report():
+    """把所有数据源的接口耗时统计写入日志"""
+    for client in ALL_CLIENTS:
+        logger.info(f"HTTP 耗时统计 {client.latency_summary()}")
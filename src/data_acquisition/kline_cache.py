@@ -0,0 +1,195 @@
+"""
+本地持久化日K线缓存。
+
+每只股票、每种复权方式一个 Parquet 文件 (KLINE_CACHE_DIR/<adjust>/<code>.parquet)，
+旁边的 JSON 记录最近一次刷新时间等元信息。调度器、Streamlit 和回测都在同一台机器上读写这份缓存，
+不同进程之间通过 "写临时文件 + os.replace" 保证读到的总是完整文件。
+
+读取流程:
+1. 缓存仍然新鲜 (TTL 内，或收盘后到下一次开盘前已刷新过) -> 直接按日期区间和条数返回。
+2. 否则只请求上次缓存之后缺失的几根K线 (通常只有今天这一根)，与缓存合并后落盘。
+3. 增量结果与缓存在重叠K线上的价格不一致时，说明发生了除权，前复权价格整体变化，改为全量重新拉取。
+4. 缓存条数少于请求的 count 且不是上市以来的完整历史时，按 count 全量重新拉取。
+"""
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.config import config
+from src.logger import logger
+from src.scheduling.trading_calendar import trading_calendar, market_now
+
+# 日K线在收盘后才算定型，开盘后当天的K线会持续变化
+SESSION_OPEN_TIME = (9, 15)
+SESSION_SETTLED_TIME = (15, 30)
+# 增量请求时在缺口条数之外多取的条数，用于和缓存比对重叠K线
+INCREMENTAL_MARGIN = 2
+# 判定重叠K线价格一致的相对误差
+PRICE_TOLERANCE = 1e-4
+
+KLINE_COLUMNS = ['time', 'code', 'open', 'high', 'low', 'close', 'volume', 'turnover']
+
+
+def _last_trading_day_at(now: datetime, hm) -> datetime:
+    """返回不晚于 now 的最近一个交易日的 hm 时刻"""
+    point = now.replace(hour=hm[0], minute=hm[1], second=0, microsecond=0)
+    day = point.date() - timedelta(days=1) if point > now else point.date()
+    return datetime.combine(trading_calendar.previous_trading_day(day, include=True), point.time())
+
+
+def prices_rebased(stored: Optional[pd.DataFrame], fresh: pd.DataFrame) -> bool:
+    """
+    新拉取的K线与已存K线的重叠部分收盘价是否不一致 (前复权价格基准已变化)。
+    已存的最后一根可能是盘中写入的未定型K线，不参与比较。
+    """
+    if stored is None or stored.empty:
+        return False
+    last = stored['time'].iloc[-1]
+    fresh = fresh.assign(time=pd.to_datetime(fresh['time']))
+    overlap = fresh[fresh['time'] < last].merge(stored[['time', 'close']], on='time', suffixes=('', '_stored'))
+    return not np.allclose(overlap['close'], overlap['close_stored'], rtol=PRICE_TOLERANCE)
+
+
+class KlineCache:
+    """
+    按 (股票代码, 复权方式) 落盘的日K线缓存，请求区间在读取时筛选。
+
+    用法:
+        cache = KlineCache(fetch=lambda code, count: ...)
+        df = cache.get("sh600519", start_date="20240101")
+    """
+
+    def __init__(self,
+                 fetch: Callable[[str, int], Optional[pd.DataFrame]],
+                 cache_dir: Optional[str] = None,
+                 adjust: str = 'qfq',
+                 ttl: Optional[float] = None):
+        """
+        :param fetch: 远程拉取函数 fetch(code, count)，返回最近 count 根K线 (不筛选日期)，失败返回 None
+        :param cache_dir: 缓存根目录，默认 config.KLINE_CACHE_DIR
+        :param adjust: 复权方式，作为缓存子目录名
+        :param ttl: 交易时段内缓存的有效期 (秒)，默认 config.KLINE_CACHE_TTL
+        """
+        self.fetch = fetch
+        self.adjust = adjust
+        self.directory = os.path.join(cache_dir or config.KLINE_CACHE_DIR, adjust)
+        self.ttl = config.KLINE_CACHE_TTL if ttl is None else ttl
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    # --- 文件读写 ---
+    def _paths(self, code: str):
+        base = os.path.join(self.directory, code)
+        return f"{base}.parquet", f"{base}.json"
+
+    def _lock_for(self, code: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(code, threading.Lock())
+
+    def _load(self, code: str):
+        data_path, meta_path = self._paths(code)
+        if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+            return None, {}
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            return pd.read_parquet(data_path), meta
+        except Exception as e:
+            logger.warning(f"读取 {code} 的K线缓存失败，将重新拉取: {e}")
+            return None, {}
+
+    def _store(self, code: str, df: pd.DataFrame, meta: dict):
+        """先写临时文件再替换，其他进程不会读到写了一半的文件"""
+        os.makedirs(self.directory, exist_ok=True)
+        data_path, meta_path = self._paths(code)
+        tmp_data, tmp_meta = f"{data_path}.{os.getpid()}.tmp", f"{meta_path}.{os.getpid()}.tmp"
+        df.to_parquet(tmp_data, index=False)
+        with open(tmp_meta, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_data, data_path)
+        os.replace(tmp_meta, meta_path)
+
+    # --- 刷新策略 ---
+    def _is_fresh(self, meta: dict, now: datetime) -> bool:
+        refreshed_at = meta.get('refreshed_at')
+        if not refreshed_at:
+            return False
+        refreshed_at = datetime.fromisoformat(refreshed_at)
+        if (now - refreshed_at).total_seconds() < self.ttl:
+            return True
+        # 收盘定型之后、下一次开盘之前，K线不会再变化
+        settled = _last_trading_day_at(now, SESSION_SETTLED_TIME)
+        return _last_trading_day_at(now, SESSION_OPEN_TIME) < settled <= refreshed_at
+
+    def _fetch(self, code: str, count: int) -> Optional[pd.DataFrame]:
+        df = self.fetch(code, count)
+        if df is None:
+            return None
+        if df.empty:
+            return pd.DataFrame(columns=KLINE_COLUMNS)
+        df = df[KLINE_COLUMNS].copy()
+        df['time'] = pd.to_datetime(df['time'])
+        return df.sort_values('time').reset_index(drop=True)
+
+    def _refresh(self, code: str, cached: Optional[pd.DataFrame], meta: dict, count: int, now: datetime):
+        """返回刷新后的 (df, meta)；远程请求失败时返回 (None, meta)"""
+        if cached is None or cached.empty or (len(cached) < count and not meta.get('complete')):
+            return self._full_refresh(code, count, meta, now)
+
+        # 增量: 只拉上次缓存之后的缺口，外加 INCREMENTAL_MARGIN 根与缓存重叠的K线
+        last = cached['time'].iloc[-1]
+        gap = int(np.busday_count(last.date() + timedelta(days=1), now.date() + timedelta(days=1)))
+        fresh = self._fetch(code, gap + INCREMENTAL_MARGIN)
+        if fresh is None:
+            return None, meta
+        if fresh.empty:
+            return cached, dict(meta, refreshed_at=now.isoformat())
+
+        if prices_rebased(cached, fresh):
+            # 前复权价格整体变化 (除权除息)，增量结果不能直接拼接
+            logger.info(f"{code} 的前复权价格发生变化，重新拉取完整K线缓存。")
+            return self._full_refresh(code, max(count, len(cached)), meta, now)
+
+        # 最后一根缓存K线可能是盘中未定型的，重叠部分以新数据为准
+        merged = pd.concat([cached[cached['time'] < fresh['time'].iloc[0]], fresh], ignore_index=True)
+        return merged, dict(meta, refreshed_at=now.isoformat())
+
+    def _full_refresh(self, code: str, count: int, meta: dict, now: datetime):
+        fresh = self._fetch(code, count)
+        if fresh is None:
+            return None, meta
+        # 返回条数不足说明已拉到上市首日，之后任意 count 都无需再加深
+        return fresh, {'refreshed_at': now.isoformat(), 'complete': len(fresh) < count}
+
+    def get(self, code: str, start_date: str = "19900101", end_date: str = "20991231",
+            count: int = 320, now: Optional[datetime] = None) -> pd.DataFrame:
+        """
+        读取单只股票的日K线，语义与 data_fetcher.fetch_stock_daily_kline 相同:
+        取最近 count 根K线，再按 [start_date, end_date] 筛选。
+
+        :param code: 腾讯格式的股票代码, 例如 "sh600519"，同时作为缓存文件名
+        :param now: 当前时间，默认 market_now() (交易所当地时间)
+        :return: DataFrame ['time', 'code', 'open', 'high', 'low', 'close', 'volume', 'turnover']
+        """
+        now = now or market_now()
+        with self._lock_for(code):
+            cached, meta = self._load(code)
+            enough_bars = cached is not None and (meta.get('complete') or len(cached) >= count)
+            if not (enough_bars and self._is_fresh(meta, now)):
+                df, new_meta = self._refresh(code, cached, meta, count, now)
+                if df is not None:
+                    self._store(code, df, new_meta)
+                    cached = df
+                elif cached is None:
+                    return pd.DataFrame()
+                else:
+                    logger.warning(f"刷新 {code} 的K线缓存失败，返回本地缓存数据。")
+
+        df = cached.tail(count)
+        mask = (df['time'] >= pd.to_datetime(start_date)) & (df['time'] <= pd.to_datetime(end_date))
+        return df.loc[mask].reset_index(drop=True)
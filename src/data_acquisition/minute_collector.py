@@ -0,0 +1,123 @@
+"""
+盘中分钟K线采集器。
+
+交易时段内按 MINUTE_COLLECT_INTERVAL 轮询自选股 (及命令行指定的股票) 的腾讯分时接口，
+只把上次写入之后新出现的分钟K线追加写入 stock_minute_kline。
+最后一根K线在当前分钟内仍会变化，每轮都会连同它一起重新写入 (Upsert)。
+午休、收盘后和非交易日按交易日历休眠到下一个交易时段。
+"""
+import concurrent.futures
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from src.config import config
+from src.logger import logger
+from src.data_storage import crud, database
+from src.data_storage.minute_store import MinuteBarStore, minute_store
+from src.data_storage.watchlist_manager import watchlist_manager
+from src.data_acquisition import data_fetcher
+from src.scheduling.trading_calendar import trading_calendar, market_now
+
+
+def _tencent_codes(codes: Iterable[str]) -> List[str]:
+    """转换为腾讯格式，无法识别的代码记录日志后跳过，不影响其余股票的采集"""
+    result = []
+    for code in codes:
+        try:
+            result.append(data_fetcher._to_tencent_code(code))
+        except ValueError as e:
+            logger.warning(f"分钟采集: 跳过无效的股票代码 {code!r}: {e}")
+    return result
+
+
+class MinuteBarCollector:
+    """
+    轮询分时接口并把新的分钟K线追加写入分钟K线库。
+    """
+
+    def __init__(self, codes: Optional[Iterable[str]] = None, store: Optional[MinuteBarStore] = None,
+                 workers: Optional[int] = None):
+        """
+        :param codes: 额外采集的股票代码，自选股总是会被采集
+        :param store: 分钟K线存储，默认全局 minute_store
+        :param workers: 并发请求数
+        """
+        self.extra_codes = _tencent_codes(codes or [])
+        self.store = store or minute_store
+        self.workers = workers or config.MINUTE_COLLECT_WORKERS
+        # 每只股票已写入的最后一根K线时间
+        self._last_times: Dict[str, pd.Timestamp] = {}
+
+    def _codes(self) -> List[str]:
+        codes = _tencent_codes(watchlist_manager.get_watchlist())
+        return list(dict.fromkeys(codes + self.extra_codes))
+
+    def _load_last_times(self, codes: List[str], now: datetime):
+        """进程启动或出现新股票时，从数据库读取当天已写入的最后一根K线时间"""
+        missing = [c for c in codes if c not in self._last_times]
+        if not missing:
+            return
+        since = pd.Timestamp(now.date()).tz_localize(config.MARKET_TIMEZONE)
+        db = database.SessionLocal()
+        try:
+            self._last_times.update(crud.get_latest_minute_times(db, missing, since))
+        finally:
+            db.close()
+
+    def _collect_one(self, code: str) -> int:
+        df = data_fetcher.fetch_stock_minute_data(code)
+        if df.empty:
+            return 0
+        written = self.store.append(code, df, since=self._last_times.get(code))
+        self._last_times[code] = df['time'].iloc[-1]
+        return written
+
+    def collect_once(self, now: Optional[datetime] = None) -> int:
+        """采集一轮，返回写入的K线条数"""
+        now = now or market_now()
+        codes = self._codes()
+        if not codes:
+            logger.info("分钟采集: 自选股为空，跳过。")
+            return 0
+        self._load_last_times(codes, now)
+
+        start = time.time()
+        written = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.workers, len(codes))) as executor:
+            futures = {executor.submit(self._collect_one, code): code for code in codes}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    written += future.result()
+                except Exception as e:
+                    logger.warning(f"分钟采集 {futures[future]} 失败: {e}")
+        logger.info(f"分钟采集完成: {len(codes)} 只股票, 写入 {written} 条, 耗时 {time.time() - start:.2f}s。")
+        return written
+
+    def run(self, interval: Optional[int] = None):
+        """启动采集循环，非交易时段休眠到下一个交易时段"""
+        interval = interval or config.MINUTE_COLLECT_INTERVAL
+        logger.info(f"🚀 启动分钟K线采集 (每 {interval} 秒一轮)...")
+        try:
+            while True:
+                now = market_now()
+                # 交易时段包含收盘后的 SESSION_CLOSE_GRACE 秒，补齐 11:30 / 15:00 的K线
+                if trading_calendar.is_trading_time(now, grace=config.SESSION_CLOSE_GRACE):
+                    self.collect_once(now)
+                # 分时接口按分钟更新，开盘 / 收盘前后不需要加密轮询
+                time.sleep(trading_calendar.sleep_seconds(market_now(), interval, lead=0, edge_interval=interval))
+        except KeyboardInterrupt:
+            logger.info("🛑 分钟K线采集已停止。")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="盘中分钟K线采集器")
+    parser.add_argument('codes', nargs='*', help="除自选股外额外采集的股票代码")
+    parser.add_argument('--interval', type=int, default=None, help="轮询间隔 (秒)")
+    args = parser.parse_args()
+
+    MinuteBarCollector(args.codes).run(interval=args.interval)
@@ -0,0 +1,252 @@
+"""
+行情报文列式解析器。
+
+腾讯 (qt.gtimg.cn) 与新浪 (hq.sinajs.cn) 的批量行情接口返回的都是
+"一行一只股票、字段用分隔符拼接" 的文本。旧的解析方式是逐行 split 后
+为每只股票构造一个 dict，并调用几十次 float()，在采集器中占用了大部分 CPU。
+
+这里改为:
+1. 用一次正则扫描提取整段报文中的 (代码, 数据串)。
+2. 拆分字段仍是逐行的 (每只股票的数据串 split 一次)，之后按厂商固定的字段表 (VendorSchema)
+   用 itemgetter 取出所有行的数值字段摊平成一个列表，整体只做一次字符串 -> float64 转换，
+   不再为每只股票构造 dict、逐个字段调用 float()。
+3. 结果存放在一个 (字段数 × 股票数) 的连续二维数组中，
+   每一列都是该数组的一个视图 (零拷贝)，可直接构造 DataFrame。
+"""
+import re
+from dataclasses import dataclass, field
+from itertools import chain
+from operator import itemgetter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class FieldSpec:
+    """单个字段: 列名、在报文中的位置、换算系数 (例如 手 -> 股 为 100)"""
+    name: str
+    index: int
+    scale: float = 1.0
+
+
+@dataclass(frozen=True)
+class VendorSchema:
+    """
+    厂商报文的固定字段表。
+
+    :param pattern: 提取 (代码, 数据串) 的正则，必须包含两个分组
+    :param field_sep: 数据串内的字段分隔符
+    :param min_fields: 字段数少于该值的记录视为无效 (停牌/不存在的代码)
+    :param numeric: 数值字段
+    :param text: 文本字段 (名称、时间等)
+    """
+    name: str
+    pattern: re.Pattern
+    field_sep: str
+    min_fields: int
+    numeric: Tuple[FieldSpec, ...]
+    text: Tuple[FieldSpec, ...] = field(default_factory=tuple)
+
+    @property
+    def width(self) -> int:
+        """解析所需的最少字段数 (最大下标 + 1)"""
+        return max(f.index for f in self.numeric + self.text) + 1
+
+
+def _book_fields(start: int, price_first: bool, side: str, vol_scale: float) -> Tuple[FieldSpec, ...]:
+    """生成五档盘口字段 (价格/数量交替排列)"""
+    specs = []
+    for level in range(5):
+        base = start + level * 2
+        price_idx, vol_idx = (base, base + 1) if price_first else (base + 1, base)
+        specs.append(FieldSpec(f"{side}{level + 1}", price_idx))
+        specs.append(FieldSpec(f"{side}{level + 1}_vol", vol_idx, vol_scale))
+    return tuple(specs)
+
+
+# 腾讯: v_sh600519="1~贵州茅台~600519~1700.00~...";
+# 3:最新 4:昨收 5:今开 9-28:五档(价,手) 30:时间 31:涨跌 32:涨跌幅 33:最高 34:最低
+# 36:成交量(手) 37:成交额(万) 38:换手率 39:市盈率 44:流通市值(亿) 45:总市值(亿)
+# 47:涨停价 48:跌停价 49:量比
+TENCENT_SCHEMA = VendorSchema(
+    name='tencent',
+    pattern=re.compile(r'v_(\w+)="([^"]*)"'),
+    field_sep='~',
+    min_fields=40,
+    numeric=(
+        FieldSpec('price', 3),
+        FieldSpec('pre_close', 4),
+        FieldSpec('open', 5),
+        FieldSpec('high', 33),
+        FieldSpec('low', 34),
+        FieldSpec('change', 31),
+        FieldSpec('pct_change', 32),
+        FieldSpec('volume', 36, 100.0),
+        FieldSpec('turnover', 37, 10000.0),
+        FieldSpec('turnover_rate', 38),
+        FieldSpec('pe', 39),
+        FieldSpec('float_mcap', 44, 1e8),
+        FieldSpec('total_mcap', 45, 1e8),
+        FieldSpec('limit_up', 47),
+        FieldSpec('limit_down', 48),
+        FieldSpec('volume_ratio', 49),
+    ) + _book_fields(9, True, 'bid', 100.0) + _book_fields(19, True, 'ask', 100.0),
+    text=(
+        FieldSpec('name', 1),
+        FieldSpec('time', 30),
+    ),
+)
+
+# 新浪: var hq_str_sh601006="大秦铁路,6.670,6.680,6.690,6.720,6.660,...";
+# 0:名称 1:今开 2:昨收 3:最新 4:最高 5:最低 8:成交量(股) 9:成交额(元)
+# 10-29:五档(量,价) 30:日期 31:时间
+SINA_SCHEMA = VendorSchema(
+    name='sina',
+    pattern=re.compile(r'hq_str_(\w+)="([^"]*)"'),
+    field_sep=',',
+    min_fields=30,
+    numeric=(
+        FieldSpec('price', 3),
+        FieldSpec('open', 1),
+        FieldSpec('pre_close', 2),
+        FieldSpec('high', 4),
+        FieldSpec('low', 5),
+        FieldSpec('volume', 8),
+        FieldSpec('turnover', 9),
+    ) + _book_fields(10, False, 'bid', 1.0) + _book_fields(20, False, 'ask', 1.0),
+    text=(
+        FieldSpec('name', 0),
+        FieldSpec('date', 30),
+        FieldSpec('clock', 31),
+    ),
+)
+
+
+@dataclass
+class QuoteBatch:
+    """
+    一次解析的结果。
+
+    :param symbols: 报文中的厂商代码，例如 'sh600519'
+    :param columns: 数值列 {列名: float64 数组}，均为 block 的行视图
+    :param text: 文本列 {列名: object 数组}
+    :param block: (数值字段数 × 股票数) 的连续 float64 数组
+    """
+    vendor: str
+    symbols: np.ndarray
+    columns: Dict[str, np.ndarray]
+    text: Dict[str, np.ndarray]
+    block: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def to_frame(self, columns: Optional[Sequence[str]] = None, code_column: str = 'code') -> pd.DataFrame:
+        """
+        转换为 DataFrame。数值列直接引用底层数组，不做复制。
+
+        :param columns: 需要的列 (按顺序)，默认全部
+        :param code_column: 代码列的列名
+        """
+        data = {code_column: self.symbols}
+        data.update(self.text)
+        data.update(self.columns)
+        if columns is not None:
+            data = {c: data[c] for c in columns if c in data}
+        return pd.DataFrame(data, copy=False)
+
+
+def _to_float(flat: List[str]) -> np.ndarray:
+    """把字符串列表整体转换为 float64，空串视为 NaN"""
+    try:
+        return np.fromiter(map(float, [v or 'nan' for v in flat]), dtype=np.float64, count=len(flat))
+    except ValueError:
+        # 报文中混入了非数值内容，退回到逐元素容错转换
+        return pd.to_numeric(pd.Series(flat, dtype=object), errors='coerce').to_numpy(dtype=np.float64)
+
+
+def parse(body, schema: VendorSchema, fields: Optional[Sequence[str]] = None,
+          encoding: str = 'gbk') -> QuoteBatch:
+    """
+    按给定字段表解析整段报文。逐行拆分字段，数值字段摊平后一次转换为 float64。
+
+    :param body: 原始响应 (bytes) 或已解码文本 (str)；多个响应可直接拼接后一次解析
+    :param schema: 厂商字段表
+    :param fields: 只解析这些字段 (数值或文本)，默认解析字段表中的全部字段
+    """
+    text = body.decode(encoding, errors='ignore') if isinstance(body, (bytes, bytearray)) else body
+    numeric, text_specs = schema.numeric, schema.text
+    if fields is not None:
+        wanted = set(fields)
+        numeric = tuple(f for f in numeric if f.name in wanted)
+        text_specs = tuple(f for f in text_specs if f.name in wanted)
+    width = schema.width
+    sep = schema.field_sep
+
+    symbols = []
+    rows = []
+    for symbol, payload in schema.pattern.findall(text):
+        parts = payload.split(sep)
+        n = len(parts)
+        if n < schema.min_fields:
+            continue
+        if n < width:
+            parts.extend([''] * (width - n))
+        symbols.append(symbol)
+        rows.append(parts)
+
+    n_rows = len(rows)
+    n_cols = len(numeric)
+
+    if n_cols == 1:
+        flat = [row[numeric[0].index] for row in rows]
+    elif n_cols > 1:
+        getter = itemgetter(*(f.index for f in numeric))
+        flat = list(chain.from_iterable(map(getter, rows)))
+    else:
+        flat = []
+    values = _to_float(flat)
+    # (股票数 × 字段数) -> (字段数 × 股票数)，保证每一列在内存中连续
+    block = np.ascontiguousarray(values.reshape(n_rows, n_cols).T)
+
+    scales = np.array([f.scale for f in numeric])
+    if (scales != 1.0).any():
+        block *= scales[:, None]
+
+    columns = {f.name: block[i] for i, f in enumerate(numeric)}
+    text_cols = {
+        f.name: np.array([row[f.index] for row in rows], dtype=object)
+        for f in text_specs
+    }
+    return QuoteBatch(
+        vendor=schema.name,
+        symbols=np.array(symbols, dtype=object),
+        columns=columns,
+        text=text_cols,
+        block=block,
+    )
+
+
+def parse_tencent(body, fields: Optional[Sequence[str]] = None) -> QuoteBatch:
+    """解析腾讯 qt.gtimg.cn 批量行情报文"""
+    return parse(body, TENCENT_SCHEMA, fields)
+
+
+def parse_sina(body) -> QuoteBatch:
+    """
+    解析新浪 hq.sinajs.cn 批量行情报文。
+    额外生成 time (日期 + 时间) 与 change_pct (按昨收计算，保留两位小数) 两列。
+    """
+    batch = parse(body, SINA_SCHEMA)
+    date = batch.text.pop('date')
+    clock = batch.text.pop('clock')
+    batch.text['time'] = np.array([f"{d} {c}" for d, c in zip(date, clock)], dtype=object)
+
+    price = batch.columns['price']
+    pre_close = batch.columns['pre_close']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pct = np.where(pre_close > 0, (price - pre_close) / pre_close * 100, 0.0)
+    batch.columns['change_pct'] = np.round(pct, 2)
+    return batch
@@ -0,0 +1,305 @@
+"""
+多数据源实时行情。
+
+腾讯 (qt.gtimg.cn) 和新浪 (hq.sinajs.cn) 的批量行情接口都是一批代码发一个请求。这里把它们抽象为可插拔的
+QuoteVendor，由 QuoteSource 统一调度:
+1. 每个数据源有一份健康度: 近期成功率、耗时 p95 和熔断状态。每个批次先请求最健康的数据源。
+2. 批次失败 (异常、非 200、解析不出数据) 时自动切到下一个数据源。所有数据源都失败的批次会记入日志，不再静默丢弃。
+3. 对冲请求: 首选数据源超过自身的耗时 p95 仍未返回时，同一批次再发给备用数据源，谁先返回用谁。
+   这样整轮扫描的尾延迟不会被最慢的批次拖住。
+4. 每个数据源的批次大小和在途请求数由 flow_control.AimdController 根据耗时、错误和限流自适应调节。
+各数据源的输出统一为 QUOTE_COLUMNS，代码统一为腾讯格式 (sh600519)。某个数据源不提供的字段为 NaN
+(例如新浪没有换手率和量比)。
+
+用法:
+    df = quote_source.default_source.fetch(["sh600519", "sz000001"])
+"""
+import concurrent.futures
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from src.config import config
+from src.logger import logger
+from src.data_acquisition import http_clients, quote_parser
+from src.data_acquisition.flow_control import AimdController, TuningStore
+
+BOOK_COLUMNS = [f"{side}{level}{suffix}" for side in ('bid', 'ask') for level in range(1, 6) for suffix in ('', '_vol')]
+QUOTE_COLUMNS = ['code', 'name', 'time', 'price', 'pre_close', 'open', 'high', 'low', 'volume', 'turnover',
+                 'change_pct', 'turnover_rate', 'volume_ratio'] + BOOK_COLUMNS
+# 全市场扫描 (data_fetcher.fetch_all_stock_spot_realtime) 的输出字段
+SNAPSHOT_COLUMNS = ['code', 'name', 'price', 'pct_change', 'volume', 'turnover_rate', 'volume_ratio']
+
+# 视为限流的 HTTP 状态码 (新浪封禁时返回 403 / 456)
+THROTTLE_STATUS = (403, 429, 456)
+# 成功率的指数移动平均系数
+HEALTH_EWMA_ALPHA = 0.2
+
+
+class QuoteVendorError(Exception):
+    """数据源返回了无法使用的结果 (非 200 或解析不出任何行情)"""
+
+
+class QuoteThrottled(QuoteVendorError):
+    """数据源限流"""
+
+
+def _parse_tencent(body: bytes) -> pd.DataFrame:
+    df = quote_parser.parse_tencent(body).to_frame().rename(columns={'pct_change': 'change_pct'})
+    # 腾讯的时间为 20240102150003，统一为新浪的 "2024-01-02 15:00:03"
+    df['time'] = pd.to_datetime(df['time'], format='%Y%m%d%H%M%S', errors='coerce').dt.strftime('%Y-%m-%d %H:%M:%S')
+    return df.reindex(columns=QUOTE_COLUMNS)
+
+
+def _parse_sina(body: bytes) -> pd.DataFrame:
+    return quote_parser.parse_sina(body).to_frame().reindex(columns=QUOTE_COLUMNS)
+
+
+@dataclass
+class QuoteVendor:
+    """
+    一个行情数据源。
+
+    :param name: 数据源名称
+    :param client: HTTP 客户端
+    :param base_url: 接口前缀，代码以逗号拼接在其后
+    :param parse: 报文解析函数，返回 QUOTE_COLUMNS 格式的 DataFrame
+    """
+    name: str
+    client: http_clients.VendorClient
+    base_url: str
+    parse: Callable[[bytes], pd.DataFrame]
+
+    def fetch(self, codes: Sequence[str]) -> pd.DataFrame:
+        resp = self.client.get(f"{self.base_url}{','.join(codes)}", timeout=config.QUOTE_SOURCE_TIMEOUT)
+        if resp.status_code in THROTTLE_STATUS:
+            raise QuoteThrottled(f"HTTP {resp.status_code}")
+        if resp.status_code != 200:
+            raise QuoteVendorError(f"HTTP {resp.status_code}")
+        df = self.parse(resp.content)
+        if df.empty:
+            raise QuoteVendorError("响应中没有可解析的行情")
+        return df
+
+
+class VendorHealth:
+    """单个数据源的健康度: 成功率 (EWMA)、耗时直方图与熔断状态 (线程安全)"""
+
+    def __init__(self, failure_threshold: Optional[int] = None, cooldown: Optional[float] = None):
+        """
+        :param failure_threshold: 连续失败达到该次数后熔断
+        :param cooldown: 熔断持续时间 (秒)，到期后放行请求试探，再次失败立即重新熔断
+        """
+        self.failure_threshold = failure_threshold or config.QUOTE_VENDOR_FAILURE_THRESHOLD
+        self.cooldown = config.QUOTE_VENDOR_COOLDOWN if cooldown is None else cooldown
+        self.latency = http_clients.LatencyHistogram()
+        self.success_rate = 1.0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, elapsed_ms: float, ok: bool, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        self.latency.observe(elapsed_ms, error=not ok)
+        with self._lock:
+            self.success_rate += HEALTH_EWMA_ALPHA * (float(ok) - self.success_rate)
+            if ok:
+                self.consecutive_failures = 0
+                self.open_until = 0.0
+            else:
+                self.consecutive_failures += 1
+                if self.consecutive_failures >= self.failure_threshold:
+                    self.open_until = now + self.cooldown
+
+    def available(self, now: Optional[float] = None) -> bool:
+        """未处于熔断期"""
+        return (time.monotonic() if now is None else now) >= self.open_until
+
+    @property
+    def score(self) -> float:
+        """成功率按耗时 p95 (秒) 折算，越大越健康"""
+        return self.success_rate / (1.0 + self.latency.percentile(95) / 1000.0)
+
+    def hedge_delay(self) -> Optional[float]:
+        """发出对冲请求前的等待时间 (秒)，即耗时 p95；样本不足时返回 None (不对冲)"""
+        if self.latency.total < config.QUOTE_HEDGE_MIN_SAMPLES:
+            return None
+        return self.latency.percentile(95) / 1000.0
+
+    def snapshot(self) -> dict:
+        return {
+            'success_rate': round(self.success_rate, 3),
+            'available': self.available(),
+            **self.latency.snapshot(),
+        }
+
+
+class QuoteSource:
+    """
+    多数据源批量行情获取，带健康度排序、按批次故障转移和对冲请求。
+    """
+
+    def __init__(self,
+                 vendors: Optional[List[QuoteVendor]] = None,
+                 batch_size: Optional[int] = None,
+                 max_workers: Optional[int] = None,
+                 hedge: Optional[bool] = None,
+                 tuning_path: Optional[str] = None):
+        """
+        :param vendors: 数据源列表，顺序即健康度相同时的优先级，默认见 build_vendors()
+        :param batch_size: 每个请求的初始股票数量，之后由流控自适应调节
+        :param max_workers: 同时处理的批次数，也是单个数据源在途请求数的上限
+        :param hedge: 是否启用对冲请求
+        :param tuning_path: 流控参数的保存路径，None 表示不持久化
+        """
+        self.vendors = list(vendors) if vendors is not None else build_vendors()
+        self.health: Dict[str, VendorHealth] = {v.name: VendorHealth() for v in self.vendors}
+        self.max_workers = max_workers or config.QUOTE_SOURCE_MAX_WORKERS
+        self.hedge = config.QUOTE_SOURCE_HEDGE if hedge is None else hedge
+        self.tuning = TuningStore(tuning_path) if tuning_path else None
+        saved = self.tuning.load() if self.tuning else {}
+        self.controllers: Dict[str, AimdController] = {}
+        for v in self.vendors:
+            state = saved.get(v.name, {})
+            self.controllers[v.name] = AimdController(
+                v.name, batch_size=state.get('batch_size', batch_size), concurrency=state.get('concurrency'),
+                max_concurrency=self.max_workers)
+        # 单个数据源请求在独立线程池中执行，被对冲掉的慢请求在后台自然结束，不占用批次线程
+        self._attempts = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_workers * len(self.vendors), thread_name_prefix='quote-attempt')
+        self._hedges = 0
+        self._lock = threading.Lock()
+
+    def ranked_vendors(self) -> List[QuoteVendor]:
+        """按健康度排序: 未熔断的在前 (分数从高到低)，熔断中的排在最后作为兜底"""
+        now = time.monotonic()
+        order = {v.name: i for i, v in enumerate(self.vendors)}
+        return sorted(self.vendors, key=lambda v: (not self.health[v.name].available(now),
+                                                   -self.health[v.name].score, order[v.name]))
+
+    def _attempt(self, vendor: QuoteVendor, codes: Sequence[str],
+                 acquired: Optional[threading.Event] = None) -> Optional[pd.DataFrame]:
+        """
+        :param acquired: 通过流控闸门、真正发出请求时置位 (对冲计时从这里开始)
+        """
+        controller = self.controllers[vendor.name]
+        controller.acquire()
+        if acquired is not None:
+            acquired.set()
+        start = time.perf_counter()
+        try:
+            df = vendor.fetch(codes)
+        except Exception as e:
+            self.health[vendor.name].record((time.perf_counter() - start) * 1000, ok=False)
+            controller.on_failure(throttled=isinstance(e, QuoteThrottled))
+            logger.debug(f"行情数据源 {vendor.name} 批次请求失败: {e}")
+            return None
+        finally:
+            controller.release()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.health[vendor.name].record(elapsed_ms, ok=True)
+        controller.on_success(elapsed_ms, len(codes))
+        return df
+
+    def _fetch_chunk(self, codes: Sequence[str]) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+        """
+        获取一个批次，返回 (DataFrame, 数据源名称)；所有数据源都失败时返回 (None, None)。
+        """
+        queue = self.ranked_vendors()
+        pending: Dict[concurrent.futures.Future, QuoteVendor] = {}
+        acquired: Dict[concurrent.futures.Future, threading.Event] = {}
+
+        def launch():
+            vendor = queue.pop(0)
+            gate = threading.Event()
+            future = self._attempts.submit(self._attempt, vendor, codes, gate)
+            pending[future], acquired[future] = vendor, gate
+
+        launch()
+        while pending:
+            delay = None
+            if self.hedge and queue and len(pending) == 1:
+                future, vendor = next(iter(pending.items()))
+                delay = self.health[vendor.name].hedge_delay()
+                if delay is not None:
+                    # 在首选数据源的流控闸门前排队不算数据源延迟，对冲计时从请求真正发出后开始
+                    acquired[future].wait()
+            done, _ = concurrent.futures.wait(pending, timeout=delay,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            if not done:
+                # 超过首选数据源的 p95 仍未返回，对冲请求下一个数据源
+                with self._lock:
+                    self._hedges += 1
+                launch()
+                continue
+            for future in done:
+                vendor = pending.pop(future)
+                df = future.result()
+                if df is not None:
+                    return df, vendor.name
+            if not pending and queue:
+                # 故障转移
+                launch()
+        return None, None
+
+    def fetch(self, codes: List[str]) -> pd.DataFrame:
+        """
+        分批获取一组股票的实时行情。
+
+        :param codes: 腾讯格式代码列表，例如 ['sh600519', 'sz000001']
+        :return: DataFrame，字段见 QUOTE_COLUMNS
+        """
+        if not codes:
+            return pd.DataFrame(columns=QUOTE_COLUMNS)
+        # 按首选数据源当前的批次大小切分，在途请求数由各数据源的流控闸门限制
+        batch_size = self.controllers[self.ranked_vendors()[0].name].batch
+        chunks = [codes[i:i + batch_size] for i in range(0, len(codes), batch_size)]
+        hedges_before = self._hedges
+
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as executor:
+            results = list(executor.map(self._fetch_chunk, chunks))
+        elapsed = time.perf_counter() - start
+
+        frames = [df for df, _ in results if df is not None]
+        served = Counter(name for _, name in results if name is not None)
+        failed = len(chunks) - len(frames)
+        if failed:
+            logger.warning(f"行情扫描有 {failed}/{len(chunks)} 个批次在所有数据源上均失败。")
+
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=QUOTE_COLUMNS)
+        logger.info(f"行情扫描完成: {len(codes)} 只股票, {len(chunks)} 个批次, 获取 {len(df)} 条, "
+                    f"耗时 {elapsed:.2f}s, 数据源分布 {dict(served)}, 对冲 {self._hedges - hedges_before} 次。")
+        logger.debug(f"行情流控参数: { {name: c.stats() for name, c in self.controllers.items()} }")
+        if self.tuning:
+            self.tuning.save(self.controllers)
+        return df
+
+    def health_report(self) -> Dict[str, dict]:
+        """返回 {数据源: 健康度快照}"""
+        return {name: dict(health.snapshot(), **self.controllers[name].stats())
+                for name, health in self.health.items()}
+
+
+def build_vendors(names: Optional[Sequence[str]] = None) -> List[QuoteVendor]:
+    """
+    按名称构造数据源，默认取 config.QUOTE_SOURCE_VENDORS。
+    行情客户端不做 HTTP 层重试，失败直接交给故障转移处理。
+    """
+    registry = {
+        'tencent': lambda: QuoteVendor('tencent', http_clients.VendorClient('tencent-quote', max_retries=0),
+                                       "http://qt.gtimg.cn/q=", _parse_tencent),
+        'sina': lambda: QuoteVendor('sina', http_clients.VendorClient(
+            'sina-quote', headers={'Referer': 'http://finance.sina.com.cn/'}, max_retries=0),
+            "http://hq.sinajs.cn/list=", _parse_sina),
+    }
+    names = names or [n.strip() for n in config.QUOTE_SOURCE_VENDORS.split(',') if n.strip()]
+    return [registry[name]() for name in names]
+
+
+# 进程内共享实例，健康度在多次扫描之间累积，流控参数跨进程持久化
+default_source = QuoteSource(tuning_path=config.QUOTE_TUNING_PATH)
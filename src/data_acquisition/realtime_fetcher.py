@@ -1,28 +1,42 @@
 import time
-import json
 import redis
-import random
-import requests
+import numpy as np
 import pandas as pd
 import akshare as ak
-from datetime import datetime
 from src.config import config
 from src.logger import logger
+from src.data_acquisition import quote_source
+from src.data_storage.quote_store import QuoteStore
+from src.scheduling.trading_calendar import trading_calendar, market_now
 
 class RealtimeDataFetcher:
     """
-    实时行情获取器 (新浪财经版)。
+    实时行情获取器 (多数据源版)。
     
-    由于东方财富全量接口不可用，我们切换为使用新浪财经接口。
+    由于东方财富全量接口不可用，我们使用新浪 / 腾讯批量行情接口。
     策略：
     1. 获取全市场代码列表。
-    2. 将代码分批（每批约80个）。
-    3. 循环请求新浪接口并解析数据。
-    4. 推送到 Redis。
+    2. 交给 QuoteSource 分批（每批约80个）并发请求，批次失败时自动切换数据源，慢批次发出对冲请求。
+    3. 推送到 Redis。
+
+    流式模式 (streaming=True):
+    每个 tick 与上一 tick 做差分，只重写行情哈希中发生变化的股票，
+    并把增量写入 Redis Stream / Pub/Sub 频道，供下游实时消费。
+    行情哈希只定期续期 TTL，Redis 写入量随市场活跃度而非股票总数变化。
     """
 
-    def __init__(self, redis_host=None, redis_port=None, redis_db=None):
+    # 差分时忽略的字段: time 每个 tick 都可能刷新，name 不影响行情
+    DELTA_IGNORE_FIELDS = ('time', 'name')
+
+    def __init__(self, redis_host=None, redis_port=None, redis_db=None, streaming: bool = False):
         """初始化并连接 Redis"""
+        self.streaming = streaming
+        # 流式模式的差分状态: 上一 tick 的快照 (以 code 为索引)、上次 TTL 续期时间、全市场快照是否待重写
+        self._last_snapshot = None
+        self._last_keyframe = 0.0
+        self._snapshot_dirty = False
+        self._last_snapshot_write = 0.0
+        self.quote_source = quote_source.default_source
         try:
             host = redis_host or config.REDIS_HOST
             port = redis_port or config.REDIS_PORT
@@ -33,6 +47,7 @@ class RealtimeDataFetcher:
             )
             self.redis_client.ping()
             logger.info("成功连接到 Redis 服务器。")
+            self.quote_store = QuoteStore(self.redis_client)
             
             # 缓存股票代码列表，避免每次都重新获取
             self.all_stock_codes = []
@@ -81,135 +96,126 @@ class RealtimeDataFetcher:
         if not self.all_stock_codes:
             self._refresh_stock_list()
 
-        # 每次处理 80 只股票 (防止URL过长)
-        BATCH_SIZE = 80
-        total_stocks = len(self.all_stock_codes)
-        all_data = []
-        
         start_time = time.time()
-        
-        # 使用 requests Session 以复用连接，提升速度
-        session = requests.Session()
-        session.headers.update({'Referer': 'http://finance.sina.com.cn/'})
-
-        for i in range(0, total_stocks, BATCH_SIZE):
-            batch_codes = self.all_stock_codes[i : i + BATCH_SIZE]
-            try:
-                data = self._fetch_batch_sina(session, batch_codes)
-                all_data.extend(data)
-            except Exception as e:
-                logger.warning(f"批次 {i//BATCH_SIZE + 1} 获取失败: {e}")
-                continue
-            
-            # 极短的停顿，防止被封
-            # time.sleep(0.01) 
-
+        df = self.quote_source.fetch(self.all_stock_codes)
         elapsed = time.time() - start_time
         
-        if not all_data:
+        if df.empty:
             logger.warning("本轮未获取到任何有效行情数据。")
             return
 
-        df = pd.DataFrame(all_data)
+        df = self._to_exchange_codes(df)
         logger.info(f"全市场轮询完成: 获取 {len(df)} 条数据, 耗时 {elapsed:.2f}s。正在推送...")
+        logger.debug(f"行情数据源健康度: {self.quote_source.health_report()}")
         
-        self._push_to_redis(df)
+        if self.streaming:
+            self._publish_deltas(df)
+        else:
+            self._push_to_redis(df)
 
-    def _fetch_batch_sina(self, session, codes):
-        """请求新浪接口并解析结果"""
-        url = f"http://hq.sinajs.cn/list={','.join(codes)}"
-        resp = session.get(url, timeout=3)
-        
-        results = []
-        if resp.status_code != 200:
-            return results
-
-        # 解析响应文本
-        # 格式: var hq_str_sh601006="大秦铁路,6.670,6.680,6.690,6.720,6.660,6.680,6.690,25328063,169344164.000,...";
-        lines = resp.text.strip().split('\n')
-        for line in lines:
-            if not line or '=""' in line: # 忽略空数据
-                continue
-                
-            try:
-                # 提取代码
-                eq_idx = line.find('=')
-                code_with_prefix = line[11:eq_idx] # var hq_str_shxxxxxx
-                
-                # 提取数据部分
-                data_str = line[eq_idx+2 : -2] # 去掉 =" 和 ";
-                fields = data_str.split(',')
-                
-                if len(fields) < 30:
-                    continue
-                    
-                # 构造数据字典
-                # 0:名称, 1:开盘, 2:昨收, 3:最新, 4:最高, 5:最低
-                item = {
-                    'code': code_with_prefix[2:] + ('.SH' if code_with_prefix.startswith('sh') else '.SZ'), # 转换为 000001.SZ 格式
-                    'name': fields[0],
-                    'price': float(fields[3]),
-                    'open': float(fields[1]),
-                    'pre_close': float(fields[2]),
-                    'high': float(fields[4]),
-                    'low': float(fields[5]),
-                    'volume': float(fields[8]), # 股数
-                    'turnover': float(fields[9]), # 金额
-                    'time': f"{fields[30]} {fields[31]}", # 日期 + 时间
-                    
-                    # --- 五档盘口 (Bid/Ask) ---
-                    # 买盘 (Bid)
-                    'bid1_vol': float(fields[10]), 'bid1': float(fields[11]),
-                    'bid2_vol': float(fields[12]), 'bid2': float(fields[13]),
-                    'bid3_vol': float(fields[14]), 'bid3': float(fields[15]),
-                    'bid4_vol': float(fields[16]), 'bid4': float(fields[17]),
-                    'bid5_vol': float(fields[18]), 'bid5': float(fields[19]),
-                    
-                    # 卖盘 (Ask)
-                    'ask1_vol': float(fields[20]), 'ask1': float(fields[21]),
-                    'ask2_vol': float(fields[22]), 'ask2': float(fields[23]),
-                    'ask3_vol': float(fields[24]), 'ask3': float(fields[25]),
-                    'ask4_vol': float(fields[26]), 'ask4': float(fields[27]),
-                    'ask5_vol': float(fields[28]), 'ask5': float(fields[29]),
-                }
-                
-                # 计算涨跌幅
-                if item['pre_close'] > 0:
-                    item['change_pct'] = round((item['price'] - item['pre_close']) / item['pre_close'] * 100, 2)
-                else:
-                    item['change_pct'] = 0.0
-                    
-                results.append(item)
-                
-            except Exception:
-                continue
-                
-        return results
+    @staticmethod
+    def _to_exchange_codes(df: pd.DataFrame) -> pd.DataFrame:
+        """把数据源代码 (sh600519) 转换为 600519.SH 格式"""
+        symbols = df['code'].str
+        df['code'] = symbols[2:] + np.where(symbols.startswith('sh'), '.SH', '.SZ')
+        return df
 
     def _push_to_redis(self, df: pd.DataFrame):
-        """将行情数据写入 Redis"""
-        pipe = self.redis_client.pipeline()
-        count = 0
-        for _, row in df.iterrows():
-            key = f"quote:{row['code']}"
-            # 转换为JSON字符串
-            # 注意：Pandas Series 转 dict 后类型可能需要处理，这里简单处理
-            data = row.to_dict()
-            pipe.setex(key, 60, json.dumps(data))
-            count += 1
+        """将行情数据写入 Redis (整张行情哈希及快照原子替换)，分别统计编码与传输耗时"""
+        start = time.perf_counter()
+        pipe = self.redis_client.pipeline(transaction=True)
+        self.quote_store.replace_all(df, pipe=pipe)
+        encoded = time.perf_counter()
+        pipe.execute()
+        done = time.perf_counter()
+        logger.info(f"已推 {len(df)} 条数据至Redis (编码 {(encoded - start) * 1000:.1f}ms, "
+                    f"传输 {(done - encoded) * 1000:.1f}ms)")
+
+    def _diff_snapshot(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        与上一 tick 的快照做向量化差分，返回发生变化 (或新出现) 的行。
+        首个 tick 视为全部变化。
+        """
+        current = df.drop_duplicates(subset=['code'], keep='last').set_index('code')
+        previous = self._last_snapshot
+        self._last_snapshot = current
+
+        if previous is None:
+            return current.reset_index()
+
+        cols = [c for c in current.columns if c not in self.DELTA_IGNORE_FIELDS]
+        prev_aligned = previous.reindex(index=current.index, columns=cols)
+        cur_values = current[cols]
+        # NaN 与 NaN 视为相等；上一 tick 不存在的股票 (整行 NaN) 视为变化
+        changed = (cur_values != prev_aligned) & ~(cur_values.isna() & prev_aligned.isna())
+        return current[changed.any(axis=1)].reset_index()
+
+    def _publish_deltas(self, df: pd.DataFrame):
+        """
+        流式发布: 只写入变化的股票，并把增量追加到 Redis Stream、广播到 Pub/Sub 频道。
+        """
+        changed = self._diff_snapshot(df)
+        now = time.time()
+        keyframe_due = now - self._last_keyframe >= config.QUOTE_KEYFRAME_INTERVAL
+
+        start = time.perf_counter()
+        pipe = self.redis_client.pipeline(transaction=False)
+        if not changed.empty:
+            self.quote_store.upsert(changed, pipe=pipe)
+            self._snapshot_dirty = True
+        elif keyframe_due:
+            # 没有变化时只续期行情哈希，不重写内容
+            self.quote_store.touch(pipe)
+        if keyframe_due:
+            self._last_keyframe = now
+        # 快照是整个市场的一个二进制块 (约 1.4MB)，不随每个 tick 重写，有变化时按 QUOTE_SNAPSHOT_INTERVAL 节流
+        if self._snapshot_dirty and now - self._last_snapshot_write >= config.QUOTE_SNAPSHOT_INTERVAL:
+            self.quote_store.write_snapshot(self._last_snapshot.reset_index(), pipe)
+            self._snapshot_dirty, self._last_snapshot_write = False, now
+
+        if not changed.empty:
+            payload = changed.to_json(orient='records')
+            pipe.xadd(
+                config.QUOTE_STREAM_KEY,
+                {'ts': f"{now:.3f}", 'count': len(changed), 'data': payload},
+                maxlen=config.QUOTE_STREAM_MAXLEN,
+                approximate=True,
+            )
+            pipe.publish(config.QUOTE_CHANNEL, payload)
+
+        encoded = time.perf_counter()
         pipe.execute()
-        logger.info(f"已推 {count} 条数据至Redis")
+        done = time.perf_counter()
+        logger.info(f"增量发布: 变化 {len(changed)}/{len(self._last_snapshot)} 只"
+                    f"{'，已续期行情哈希' if keyframe_due else ''} "
+                    f"(编码 {(encoded - start) * 1000:.1f}ms, 传输 {(done - encoded) * 1000:.1f}ms)")
 
     def run(self, interval: int = 3):
-        """启动服务"""
-        logger.info(f"🚀 启动实时采集 (新浪源), PID: {pd.io.common.os.getpid()}")
+        """
+        启动服务。只在交易时段 (含开盘前预热和收盘后补齐) 轮询，开盘 / 收盘前后加密轮询，
+        其余时间按交易日历休眠到下一个交易时段。
+        """
+        mode = "流式增量" if self.streaming else "全量推送"
+        logger.info(f"🚀 启动实时采集 (多数据源, {mode}), PID: {pd.io.common.os.getpid()}")
         try:
             while True:
-                self.fetch_realtime_quotes()
-                time.sleep(interval)
+                if trading_calendar.is_trading_time(market_now(), config.SESSION_WAKE_LEAD,
+                                                    config.SESSION_CLOSE_GRACE):
+                    self.fetch_realtime_quotes()
+                delay = trading_calendar.sleep_seconds(market_now(), interval)
+                if delay > interval:
+                    logger.info(f"非交易时段，休眠 {delay / 60:.1f} 分钟至下一个交易时段。")
+                time.sleep(delay)
         except KeyboardInterrupt:
             logger.info("🛑 停止服务")
 
 if __name__ == '__main__':
-    fetcher = RealtimeDataFetcher()
-    fetcher.run(interval=3)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="实时行情采集器")
+    parser.add_argument('--stream', action='store_true', help="流式模式: 只发布变化的行情并写入增量流")
+    parser.add_argument('--interval', type=int, default=3, help="轮询间隔 (秒)")
+    args = parser.parse_args()
+
+    fetcher = RealtimeDataFetcher(streaming=args.stream)
+    fetcher.run(interval=args.interval)
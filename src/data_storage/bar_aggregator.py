@@ -0,0 +1,374 @@
+"""
+实时行情流 -> 多周期K线聚合。
+
+PersistenceService 只把最新快照写成每只股票一天一行的日K线，盘中走势全部丢失。
+这里消费实时采集器 (流式模式) 写入的 Redis Stream，在本地把 tick 聚合为 1/5/15/60 分钟K线，不需要额外请求数据源。
+
+实现要点:
+1. 时间按 "交易分钟" 编号: 日序号 * 240 + 当日第几个交易分钟 (上午 0-119，下午 120-239)。
+   各周期的K线边界都落在交易分钟上，午休自然被跳过，60 分钟K线为 9:30/10:30/13:00/14:00 四根。
+2. 每个周期一组按股票行排列的 NumPy 数组: 当前未完成K线的 OHLCV，以及已完成K线的环形缓冲区 (行 × 容量)。
+   一次快照中的所有股票用数组下标整体更新，不逐只股票循环。
+3. 行情中的成交量是当日累计值。K线成交量 = 最新累计量 - K线开始前的累计量。
+4. 某只股票的新 tick 落入更晚的K线，或者行情时钟 (批次中最新的时间 / 墙上时钟) 越过K线终点时，该K线完成。
+   完成的K线进入待写队列，由 BarAggregationService 批量写入 stock_intraday_bar。
+"""
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import redis
+
+from src.config import config
+from src.logger import logger
+from src.data_storage import database, crud
+from src.scheduling.trading_calendar import market_now
+
+# 每个交易日的交易分钟数，上午 120 分钟
+TRADING_MINUTES = 240
+MORNING_MINUTES = 120
+MORNING_OPEN = (9 * 60 + 30) * 60
+MORNING_CLOSE = (11 * 60 + 30) * 60
+AFTERNOON_OPEN = 13 * 60 * 60
+AFTERNOON_CLOSE = 15 * 60 * 60
+NS_PER_DAY = 86400 * 10 ** 9
+# 环形缓冲区的最小容量 (长周期按时间跨度折算后不少于该根数)
+MIN_RING_CAPACITY = 16
+# 墙上时钟关闭K线时的宽限 (秒)，给收盘后才到达的最后一笔快照留出时间
+CLOSE_GRACE_SECONDS = 10
+
+BAR_COLUMNS = ['time', 'code', 'period', 'open', 'high', 'low', 'close', 'volume']
+
+
+def trading_minute_keys(times) -> np.ndarray:
+    """
+    把行情时间转换为绝对交易分钟序号。
+    集合竞价 (9:30 之前) 计入第一分钟，午休和收盘之后的快照计入各自时段的最后一分钟。
+    """
+    # pandas 2 可能按秒/微秒精度存储时间，统一换算为纳秒
+    ns = pd.DatetimeIndex(times).values.astype('datetime64[ns]').astype(np.int64)
+    day = ns // NS_PER_DAY
+    sec = (ns - day * NS_PER_DAY) // 10 ** 9
+    minute = np.select(
+        [sec < MORNING_CLOSE, sec < AFTERNOON_OPEN, sec < AFTERNOON_CLOSE],
+        [(sec - MORNING_OPEN) // 60, MORNING_MINUTES - 1, MORNING_MINUTES + (sec - AFTERNOON_OPEN) // 60],
+        TRADING_MINUTES - 1,
+    )
+    return day * TRADING_MINUTES + np.clip(minute, 0, TRADING_MINUTES - 1)
+
+
+def session_clock_key(now: datetime) -> int:
+    """
+    墙上时钟对应的交易分钟序号，用于关闭长时间没有新 tick 的K线。
+    午休时返回下午第一分钟，收盘后返回下一交易日的第 0 分钟，使上午 / 全天的最后一根K线能够完成。
+    """
+    now = now - timedelta(seconds=CLOSE_GRACE_SECONDS)
+    key = int(trading_minute_keys([now])[0])
+    sec = now.hour * 3600 + now.minute * 60 + now.second
+    if MORNING_CLOSE <= sec < AFTERNOON_OPEN:
+        return key - key % TRADING_MINUTES + MORNING_MINUTES
+    if sec >= AFTERNOON_CLOSE:
+        return key - key % TRADING_MINUTES + TRADING_MINUTES
+    return key
+
+
+def keys_to_times(keys: np.ndarray) -> pd.DatetimeIndex:
+    """交易分钟序号 -> K线起始时间"""
+    day, minute = np.divmod(np.asarray(keys, dtype=np.int64), TRADING_MINUTES)
+    clock = np.where(minute < MORNING_MINUTES, MORNING_OPEN // 60 + minute,
+                     AFTERNOON_OPEN // 60 + minute - MORNING_MINUTES)
+    return pd.DatetimeIndex(day * NS_PER_DAY + clock * 60 * 10 ** 9)
+
+
+class _PeriodBars:
+    """单个周期的K线状态: 当前K线 (每行一根) + 已完成K线的环形缓冲区"""
+
+    def __init__(self, period: int, rows: int, capacity: int):
+        self.period = period
+        self.capacity = capacity
+        self.bucket = np.full(rows, -1, dtype=np.int64)
+        self.is_open = np.zeros(rows, dtype=bool)
+        self.ohlc = np.full((rows, 4), np.nan)
+        self.base = np.zeros(rows)
+        self.volume = np.zeros(rows)
+        self.ring_key = np.full((rows, capacity), -1, dtype=np.int64)
+        self.ring_ohlcv = np.full((rows, capacity, 5), np.nan)
+        self.ring_count = np.zeros(rows, dtype=np.int64)
+
+    def grow(self, rows: int):
+        extra = rows - len(self.bucket)
+        if extra <= 0:
+            return
+        self.bucket = np.concatenate([self.bucket, np.full(extra, -1, dtype=np.int64)])
+        self.is_open = np.concatenate([self.is_open, np.zeros(extra, dtype=bool)])
+        self.ohlc = np.concatenate([self.ohlc, np.full((extra, 4), np.nan)])
+        self.base = np.concatenate([self.base, np.zeros(extra)])
+        self.volume = np.concatenate([self.volume, np.zeros(extra)])
+        self.ring_key = np.concatenate([self.ring_key, np.full((extra, self.capacity), -1, dtype=np.int64)])
+        self.ring_ohlcv = np.concatenate([self.ring_ohlcv, np.full((extra, self.capacity, 5), np.nan)])
+        self.ring_count = np.concatenate([self.ring_count, np.zeros(extra, dtype=np.int64)])
+
+    def bucket_of(self, keys: np.ndarray) -> np.ndarray:
+        day, minute = np.divmod(keys, TRADING_MINUTES)
+        return day * TRADING_MINUTES + minute // self.period * self.period
+
+    def close(self, rows: np.ndarray) -> Optional[dict]:
+        """完成这些行的当前K线: 写入环形缓冲区并返回 {字段: 数组}"""
+        rows = rows[self.is_open[rows]]
+        if len(rows) == 0:
+            return None
+        keys = self.bucket[rows]
+        ohlcv = np.column_stack([self.ohlc[rows], self.volume[rows]])
+        pos = self.ring_count[rows] % self.capacity
+        self.ring_key[rows, pos] = keys
+        self.ring_ohlcv[rows, pos] = ohlcv
+        self.ring_count[rows] += 1
+        self.is_open[rows] = False
+        return {'rows': rows, 'keys': keys, 'ohlcv': ohlcv}
+
+    def update(self, rows: np.ndarray, keys: np.ndarray, price: np.ndarray, cum: np.ndarray,
+               prev_cum: np.ndarray) -> Optional[dict]:
+        """用一批 tick (每行至多一个) 更新当前K线，返回因进入新K线而完成的K线"""
+        bucket = self.bucket_of(keys)
+        current = self.bucket[rows]
+        new = bucket > current
+        same = (bucket == current) & self.is_open[rows]
+
+        finished = self.close(rows[new])
+
+        r = rows[new]
+        self.bucket[r] = bucket[new]
+        self.ohlc[r] = price[new, None]
+        self.base[r] = prev_cum[new]
+        self.volume[r] = np.maximum(cum[new] - prev_cum[new], 0.0)
+        self.is_open[r] = True
+
+        r, p = rows[same], price[same]
+        self.ohlc[r, 1] = np.maximum(self.ohlc[r, 1], p)
+        self.ohlc[r, 2] = np.minimum(self.ohlc[r, 2], p)
+        self.ohlc[r, 3] = p
+        self.volume[r] = np.maximum(cum[same] - self.base[r], 0.0)
+        return finished
+
+    def expire(self, clock_key: int) -> Optional[dict]:
+        """关闭终点已经过去的K线 (clock_key 所在K线之前的所有K线)"""
+        clock_bucket = self.bucket_of(np.array([clock_key]))[0]
+        return self.close(np.flatnonzero(self.is_open & (self.bucket < clock_bucket)))
+
+
+class BarAggregator:
+    """
+    多周期K线聚合器 (非线程安全，由单个消费线程驱动)。
+
+    用法:
+        agg = BarAggregator(periods=(1, 5))
+        agg.update(ticks)            # DataFrame['code', 'time', 'price', 'volume']
+        done = agg.drain()           # 已完成、待写库的K线
+        recent = agg.bars('sh600519', period=5, n=48)
+    """
+
+    def __init__(self, periods: Optional[Sequence[int]] = None, capacity: Optional[int] = None):
+        """
+        :param periods: 聚合周期 (分钟)，默认 config.BAR_PERIODS
+        :param capacity: 每只股票在内存中保留的 1 分钟K线数，其他周期按相同的时间跨度折算 (至少 MIN_RING_CAPACITY 根)
+        """
+        if periods is None:
+            periods = [int(p) for p in config.BAR_PERIODS.split(',') if p.strip()]
+        capacity = capacity or config.BAR_RING_CAPACITY
+        self.codes: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._last_cum = np.full(0, np.nan)
+        self._last_day = np.full(0, -1, dtype=np.int64)
+        self._periods = {p: _PeriodBars(p, 0, max(capacity // p, MIN_RING_CAPACITY)) for p in periods}
+        self._pending: List[pd.DataFrame] = []
+
+    @property
+    def periods(self) -> List[int]:
+        return list(self._periods)
+
+    def _rows_for(self, codes: np.ndarray) -> np.ndarray:
+        for code in codes:
+            if code not in self._rows:
+                self._rows[code] = len(self.codes)
+                self.codes.append(code)
+        n = len(self.codes)
+        if n > len(self._last_cum):
+            # 按倍数扩容，避免股票陆续出现时频繁复制
+            rows = max(n, 2 * len(self._last_cum), 64)
+            extra = rows - len(self._last_cum)
+            self._last_cum = np.concatenate([self._last_cum, np.full(extra, np.nan)])
+            self._last_day = np.concatenate([self._last_day, np.full(extra, -1, dtype=np.int64)])
+            for bars in self._periods.values():
+                bars.grow(rows)
+        return np.fromiter((self._rows[c] for c in codes), dtype=np.int64, count=len(codes))
+
+    def _collect(self, period: int, finished: Optional[dict]):
+        if not finished:
+            return
+        ohlcv = finished['ohlcv']
+        self._pending.append(pd.DataFrame({
+            'time': keys_to_times(finished['keys']),
+            'code': np.asarray(self.codes, dtype=object)[finished['rows']],
+            'period': period,
+            'open': ohlcv[:, 0], 'high': ohlcv[:, 1], 'low': ohlcv[:, 2], 'close': ohlcv[:, 3],
+            'volume': np.rint(ohlcv[:, 4]).astype(np.int64),
+        }))
+
+    def update(self, ticks: pd.DataFrame) -> int:
+        """
+        处理一次快照 (同一只股票至多一行)。
+
+        :param ticks: DataFrame['code', 'time', 'price', 'volume']，volume 为当日累计成交量
+        :return: 本次完成的K线数
+        """
+        pending_before = sum(len(df) for df in self._pending)
+        ticks = ticks[(ticks['price'] > 0) & ticks['time'].notna()]
+        if ticks.empty:
+            return 0
+        ticks = ticks.drop_duplicates(subset='code', keep='last')
+
+        rows = self._rows_for(ticks['code'].to_numpy())
+        keys = trading_minute_keys(pd.to_datetime(ticks['time']))
+        price = ticks['price'].to_numpy(dtype=float)
+        cum = ticks['volume'].to_numpy(dtype=float)
+        day = keys // TRADING_MINUTES
+
+        # 同一交易日沿用上一 tick 的累计量；新的一天从 0 开始；首次见到的股票只能从当前累计量开始计
+        last_day = self._last_day[rows]
+        prev_cum = np.where(last_day == day, self._last_cum[rows], np.where(last_day < 0, cum, 0.0))
+        prev_cum = np.where(np.isnan(prev_cum), cum, prev_cum)
+
+        for period, bars in self._periods.items():
+            self._collect(period, bars.update(rows, keys, price, cum, prev_cum))
+        self.expire(int(keys.max()))
+
+        self._last_cum[rows] = cum
+        self._last_day[rows] = day
+        return sum(len(df) for df in self._pending) - pending_before
+
+    def expire(self, clock_key: int):
+        """按行情时钟关闭终点已过的K线 (没有新 tick 的股票依靠它完成K线)"""
+        for period, bars in self._periods.items():
+            self._collect(period, bars.expire(clock_key))
+
+    def drain(self) -> pd.DataFrame:
+        """取出所有已完成、尚未写库的K线"""
+        if not self._pending:
+            return pd.DataFrame(columns=BAR_COLUMNS)
+        df = pd.concat(self._pending, ignore_index=True)
+        self._pending = []
+        return df
+
+    @property
+    def pending_rows(self) -> int:
+        return sum(len(df) for df in self._pending)
+
+    def bars(self, code: str, period: int, n: Optional[int] = None, include_current: bool = False) -> pd.DataFrame:
+        """
+        读取内存中某只股票最近的K线。
+
+        :param n: 最多返回的已完成K线数，默认缓冲区中的全部
+        :param include_current: 是否附带当前尚未完成的K线
+        :return: DataFrame['time', 'open', 'high', 'low', 'close', 'volume']
+        """
+        columns = ['time', 'open', 'high', 'low', 'close', 'volume']
+        row = self._rows.get(code)
+        if row is None or period not in self._periods:
+            return pd.DataFrame(columns=columns)
+        bars = self._periods[period]
+        count = int(bars.ring_count[row])
+        k = min(count, bars.capacity, n if n is not None else bars.capacity)
+        idx = np.arange(count - k, count) % bars.capacity
+        keys = bars.ring_key[row, idx]
+        ohlcv = bars.ring_ohlcv[row, idx]
+        if include_current and bars.is_open[row]:
+            keys = np.append(keys, bars.bucket[row])
+            ohlcv = np.vstack([ohlcv, np.append(bars.ohlc[row], bars.volume[row])])
+        return pd.DataFrame({
+            'time': keys_to_times(keys),
+            'open': ohlcv[:, 0], 'high': ohlcv[:, 1], 'low': ohlcv[:, 2], 'close': ohlcv[:, 3],
+            'volume': ohlcv[:, 4],
+        })
+
+
+class BarAggregationService:
+    """
+    聚合服务: 阻塞读取实时行情 Stream，驱动 BarAggregator，并把完成的K线批量写入数据库。
+    需要实时采集器以流式模式运行 (realtime_fetcher --stream)。
+    """
+
+    def __init__(self, aggregator: Optional[BarAggregator] = None, from_start: bool = False):
+        """
+        :param aggregator: 聚合器，默认按配置新建
+        :param from_start: 从 Stream 中保留的最早一条开始消费 (重启后补回当前K线)，默认只消费新数据
+        """
+        self.aggregator = aggregator or BarAggregator()
+        self.redis_client = redis.Redis(host=config.REDIS_HOST, port=config.REDIS_PORT,
+                                        db=config.REDIS_DB, decode_responses=True)
+        self.SessionLocal = database.SessionLocal
+        self.last_id = '0' if from_start else '$'
+        self._last_flush = time.monotonic()
+
+    @staticmethod
+    def _to_ticks(records: list) -> pd.DataFrame:
+        """Stream 中的行情 (600519.SH 格式) -> 聚合器输入 (sh600519 格式)"""
+        df = pd.DataFrame(records, columns=['code', 'time', 'price', 'volume'])
+        codes = df['code'].astype(str)
+        df['code'] = np.where(codes.str.endswith('.SH'), 'sh', 'sz') + codes.str[:6]
+        df['time'] = pd.to_datetime(df['time'], errors='coerce')
+        return df
+
+    def flush(self):
+        """把已完成的K线写入数据库"""
+        bars = self.aggregator.drain()
+        self._last_flush = time.monotonic()
+        if bars.empty:
+            return
+        bars['time'] = bars['time'].dt.tz_localize(config.MARKET_TIMEZONE)
+        db = self.SessionLocal()
+        try:
+            crud.bulk_upsert_intraday_bars(db, bars[BAR_COLUMNS].to_dict(orient='records'))
+            logger.info(f"多周期K线写库: {len(bars)} 根。")
+        except Exception as e:
+            logger.error(f"多周期K线写库失败，本批 {len(bars)} 根K线丢弃: {e}")
+        finally:
+            db.close()
+
+    def poll_once(self, block_ms: int = 1000):
+        """读取一批 Stream 消息并聚合，必要时写库"""
+        response = self.redis_client.xread({config.QUOTE_STREAM_KEY: self.last_id}, count=100, block=block_ms)
+        for _, entries in response or []:
+            for entry_id, fields in entries:
+                self.last_id = entry_id
+                try:
+                    self.aggregator.update(self._to_ticks(json.loads(fields['data'])))
+                except Exception as e:
+                    logger.warning(f"聚合行情消息 {entry_id} 失败: {e}")
+
+        # 行情停止推送 (午休、收盘) 时依靠墙上时钟完成K线
+        self.aggregator.expire(session_clock_key(market_now()))
+        if self.aggregator.pending_rows >= config.BAR_FLUSH_ROWS \
+                or time.monotonic() - self._last_flush >= config.BAR_FLUSH_INTERVAL:
+            self.flush()
+
+    def run(self):
+        logger.info(f"🚀 启动多周期K线聚合 (周期 {self.aggregator.periods} 分钟)...")
+        try:
+            while True:
+                self.poll_once()
+        except KeyboardInterrupt:
+            self.flush()
+            logger.info("🛑 多周期K线聚合已停止。")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="实时行情多周期K线聚合")
+    parser.add_argument('--from-start', action='store_true', help="从 Stream 中最早的消息开始消费")
+    args = parser.parse_args()
+
+    BarAggregationService(from_start=args.from_start).run()
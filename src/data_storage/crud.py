@@ -1,11 +1,27 @@
-from typing import List, Dict
+import io
+from typing import List, Dict, Union
 import pandas as pd
+from sqlalchemy import func, any_, bindparam, text
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import Session
 from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.types import String, Date
 
 from . import models, database
+from src.config import config
 from src.logger import logger
 
+# stock_daily_kline 的列顺序 (COPY 与 INSERT ... SELECT 共用)
+KLINE_COLUMNS = ['time', 'code', 'open', 'high', 'low', 'close', 'volume', 'turnover']
+# Upsert 时需要刷新的列
+KLINE_UPDATE_COLUMNS = ['open', 'high', 'low', 'close', 'volume', 'turnover']
+# stock_minute_kline 的列顺序
+MINUTE_COLUMNS = ['time', 'code', 'open', 'high', 'low', 'close', 'volume']
+# stock_intraday_bar 的列顺序
+INTRADAY_BAR_COLUMNS = ['time', 'code', 'period', 'open', 'high', 'low', 'close', 'volume']
+# COPY 使用的会话级临时表 (每个数据库连接一张，提交时自动清空)
+KLINE_STAGING_TABLE = 'stock_daily_kline_staging'
+
 def get_or_create_stock(db: Session, stock_code: str, stock_name: str, market: str, ipo_date: pd.Timestamp):
     """
     根据股票代码获取或创建股票记录。
@@ -91,6 +107,183 @@ def get_stock_names(db: Session, codes: List[str]) -> Dict[str, str]:
         logger.error(f"获取股票名称失败: {e}")
         return {}
 
+def get_latest_kline_times(db: Session) -> Dict[str, pd.Timestamp]:
+    """
+    一次查询获取每只股票已入库的最新日K线时间 (水位线)，用于增量同步。
+
+    :param db: 数据库会话
+    :return: 字典 {code: 最新K线时间}，没有任何K线的股票不在其中
+    """
+    try:
+        results = db.query(models.StockDailyKline.code, func.max(models.StockDailyKline.time))\
+            .group_by(models.StockDailyKline.code).all()
+        return {code: pd.Timestamp(latest) for code, latest in results}
+    except Exception as e:
+        logger.error(f"查询K线水位线失败: {e}")
+        return {}
+
+def get_earliest_kline_times(db: Session, codes: List[str]) -> Dict[str, pd.Timestamp]:
+    """
+    一次查询获取若干股票已入库的最早日K线时间，用于按已有历史的长度重新拉取。
+
+    :param db: 数据库会话
+    :param codes: 股票代码列表
+    :return: 字典 {code: 最早K线时间}，没有任何K线的股票不在其中
+    """
+    if not codes:
+        return {}
+    try:
+        results = db.query(models.StockDailyKline.code, func.min(models.StockDailyKline.time))\
+            .filter(models.StockDailyKline.code.in_(list(codes)))\
+            .group_by(models.StockDailyKline.code).all()
+        return {code: pd.Timestamp(earliest) for code, earliest in results}
+    except Exception as e:
+        logger.error(f"查询最早K线时间失败: {e}")
+        return {}
+
+def get_stock_ipo_dates(db: Session, codes: List[str]) -> Dict[str, pd.Timestamp]:
+    """
+    批量获取股票的上市日期，未知的不在结果中。
+
+    :param db: 数据库会话
+    :param codes: 股票代码列表
+    :return: 字典 {code: 上市日期}
+    """
+    if not codes:
+        return {}
+    try:
+        results = db.query(models.Stock.code, models.Stock.ipo_date)\
+            .filter(models.Stock.code.in_(codes), models.Stock.ipo_date.isnot(None)).all()
+        return {code: pd.Timestamp(ipo_date) for code, ipo_date in results}
+    except Exception as e:
+        logger.error(f"查询上市日期失败: {e}")
+        return {}
+
+def update_stock_ipo_dates(db: Session, ipo_dates: Dict[str, pd.Timestamp]):
+    """
+    回填已知股票的上市日期 (只更新原本为空的记录)。
+
+    :param db: 数据库会话
+    :param ipo_dates: 字典 {code: 上市日期}
+    """
+    if not ipo_dates:
+        return
+    try:
+        for code, ipo_date in ipo_dates.items():
+            db.query(models.Stock)\
+                .filter(models.Stock.code == code, models.Stock.ipo_date.is_(None))\
+                .update({models.Stock.ipo_date: ipo_date.date()}, synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        logger.error(f"回填上市日期失败: {e}")
+        db.rollback()
+
+def get_daily_klines(db: Session, codes: List[str], start: pd.Timestamp = None,
+                     end: pd.Timestamp = None) -> pd.DataFrame:
+    """
+    一次查询读取多只股票在 [start, end] 区间内的日K线 (WHERE code = ANY(...))。
+
+    :param db: 数据库会话
+    :param codes: 股票代码列表
+    :param start: 开始时间 (含)，None 表示不限
+    :param end: 结束时间 (含)，None 表示不限
+    :return: 长表 DataFrame，列见 KLINE_COLUMNS，按 (code, time) 排序，time 为不带时区的日期
+    """
+    if not codes:
+        return pd.DataFrame(columns=KLINE_COLUMNS)
+    try:
+        table = models.StockDailyKline
+        query = db.query(*[getattr(table, c) for c in KLINE_COLUMNS])\
+            .filter(table.code == any_(bindparam('codes', list(codes), type_=ARRAY(String))))
+        if start is not None:
+            query = query.filter(table.time >= start)
+        if end is not None:
+            query = query.filter(table.time <= end)
+        rows = query.order_by(table.code, table.time).all()
+    except Exception as e:
+        logger.error(f"查询日K线失败: {e}")
+        db.rollback()
+        return pd.DataFrame(columns=KLINE_COLUMNS)
+
+    df = pd.DataFrame(rows, columns=KLINE_COLUMNS)
+    if not df.empty:
+        # timestamptz 按会话时区返回，去掉时区后与写入时的本地日期一致
+        df['time'] = pd.to_datetime(df['time'])
+        if df['time'].dt.tz is not None:
+            df['time'] = df['time'].dt.tz_localize(None)
+    return df
+
+# 缺口扫描: 每只股票从最早一根K线起，对照交易日列表找出库中缺失的交易日。
+# 没有任何K线的股票返回一行 day 为 NULL。
+MISSING_DAILY_BARS_SQL = text("""
+WITH days AS (
+    SELECT unnest(:days) AS day
+),
+firsts AS (
+    SELECT c.code, CAST(min(k.time) AS date) AS first_day
+    FROM unnest(:codes) AS c(code)
+    LEFT JOIN stock_daily_kline k ON k.code = c.code
+    GROUP BY c.code
+),
+stored AS (
+    SELECT code, CAST(time AS date) AS day
+    FROM stock_daily_kline
+    WHERE code = ANY(:codes) AND time >= :start
+)
+SELECT f.code, d.day
+FROM firsts f
+LEFT JOIN days d ON d.day >= f.first_day
+LEFT JOIN stored s ON s.code = f.code AND s.day = d.day
+WHERE f.first_day IS NULL OR (d.day IS NOT NULL AND s.code IS NULL)
+ORDER BY f.code, d.day
+""").bindparams(bindparam('codes', type_=ARRAY(String)), bindparam('days', type_=ARRAY(Date)))
+
+def get_missing_daily_bars(db: Session, codes: List[str], trade_days: List) -> pd.DataFrame:
+    """
+    一条 SQL 找出每只股票在 trade_days 中缺失的日K线 (只统计该股票最早一根K线之后的交易日)。
+
+    :param db: 数据库会话
+    :param codes: 股票代码列表
+    :param trade_days: 应有K线的交易日 (升序的 date 列表)
+    :return: DataFrame ['code', 'day']；库中没有任何K线的股票 day 为 NaT
+    """
+    if not codes or not trade_days:
+        return pd.DataFrame(columns=['code', 'day'])
+    try:
+        rows = db.execute(MISSING_DAILY_BARS_SQL, {
+            'codes': list(codes), 'days': list(trade_days), 'start': pd.Timestamp(trade_days[0]),
+        }).fetchall()
+    except Exception as e:
+        logger.error(f"扫描日K线缺口失败: {e}")
+        db.rollback()
+        return pd.DataFrame(columns=['code', 'day'])
+    df = pd.DataFrame(rows, columns=['code', 'day'])
+    df['day'] = pd.to_datetime(df['day'])
+    return df
+
+def delete_daily_klines(db: Session, codes: List[str]) -> int:
+    """
+    删除若干股票的全部日K线。前复权价格基准变化 (除权除息) 后，库中旧基准的K线整体作废，
+    调用方随后写入按新基准重新拉取的K线。
+
+    :param db: 数据库会话
+    :param codes: 股票代码列表
+    :return: 删除的行数
+    """
+    if not codes:
+        return 0
+    try:
+        deleted = db.query(models.StockDailyKline)\
+            .filter(models.StockDailyKline.code.in_(list(codes)))\
+            .delete(synchronize_session=False)
+        db.commit()
+        logger.info(f"已删除 {len(codes)} 只股票的 {deleted} 条旧价格基准日K线。")
+        return deleted
+    except Exception as e:
+        logger.error(f"删除日K线失败: {e}")
+        db.rollback()
+        raise
+
 def bulk_save_daily_kline(db: Session, kline_data: List[dict]):
     """
     批量保存日线行情数据。
@@ -104,6 +297,11 @@ def bulk_save_daily_kline(db: Session, kline_data: List[dict]):
         logger.warning("尝试批量保存K线数据，但列表为空。")
         return
 
+    # 数据量较大时改走 COPY 通道，避免生成巨大的 INSERT 语句
+    if len(kline_data) >= config.KLINE_COPY_THRESHOLD:
+        copy_load_daily_kline(db, kline_data, upsert=False)
+        return
+
     try:
         # 使用 SQLAlchemy Core 的 insert() 结合 PostgreSQL 的 on_conflict_do_nothing
         stmt = pg_insert(models.StockDailyKline).values(kline_data)
@@ -131,6 +329,11 @@ def bulk_upsert_daily_kline(db: Session, kline_data: List[dict]):
     if not kline_data:
         return
 
+    # 数据量较大时改走 COPY 通道，避免生成巨大的 INSERT 语句
+    if len(kline_data) >= config.KLINE_COPY_THRESHOLD:
+        copy_load_daily_kline(db, kline_data, upsert=True)
+        return
+
     try:
         stmt = pg_insert(models.StockDailyKline).values(kline_data)
         
@@ -159,6 +362,170 @@ def bulk_upsert_daily_kline(db: Session, kline_data: List[dict]):
         db.rollback()
         raise
 
+def _copy_rows(cursor, table: str, columns: List[str], buffer: io.StringIO):
+    """通过 COPY FROM STDIN 写入 CSV 数据，兼容 psycopg2 (copy_expert) 与 psycopg3 (copy)"""
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    if hasattr(cursor, 'copy_expert'):
+        cursor.copy_expert(sql, buffer)
+    else:
+        with cursor.copy(sql) as copy:
+            copy.write(buffer.getvalue())
+
+def copy_load_daily_kline(db: Session, kline_data: Union[List[dict], pd.DataFrame], upsert: bool = False,
+                          chunk_rows: int = None) -> int:
+    """
+    基于 PostgreSQL COPY 的日K线批量写入。
+
+    每个分块的流程:
+    1. COPY 到会话级临时表 (ON COMMIT DELETE ROWS，提交后自动清空)。
+    2. 一条 INSERT ... SELECT ... ON CONFLICT 合并到 stock_daily_kline。
+    3. 提交。
+    相比 pg_insert(...).values(list_of_dicts)，不需要编译巨大的 SQL，也不受绑定参数数量限制。
+
+    :param db: 数据库会话
+    :param kline_data: 字典列表或 DataFrame，字段见 KLINE_COLUMNS
+    :param upsert: True 时冲突行更新价格和成交量 (同 bulk_upsert_daily_kline)，False 时忽略 (同 bulk_save_daily_kline)
+    :param chunk_rows: 每个分块的行数，默认 config.KLINE_COPY_CHUNK_ROWS
+    :return: 写入 (或更新) 的行数
+    """
+    df = kline_data if isinstance(kline_data, pd.DataFrame) else pd.DataFrame(kline_data)
+    if df.empty:
+        return 0
+
+    chunk_rows = chunk_rows or config.KLINE_COPY_CHUNK_ROWS
+    df = df[KLINE_COLUMNS].copy()
+    # 同一条语句中重复的主键会导致 ON CONFLICT DO UPDATE 报错，保留最后一条
+    df = df.drop_duplicates(subset=['time', 'code'], keep='last')
+    # volume 列为 BIGINT，COPY 不接受 "1000.0" 这样的文本
+    df['volume'] = df['volume'].round().astype('Int64')
+
+    columns = ', '.join(KLINE_COLUMNS)
+    if upsert:
+        updates = ', '.join(f"{c} = EXCLUDED.{c}" for c in KLINE_UPDATE_COLUMNS)
+        conflict = f"ON CONFLICT (time, code) DO UPDATE SET {updates}"
+    else:
+        conflict = "ON CONFLICT (time, code) DO NOTHING"
+    merge_sql = (f"INSERT INTO {models.StockDailyKline.__tablename__} ({columns}) "
+                 f"SELECT {columns} FROM {KLINE_STAGING_TABLE} {conflict}")
+
+    affected = 0
+    try:
+        for start in range(0, len(df), chunk_rows):
+            chunk = df.iloc[start:start + chunk_rows]
+            buffer = io.StringIO()
+            chunk.to_csv(buffer, index=False, header=False)
+            buffer.seek(0)
+
+            cursor = db.connection().connection.dbapi_connection.cursor()
+            try:
+                cursor.execute(
+                    f"CREATE TEMP TABLE IF NOT EXISTS {KLINE_STAGING_TABLE} "
+                    f"(LIKE {models.StockDailyKline.__tablename__} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+                )
+                _copy_rows(cursor, KLINE_STAGING_TABLE, KLINE_COLUMNS, buffer)
+                cursor.execute(merge_sql)
+                affected += max(cursor.rowcount, 0)
+            finally:
+                cursor.close()
+            db.commit()
+
+        logger.info(f"COPY 批量{'更新' if upsert else '保存'} {len(df)} 条K线数据 "
+                    f"(实际写入 {affected} 条, {-(-len(df) // chunk_rows)} 个分块)。")
+        return affected
+
+    except Exception as e:
+        logger.error(f"COPY 批量写入K线数据时发生错误: {e}")
+        db.rollback()
+        raise
+
+def bulk_upsert_minute_kline(db: Session, minute_data: List[dict]):
+    """
+    批量更新或插入分钟行情 (Upsert)。
+    盘中最后一根分钟K线仍在变化，采集器每轮都会带上它重新写入。
+    """
+    if not minute_data:
+        return
+    try:
+        stmt = pg_insert(models.StockMinuteKline).values(minute_data)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['time', 'code'],
+            set_={c: getattr(stmt.excluded, c) for c in MINUTE_COLUMNS[2:]}
+        )
+        db.execute(stmt)
+        db.commit()
+        logger.debug(f"成功写入(Upsert) {len(minute_data)} 条分钟K线数据。")
+    except Exception as e:
+        logger.error(f"批量Upsert分钟K线数据错误: {e}")
+        db.rollback()
+        raise
+
+def get_minute_klines(db: Session, code: str, start: pd.Timestamp = None,
+                      end: pd.Timestamp = None) -> pd.DataFrame:
+    """
+    读取单只股票在 [start, end] 区间内的分钟K线。
+
+    :return: DataFrame，列见 MINUTE_COLUMNS，按 time 排序，time 为不带时区的本地时间
+    """
+    table = models.StockMinuteKline
+    query = db.query(*[getattr(table, c) for c in MINUTE_COLUMNS]).filter(table.code == code)
+    if start is not None:
+        query = query.filter(table.time >= start)
+    if end is not None:
+        query = query.filter(table.time <= end)
+    df = pd.DataFrame(query.order_by(table.time).all(), columns=MINUTE_COLUMNS)
+    if not df.empty:
+        df['time'] = pd.to_datetime(df['time'])
+        if df['time'].dt.tz is not None:
+            df['time'] = df['time'].dt.tz_convert(config.MARKET_TIMEZONE).dt.tz_localize(None)
+    return df
+
+def get_latest_minute_times(db: Session, codes: List[str], since: pd.Timestamp) -> Dict[str, pd.Timestamp]:
+    """
+    查询每只股票在 since 之后最新一根分钟K线的时间 (只扫描最近的分块)。
+
+    :return: 字典 {code: 本地时间}，since 之后没有数据的股票不在其中
+    """
+    if not codes:
+        return {}
+    table = models.StockMinuteKline
+    try:
+        rows = db.query(table.code, func.max(table.time))\
+            .filter(table.code == any_(bindparam('codes', list(codes), type_=ARRAY(String))))\
+            .filter(table.time >= since)\
+            .group_by(table.code).all()
+    except Exception as e:
+        logger.error(f"查询最新分钟K线时间失败: {e}")
+        db.rollback()
+        return {}
+    latest = {}
+    for code, ts in rows:
+        ts = pd.Timestamp(ts)
+        latest[code] = ts.tz_convert(config.MARKET_TIMEZONE).tz_localize(None) if ts.tzinfo else ts
+    return latest
+
+def bulk_upsert_intraday_bars(db: Session, bars: List[dict], chunk_rows: int = 5000):
+    """
+    批量写入聚合出的多周期K线 (Upsert，按 chunk_rows 分批生成 INSERT 语句)。
+    进程重启后同一根K线可能被再次聚合写入，以最后一次为准。
+    """
+    if not bars:
+        return
+    table = models.StockIntradayBar
+    try:
+        for i in range(0, len(bars), chunk_rows):
+            stmt = pg_insert(table).values(bars[i:i + chunk_rows])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['time', 'code', 'period'],
+                set_={c: getattr(stmt.excluded, c) for c in INTRADAY_BAR_COLUMNS[3:]}
+            )
+            db.execute(stmt)
+        db.commit()
+        logger.debug(f"成功写入(Upsert) {len(bars)} 根多周期K线。")
+    except Exception as e:
+        logger.error(f"批量Upsert多周期K线错误: {e}")
+        db.rollback()
+        raise
+
 def save_signals(db: Session, signals_data: List[dict]):
     """
     批量保存生成的交易信号。
@@ -0,0 +1,143 @@
+"""
+多股票日K线面板。
+
+把 N 只股票的K线按交易日对齐成每个字段一个 (T, N) 的二维数组，缺失 (未上市、停牌) 为 NaN，
+截面计算 (选股打分、多股票回测) 可以直接对整块数组做向量化运算，不再逐只构造 DataFrame。
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+PANEL_FIELDS = ('open', 'high', 'low', 'close', 'volume', 'turnover')
+
+
+@dataclass
+class KlinePanel:
+    """
+    :param codes: 股票代码，对应数组的列
+    :param index: 行索引。按日期对齐时为交易日 (DatetimeIndex)；bar_aligned() 之后为距最新K线的偏移 (..., -1, 0)
+    :param fields: {字段名: (T, N) 的 float64 数组}
+    :param last_times: 每只股票最新K线的时间，bar_aligned() 时保存 (之后行索引不再是日期)
+    """
+    codes: List[str]
+    index: pd.Index
+    fields: Dict[str, np.ndarray]
+    last_times: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_long(cls, df: pd.DataFrame, codes: Optional[List[str]] = None,
+                  fields=PANEL_FIELDS) -> 'KlinePanel':
+        """
+        由长表 (time, code, 字段...) 构造面板。
+
+        :param codes: 列顺序，默认按长表中出现的顺序；没有数据的股票整列为 NaN
+        """
+        if codes is None:
+            codes = list(dict.fromkeys(df['code'])) if not df.empty else []
+        index = pd.DatetimeIndex(sorted(df['time'].unique())) if not df.empty else pd.DatetimeIndex([])
+        rows = index.get_indexer(df['time'])
+        col_map = {code: i for i, code in enumerate(codes)}
+        cols = df['code'].map(col_map)
+        keep = cols.notna().to_numpy()
+        rows, cols = rows[keep], cols[keep].astype(int).to_numpy()
+
+        arrays = {}
+        for field in fields:
+            arr = np.full((len(index), len(codes)), np.nan)
+            if field in df.columns:
+                arr[rows, cols] = df[field].to_numpy(dtype=float)[keep]
+            arrays[field] = arr
+        return cls(codes=list(codes), index=index, fields=arrays)
+
+    @classmethod
+    def from_frames(cls, frames: Dict[str, pd.DataFrame], fields=PANEL_FIELDS) -> 'KlinePanel':
+        """由 {code: DataFrame} 构造面板 (兼容逐只获取K线的旧调用方)"""
+        frames = {code: df for code, df in frames.items() if df is not None and not df.empty}
+        if not frames:
+            return cls.from_long(pd.DataFrame(columns=['time', 'code', *fields]), codes=[], fields=fields)
+        long_df = pd.concat([df.assign(code=code) for code, df in frames.items()], ignore_index=True)
+        long_df['time'] = pd.to_datetime(long_df['time'])
+        return cls.from_long(long_df, codes=list(frames), fields=fields)
+
+    def __getitem__(self, field: str) -> np.ndarray:
+        return self.fields[field]
+
+    @property
+    def shape(self):
+        return len(self.index), len(self.codes)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """每只股票的有效K线条数 (以收盘价非空计)"""
+        return (~np.isnan(self.fields['close'])).sum(axis=0)
+
+    def last_bar_times(self) -> np.ndarray:
+        """每只股票最新一根有效K线的时间 (datetime64)，没有数据的股票为 NaT"""
+        if self.last_times is not None:
+            return self.last_times
+        valid = ~np.isnan(self.fields['close'])
+        times = np.full(len(self.codes), np.datetime64('NaT'), dtype='datetime64[ns]')
+        has = valid.any(axis=0)
+        if isinstance(self.index, pd.DatetimeIndex) and has.any():
+            last_row = len(valid) - 1 - np.argmax(valid[::-1], axis=0)
+            times[has] = self.index.values[last_row[has]]
+        return times
+
+    def frame(self, field: str) -> pd.DataFrame:
+        """返回某个字段的 (T, N) DataFrame，列为股票代码"""
+        return pd.DataFrame(self.fields[field], index=self.index, columns=self.codes)
+
+    def select(self, codes: List[str]) -> 'KlinePanel':
+        """按代码取子面板 (不在面板中的代码会被忽略)"""
+        col_map = {code: i for i, code in enumerate(self.codes)}
+        picked = [code for code in codes if code in col_map]
+        cols = [col_map[code] for code in picked]
+        last_times = self.last_times[cols] if self.last_times is not None else None
+        return KlinePanel(codes=picked, index=self.index, fields={k: v[:, cols] for k, v in self.fields.items()},
+                          last_times=last_times)
+
+    def tail(self, n: int) -> 'KlinePanel':
+        """保留最后 n 行"""
+        return KlinePanel(codes=self.codes, index=self.index[-n:], fields={k: v[-n:] for k, v in self.fields.items()},
+                          last_times=self.last_times)
+
+    def bar_aligned(self) -> 'KlinePanel':
+        """
+        按 "距最新K线的根数" 重新对齐: 每列的有效K线依次压到底部，停牌造成的空洞被挤掉，缺口放到顶部。
+        这样最后一行就是每只股票各自的最新K线，"最近 n 根" 类因子与逐只计算的结果一致。
+        """
+        valid = ~np.isnan(self.fields['close'])
+        # 稳定排序: 无效行 (False) 排到前面，有效行保持原有先后顺序
+        order = np.argsort(valid, axis=0, kind='stable')
+        fields = {}
+        for name, arr in self.fields.items():
+            arr = np.where(valid, arr, np.nan)
+            fields[name] = np.take_along_axis(arr, order, axis=0)
+        index = pd.RangeIndex(-len(self.index) + 1, 1)
+        return KlinePanel(codes=self.codes, index=index, fields=fields, last_times=self.last_bar_times())
+
+    def unalign(self, aligned: np.ndarray) -> np.ndarray:
+        """
+        bar_aligned() 的逆变换: 把本面板 bar_aligned() 之后算出的 (T, N) 数组放回按交易日对齐的行，
+        停牌 / 未上市的行为 NaN。
+        """
+        valid = ~np.isnan(self.fields['close'])
+        order = np.argsort(valid, axis=0, kind='stable')
+        out = np.empty(np.shape(aligned))
+        np.put_along_axis(out, order, np.asarray(aligned, dtype=float), axis=0)
+        return np.where(valid, out, np.nan)
+
+    def to_frames(self) -> Dict[str, pd.DataFrame]:
+        """拆回 {code: DataFrame['time', 'code', 字段...]}，只保留有效K线"""
+        frames = {}
+        for j, code in enumerate(self.codes):
+            valid = ~np.isnan(self.fields['close'][:, j])
+            if not valid.any():
+                continue
+            df = pd.DataFrame({'time': self.index[valid], 'code': code})
+            for name, arr in self.fields.items():
+                df[name] = arr[valid, j]
+            frames[code] = df
+        return frames
@@ -0,0 +1,245 @@
+"""
+日K线读取层 (数据库优先)。
+
+stock_daily_kline 由同步任务、调度器和 PersistenceService 持续写入，这里把它作为读取的第一来源:
+1. 一条 SQL 读出所有请求股票在区间内的K线。
+2. 按股票判断缺口: 区间末尾晚于库中最新K线 (尾部缺口)，或区间开头早于库中最早K线且早于上市日期 (头部缺口)。
+3. 只为有缺口的股票向网络请求，请求结果回写数据库，下次读取不再走网络。
+   盘中尚未定型的当天K线只返回给调用方、不写库 (否则之后按日期判断不再有缺口，半截K线会变成历史)。
+4. stock_daily_kline 存的是前复权价格。网络结果与库中重叠部分的收盘价不一致时说明发生了除权除息，
+   库中旧价格基准的K线整体作废: 删除该股票的全部K线，重新拉取到上市日期 (未知时为请求区间开头，
+   至少 FULL_HISTORY_COUNT 根) 为止的K线写入 (与 KlineCache 的处理一致)。没有重新拉取到的更早区间
+   之后被读取时按头部缺口补齐，库中不会留下新旧基准混杂的K线。
+"最新" 以收盘定型的交易日为准 (见 main_sync.latest_expected_trade_date)，盘中当天的K线由 PersistenceService 写入。
+数据库不可用时整体退化为网络请求，调用方无需关心。
+"""
+import concurrent.futures
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.config import config
+from src.logger import logger
+from src.data_storage import crud, database
+from src.data_storage.kline_panel import KlinePanel
+from src.data_acquisition import data_fetcher
+from src.data_acquisition.kline_cache import prices_rebased
+from src.scheduling.trading_calendar import market_now
+from src.main_sync import latest_expected_trade_date, INCREMENTAL_MARGIN, FULL_HISTORY_COUNT
+
+# 区间开头与库中最早K线相差不超过该工作日数时不视为头部缺口 (节假日、停牌)
+HEAD_GAP_TOLERANCE = 10
+# 按条数读取时，把条数换算成日期区间的放大系数 (法定节假日约占工作日的 4%)
+COUNT_TO_BUSDAYS = 1.05
+
+
+def _busdays(start: pd.Timestamp, end: pd.Timestamp) -> int:
+    """[start, end] 之间的工作日数"""
+    return int(np.busday_count(start.date(), end.date() + timedelta(days=1)))
+
+
+class KlineRepository:
+    """
+    数据库优先的日K线读取接口，支持单只、批量 ({code: DataFrame}) 和面板 (KlinePanel) 三种形式。
+
+    用法:
+        repo = KlineRepository()
+        df = repo.get("sh600519", start_date="20240101")
+        frames = repo.get_many(["sh600519", "sz000001"], count=120)
+        panel = repo.get_panel(["sh600519", "sz000001"], count=120)
+    """
+
+    def __init__(self,
+                 session_factory: Optional[Callable] = None,
+                 fetch_workers: Optional[int] = None):
+        """
+        :param session_factory: 数据库会话工厂，默认 database.SessionLocal
+        :param fetch_workers: 补缺口时网络请求的并发线程数
+        """
+        self.session_factory = session_factory or database.SessionLocal
+        self.fetch_workers = fetch_workers or config.KLINE_REPOSITORY_FETCH_WORKERS
+
+    def _resolve_range(self, start_date: Optional[str], end_date: Optional[str], count: Optional[int],
+                       now: datetime):
+        """把 (start_date, end_date, count) 换算为查询区间 [start, end]"""
+        expected = pd.Timestamp(latest_expected_trade_date(now))
+        end = pd.to_datetime(end_date) if end_date else pd.Timestamp(now.date())
+        if start_date:
+            start = pd.to_datetime(start_date)
+        elif count:
+            anchor = min(end, expected)
+            start = pd.Timestamp(np.busday_offset(anchor.date(), -int(count * COUNT_TO_BUSDAYS) - 1, roll='backward'))
+        else:
+            start = None
+        return start, end, expected
+
+    def _plan_fetch(self, db_df: Optional[pd.DataFrame], start: Optional[pd.Timestamp], end: pd.Timestamp,
+                    expected: pd.Timestamp, ipo_date: Optional[pd.Timestamp], now: datetime) -> Optional[int]:
+        """
+        判断单只股票是否需要请求网络。
+
+        :return: None 表示库中数据已覆盖请求区间；否则返回需要请求的最近K线条数
+        """
+        target = min(end, expected)
+        if db_df is None or db_df.empty:
+            if start is None:
+                return FULL_HISTORY_COUNT
+            return _busdays(start, pd.Timestamp(now.date())) + INCREMENTAL_MARGIN
+
+        first, last = db_df['time'].iloc[0], db_df['time'].iloc[-1]
+        if start is not None and _busdays(start, first) > HEAD_GAP_TOLERANCE \
+                and (ipo_date is None or ipo_date < first - timedelta(days=HEAD_GAP_TOLERANCE)):
+            # 头部缺口: 腾讯接口只能按 "最近 N 条" 取，一次取到区间开头
+            return _busdays(start, pd.Timestamp(now.date())) + INCREMENTAL_MARGIN
+        if last < target:
+            return _busdays(last, pd.Timestamp(now.date())) + INCREMENTAL_MARGIN
+        return None
+
+    def _load_long(self, codes: List[str], start_date: Optional[str], end_date: Optional[str],
+                   count: Optional[int], now: Optional[datetime]) -> pd.DataFrame:
+        """
+        读取并补齐缺口，返回按请求区间和条数裁剪后的长表 (按 code, time 排序)。
+        """
+        now = now or market_now()
+        start, end, expected = self._resolve_range(start_date, end_date, count, now)
+
+        # 1. 一条 SQL 读出全部股票的区间数据
+        db = self.session_factory()
+        try:
+            db_long = crud.get_daily_klines(db, codes, start, end)
+            ipo_dates = crud.get_stock_ipo_dates(db, codes) if start is not None else {}
+        finally:
+            db.close()
+        frames = {code: df for code, df in db_long.groupby('code', sort=False)}
+
+        # 2. 只为有缺口的股票请求网络
+        plans = {}
+        for code in codes:
+            fetch_count = self._plan_fetch(frames.get(code), start, end, expected, ipo_dates.get(code), now)
+            if fetch_count is not None:
+                plans[code] = fetch_count
+
+        if plans:
+            fetched = self._fetch_missing(plans)
+            rebased = [code for code, df in fetched.items() if prices_rebased(frames.get(code), df)]
+            refetched = {}
+            if rebased:
+                logger.info(f"{len(rebased)} 只股票的前复权价格发生变化 (除权除息)，重新拉取完整K线: {rebased[:10]}")
+                refetch = {code: _history_count(start, ipo_dates.get(code), now) for code in rebased}
+                plans.update(refetch)
+                refetched = self._fetch_missing(refetch)
+                fetched.update(refetched)
+                for code in refetched:
+                    frames.pop(code, None)   # 旧价格基准的K线不再参与合并
+            self._backfill(fetched, plans, start, expected, replace=list(refetched))
+            for code, df in fetched.items():
+                merged = pd.concat([frames[code], df], ignore_index=True) if code in frames else df
+                frames[code] = merged.drop_duplicates(subset='time', keep='last').sort_values('time')
+            logger.info(f"K线读取: {len(codes)} 只股票中 {len(codes) - len(plans)} 只由数据库满足，"
+                        f"{len(plans)} 只请求网络补齐。")
+
+        # 3. 按请求区间和条数裁剪
+        parts = []
+        for code in codes:
+            df = frames.get(code)
+            if df is None or df.empty:
+                continue
+            mask = df['time'] <= end
+            if start is not None:
+                mask &= df['time'] >= start
+            df = df.loc[mask]
+            parts.append(df.tail(count) if count else df)
+        if not parts:
+            return pd.DataFrame(columns=crud.KLINE_COLUMNS)
+        return pd.concat(parts, ignore_index=True)
+
+    def get_many(self, codes: List[str], start_date: Optional[str] = None, end_date: Optional[str] = None,
+                 count: Optional[int] = None, now: Optional[datetime] = None) -> Dict[str, pd.DataFrame]:
+        """
+        批量读取多只股票的日K线。
+
+        :param codes: 股票代码列表
+        :param start_date: 开始日期 'YYYYMMDD'，None 时按 count 推算
+        :param end_date: 结束日期 'YYYYMMDD'，默认今天
+        :param count: 只返回每只股票最近的 count 条K线
+        :param now: 当前时间，默认 market_now() (交易所当地时间)
+        :return: 字典 {code: DataFrame['time', 'code', 'open', 'high', 'low', 'close', 'volume', 'turnover']}，
+                 没有数据的股票不在其中
+        """
+        codes = list(dict.fromkeys(codes))
+        if not codes:
+            return {}
+        long_df = self._load_long(codes, start_date, end_date, count, now)
+        return {code: df.reset_index(drop=True) for code, df in long_df.groupby('code', sort=False)}
+
+    def get_panel(self, codes: List[str], start_date: Optional[str] = None, end_date: Optional[str] = None,
+                  count: Optional[int] = None, now: Optional[datetime] = None) -> KlinePanel:
+        """
+        批量读取多只股票的日K线并按交易日对齐为面板，参数同 get_many。
+
+        :return: KlinePanel，列顺序与 codes 一致，没有数据的股票整列为 NaN
+        """
+        codes = list(dict.fromkeys(codes))
+        if not codes:
+            return KlinePanel.from_long(pd.DataFrame(columns=crud.KLINE_COLUMNS), codes=[])
+        return KlinePanel.from_long(self._load_long(codes, start_date, end_date, count, now), codes=codes)
+
+    def get(self, code: str, start_date: Optional[str] = None, end_date: Optional[str] = None,
+            count: Optional[int] = None, now: Optional[datetime] = None) -> pd.DataFrame:
+        """
+        读取单只股票的日K线，参数同 get_many。
+
+        :return: DataFrame['time', 'code', 'open', 'high', 'low', 'close', 'volume', 'turnover']，无数据时为空
+        """
+        return self.get_many([code], start_date, end_date, count, now).get(code, pd.DataFrame())
+
+    def _fetch_missing(self, plans: Dict[str, int]) -> Dict[str, pd.DataFrame]:
+        """并发请求网络，返回 {code: DataFrame}，失败或无数据的股票不在其中"""
+        def fetch(item):
+            code, fetch_count = item
+            return code, data_fetcher.fetch_stock_daily_kline(code, count=fetch_count)
+
+        fetched = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.fetch_workers, len(plans))) as executor:
+            for code, df in executor.map(fetch, plans.items()):
+                if not df.empty:
+                    fetched[code] = df
+        return fetched
+
+    def _backfill(self, fetched: Dict[str, pd.DataFrame], plans: Dict[str, int], start: Optional[pd.Timestamp],
+                  expected: pd.Timestamp, replace: Optional[List[str]] = None):
+        """
+        把网络补到的K线写回数据库 (晚于 expected 的盘中K线不写)；
+        返回条数少于请求条数说明已取到上市首日，顺带回填上市日期。
+
+        :param replace: 价格基准已变化的股票，写入前先删除它们在库中的全部K线
+        """
+        if not fetched:
+            return
+        settled = pd.concat(fetched.values(), ignore_index=True)
+        records = settled[pd.to_datetime(settled['time']) <= expected].to_dict(orient='records')
+        ipo_dates = {code: df['time'].iloc[0] for code, df in fetched.items()
+                     if start is not None and len(df) < plans[code]}
+        db = self.session_factory()
+        try:
+            crud.delete_daily_klines(db, replace or [])
+            crud.bulk_upsert_daily_kline(db, records)
+            crud.update_stock_ipo_dates(db, ipo_dates)
+        except Exception as e:
+            logger.warning(f"回写 {len(fetched)} 只股票的K线失败，下次读取将再次请求网络: {e}")
+        finally:
+            db.close()
+
+
+def _history_count(start: Optional[pd.Timestamp], ipo_date: Optional[pd.Timestamp], now: datetime) -> int:
+    """除权除息后重新拉取的K线条数: 覆盖到上市日期 (未知时为请求区间开头)，至少 FULL_HISTORY_COUNT 根"""
+    since = ipo_date if ipo_date is not None else start
+    if since is None:
+        return FULL_HISTORY_COUNT
+    return max(FULL_HISTORY_COUNT, _busdays(since, pd.Timestamp(now.date())) + INCREMENTAL_MARGIN)
+
+
+# 全局共享实例
+kline_repository = KlineRepository()
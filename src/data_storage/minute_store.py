@@ -0,0 +1,128 @@
+"""
+分钟K线存储 (stock_minute_kline 超表)。
+
+腾讯分时接口每次都返回当天从开盘到现在的整段数据。过去详情页每次渲染都重新下载这一段并丢弃，
+现在改为:
+1. 分钟采集器 (minute_collector) 在盘中把新出现的分钟K线追加写入数据库。
+2. 读取时优先查库，只有当天的数据缺失或落后于当前时间时才请求网络补齐，补到的数据同样写回数据库。
+3. 同一只股票在 MINUTE_REFRESH_TTL 秒内不会重复补齐，避免页面频繁刷新时反复请求。
+数据库不可用时退化为直接请求网络 (只有当天数据)。
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+import pandas as pd
+
+from src.config import config
+from src.logger import logger
+from src.data_storage import crud, database
+from src.data_acquisition import data_fetcher
+from src.scheduling.trading_calendar import trading_calendar, market_now
+
+
+class MinuteBarStore:
+    """
+    分钟K线的读写接口。
+
+    用法:
+        df = minute_store.history("sh600519", days=5)
+    """
+
+    def __init__(self,
+                 session_factory: Optional[Callable] = None,
+                 refresh_ttl: Optional[float] = None):
+        """
+        :param session_factory: 数据库会话工厂，默认 database.SessionLocal
+        :param refresh_ttl: 同一只股票两次网络补齐的最短间隔 (秒)
+        """
+        self.session_factory = session_factory or database.SessionLocal
+        self.refresh_ttl = config.MINUTE_REFRESH_TTL if refresh_ttl is None else refresh_ttl
+        self._refreshed_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def append(self, code: str, df: pd.DataFrame, since: Optional[pd.Timestamp] = None) -> int:
+        """
+        把分钟K线写入数据库 (Upsert)。
+
+        :param code: 股票代码
+        :param df: DataFrame ['time', 'open', 'high', 'low', 'close', 'volume']，time 为本地时间
+        :param since: 只写入不早于该时间的K线 (库中最后一根可能还在变化，调用方通常传入它的时间)
+        :return: 写入的条数
+        """
+        if df is None or df.empty:
+            return 0
+        if since is not None:
+            df = df[df['time'] >= since]
+            if df.empty:
+                return 0
+        records = df.assign(
+            code=data_fetcher._to_tencent_code(code),
+            time=df['time'].dt.tz_localize(config.MARKET_TIMEZONE),
+            volume=df['volume'].round().astype('int64'),
+        )[crud.MINUTE_COLUMNS].to_dict(orient='records')
+        db = self.session_factory()
+        try:
+            crud.bulk_upsert_minute_kline(db, records)
+        finally:
+            db.close()
+        return len(records)
+
+    def _stale(self, stored: pd.DataFrame, now: datetime) -> bool:
+        """库中数据是否落后于当前交易日应有的最后一根K线"""
+        expected = trading_calendar.latest_session_end(now)
+        if expected is None:
+            return False
+        if stored.empty:
+            return True
+        return stored['time'].iloc[-1] < pd.Timestamp(expected) - timedelta(minutes=1)
+
+    def _may_refresh(self, code: str) -> bool:
+        with self._lock:
+            last = self._refreshed_at.get(code, 0.0)
+            if time.monotonic() - last < self.refresh_ttl:
+                return False
+            self._refreshed_at[code] = time.monotonic()
+            return True
+
+    def history(self, code: str, days: int = 1, now: Optional[datetime] = None) -> pd.DataFrame:
+        """
+        读取最近 days 个交易日的分钟K线。
+
+        :param code: 股票代码 (任意格式，内部统一为腾讯格式)
+        :param days: 交易日数 (按交易日历计)
+        :param now: 当前时间，默认 market_now() (交易所当地时间)
+        :return: DataFrame ['time', 'open', 'high', 'low', 'close', 'volume']，按时间排序
+        """
+        now = now or market_now()
+        clean_code = data_fetcher._to_tencent_code(code)
+        start = pd.Timestamp(trading_calendar.offset(now.date(), -(days - 1)))
+
+        try:
+            db = self.session_factory()
+            try:
+                stored = crud.get_minute_klines(db, clean_code, start=start.tz_localize(config.MARKET_TIMEZONE))
+            finally:
+                db.close()
+        except Exception as e:
+            logger.warning(f"读取 {clean_code} 的分钟K线失败，改为直接请求网络: {e}")
+            return data_fetcher.fetch_stock_minute_data(clean_code)
+
+        if self._stale(stored, now) and self._may_refresh(clean_code):
+            fresh = data_fetcher.fetch_stock_minute_data(clean_code)
+            if not fresh.empty:
+                since = stored['time'].iloc[-1] if not stored.empty else None
+                try:
+                    self.append(clean_code, fresh, since=since)
+                except Exception as e:
+                    logger.warning(f"写入 {clean_code} 的分钟K线失败: {e}")
+                merged = pd.concat([stored.drop(columns='code'), fresh], ignore_index=True)
+                stored = merged.drop_duplicates(subset='time', keep='last').sort_values('time')
+                stored = stored[stored['time'] >= start]
+
+        return stored.drop(columns='code', errors='ignore').reset_index(drop=True)
+
+
+# 全局共享实例
+minute_store = MinuteBarStore()
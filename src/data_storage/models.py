@@ -1,4 +1,4 @@
-from sqlalchemy import (Column, String, Date, TIMESTAMP, BIGINT,
+from sqlalchemy import (Column, String, Date, TIMESTAMP, BIGINT, SmallInteger,
                           Float, PrimaryKeyConstraint, Index, Text)
 from sqlalchemy.sql import func
 from .database import Base
@@ -44,6 +44,51 @@ class StockDailyKline(Base):
     def __repr__(self):
         return f"<StockDailyKline(time='{self.time}', code='{self.code}', close='{self.close}')>"
 
+class StockMinuteKline(Base):
+    """
+    股票分钟行情模型，对应 `stock_minute_kline` 表。
+    这张表将被创建为按天分块的 TimescaleDB 超表，并对历史分块开启压缩 (按 code 分段)。
+    """
+    __tablename__ = 'stock_minute_kline'
+
+    time = Column(TIMESTAMP(timezone=True), nullable=False, comment="分钟K线时间")
+    code = Column(String(16), nullable=False, comment="股票代码，腾讯格式，例如 'sh600519'")
+    open = Column(Float, comment="开盘价")
+    high = Column(Float, comment="最高价")
+    low = Column(Float, comment="最低价")
+    close = Column(Float, comment="收盘价")
+    volume = Column(BIGINT, comment="成交量（股）")
+
+    __table_args__ = (
+        PrimaryKeyConstraint('time', 'code', name='pk_stock_minute_kline'),
+    )
+
+    def __repr__(self):
+        return f"<StockMinuteKline(time='{self.time}', code='{self.code}', close='{self.close}')>"
+
+class StockIntradayBar(Base):
+    """
+    由实时行情流聚合出的多周期K线 (1/5/15/60 分钟)，对应 `stock_intraday_bar` 表。
+    time 为K线起始时间；与 stock_minute_kline (数据源提供的分时) 分开存放，互不覆盖。
+    """
+    __tablename__ = 'stock_intraday_bar'
+
+    time = Column(TIMESTAMP(timezone=True), nullable=False, comment="K线起始时间")
+    code = Column(String(16), nullable=False, comment="股票代码，腾讯格式，例如 'sh600519'")
+    period = Column(SmallInteger, nullable=False, comment="周期 (分钟)")
+    open = Column(Float, comment="开盘价")
+    high = Column(Float, comment="最高价")
+    low = Column(Float, comment="最低价")
+    close = Column(Float, comment="收盘价")
+    volume = Column(BIGINT, comment="成交量（股）")
+
+    __table_args__ = (
+        PrimaryKeyConstraint('time', 'code', 'period', name='pk_stock_intraday_bar'),
+    )
+
+    def __repr__(self):
+        return f"<StockIntradayBar(time='{self.time}', code='{self.code}', period={self.period})>"
+
 class SignalRecord(Base):
     """
     策略信号记录表，对应 `signal_records` 表。
@@ -1,13 +1,13 @@
 import time
-import json
 import redis
 import pandas as pd
-from datetime import datetime
 from sqlalchemy.orm import Session
 
 from src.config import config
 from src.logger import logger
 from src.data_storage import database, crud
+from src.data_storage.quote_store import QuoteStore
+from src.scheduling.trading_calendar import trading_calendar, market_now
 
 class PersistenceService:
     """
@@ -26,6 +26,7 @@ class PersistenceService:
             )
             self.redis_client.ping()
             logger.info("持久化服务: Redis 连接成功。")
+            self.quote_store = QuoteStore(self.redis_client)
         except Exception as e:
             logger.critical(f"持久化服务: Redis 连接失败: {e}")
             raise
@@ -37,20 +38,16 @@ class PersistenceService:
         """执行一次从 Redis 到 DB 的同步"""
         start_time = time.time()
         
-        # 1. 获取 Redis 中所有行情 keys
-        keys = self.redis_client.keys('quote:*')
-        if not keys:
+        # 1. 一次往返读取 Redis 行情哈希中的全部行情
+        records = self.quote_store.get_records()
+        if not records:
             logger.info("Redis 中暂无行情数据，跳过同步。")
             return
 
-        # 2. 批量获取数据
-        values = self.redis_client.mget(keys)
-        
+        # 2. 转换数据
         kline_data = []
-        for v in values:
-            if not v: continue
+        for data in records:
             try:
-                data = json.loads(v)
                 # 数据转换: Redis JSON -> DB Schema
                 # 注意: Redis 里的 time 是字符串 "2023-10-27 14:30:00"
                 # 我们需要将其解析为 datetime 对象
@@ -96,12 +93,19 @@ class PersistenceService:
             db.close()
 
     def run(self, interval: int = 60):
-        """启动持久化循环"""
+        """启动持久化循环，非交易时段按交易日历休眠到下一个交易时段"""
         logger.info(f"🚀 启动持久化服务 (每 {interval} 秒同步一次)...")
         try:
             while True:
-                self.sync_to_db()
-                time.sleep(interval)
+                # 收盘后的 grace 窗口内继续同步，保证收盘价落库
+                if trading_calendar.is_trading_time(market_now(), grace=config.SESSION_CLOSE_GRACE + interval):
+                    self.sync_to_db()
+                delay = trading_calendar.sleep_seconds(market_now(), interval, lead=0,
+                                                       grace=config.SESSION_CLOSE_GRACE + interval,
+                                                       edge_interval=interval)
+                if delay > interval:
+                    logger.info(f"非交易时段，持久化服务休眠 {delay / 60:.1f} 分钟。")
+                time.sleep(delay)
         except KeyboardInterrupt:
             logger.info("🛑 持久化服务已停止。")
 
@@ -0,0 +1,239 @@
+"""
+Redis 实时行情存储 (哈希布局)。
+
+旧布局是每只股票一个 quote:<code> 字符串键，读全市场时要先 KEYS quote:* 扫描整个键空间再 MGET。
+KEYS 的耗时与 Redis 中的键总数成正比，执行期间会阻塞 Redis，而看板每次刷新、持久化服务每个周期都要做一次。
+
+新布局把行情放进固定的 QUOTE_HASH_SHARDS 个哈希 (<QUOTE_HASH_KEY>:<分片号>)，field 为股票代码，value 为行情 JSON:
+- 读全市场: 一个 pipeline 内对各分片 HGETALL，一次往返，不扫描键空间。
+- 读部分股票: 按分片 HMGET，同样一次往返。
+- 过期: 哈希整体设置 QUOTE_TTL。采集器每次写入都会续期，采集器停止后整张行情表一起过期。
+- 全量推送时在 MULTI 事务内删除旧哈希再写入，读方不会看到新旧混合的快照。
+股票数量很大 (5 万以上) 时可以增加分片数，缩短单条 HGETALL 占用 Redis 的时间。
+
+紧凑快照 (QUOTE_SNAPSHOT_FORMAT='arrow'):
+哈希里的每只股票仍是一个 JSON 文档，读全市场时要逐只 json.loads。
+开启后采集器每次推送还会把全市场行情按固定 schema (QUOTE_COLUMNS) 打包成一个 Arrow IPC 二进制块，
+写入 QUOTE_SNAPSHOT_KEY。看板一次 GET 取回整个市场，数值列零拷贝转换为 DataFrame，不做逐只解析。
+快照缺失或格式为 'none' 时 get_all 回退到读哈希。
+流式模式下快照按 QUOTE_SNAPSHOT_INTERVAL 节流重写，哈希则每个 tick 都在更新。写哈希和写快照时分别记下时间
+(<QUOTE_HASH_KEY>:updated_at / <QUOTE_HASH_KEY>:snapshot_at)，get_all 先一次 MGET 比较两者，快照落后于哈希时
+改读哈希，不会返回最多落后一个节流间隔的行情。
+"""
+import json
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+from redis.client import NEVER_DECODE
+
+from src.config import config
+from src.data_acquisition.quote_source import QUOTE_COLUMNS
+
+# 快照的固定 schema: 代码 / 名称 / 时间为字符串，其余字段为 float64
+SNAPSHOT_STRING_COLUMNS = ('code', 'name', 'time')
+SNAPSHOT_SCHEMA = pa.schema([(c, pa.string() if c in SNAPSHOT_STRING_COLUMNS else pa.float64())
+                             for c in QUOTE_COLUMNS])
+
+
+def encode_documents(df: pd.DataFrame) -> List[str]:
+    """
+    把行情 DataFrame 逐行编码为 JSON 文档。
+
+    由 pandas 的 C 实现整批按列编码 (NaN 编码为 null)，
+    比逐行 to_dict + json.dumps 快一个数量级，5000 只股票约数十毫秒。
+    """
+    if df.empty:
+        return []
+    return df.to_json(orient='records', lines=True, force_ascii=True).splitlines()
+
+
+def encode_snapshot(df: pd.DataFrame) -> bytes:
+    """把行情 DataFrame 按 SNAPSHOT_SCHEMA 打包为 Arrow IPC 流，缺少的字段为空值，多余的字段丢弃"""
+    frame = df.reindex(columns=QUOTE_COLUMNS)
+    for col in SNAPSHOT_STRING_COLUMNS:
+        frame[col] = frame[col].astype('string')
+    table = pa.Table.from_pandas(frame, schema=SNAPSHOT_SCHEMA, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, SNAPSHOT_SCHEMA) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def decode_snapshot(blob: bytes) -> pd.DataFrame:
+    """解码 Arrow IPC 快照，无空值的数值列不复制内存"""
+    table = pa.ipc.open_stream(pa.py_buffer(blob)).read_all()
+    return table.to_pandas(split_blocks=True)
+
+
+class QuoteStore:
+    """
+    用法:
+        store = QuoteStore(redis_client)
+        store.replace_all(df)                # 全量推送
+        store.upsert(changed_df, pipe=pipe)  # 增量推送 (可并入调用方的 pipeline)
+        df = store.get_all()
+    """
+
+    def __init__(self, redis_client, key_prefix: Optional[str] = None, shards: Optional[int] = None,
+                 ttl: Optional[int] = None, snapshot_format: Optional[str] = None,
+                 chunk_size: Optional[int] = None):
+        """
+        :param redis_client: redis.Redis 实例 (decode_responses=True)
+        :param key_prefix: 哈希键前缀，默认 config.QUOTE_HASH_KEY
+        :param shards: 分片数，默认 config.QUOTE_HASH_SHARDS
+        :param ttl: 哈希的过期时间 (秒)，默认 config.QUOTE_TTL
+        :param snapshot_format: 全市场快照格式 'arrow' / 'none'，默认 config.QUOTE_SNAPSHOT_FORMAT
+        :param chunk_size: 单条 HSET 命令写入的股票数上限，默认 config.QUOTE_PUSH_CHUNK
+        """
+        self.redis = redis_client
+        self.key_prefix = key_prefix or config.QUOTE_HASH_KEY
+        self.shards = shards or config.QUOTE_HASH_SHARDS
+        self.ttl = ttl or config.QUOTE_TTL
+        self.keys = [f"{self.key_prefix}:{i}" for i in range(self.shards)]
+        self.snapshot_format = (snapshot_format or config.QUOTE_SNAPSHOT_FORMAT).lower()
+        if self.snapshot_format not in ('arrow', 'none'):
+            raise ValueError(f"不支持的快照格式: {self.snapshot_format}")
+        self.snapshot_key = f"{self.key_prefix}:snapshot"
+        # 哈希 / 快照最近一次写入的时间
+        self.updated_at_key = f"{self.key_prefix}:updated_at"
+        self.snapshot_at_key = f"{self.key_prefix}:snapshot_at"
+        self.chunk_size = chunk_size or config.QUOTE_PUSH_CHUNK
+
+    def key_for(self, code: str) -> str:
+        if self.shards == 1:
+            return self.keys[0]
+        return self.keys[zlib.crc32(code.encode()) % self.shards]
+
+    def _group(self, codes: Iterable[str]) -> Dict[str, List[str]]:
+        groups: Dict[str, List[str]] = {}
+        for code in codes:
+            groups.setdefault(self.key_for(code), []).append(code)
+        return groups
+
+    @staticmethod
+    def _decode(value: str) -> dict:
+        return json.loads(value)
+
+    # --- 写入 ---
+    def _hset(self, pipe, df: pd.DataFrame):
+        """按分片分组，每条 HSET 最多 chunk_size 只股票，避免单条超大命令长时间占用 Redis"""
+        mappings: Dict[str, dict] = {}
+        for code, doc in zip(df['code'].tolist(), encode_documents(df)):
+            mappings.setdefault(self.key_for(code), {})[code] = doc
+        for key, mapping in mappings.items():
+            items = list(mapping.items())
+            for start in range(0, len(items), self.chunk_size):
+                pipe.hset(key, mapping=dict(items[start:start + self.chunk_size]))
+        pipe.set(self.updated_at_key, repr(time.time()), ex=self.ttl)
+
+    def upsert(self, df: pd.DataFrame, pipe=None):
+        """
+        写入 (覆盖) 部分股票的行情，并续期所有分片。
+
+        :param df: 行情 DataFrame，必须包含 code 列
+        :param pipe: 调用方的 pipeline；为 None 时自建并立即执行
+        """
+        own = pipe is None
+        pipe = self.redis.pipeline(transaction=False) if own else pipe
+        if not df.empty:
+            self._hset(pipe, df)
+        self.touch(pipe)
+        if own:
+            pipe.execute()
+
+    def replace_all(self, df: pd.DataFrame, pipe=None):
+        """
+        用一份完整行情原子地替换全部行情及快照。
+
+        :param pipe: 调用方的事务 pipeline (transaction=True)，用于分开统计编码与传输耗时；
+                     为 None 时自建并立即执行
+        """
+        own = pipe is None
+        pipe = self.redis.pipeline(transaction=True) if own else pipe
+        pipe.delete(*self.keys)
+        if not df.empty:
+            self._hset(pipe, df)
+        self.touch(pipe)
+        self.write_snapshot(df, pipe)
+        if own:
+            pipe.execute()
+
+    def write_snapshot(self, df: pd.DataFrame, pipe=None):
+        """写入全市场紧凑快照 (df 须为完整市场)，快照格式为 'none' 时不写"""
+        if self.snapshot_format == 'none':
+            return
+        target = pipe or self.redis
+        target.set(self.snapshot_at_key, repr(time.time()), ex=self.ttl)
+        target.set(self.snapshot_key, encode_snapshot(df), ex=self.ttl)
+
+    def touch(self, pipe=None):
+        """续期所有分片及快照"""
+        target = pipe or self.redis
+        for key in self.keys:
+            target.expire(key, self.ttl)
+        if self.snapshot_format != 'none':
+            target.expire(self.snapshot_key, self.ttl)
+
+    def remove(self, codes: Iterable[str], pipe=None):
+        """删除已不再推送的股票 (例如退市)"""
+        target = pipe or self.redis
+        for key, group in self._group(codes).items():
+            target.hdel(key, *group)
+
+    # --- 读取 ---
+    def get(self, code: str) -> Optional[dict]:
+        value = self.redis.hget(self.key_for(code), code)
+        return self._decode(value) if value else None
+
+    def get_many(self, codes: List[str]) -> Dict[str, dict]:
+        """按代码批量读取，返回 {code: 行情}，不存在的代码不在其中"""
+        groups = self._group(codes)
+        if not groups:
+            return {}
+        pipe = self.redis.pipeline(transaction=False)
+        for key, group in groups.items():
+            pipe.hmget(key, group)
+        result = {}
+        for group, values in zip(groups.values(), pipe.execute()):
+            for code, value in zip(group, values):
+                if value:
+                    result[code] = self._decode(value)
+        return result
+
+    def get_records(self) -> List[dict]:
+        """读取全部行情 (一次往返)"""
+        pipe = self.redis.pipeline(transaction=False)
+        for key in self.keys:
+            pipe.hgetall(key)
+        return [self._decode(v) for shard in pipe.execute() for v in shard.values() if v]
+
+    def get_snapshot(self) -> Optional[pd.DataFrame]:
+        """一次 GET 读取全市场快照，未开启或不存在时返回 None"""
+        if self.snapshot_format == 'none':
+            return None
+        blob = self.redis.execute_command('GET', self.snapshot_key, **{NEVER_DECODE: True})
+        return decode_snapshot(blob) if blob else None
+
+    def snapshot_is_current(self) -> bool:
+        """快照不早于哈希的最近一次写入 (没有时间记录时视为最新)"""
+        updated_at, snapshot_at = self.redis.mget(self.updated_at_key, self.snapshot_at_key)
+        if updated_at is None or snapshot_at is None:
+            return True
+        return float(snapshot_at) >= float(updated_at)
+
+    def get_all(self) -> pd.DataFrame:
+        """读取全部行情为 DataFrame (快照不落后于哈希时读快照)，没有数据时为空"""
+        if self.snapshot_format != 'none' and self.snapshot_is_current():
+            df = self.get_snapshot()
+            if df is not None:
+                return df
+        return pd.DataFrame(self.get_records())
+
+    def count(self) -> int:
+        pipe = self.redis.pipeline(transaction=False)
+        for key in self.keys:
+            pipe.hlen(key)
+        return sum(pipe.execute())
@@ -0,0 +1,250 @@
+"""
+股票池与代码格式转换。
+
+各数据源使用的代码格式不同:
+    腾讯 / 新浪  sh600519      交易所后缀  600519.SH      Baostock  sh.600519
+    东财 secid   1.600519      东财 Web    SH600519       纯数字    600519
+过去每个模块各自用 lower().replace(...) 链转换，结果不一致 (例如纯数字代码无法区分 sh000001 指数与 sz000001)。
+这里统一为:
+1. parse_code(): 任意格式 -> (市场, 6 位数字)，结果缓存，重复转换是一次字典查找。
+   to_tencent() / to_exchange() / to_baostock() / to_secid() / to_em_web() / to_digits() 基于它生成各格式。
+2. StockUniverse: 把 stocks 表装入一张按行存储的结构化数组 (数字代码、市场、名称、上市日期)，
+   行号即整数 ID；各数据源格式的代码在加载时一次性生成并驻留 (sys.intern)，按任意格式查 ID / 名称都是 O(1)。
+3. 结构化数组落盘为 STOCK_UNIVERSE_PATH (.npy)，各进程 (采集器、调度器、看板) 以内存映射方式只读打开，
+   共享操作系统的页缓存，不必各自查库。文件超过 STOCK_UNIVERSE_TTL 或更新股票列表后从数据库重建。
+"""
+import os
+import sys
+import threading
+import time
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from src.config import config
+from src.logger import logger
+from src.data_storage import crud, database
+
+# 市场 ID = 下标
+MARKETS = ('sz', 'sh', 'bj')
+_MARKET_IDS = {m: i for i, m in enumerate(MARKETS)}
+# 东财 secid 的市场前缀 (北交所与深市同为 0)
+_SECID_PREFIX = {'sz': '0', 'sh': '1', 'bj': '0'}
+
+UNIVERSE_DTYPE = np.dtype([
+    ('number', '<u4'),       # 6 位数字代码
+    ('market', 'u1'),        # MARKETS 下标
+    ('name', '<U16'),
+    ('ipo_date', '<M8[D]'),  # 未知为 NaT
+])
+
+
+def infer_market(digits: str) -> str:
+    """纯数字代码推断市场: 6 开头沪市，8 / 4 / 92 开头北交所，其余深市"""
+    if digits.startswith('6'):
+        return 'sh'
+    if digits.startswith(('8', '4', '92')):
+        return 'bj'
+    return 'sz'
+
+
+@lru_cache(maxsize=65536)
+def parse_code(code: str) -> Tuple[str, str]:
+    """
+    把任意格式的代码解析为 (市场, 6 位数字)。
+
+    :raises ValueError: 无法识别的代码
+    """
+    c = str(code).strip().lower()
+    if c[:2] in _MARKET_IDS:
+        market, digits = c[:2], c[2:].lstrip('.')
+    elif '.' in c:
+        left, right = c.split('.', 1)
+        if right in _MARKET_IDS:
+            market, digits = right, left
+        elif left in ('0', '1'):
+            digits = right
+            market = 'sh' if left == '1' else infer_market(right)
+        else:
+            raise ValueError(f"无法识别的股票代码: {code}")
+    else:
+        market, digits = infer_market(c), c
+    if len(digits) != 6 or not digits.isdigit():
+        raise ValueError(f"无法识别的股票代码: {code}")
+    return market, digits
+
+
+def to_tencent(code: str) -> str:
+    """sh600519"""
+    market, digits = parse_code(code)
+    return market + digits
+
+
+def to_exchange(code: str) -> str:
+    """600519.SH"""
+    market, digits = parse_code(code)
+    return f"{digits}.{market.upper()}"
+
+
+def to_baostock(code: str) -> str:
+    """sh.600519"""
+    market, digits = parse_code(code)
+    return f"{market}.{digits}"
+
+
+def to_secid(code: str) -> str:
+    """东财 secid: 1.600519"""
+    market, digits = parse_code(code)
+    return f"{_SECID_PREFIX[market]}.{digits}"
+
+
+def to_em_web(code: str) -> str:
+    """东财 Web: SH600519"""
+    market, digits = parse_code(code)
+    return market.upper() + digits
+
+
+def to_digits(code: str) -> str:
+    """600519"""
+    return parse_code(code)[1]
+
+
+def _key(market: str, digits: str) -> int:
+    return _MARKET_IDS[market] * 1_000_000 + int(digits)
+
+
+class StockUniverse:
+    """
+    用法:
+        universe = get_universe()
+        universe.name("600519.SH")          # '贵州茅台'
+        sid = universe.id_of("sh.600519")   # 行号，不在股票池中为 None
+        universe.tencent[sid]               # 'sh600519'
+    """
+
+    def __init__(self, table: np.ndarray):
+        """
+        :param table: UNIVERSE_DTYPE 结构化数组 (可以是内存映射的只读数组)
+        """
+        self.table = table
+        numbers = table['number'].tolist()
+        markets = [MARKETS[m] for m in table['market'].tolist()]
+        digits = [f"{n:06d}" for n in numbers]
+        self.tencent = [sys.intern(m + d) for m, d in zip(markets, digits)]
+        self.exchange = [sys.intern(f"{d}.{m.upper()}") for m, d in zip(markets, digits)]
+        self.baostock = [sys.intern(f"{m}.{d}") for m, d in zip(markets, digits)]
+        self.secid = [sys.intern(f"{_SECID_PREFIX[m]}.{d}") for m, d in zip(markets, digits)]
+        self.names = table['name'].tolist()
+        keys = (table['market'].astype(np.int64) * 1_000_000 + table['number']).tolist()
+        self._index: Dict[int, int] = dict(zip(keys, range(len(keys))))
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def __contains__(self, code: str) -> bool:
+        return self.id_of(code) is not None
+
+    def id_of(self, code: str) -> Optional[int]:
+        """任意格式代码 -> 整数 ID (行号)；无法识别或不在股票池中为 None"""
+        try:
+            return self._index.get(_key(*parse_code(code)))
+        except ValueError:
+            return None
+
+    def name(self, code: str, default: Optional[str] = None) -> Optional[str]:
+        sid = self.id_of(code)
+        return self.names[sid] if sid is not None else default
+
+    def names_for(self, codes: Iterable[str]) -> Dict[str, str]:
+        """批量查名称，返回 {传入的代码: 名称}，不在股票池中的代码不在其中"""
+        result = {}
+        for code in codes:
+            sid = self.id_of(code)
+            if sid is not None:
+                result[code] = self.names[sid]
+        return result
+
+    # --- 构建与持久化 ---
+    @classmethod
+    def from_records(cls, records: Iterable[dict]) -> 'StockUniverse':
+        """从 {'code', 'name', 'ipo_date'} 记录构建，无法识别的代码跳过"""
+        rows = {}
+        for record in records:
+            try:
+                market, digits = parse_code(record['code'])
+            except ValueError:
+                continue
+            ipo = record.get('ipo_date')
+            rows[_key(market, digits)] = (int(digits), _MARKET_IDS[market], record.get('name') or '',
+                                          np.datetime64(ipo, 'D') if ipo else np.datetime64('NaT'))
+        table = np.array([rows[k] for k in sorted(rows)], dtype=UNIVERSE_DTYPE)
+        return cls(table)
+
+    @classmethod
+    def from_db(cls, session_factory: Optional[Callable] = None) -> 'StockUniverse':
+        db = (session_factory or database.SessionLocal)()
+        try:
+            stocks = crud.get_all_stocks(db)
+        finally:
+            db.close()
+        return cls.from_records({'code': s.code, 'name': s.name, 'ipo_date': s.ipo_date} for s in stocks)
+
+    def save(self, path: str):
+        """写临时文件后 os.replace，其他进程读到的总是完整文件"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            np.save(f, np.asarray(self.table))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'StockUniverse':
+        """以只读内存映射方式打开"""
+        return cls(np.load(path, mmap_mode='r'))
+
+
+_universe: Optional[StockUniverse] = None
+_loaded_mtime: Optional[float] = None
+# 重建失败后，在该时刻 (time.monotonic) 之前不再尝试重建
+_retry_after = 0.0
+_lock = threading.Lock()
+
+
+def rebuild(path: Optional[str] = None) -> StockUniverse:
+    """从数据库重建股票池文件并替换当前进程的股票池"""
+    global _universe, _loaded_mtime
+    path = path or config.STOCK_UNIVERSE_PATH
+    universe = StockUniverse.from_db()
+    if not len(universe):
+        # 数据库不可用时 crud 返回空列表，不能用空表覆盖已有的文件
+        raise RuntimeError("数据库中没有股票列表数据")
+    universe.save(path)
+    with _lock:
+        _universe, _loaded_mtime = StockUniverse.load(path), os.path.getmtime(path)
+    logger.info(f"股票池已重建: {len(universe)} 只 -> {path}")
+    return _universe
+
+
+def get_universe(path: Optional[str] = None) -> StockUniverse:
+    """
+    当前进程的股票池。文件缺失或超过 STOCK_UNIVERSE_TTL 时从数据库重建；
+    其他进程重建了文件 (mtime 变化) 时重新映射。数据库不可用时沿用旧文件，都没有时为空股票池；
+    重建失败后 STOCK_UNIVERSE_RETRY_INTERVAL 秒内不再重试，避免每次调用都去连接数据库。
+    """
+    global _universe, _loaded_mtime, _retry_after
+    path = path or config.STOCK_UNIVERSE_PATH
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    stale = mtime is None or time.time() - mtime > config.STOCK_UNIVERSE_TTL
+    if stale and time.monotonic() >= _retry_after:
+        try:
+            return rebuild(path)
+        except Exception as e:
+            _retry_after = time.monotonic() + config.STOCK_UNIVERSE_RETRY_INTERVAL
+            logger.warning(f"从数据库重建股票池失败，沿用现有文件，{config.STOCK_UNIVERSE_RETRY_INTERVAL} 秒后重试: {e}")
+    with _lock:
+        if mtime is not None and (_universe is None or mtime != _loaded_mtime):
+            _universe, _loaded_mtime = StockUniverse.load(path), mtime
+        elif _universe is None:
+            _universe = StockUniverse(np.empty(0, dtype=UNIVERSE_DTYPE))
+        return _universe
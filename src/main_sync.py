@@ -1,12 +1,188 @@
+from datetime import datetime, date, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
 from sqlalchemy.orm import Session
+from src.config import config
 from src.data_storage import crud, database
 from src.data_acquisition import data_fetcher
 from src.logger import logger
+from src.scheduling.trading_calendar import trading_calendar, market_now
+from src.sync_pipeline import SyncPipeline, SyncTask
+
+# 日K线在收盘后才算定型，此时间之前只同步到上一个交易日
+DAILY_KLINE_READY_TIME = (15, 30)
+# 增量请求时在缺口条数之外多取的条数 (容错)
+INCREMENTAL_MARGIN = 2
+# 没有任何历史K线的股票首次同步的条数
+FULL_HISTORY_COUNT = 320
+# 读取水位线之前多少自然日内的已入库K线，与增量结果的重叠部分比对 (覆盖长假)
+REFERENCE_LOOKBACK_DAYS = 15
+
+
+def latest_expected_trade_date(now: Optional[datetime] = None) -> date:
+    """
+    推算数据库中"应当已有"的最新日K线日期 (按交易日历，跳过周末和法定节假日)。
+
+    :param now: 当前时间，默认 market_now() (交易所当地时间)
+    """
+    now = now or market_now()
+    day = now.date()
+    if (now.hour, now.minute) < DAILY_KLINE_READY_TIME:
+        day -= timedelta(days=1)
+    return trading_calendar.previous_trading_day(day, include=True)
+
+
+def plan_incremental_fetch(watermark: Optional[pd.Timestamp], expected: date):
+    """
+    根据水位线计算单只股票需要请求的区间。
+
+    :param watermark: 已入库的最新K线时间，None 表示尚无数据
+    :param expected: 应当已有的最新日期
+    :return: None 表示已是最新无需请求；否则返回 (start_date, count)，start_date 为 None 表示全量
+    """
+    if watermark is None or pd.isna(watermark):
+        return None, FULL_HISTORY_COUNT
+
+    last = watermark.date()
+    if last >= expected:
+        return None
+
+    start = last + timedelta(days=1)
+    gap = int(np.busday_count(start, expected + timedelta(days=1)))
+    return start.strftime('%Y%m%d'), gap + INCREMENTAL_MARGIN
+
+
+def load_reference_bars(db: Session, watermarks: Dict[str, pd.Timestamp]) -> Dict[str, pd.DataFrame]:
+    """
+    读出每只股票水位线附近已入库的K线 (time, close)，供 SyncPipeline 检测除权除息。
+    按水位线分组查询，每组只读 [水位线 - REFERENCE_LOOKBACK_DAYS, 水位线] 这一小段 (主键以 time 开头)。
+
+    :param watermarks: {code: 水位线}
+    :return: {code: DataFrame['time', 'close']}，库中没有对应K线的股票不在其中
+    """
+    groups: Dict[pd.Timestamp, List[str]] = {}
+    for code, watermark in watermarks.items():
+        groups.setdefault(watermark, []).append(code)
+
+    references = {}
+    for watermark, codes in groups.items():
+        bars = crud.get_daily_klines(db, codes, watermark - timedelta(days=REFERENCE_LOOKBACK_DAYS), watermark)
+        references.update({code: df[['time', 'close']].reset_index(drop=True)
+                           for code, df in bars.groupby('code', sort=False)})
+    return references
+
+
+def plan_rebase_refetch(codes: List[str], earliest: Dict[str, pd.Timestamp], now: Optional[datetime] = None) \
+        -> List[SyncTask]:
+    """
+    为前复权价格基准已变化的股票生成全量重新拉取任务: 条数覆盖库中已有的全部历史 (至少 FULL_HISTORY_COUNT)，
+    写入前删除库中旧基准的K线。
+
+    :param codes: 检测到除权除息的股票
+    :param earliest: {code: 库中最早K线时间}
+    """
+    now = now or market_now()
+    tasks = []
+    for code in codes:
+        count = FULL_HISTORY_COUNT
+        if code in earliest:
+            history = trading_calendar.count(earliest[code].date(), now.date() + timedelta(days=1)) + INCREMENTAL_MARGIN
+            count = max(count, history)
+        tasks.append(SyncTask(code=code, count=count, replace=True))
+    return tasks
+
+
+def gap_ranges(missing: pd.DataFrame, trade_days: List[date]) -> pd.DataFrame:
+    """
+    把缺失的 (code, day) 按交易日连续性合并为区间。
+
+    :param missing: crud.get_missing_daily_bars 的结果 (不含 day 为空的行)
+    :param trade_days: 扫描所用的交易日列表 (升序)
+    :return: DataFrame ['code', 'start', 'end', 'days']
+    """
+    if missing.empty:
+        return pd.DataFrame(columns=['code', 'start', 'end', 'days'])
+    df = missing.sort_values(['code', 'day']).reset_index(drop=True)
+    # 交易日序号相差 1 视为同一段缺口 (中间的周末、节假日不打断)
+    position = pd.Index(pd.to_datetime(trade_days)).get_indexer(df['day'])
+    new_run = (df['code'] != df['code'].shift()) | (np.diff(position, prepend=-2) != 1)
+    run_id = new_run.cumsum()
+    return df.groupby(run_id).agg(code=('code', 'first'), start=('day', 'min'), end=('day', 'max'),
+                                  days=('day', 'size')).reset_index(drop=True)
+
+
+def plan_gap_repair(missing: pd.DataFrame, trade_days: List[date], now: Optional[datetime] = None) -> List[SyncTask]:
+    """
+    根据缺口扫描结果生成修复任务。
+
+    腾讯接口只能按 "最近 N 条" 取K线，所以每只股票一个任务: 条数覆盖到最早的缺口，
+    解析时只保留 [最早缺口, 最晚缺口] 区间写库。库中没有任何K线的股票按首次同步全量拉取。
+    """
+    now = now or market_now()
+    tasks = []
+    empty_codes = missing.loc[missing['day'].isna(), 'code']
+    tasks.extend(SyncTask(code=code, count=FULL_HISTORY_COUNT) for code in empty_codes)
+
+    ranges = gap_ranges(missing.dropna(subset=['day']), trade_days)
+    for code, group in ranges.groupby('code', sort=False):
+        start, end = group['start'].min().date(), group['end'].max().date()
+        count = trading_calendar.count(start, now.date() + timedelta(days=1)) + INCREMENTAL_MARGIN
+        tasks.append(SyncTask(code=code, count=count, start_date=start.strftime('%Y%m%d'),
+                              end_date=end.strftime('%Y%m%d')))
+    return tasks
+
+
+def repair_daily_kline_gaps(codes: Optional[List[str]] = None, lookback_days: Optional[int] = None):
+    """
+    扫描并修复日K线缺口: 对照交易日历一条 SQL 找出每只股票缺失的交易日，只为有缺口的股票请求缺失区间。
+
+    停牌日也会被扫描为缺口，请求后没有数据、不会写入，回看窗口 (GAP_SCAN_LOOKBACK_DAYS) 限制了这类重复请求的范围。
+
+    :param codes: 要检查的股票，默认库中已有K线的全部股票
+    :param lookback_days: 回看的交易日数
+    :return: SyncPipeline 的运行指标；没有缺口时返回 None
+    """
+    lookback_days = lookback_days or config.GAP_SCAN_LOOKBACK_DAYS
+    expected = latest_expected_trade_date()
+    first = trading_calendar.offset(expected, -(lookback_days - 1))
+    trade_days = trading_calendar.trading_days(first, expected)
+
+    db: Session = next(database.get_db())
+    try:
+        if codes is None:
+            codes = list(crud.get_latest_kline_times(db))
+        missing = crud.get_missing_daily_bars(db, codes, trade_days)
+    finally:
+        db.close()
+
+    ranges = gap_ranges(missing.dropna(subset=['day']), trade_days)
+    logger.info(f"缺口扫描 ({first} ~ {expected}, {len(codes)} 只): 缺失 {int(ranges['days'].sum())} 根K线, "
+                f"{len(ranges)} 段, 涉及 {ranges['code'].nunique()} 只; "
+                f"无任何K线 {int(missing['day'].isna().sum())} 只。")
+    for row in ranges.sort_values('days', ascending=False).head(10).itertuples():
+        logger.info(f"  {row.code}: {row.start.date()} ~ {row.end.date()} ({row.days} 个交易日)")
+
+    tasks = plan_gap_repair(missing, trade_days)
+    if not tasks:
+        return None
+    return SyncPipeline(target=expected, checkpoint_path=config.GAP_REPAIR_CHECKPOINT_PATH).run(tasks)
+
+
+def _market_of(code: str) -> str:
+    """根据代码前缀 (sh/sz/bj) 推断交易所"""
+    prefix = code[:2].lower()
+    return prefix.upper() if prefix in ('sh', 'sz', 'bj') else ('SH' if code.startswith('6') else 'SZ')
+
 
 def sync_all_stocks_and_kline():
     """
     同步所有A股的股票列表和它们的日线行情数据。
     这是一个核心的、完整的同步流程。
+    日K线按水位线 (每只股票已入库的最新日期) 增量同步，只请求缺失的部分；
+    抓取、解析、写库由 SyncPipeline 分阶段并行执行，中断后重新运行会从断点继续。
+    增量结果与库中重叠K线的收盘价不一致 (除权除息) 的股票，删除旧K线后全量重新拉取。
     """
     logger.info("========== 开始执行全量数据同步任务 ==========")
 
@@ -17,43 +193,66 @@ def sync_all_stocks_and_kline():
     stocks_df = data_fetcher.fetch_all_stock_list()
     if stocks_df.empty:
         logger.error("获取股票列表失败，无法继续同步。任务终止。")
+        db.close()
         return
 
     total_stocks = len(stocks_df)
-    logger.info(f"共获取到 {total_stocks} 只股票，将开始逐一处理。")
 
-    # 3. 遍历每只股票，同步其信息和日K线数据
-    for index, row in stocks_df.iterrows():
-        stock_code = row['code']
-        stock_name = row['name']
-        
-        # 构造一个临时的 market 和 ipo_date
-        # TODO: 后续可以从更详细的数据源获取这些信息
-        market = 'SH' if stock_code.startswith('6') else 'SZ'
-        ipo_date = None # ak.stock_individual_info_em(symbol=stock_code.split('.')[0])['上市日期'].iloc[0]
+    # 3. 一次性 Upsert 股票基础信息 (代替逐只 get_or_create + commit)
+    # TODO: ipo_date 后续可以从更详细的数据源获取
+    crud.bulk_save_stocks(db, [
+        {'code': code, 'name': name, 'market': _market_of(code)}
+        for code, name in zip(stocks_df['code'], stocks_df['name'])
+    ])
 
-        logger.info(f"--- [{index + 1}/{total_stocks}] 正在处理: {stock_code} {stock_name} ---")
+    # 4. 一次查询取出所有股票的水位线，只请求缺口部分
+    watermarks = crud.get_latest_kline_times(db)
+    expected = latest_expected_trade_date()
+    logger.info(f"共获取到 {total_stocks} 只股票，已有K线水位线 {len(watermarks)} 只，目标日期 {expected}。")
 
-        # 3.1 在 'stocks' 表中获取或创建记录
-        crud.get_or_create_stock(db, stock_code=stock_code, stock_name=stock_name, market=market, ipo_date=ipo_date)
+    plans = {}
+    for code in stocks_df['code']:
+        plan = plan_incremental_fetch(watermarks.get(code), expected)
+        if plan is not None:
+            plans[code] = plan
+    # 增量任务带上水位线附近的已入库K线，用于检测除权除息
+    references = load_reference_bars(db, {code: watermarks[code] for code, (start_date, _) in plans.items()
+                                          if start_date is not None})
+    db.close()
+    tasks = [SyncTask(code=code, count=count, start_date=start_date, reference=references.get(code))
+             for code, (start_date, count) in plans.items()]
 
-        # 3.2 获取该股票的日K线
-        # 为了演示，我们可以先同步最近一年的数据，避免首次运行时间过长
-        # start_date="20230101"
-        kline_df = data_fetcher.fetch_stock_daily_kline(stock_code=stock_code)
-        
-        if kline_df.empty:
-            logger.warning(f"未能获取 {stock_code} 的K线数据，跳过保存。")
-            continue
+    logger.info(f"跳过已是最新的股票 {total_stocks - len(tasks)} 只，待同步 {len(tasks)} 只。")
 
-        # 3.3 将DataFrame转换为字典列表，然后批量保存
-        kline_data_list = kline_df.to_dict(orient='records')
-        crud.bulk_save_daily_kline(db, kline_data=kline_data_list)
+    # 5. 分阶段并行抓取、解析、批量写库
+    if tasks:
+        pipeline = SyncPipeline(target=expected)
+        pipeline.run(tasks)
+        # 6. 前复权价格基准变化的股票: 删除旧K线，按已有历史长度全量重新拉取
+        if pipeline.rebased:
+            logger.info(f"{len(pipeline.rebased)} 只股票的前复权价格发生变化 (除权除息)，全量重新拉取: "
+                        f"{pipeline.rebased[:10]}")
+            db = next(database.get_db())
+            try:
+                earliest = crud.get_earliest_kline_times(db, pipeline.rebased)
+            finally:
+                db.close()
+            SyncPipeline(target=expected).run(plan_rebase_refetch(pipeline.rebased, earliest))
 
-    logger.info("========== 全量数据同步任务执行完毕 ==========")
+    logger.info("========== 数据同步任务执行完毕 ==========")
 
 
 if __name__ == '__main__':
     # 提供一个直接运行此脚本的入口
     # 确保数据库已启动并初始化
-    sync_all_stocks_and_kline() 
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="日K线同步")
+    parser.add_argument('--repair-gaps', action='store_true', help="只扫描并修复库中已有股票的日K线缺口")
+    parser.add_argument('--lookback', type=int, default=None, help="缺口扫描回看的交易日数")
+    args = parser.parse_args()
+
+    if args.repair_gaps:
+        repair_daily_kline_gaps(lookback_days=args.lookback)
+    else:
+        sync_all_stocks_and_kline()
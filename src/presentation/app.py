@@ -1,15 +1,12 @@
 import streamlit as st
-import pandas as pd
 import redis
-import json
 import time
 import numpy as np
-import os
-from datetime import datetime
 from src.config import config
 from src.presentation import stock_detail, signal_history, top_picks, multifactor_picks
 from src.data_storage.watchlist_manager import watchlist_manager
-from src.data_storage import database, crud # 新增导入
+from src.data_storage.quote_store import QuoteStore
+from src.data_storage import stock_universe
 from src.data_acquisition import data_fetcher # 新增导入
 
 # --- 页面配置 (必须是第一个 st 命令) ---
@@ -39,54 +36,6 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# --- 静态股票名称加载 (从数据库加载) ---
-@st.cache_resource(ttl=3600) # 缓存 1 小时，避免频繁查库
-def load_stock_name_map_from_db():
-    """
-    从本地数据库加载全量股票名称，并构建多维索引。
-    数据源：PostgreSQL 'stock_basic' 表 (models.Stock)
-    确保无论代码什么格式都能找到名称。
-    """
-    name_map = {}
-    try:
-        # 使用独立的 session 进行查询
-        with database.SessionLocal() as db:
-            all_stocks = crud.get_all_stocks(db)
-            # print(f"DEBUG: Loaded {len(all_stocks)} stocks from database for name mapping.")
-            
-            for stock in all_stocks:
-                if not stock.code or not stock.name:
-                    continue
-                    
-                code = str(stock.code).strip() # e.g. sh600000
-                name = str(stock.name).strip()
-                
-                # 1. 原始格式
-                name_map[code] = name
-                
-                # 2. 纯数字格式 (去前缀)
-                # 假设数据库存的是带前缀的标准代码 (sh600000)
-                clean_code = code.lower().replace("sh", "").replace("sz", "").replace(".", "")
-                if clean_code:
-                    name_map[clean_code] = name
-                    
-                    # 3. 各种变体索引 (方便前端怎么传都能找到)
-                    # 生成 .SH/.SZ 后缀
-                    name_map[f"{clean_code}.SH"] = name
-                    name_map[f"{clean_code}.SZ"] = name
-                    name_map[f"{clean_code}.sh"] = name
-                    name_map[f"{clean_code}.sz"] = name
-                    # 生成 sh/sz 前缀
-                    name_map[f"sh{clean_code}"] = name
-                    name_map[f"sz{clean_code}"] = name
-                    name_map[f"SH{clean_code}"] = name
-                    name_map[f"SZ{clean_code}"] = name
-                    
-    except Exception as e:
-        print(f"Error loading stock names from DB: {e}")
-    
-    return name_map
-
 # --- Redis 连接 ---
 @st.cache_resource
 def get_redis_client():
@@ -98,14 +47,8 @@ def get_redis_client():
     )
 
 def get_realtime_data_from_redis(client):
-    keys = client.keys('quote:*')
-    if not keys:
-        return pd.DataFrame()
-    
-    # 批量获取
-    values = client.mget(keys)
-    data_list = [json.loads(v) for v in values if v]
-    return pd.DataFrame(data_list)
+    # 行情哈希一次往返读全，不扫描 quote:* 键空间
+    return QuoteStore(client).get_all()
 
 def calculate_snapshot_score(df):
     """
@@ -243,44 +186,29 @@ def on_watchlist_click(stock):
 def get_watchlist_names(watchlist_codes, redis_client):
     """
     获取自选股代码对应的中文名称。
-    策略：内存静态字典(基于数据库) -> Redis实时数据 -> 实时API兜底
+    策略：股票池(基于数据库) -> Redis实时数据 -> 实时API兜底
     """
     if not watchlist_codes:
         return {}
-        
-    name_map = {}
-    
-    # 0. 优先使用内存静态字典 (从数据库加载)
+
+    # 0. 优先使用股票池 (数据库 stocks 表的内存映射副本，任意代码格式 O(1) 查找)
     # 这是最快且最准确的方式
-    static_map = load_stock_name_map_from_db()
-    
-    missing_codes = []
-    for code in watchlist_codes:
-        # 尝试直接匹配 (已包含各种变体)
-        if code in static_map:
-            name_map[code] = static_map[code]
-        else:
-            # 再次尝试大小写转换 (虽然 dict 里已经有了，但以防万一)
-            upper_code = code.upper()
-            if upper_code in static_map:
-                name_map[code] = static_map[upper_code]
-            else:
-                missing_codes.append(code)
-                
+    name_map = stock_universe.get_universe().names_for(watchlist_codes)
+    missing_codes = [code for code in watchlist_codes if code not in name_map]
+
     # 如果全都找到了，直接返回
     if not missing_codes:
         return name_map
 
     # 1. 批量从 Redis 获取 (针对新股或 DB 未及时更新的)
-    keys = [f"quote:{code}" for code in missing_codes]
-    values = redis_client.mget(keys)
+    quotes = QuoteStore(redis_client).get_many(missing_codes)
     
     still_missing = []
-    for code, val in zip(missing_codes, values):
+    for code in missing_codes:
         found = False
-        if val:
+        data = quotes.get(code)
+        if data:
             try:
-                data = json.loads(val)
                 name = data.get('name')
                 if name and name != code: 
                     name_map[code] = name
@@ -1,17 +1,13 @@
 import streamlit as st
 import pandas as pd
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from src.data_acquisition import data_fetcher
+from src.data_storage.kline_repository import kline_repository
+from src.data_storage import stock_universe
 from src.logger import logger
 from src.strategy_engine.multifactor_stock_picker import score_candidates, build_horizon_config, PREFERENCES, PreferenceKey
 
 
-@st.cache_data(ttl=3600, show_spinner=False)
-def cached_kline(code: str) -> pd.DataFrame:
-    return data_fetcher.fetch_stock_daily_kline(code)
-
-
 def _build_candidate_pool(spot_df: pd.DataFrame, horizon: str, pool_size: int) -> pd.DataFrame:
     df = spot_df.copy()
     for col in ["pct_change", "turnover_rate", "volume_ratio", "price"]:
@@ -85,14 +81,11 @@ def _calc_neighbor_attention(codes: list[str], spot_df: pd.DataFrame, k: int = 3
         df[col] = pd.to_numeric(df[col], errors="coerce")
 
     def parse_key(code: str):
-        c = str(code).lower().replace(".", "")
-        market = "sh" if c.startswith("sh") else "sz" if c.startswith("sz") else c[:2]
-        num = "".join([ch for ch in c if ch.isdigit()])
         try:
-            n = int(num)
-        except Exception:
-            n = -1
-        return market, n
+            market, digits = stock_universe.parse_code(code)
+        except ValueError:
+            return "", -1
+        return market, int(digits)
 
     df["market"] = df["code"].map(lambda x: parse_key(x)[0])
     df["num"] = df["code"].map(lambda x: parse_key(x)[1])
@@ -133,7 +126,7 @@ def render_multifactor_picks_page():
     st.title("🧠 多因子选股（短线 / 中线 / 长线）")
     st.markdown(
         """
-本页基于**全市场实时快照**做候选池，再并发拉取候选池的**历史日K**计算多因子得分。
+本页基于**全市场实时快照**做候选池，再一次性读取候选池的**历史日K**面板计算多因子得分。
 
 - **短线（2–5个交易日）**：更偏向动量 + 量能 + 动能走强
 - **中线（2–8周）**：更偏向趋势结构 + 动量 + 波动控制
@@ -144,14 +137,12 @@ def render_multifactor_picks_page():
     )
 
     with st.expander("参数（可选）", expanded=False):
-        col1, col2, col3 = st.columns(3)
+        col1, col2 = st.columns(2)
         with col1:
             short_pool = st.slider("短线候选池规模", 30, 200, 80, step=10)
             mid_pool = st.slider("中线候选池规模", 50, 300, 150, step=10)
             long_pool = st.slider("长线候选池规模", 80, 400, 220, step=10)
         with col2:
-            workers = st.slider("并发线程数", 4, 20, 10, step=1)
-        with col3:
             top_n = st.slider("每组输出数量（最多5）", 2, 5, 5, step=1)
             min_score = st.slider("最低得分门槛", 50, 85, 65, step=1)
             min_prob = st.slider("最低推荐置信度门槛", 0.45, 0.85, 0.55, step=0.01)
@@ -194,9 +185,7 @@ def render_multifactor_picks_page():
                 all_codes.extend(p["code"].tolist())
             all_codes = list(dict.fromkeys(all_codes))
 
-            st.write(f"3) 并发拉取候选池日K并计算因子（候选总数：{len(all_codes)}）...")
-            progress = st.progress(0)
-            klines: dict[str, pd.DataFrame] = {}
+            st.write(f"3) 读取候选池日K面板并计算因子（候选总数：{len(all_codes)}）...")
             realtime_rows: dict[str, dict] = {}
 
             # realtime_rows 需要包含 name/price/pct_change/turnover_rate/volume_ratio
@@ -225,25 +214,19 @@ def render_multifactor_picks_page():
                     if c in realtime_rows:
                         realtime_rows[c]["neighbor_attention"] = s
 
-            with ThreadPoolExecutor(max_workers=workers) as executor:
-                futures = {executor.submit(cached_kline, code): code for code in all_codes}
-                done = 0
-                for f in as_completed(futures):
-                    code = futures[f]
-                    try:
-                        df = f.result()
-                        if df is not None and not df.empty:
-                            klines[code] = df
-                    except Exception as e:
-                        logger.error(f"多因子选股：拉取K线失败 {code}: {e}")
-                    done += 1
-                    progress.progress(done / max(1, len(all_codes)))
+            # 一条 SQL 读出全部候选股的K线 (数据库缺口才请求网络)，按交易日对齐为面板
+            try:
+                panel = kline_repository.get_panel(all_codes, count=320)
+            except Exception as e:
+                logger.error(f"多因子选股：读取K线面板失败: {e}")
+                st.error("读取历史K线失败，请稍后再试。")
+                return
 
             st.write("4) 分期限计算多因子得分并给出推荐...")
             results = {}
             for horizon_key in ["short", "mid", "long"]:
                 pool_codes = set(pools[horizon_key]["code"].tolist())
-                sub_klines = {c: klines[c] for c in pool_codes if c in klines}
+                sub_klines = panel.select([c for c in panel.codes if c in pool_codes])
                 sub_rt = {c: realtime_rows.get(c, {}) for c in pool_codes}
                 results[horizon_key] = score_candidates(
                     horizon=horizon_key,
@@ -8,7 +8,12 @@ import concurrent.futures
 from src.config import config
 from src.data_acquisition import data_fetcher, deep_analysis_fetcher
 from src.data_storage.watchlist_manager import watchlist_manager
-from src.strategy_engine.composite_strategy import CompositeStrategy
+from src.data_storage.kline_repository import kline_repository
+from src.data_storage.minute_store import minute_store
+from src.data_storage.quote_store import QuoteStore
+from src.data_storage import stock_universe
+from src.strategy_engine.composite_strategy import CompositeStrategy, composite_states
+from src.scheduling.trading_calendar import trading_calendar, market_now
 from src.strategy_engine.backtest_engine import run_backtest
 from datetime import datetime, timedelta
 
@@ -29,9 +34,9 @@ def get_stock_realtime_info(stock_code):
     # 1. 尝试从 Redis 获取
     try:
         r = get_redis_client()
-        data_str = r.get(f"quote:{stock_code}")
-        if data_str:
-            return json.loads(data_str)
+        data = QuoteStore(r).get(stock_code)
+        if data:
+            return data
     except Exception as e:
         # Redis 连接失败，不阻塞，尝试直接API
         pass
@@ -86,7 +91,7 @@ def render_order_book(data):
 def render_kline_chart(stock_code):
     """绘制简单的K线图 (需连接 akshare 获取历史数据)"""
     try:
-        df = data_fetcher.fetch_stock_daily_kline(stock_code, start_date="20240101")
+        df = kline_repository.get(stock_code, start_date="20240101")
         if df.empty:
             st.warning("暂无历史K线数据")
             return
@@ -128,7 +133,8 @@ def render_minute_chart(stock_code):
     """绘制分时图 (Debug模式)"""
     try:
         # 获取分钟数据
-        df = data_fetcher.fetch_stock_minute_data(stock_code, period='1')
+        # 优先读取分钟K线库，只有当天数据落后时才请求网络补齐
+        df = minute_store.history(stock_code, days=1)
         if df.empty:
             st.warning("API返回数据为空")
             return
@@ -291,7 +297,7 @@ def render_history_money_flow(stock_code):
         # 获取最近 60 天日线数据
         end_date = datetime.now().strftime("%Y%m%d")
         start_date = (datetime.now() - timedelta(days=90)).strftime("%Y%m%d")
-        df = data_fetcher.fetch_stock_daily_kline(stock_code, start_date=start_date, end_date=end_date)
+        df = kline_repository.get(stock_code, start_date=start_date, end_date=end_date)
         
         if df.empty:
             st.warning("暂无历史数据计算资金趋势")
@@ -400,8 +406,11 @@ def render_deep_analysis(stock_code):
                     st.dataframe(holders, use_container_width=True)
                 else:
                     clean_code = deep_analysis_fetcher.get_clean_code(stock_code)
-                    url = f"http://data.eastmoney.com/gdfx/{clean_code}.html"
-                    st.warning(f"暂无最新股东数据 (可能受限于网络)。 [👉 点击查看东财深度数据]({url})")
+                    if clean_code:
+                        url = f"http://data.eastmoney.com/gdfx/{clean_code}.html"
+                        st.warning(f"暂无最新股东数据 (可能受限于网络)。 [👉 点击查看东财深度数据]({url})")
+                    else:
+                        st.warning("暂无最新股东数据")
 
                 # --- 4. 消息面 ---
                 st.markdown("#### 4. 📰 市场消息与热度")
@@ -419,11 +428,11 @@ def render_strategy_diagnosis(stock_code):
     """渲染策略诊断面板"""
     try:
         # 1. 获取历史数据 (至少200天以计算指标)
-        # 在生产环境中，这里可以进一步优化缓存
+        # 数据库优先读取，只有缺口部分才请求网络
         end_date = datetime.now().strftime("%Y%m%d")
         start_date = (datetime.now() - timedelta(days=300)).strftime("%Y%m%d")
         
-        df = data_fetcher.fetch_stock_daily_kline(stock_code, start_date=start_date, end_date=end_date)
+        df = kline_repository.get(stock_code, start_date=start_date, end_date=end_date)
         
         if df.empty or len(df) < 30:
             st.warning("历史数据不足，无法进行策略诊断")
@@ -435,6 +444,15 @@ def render_strategy_diagnosis(stock_code):
         
         # 取最新一天的结果
         latest = result_df.iloc[-1]
+
+        # 盘中今天的K线尚未入库时，用最新价对增量状态试算实时评分 (状态按股票缓存，不在每次渲染时重放历史)
+        live = None
+        now = market_now()
+        if trading_calendar.is_trading_time(now) and pd.Timestamp(latest['time']).date() < now.date():
+            quote = get_stock_realtime_info(stock_code)
+            price = float(quote.get('price') or 0) if quote else 0.0
+            if price > 0:
+                live = composite_states.preview(stock_code, df['time'], df['close'], price)
         
         # 3. 布局展示
         st.subheader("🤖 AI 策略诊断")
@@ -464,6 +482,8 @@ def render_strategy_diagnosis(stock_code):
             ))
             fig.update_layout(height=250, margin=dict(l=10, r=10, t=30, b=10))
             st.plotly_chart(fig, use_container_width=True)
+            if live is not None:
+                st.caption(f"盘中实时评分: {live['score']} (按最新价 {live['close']:.2f} 试算)")
             
         with col_signal:
             st.markdown("### 核心信号")
@@ -576,12 +596,10 @@ def render_stock_detail_page():
     if not realtime_data:
         # 再试一次，可能格式问题，尝试转换格式
         # 如果传入的是 300115.SZ，尝试转为 sz300115
-        clean_code = stock_code.lower().replace('.', '').replace('sz', 'sz').replace('sh', 'sh') # 简单清理
-        # 正规化 logic same as data_fetcher
-        if not (clean_code.startswith('sh') or clean_code.startswith('sz')):
-             if stock_code.startswith('6'): clean_code = f"sh{clean_code}"
-             else: clean_code = f"sz{clean_code}"
-             
+        try:
+            clean_code = stock_universe.to_tencent(stock_code)
+        except ValueError:
+            clean_code = stock_code
         realtime_data = get_stock_realtime_info(clean_code)
         
         if not realtime_data:
@@ -1,40 +1,54 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from src.data_acquisition import data_fetcher
-from src.strategy_engine.composite_strategy import CompositeStrategy
+from src.data_storage.kline_repository import kline_repository
+from src.scheduling.trading_calendar import trading_calendar, market_now
+from src.strategy_engine.composite_strategy import CompositeStrategy, composite_states
 from src.logger import logger
 
-def get_strategy_score(stock_code, stock_name):
+def score_candidates(candidates: pd.DataFrame) -> list:
     """
-    获取单只股票的策略评分。
-    辅助函数，用于线程池并发调用。
+    对候选股票批量运行综合策略，返回最新一根K线的评分。
+    K线由 kline_repository.get_panel 一次读成面板，CompositeStrategy.latest_scores 对全部候选股做截面计算。
+    盘中今天的K线尚未入库的股票，用候选池里的最新价对缓存的增量状态 (composite_states) 试算实时评分。
     """
-    try:
-        # 获取 K 线数据 (最近 100 天即可满足指标计算)
-        df = data_fetcher.fetch_stock_daily_kline(stock_code)
-        if df.empty or len(df) < 30:
-            return None
-            
-        strategy = CompositeStrategy()
-        result_df = strategy.apply(df)
-        
-        if result_df.empty:
-            return None
-            
-        latest = result_df.iloc[-1]
-        
-        return {
-            'code': stock_code,
-            'name': stock_name,
-            'score': latest.get('score', 0),
-            'signal': latest.get('signal', 0),
-            'price': latest.get('close', 0),
-            'desc': latest.get('signal_desc', '')
-        }
-    except Exception as e:
-        logger.error(f"Error scoring {stock_code}: {e}")
-        return None
+    panel = kline_repository.get_panel(candidates['code'].tolist(), count=320)
+    latest = CompositeStrategy().latest_scores(panel, min_bars=30)
+    if latest.empty:
+        return []
+    live_columns = candidates[['code', 'name', 'price', 'pct_change', 'volume_ratio']].rename(columns={'price': 'live_price'})
+    latest = latest.merge(live_columns.drop_duplicates('code'), on='code', how='left')
+    now = market_now()
+    if trading_calendar.is_trading_time(now):
+        latest = _preview_live(latest, panel, now)
+    return [{
+        'code': row['code'],
+        'name': row['name'],
+        'score': row['score'],
+        'signal': row['signal'],
+        'price': row['close'],
+        'desc': row['signal_desc'],
+        # 补充实时数据中的涨幅信息 (K线里的数据可能是昨天的)
+        'pct_change': row['pct_change'],
+        'volume_ratio': row['volume_ratio'],
+    } for _, row in latest.iterrows()]
+
+def _preview_live(latest: pd.DataFrame, panel, now) -> pd.DataFrame:
+    """最新K线早于今天且有实时价的股票，评分换成增量状态按实时价试算的结果"""
+    latest = latest.copy()
+    columns = {code: j for j, code in enumerate(panel.codes)}
+    close = panel['close']
+    for i, row in latest.iterrows():
+        price = float(row['live_price'])
+        if pd.Timestamp(row['time']).date() >= now.date() or not price > 0:
+            continue
+        j = columns[row['code']]
+        valid = ~np.isnan(close[:, j])
+        live = composite_states.preview(row['code'], panel.index[valid], close[valid, j], price)
+        latest.loc[i, ['close', 'score', 'signal', 'signal_desc']] = [
+            price, live['score'], live['signal'], live['signal_desc']]
+    return latest
 
 def on_view_detail(code):
     """
@@ -89,30 +103,14 @@ def render_top_picks_page():
             
             st.write(f"初筛完成，选出 {len(candidates)} 只潜力股，准备进行 AI 评分...")
             
-            # --- 第三步: 并发策略计算 ---
-            st.write("3. 并发拉取 K 线并运行 AI 策略模型...")
-            
-            scored_stocks = []
-            progress_bar = st.progress(0)
-            
-            with ThreadPoolExecutor(max_workers=10) as executor:
-                futures = {
-                    executor.submit(get_strategy_score, row['code'], row['name']): row 
-                    for _, row in candidates.iterrows()
-                }
-                
-                completed_count = 0
-                for future in as_completed(futures):
-                    result = future.result()
-                    if result:
-                        # 补充实时数据中的涨幅信息 (K线里的数据可能是昨天的)
-                        match_row = candidates[candidates['code'] == result['code']].iloc[0]
-                        result['pct_change'] = match_row['pct_change']
-                        result['volume_ratio'] = match_row['volume_ratio']
-                        scored_stocks.append(result)
-                    
-                    completed_count += 1
-                    progress_bar.progress(completed_count / len(candidates))
+            # --- 第三步: 批量策略计算 ---
+            st.write("3. 批量读取 K 线并运行 AI 策略模型...")
+            # 一条 SQL 读出全部候选股的K线 (数据库缺口才请求网络)，整个候选池一次截面评分
+            try:
+                scored_stocks = score_candidates(candidates)
+            except Exception as e:
+                logger.error(f"Error scoring candidates: {e}")
+                scored_stocks = []
             
             status.update(label="扫描完成!", state="complete", expanded=False)
 
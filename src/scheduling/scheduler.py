@@ -2,9 +2,28 @@ from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.triggers.cron import CronTrigger
 from src.logger import logger
 from src.data_storage import database, crud
-from src.data_acquisition import data_fetcher
+from src.data_acquisition import data_fetcher, http_clients
 from src.data_storage.watchlist_manager import watchlist_manager
+from src.data_storage.kline_repository import kline_repository
+from src.scheduling.trading_calendar import trading_calendar, market_now
+from src.main_sync import repair_daily_kline_gaps, latest_expected_trade_date
+from src.config import config
 from datetime import datetime, timedelta
+import functools
+import pandas as pd
+
+def trading_day_only(job):
+    """
+    只在交易日执行的任务: 周末和法定节假日没有新的日K线，跳过同步和策略扫描。
+    """
+    @functools.wraps(job)
+    def wrapper(*args, **kwargs):
+        today = market_now().date()
+        if not trading_calendar.is_trading_day(today):
+            logger.info(f"SCHEDULER: {today} is not a trading day, skipping {job.__name__}.")
+            return
+        return job(*args, **kwargs)
+    return wrapper
 
 def update_stock_list_job():
     """
@@ -19,10 +38,14 @@ def update_stock_list_job():
     except Exception as e:
         logger.error(f"SCHEDULER: Error updating stock list: {e}")
 
+@trading_day_only
 def daily_sync_watchlist_job():
     """
     每日任务：同步自选股的日线历史数据。
     通常在收盘后运行 (e.g., 17:00)，确保数据库中有完整的日K线用于回测和分析。
+    对照交易日历扫描自选股的日K线缺口 (含今天)，只请求缺失的区间；
+    缺口修复只补缺失的日期 (不覆盖已有K线)，之后再用收盘定型的数据覆盖最近几个交易日，
+    修正盘中由 PersistenceService / 读取层写入的未定型K线。
     """
     logger.info("SCHEDULER: [Start] Syncing watchlist history...")
     try:
@@ -31,30 +54,34 @@ def daily_sync_watchlist_job():
             logger.info("SCHEDULER: Watchlist is empty, nothing to sync.")
             return
 
-        db = next(database.get_db())
-        
-        # 同步最近 5 天的数据，以防遗漏
-        end_date = datetime.now().strftime("%Y%m%d")
-        start_date = (datetime.now() - timedelta(days=5)).strftime("%Y%m%d")
-        
-        for stock_code in watchlist:
-            try:
-                logger.info(f"SCHEDULER: Syncing {stock_code}...")
-                df = data_fetcher.fetch_stock_daily_kline(stock_code, start_date=start_date, end_date=end_date)
-                
-                if not df.empty:
-                    # 转换为 list of dicts
-                    records = df.to_dict('records')
-                    crud.bulk_upsert_daily_kline(db, records)
-            except Exception as e:
-                logger.error(f"SCHEDULER: Failed to sync {stock_code}: {e}")
-                
-        db.close()
+        metrics = repair_daily_kline_gaps(watchlist)
+        if metrics is None:
+            logger.info("SCHEDULER: Watchlist daily klines are complete, nothing to repair.")
+        settle_recent_bars(watchlist)
         logger.info("SCHEDULER: [End] Watchlist sync completed.")
 
     except Exception as e:
         logger.error(f"SCHEDULER: Error syncing watchlist: {e}")
 
+def settle_recent_bars(codes, days: int = None):
+    """用收盘定型的K线覆盖写入 (upsert) 每只股票最近 days 个交易日，晚于应有最新交易日的K线不写"""
+    days = days or config.SETTLE_RECENT_DAYS
+    expected = pd.Timestamp(latest_expected_trade_date(market_now()))
+    db = next(database.get_db())
+    try:
+        for stock_code in codes:
+            try:
+                df = data_fetcher.fetch_stock_daily_kline(stock_code, count=days, use_cache=False)
+                if df.empty:
+                    continue
+                df = df[pd.to_datetime(df['time']) <= expected]
+                crud.bulk_upsert_daily_kline(db, df.to_dict('records'))
+            except Exception as e:
+                logger.error(f"SCHEDULER: Failed to settle recent bars of {stock_code}: {e}")
+    finally:
+        db.close()
+
+@trading_day_only
 def daily_strategy_scan_job():
     """
     每日任务：扫描自选股，运行策略并保存信号。
@@ -81,40 +108,30 @@ def daily_strategy_scan_job():
         start_date = (datetime.now() - timedelta(days=300)).strftime("%Y%m%d")
         today_str = datetime.now().strftime("%Y-%m-%d")
 
-        for stock_code in watchlist:
-            try:
-                # 1. 获取历史K线
-                df = data_fetcher.fetch_stock_daily_kline(stock_code, start_date=start_date, end_date=end_date)
-                if df.empty:
-                    continue
-                    
-                # 2. 运行策略
-                result_df = strategy.apply(df)
-                
-                # 3. 检查今日信号
-                # 注意：result_df 的索引可能是整数，也可能是时间，取决于 fetcher
-                # 这里我们假设最后一行是最新的，并且时间是今天
-                latest = result_df.iloc[-1]
-                latest_date_str = str(latest['time']).split(' ')[0] # 提取日期部分
-                
-                # 只保存今天的信号
-                if latest_date_str == today_str and latest['signal'] != 0:
-                    logger.info(f"SCHEDULER: Found signal for {stock_code}: {latest['signal']}")
-                    
-                    signal_type = 'BUY' if latest['signal'] == 1 else 'SELL'
-                    desc = latest.get('signal_desc', '')
-                    
-                    all_signals.append({
-                        'time': latest['time'],
-                        'code': stock_code,
-                        'strategy_name': strategy.name,
-                        'signal_type': signal_type,
-                        'price': float(latest['close']),
-                        'description': desc
-                    })
-                    
-            except Exception as e:
-                logger.error(f"SCHEDULER: Error scanning {stock_code}: {e}")
+        # 1. 一次读出全部自选股的历史K线面板 (数据库优先，缺口才请求网络)，2. 截面运行策略
+        panel = kline_repository.get_panel(watchlist, start_date=start_date, end_date=end_date)
+        latest_scores = strategy.latest_scores(panel)
+
+        # 3. 检查今日信号 (time 为每只股票自己的最新K线日期)
+        for _, latest in latest_scores.iterrows():
+            stock_code = latest['code']
+            latest_date_str = str(latest['time']).split(' ')[0] # 提取日期部分
+
+            # 只保存今天的信号
+            if latest_date_str == today_str and latest['signal'] != 0:
+                logger.info(f"SCHEDULER: Found signal for {stock_code}: {latest['signal']}")
+
+                signal_type = 'BUY' if latest['signal'] == 1 else 'SELL'
+                desc = latest.get('signal_desc', '')
+
+                all_signals.append({
+                    'time': latest['time'],
+                    'code': stock_code,
+                    'strategy_name': strategy.name,
+                    'signal_type': signal_type,
+                    'price': float(latest['close']),
+                    'description': desc
+                })
 
         # 4. 批量保存信号
         if all_signals:
@@ -133,6 +150,7 @@ def daily_strategy_scan_job():
             logger.info("SCHEDULER: No new signals found today.")
             
         db.close()
+        http_clients.log_latency_report()
         logger.info("SCHEDULER: [End] Strategy scan completed.")
 
     except Exception as e:
@@ -145,25 +163,25 @@ def start_scheduler():
     scheduler = BlockingScheduler(timezone="Asia/Shanghai")
     logger.info("调度器已成功初始化。")
 
-    # 1. 每日 17:30 更新股票列表
+    # 1. 每个工作日 17:30 更新股票列表
     # 在收盘后进行，以确保列表是最新的
     scheduler.add_job(
         update_stock_list_job, 
-        CronTrigger(hour=17, minute=30),
+        CronTrigger(day_of_week='mon-fri', hour=17, minute=30),
         id='update_stock_list'
     )
 
-    # 2. 每日 17:00 同步自选股数据
+    # 2. 每个交易日 17:00 同步自选股数据 (节假日由 trading_day_only 跳过)
     scheduler.add_job(
         daily_sync_watchlist_job, 
-        CronTrigger(hour=17, minute=0),
+        CronTrigger(day_of_week='mon-fri', hour=17, minute=0),
         id='sync_watchlist'
     )
     
-    # 3. 每日 18:00 运行策略扫描 (推迟到列表更新后)
+    # 3. 每个交易日 18:00 运行策略扫描 (推迟到列表更新后)
     scheduler.add_job(
         daily_strategy_scan_job,
-        CronTrigger(hour=18, minute=0),
+        CronTrigger(day_of_week='mon-fri', hour=18, minute=0),
         id='strategy_scan'
     )
     
@@ -0,0 +1,163 @@
+"""
+A 股交易日历。
+
+交易日 = 工作日 - 法定节假日休市日。休市日从本地文件 TRADING_HOLIDAYS_PATH 读取 (每行一个 YYYY-MM-DD，# 开头为注释)，
+交易所每年年底公布次年安排后追加即可；文件中没有覆盖的年份按工作日处理并打印警告。
+
+交易时段为上午 9:30-11:30、下午 13:00-15:00。采集类服务 (实时行情、持久化、分钟K线) 通过 sleep_seconds()
+决定下一轮的等待时间:
+- 交易时段内 (开盘前 SESSION_WAKE_LEAD 秒到收盘后 SESSION_CLOSE_GRACE 秒) 按服务自己的间隔轮询，
+  开盘 / 收盘前后 SESSION_EDGE_MINUTES 分钟内缩短到不超过 SESSION_EDGE_INTERVAL 秒；
+- 午休、收盘后、周末和节假日直接休眠到下一个交易时段，不再请求数据源。
+
+时间均为交易所当地时间 (config.MARKET_TIMEZONE) 的 naive datetime，market_now() 返回当前的交易所时间。
+"""
+import os
+from datetime import date, datetime, time as dtime, timedelta
+from typing import List, Optional, Sequence, Tuple
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from src.config import config
+from src.logger import logger
+
+# 连续竞价时段 (上午、下午)
+SESSIONS = (((9, 30), (11, 30)), ((13, 0), (15, 0)))
+
+
+def market_now() -> datetime:
+    """交易所当地的当前时间 (naive)，与服务器时区无关"""
+    return datetime.now(ZoneInfo(config.MARKET_TIMEZONE)).replace(tzinfo=None)
+
+
+def load_holidays(path: str) -> List[date]:
+    """读取休市日文件，文件不存在时返回空列表"""
+    if not os.path.exists(path):
+        logger.warning(f"未找到休市日文件 {path}，交易日历只排除周末。")
+        return []
+    holidays = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                holidays.append(date.fromisoformat(line))
+    return sorted(set(holidays))
+
+
+class TradingCalendar:
+    """
+    用法:
+        trading_calendar.is_trading_day(date.today())
+        time.sleep(trading_calendar.sleep_seconds(market_now(), interval=3))
+    """
+
+    def __init__(self, holidays: Optional[Sequence[date]] = None,
+                 sessions: Sequence[Tuple[Tuple[int, int], Tuple[int, int]]] = SESSIONS):
+        """
+        :param holidays: 休市日 (工作日中的节假日)，默认读取 config.TRADING_HOLIDAYS_PATH
+        :param sessions: 交易时段 ((开始时, 分), (结束时, 分))，按时间顺序
+        """
+        if holidays is None:
+            holidays = load_holidays(config.TRADING_HOLIDAYS_PATH)
+        self.holidays = sorted(set(holidays))
+        self.covered_years = {d.year for d in self.holidays}
+        # numpy 的工作日日历，供 busday_count / busday_offset 使用
+        self.busdaycal = np.busdaycalendar(holidays=[np.datetime64(d) for d in self.holidays])
+        self.sessions = [(dtime(*start), dtime(*end)) for start, end in sessions]
+        self._warned_years = set()
+
+    # --- 交易日 ---
+    def is_trading_day(self, day: date) -> bool:
+        if day.year not in self.covered_years and day.year not in self._warned_years and self.holidays:
+            self._warned_years.add(day.year)
+            logger.warning(f"休市日文件未覆盖 {day.year} 年，该年按工作日处理。")
+        return bool(np.is_busday(np.datetime64(day), busdaycal=self.busdaycal))
+
+    def next_trading_day(self, day: date, include: bool = False) -> date:
+        """day 之后 (include=True 时含 day 本身) 的第一个交易日"""
+        start = day if include else day + timedelta(days=1)
+        return np.busday_offset(np.datetime64(start), 0, roll='forward', busdaycal=self.busdaycal).astype(date)
+
+    def previous_trading_day(self, day: date, include: bool = False) -> date:
+        """day 之前 (include=True 时含 day 本身) 的最后一个交易日"""
+        start = day if include else day - timedelta(days=1)
+        return np.busday_offset(np.datetime64(start), 0, roll='backward', busdaycal=self.busdaycal).astype(date)
+
+    def offset(self, day: date, n: int) -> date:
+        """从 day (非交易日先回退到前一交易日) 起第 n 个交易日，n 可为负"""
+        return np.busday_offset(np.datetime64(day), n, roll='backward', busdaycal=self.busdaycal).astype(date)
+
+    def trading_days(self, start: date, end: date) -> List[date]:
+        """[start, end] 之间的全部交易日 (升序)"""
+        days = np.arange(np.datetime64(start), np.datetime64(end) + 1, dtype='datetime64[D]')
+        return days[np.is_busday(days, busdaycal=self.busdaycal)].astype(date).tolist()
+
+    def count(self, start: date, end: date) -> int:
+        """[start, end) 之间的交易日数"""
+        return int(np.busday_count(np.datetime64(start), np.datetime64(end), busdaycal=self.busdaycal))
+
+    # --- 交易时段 ---
+    def _session_bounds(self, day: date) -> List[Tuple[datetime, datetime]]:
+        return [(datetime.combine(day, start), datetime.combine(day, end)) for start, end in self.sessions]
+
+    def is_trading_time(self, now: datetime, lead: float = 0, grace: float = 0) -> bool:
+        """
+        now 是否处于 [开盘 - lead 秒, 收盘 + grace 秒] 的任一时段内。
+
+        :param lead: 提前唤醒的秒数 (例如赶在开盘前预热连接)
+        :param grace: 收盘后继续工作的秒数 (例如补齐收盘那一刻的行情)
+        """
+        if not self.is_trading_day(now.date()):
+            return False
+        return any(start - timedelta(seconds=lead) <= now <= end + timedelta(seconds=grace)
+                   for start, end in self._session_bounds(now.date()))
+
+    def latest_session_end(self, now: datetime) -> Optional[datetime]:
+        """
+        当前交易日应有的最后一根分钟K线时间: 盘中为当前分钟，午休为 11:30，收盘后为 15:00。
+        开盘前和非交易日返回 None (当天不应有数据)。
+        """
+        if not self.is_trading_day(now.date()):
+            return None
+        minute = now.replace(second=0, microsecond=0)
+        latest = None
+        for start, end in self._session_bounds(now.date()):
+            if minute >= start:
+                latest = min(minute, end)
+        return latest
+
+    def next_session_start(self, now: datetime) -> datetime:
+        """now 之后 (不含正在进行的时段) 最近一个交易时段的开始时间"""
+        if self.is_trading_day(now.date()):
+            for start, _ in self._session_bounds(now.date()):
+                if start > now:
+                    return start
+        day = self.next_trading_day(now.date())
+        return self._session_bounds(day)[0][0]
+
+    def sleep_seconds(self, now: datetime, interval: float, lead: Optional[float] = None,
+                      grace: Optional[float] = None, edge_interval: Optional[float] = None) -> float:
+        """
+        采集循环下一轮之前应等待的秒数。
+
+        :param interval: 交易时段内的常规轮询间隔 (秒)
+        :param lead: 开盘前提前唤醒的秒数，默认 config.SESSION_WAKE_LEAD
+        :param grace: 收盘后继续采集的秒数，默认 config.SESSION_CLOSE_GRACE
+        :param edge_interval: 开盘 / 收盘前后的轮询间隔上限，默认 config.SESSION_EDGE_INTERVAL
+        """
+        lead = config.SESSION_WAKE_LEAD if lead is None else lead
+        grace = config.SESSION_CLOSE_GRACE if grace is None else grace
+        edge_interval = config.SESSION_EDGE_INTERVAL if edge_interval is None else edge_interval
+        if self.is_trading_time(now, lead, grace):
+            edge = timedelta(minutes=config.SESSION_EDGE_MINUTES)
+            near_edge = any(abs(now - point) <= edge
+                            for bounds in self._session_bounds(now.date()) for point in bounds)
+            if near_edge:
+                return min(interval, edge_interval)
+            return interval
+        wake = self.next_session_start(now) - timedelta(seconds=lead)
+        return max((wake - now).total_seconds(), 0.0)
+
+
+trading_calendar = TradingCalendar()
@@ -1,7 +1,7 @@
 import backtrader as bt
 import pandas as pd
 import datetime
-from src.data_acquisition import data_fetcher
+from src.data_storage.kline_repository import kline_repository
 from src.logger import logger
 
 # --- Backtrader 策略实现 ---
@@ -80,7 +80,7 @@ def run_backtest(stock_code, start_date, end_date, initial_cash=100000):
     """
     try:
         # 1. 获取数据
-        df = data_fetcher.fetch_stock_daily_kline(stock_code, start_date, end_date)
+        df = kline_repository.get(stock_code, start_date, end_date)
         if df.empty:
             return None, {"error": "No data"}, None
             
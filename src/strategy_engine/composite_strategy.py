@@ -1,6 +1,15 @@
+import copy
+import threading
+from collections import OrderedDict, deque
+from typing import Deque, Hashable, Optional, Tuple
+
+import numpy as np
 import pandas as pd
-import pandas_ta as ta
+from . import indicators
+from .indicator_cache import INDICATORS, indicator_cache, time_key
 from .base_strategy import BaseStrategy
+from src.config import config
+from src.data_storage.kline_panel import KlinePanel
 from src.logger import logger
 
 class CompositeStrategy(BaseStrategy):
@@ -17,6 +26,9 @@ class CompositeStrategy(BaseStrategy):
     - 突破布林带下轨: +10分 (反弹预期)
     - 评分 > 80: 强力买入
     - 评分 < 20: 强力卖出
+
+    apply() 逐只计算；apply_panel() / latest_scores() 对整个 KlinePanel 做截面向量化计算，
+    全市场评分不必逐只构造 DataFrame。
     """
 
     def __init__(self):
@@ -34,113 +46,337 @@ class CompositeStrategy(BaseStrategy):
 
         df = kline_data.copy()
 
-        # --- 1. 计算技术指标 ---
-        
-        # MACD (12, 26, 9)
-        # 返回列名通常为: MACD_12_26_9, MACDh_12_26_9 (Histogram), MACDs_12_26_9 (Signal)
-        macd = df.ta.macd(fast=12, slow=26, signal=9, append=True)
-        
-        # 动态查找列名
-        macd_col = [c for c in df.columns if c.startswith('MACD_')][0]
-        macd_signal_col = [c for c in df.columns if c.startswith('MACDs_')][0]
-        macd_hist_col = [c for c in df.columns if c.startswith('MACDh_')][0]
-
-        # RSI (14)
-        df.ta.rsi(length=14, append=True)
-        rsi_col = [c for c in df.columns if c.startswith('RSI_')][0]
-
-        # Bollinger Bands (20, 2)
-        # 返回列名: BBL_... (Lower), BBM_... (Mid), BBU_... (Upper)
-        df.ta.bbands(length=20, std=2, append=True)
-        # 动态查找列名 (应对 BBL_20_2.0 或 BBL_20_2.0_2.0 等不同版本)
-        bb_lower_col = [c for c in df.columns if c.startswith('BBL_')][0]
-        bb_upper_col = [c for c in df.columns if c.startswith('BBU_')][0]
-
-        # --- 2. 综合评分逻辑 (更细粒度的状态评分) ---
-        
-        # 初始化分数为 50 (中性)
-        df['score'] = 50
-        # 初始化信号列为浮点数，以支持 0.5 这种弱信号
-        df['signal'] = 0.0
-        # 设置默认描述，防止前端渲染空标签
-        df['signal_desc'] = 'Wait (Neutral Trend)'
-
-        # A. MACD 逻辑
-        # 1. 金叉/死叉 (强信号)
-        macd_golden_cross = (df[macd_col] > df[macd_signal_col]) & (df[macd_col].shift(1) <= df[macd_signal_col].shift(1))
-        df.loc[macd_golden_cross, 'score'] += 20
-        
-        macd_death_cross = (df[macd_col] < df[macd_signal_col]) & (df[macd_col].shift(1) >= df[macd_signal_col].shift(1))
-        df.loc[macd_death_cross, 'score'] -= 20
-        
-        # 2. 趋势持续 (弱信号)
-        # MACD > Signal (多头趋势)
-        df.loc[df[macd_col] > df[macd_signal_col], 'score'] += 5
-        # MACD < Signal (空头趋势)
-        df.loc[df[macd_col] < df[macd_signal_col], 'score'] -= 5
-
-        # B. RSI 逻辑
-        # 1. 超卖 (<30): 可能反弹，加分
-        df.loc[df[rsi_col] < 30, 'score'] += 15
-        # 2. 超买 (>70): 可能回调，减分
-        df.loc[df[rsi_col] > 70, 'score'] -= 15
-        # 3. 强势区间 (50-70): 趋势向上
-        mask_rsi_bull = (df[rsi_col] >= 50) & (df[rsi_col] <= 70)
-        df.loc[mask_rsi_bull, 'score'] += 5
-        # 4. 弱势区间 (30-50): 趋势向下
-        mask_rsi_bear = (df[rsi_col] >= 30) & (df[rsi_col] < 50)
-        df.loc[mask_rsi_bear, 'score'] -= 5
-
-        # C. 布林带逻辑
-        # 1. 价格触及下轨: 强支撑
-        df.loc[df['close'] <= df[bb_lower_col], 'score'] += 10
-        # 2. 价格突破上轨: 强阻力/超买
-        df.loc[df['close'] >= df[bb_upper_col], 'score'] -= 10
-        # 3. 中轨之上 (多头)
-        mid_col = [c for c in df.columns if c.startswith('BBM_')][0]
-        df.loc[df['close'] > df[mid_col], 'score'] += 5
-        # 4. 中轨之下 (空头)
-        df.loc[df['close'] < df[mid_col], 'score'] -= 5
-
-
-        # --- 3. 生成最终信号 ---
-        
-        # 限制分数范围 0-100
-        df['score'] = df['score'].clip(0, 100)
-        
-        # 强力买入: 分数 >= 80
-        buy_condition = df['score'] >= 80
-        df.loc[buy_condition, 'signal'] = 1
-        df.loc[buy_condition, 'signal_desc'] = 'Strong Buy (Multiple Bullish Signals)'
-
-        # 适度买入: 60 <= 分数 < 80
-        mod_buy_condition = (df['score'] >= 60) & (df['score'] < 80)
-        df.loc[mod_buy_condition, 'signal'] = 0.5 # 弱买信号
-        df.loc[mod_buy_condition, 'signal_desc'] = 'Moderate Buy (Positive Trend)'
-
-        # 适度卖出: 20 < 分数 <= 40
-        mod_sell_condition = (df['score'] > 20) & (df['score'] <= 40)
-        df.loc[mod_sell_condition, 'signal'] = -0.5 # 弱卖信号
-        df.loc[mod_sell_condition, 'signal_desc'] = 'Moderate Sell (Negative Trend)'
-
-        # 强力卖出: 分数 <= 20
-        sell_condition = df['score'] <= 20
-        df.loc[sell_condition, 'signal'] = -1
-        df.loc[sell_condition, 'signal_desc'] = 'Strong Sell (Multiple Bearish Signals)'
-        
-        # 关键修复：因为前N行数据计算出的指标为NaN，这里会导致 score 计算异常或不准确。
-        # 我们应该将前 30 行（大约是 MACD 和 布林带 需要的窗口）的 score 设为 NaN 或者 50 (不操作)
-        # 为了安全，直接 dropna 或者保留但标记
-        # 简单做法：如果任意关键指标为 NaN，则 Score 为 50，Desc 为 "Insufficient Data"
-        cols_to_check = [macd_col, rsi_col, bb_upper_col]
-        mask_nan = df[cols_to_check].isna().any(axis=1)
-        df.loc[mask_nan, 'score'] = 50
-        df.loc[mask_nan, 'signal'] = 0
-        df.loc[mask_nan, 'signal_desc'] = 'Initializing Indicators...'
+        # --- 1. 计算技术指标 (列名沿用 pandas_ta 的命名，看板按这些列名读取) ---
+        close = df['close'].to_numpy(dtype=float)
+        macd_line, macd_signal, macd_hist = _series_indicator(df, 'macd', close, 12, 26, 9)
+        rsi = _series_indicator(df, 'rsi', close, 14)
+        bb_lower, bb_mid, bb_upper = _series_indicator(df, 'bbands', close, 20, 2.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bb_width = 100 * (bb_upper - bb_lower) / bb_mid
+            bb_percent = (close - bb_lower) / (bb_upper - bb_lower)
+        df = df.assign(**{
+            'MACD_12_26_9': macd_line, 'MACDh_12_26_9': macd_hist, 'MACDs_12_26_9': macd_signal,
+            'RSI_14': rsi,
+            'BBL_20_2.0': bb_lower, 'BBM_20_2.0': bb_mid, 'BBU_20_2.0': bb_upper,
+            'BBB_20_2.0': bb_width, 'BBP_20_2.0': bb_percent,
+        })
 
+        # --- 2. 综合评分与信号 (规则与 apply_panel 共用 score_rules) ---
+        score, signal, desc_id = score_rules(
+            close=close, macd=macd_line, macd_signal=macd_signal,
+            prev_macd=indicators.shift(macd_line), prev_macd_signal=indicators.shift(macd_signal),
+            rsi=rsi, bb_lower=bb_lower, bb_mid=bb_mid, bb_upper=bb_upper,
+        )
+        df['score'] = score
+        df['signal'] = signal
+        df['signal_desc'] = np.asarray(SIGNAL_DESCS, dtype=object)[desc_id]
         return df
 
-        return df
+    # --- 截面 (多股票) 模式 ---
+    def apply_panel(self, panel: KlinePanel, use_cache: bool = True) -> KlinePanel:
+        """
+        对面板中的全部股票一次性计算指标与评分，结果与逐只调用 apply 一致。
+
+        先按 bar_aligned() 对齐 (停牌日被挤掉，与逐只 DataFrame 只含有效K线的情形相同)，
+        指标和评分规则都在 (T, N) 数组上整块计算，不再逐只构造 DataFrame。
+
+        :param use_cache: 是否经过 indicator_cache。组合回测的长历史面板只用一次，应传 False，
+                          以免挤掉页面和扫描共享的缓存条目
+
+        :return: bar_aligned 之后的面板，包含 close / macd / macd_signal / macd_hist / rsi /
+                 bb_lower / bb_mid / bb_upper / score / signal / signal_desc_id (SIGNAL_DESCS 的下标) 字段
+        """
+        aligned = _close_panel(panel).bar_aligned()
+        fields = _panel_indicators(aligned, use_cache=use_cache)
+        score, signal, desc_id = score_rules(
+            prev_macd=indicators.shift(fields['macd']), prev_macd_signal=indicators.shift(fields['macd_signal']),
+            **{k: fields[k] for k in _RULE_INPUTS},
+        )
+        fields.update(score=score.astype(float), signal=signal, signal_desc_id=desc_id.astype(float))
+        return KlinePanel(codes=aligned.codes, index=aligned.index, fields=fields, last_times=aligned.last_times)
+
+    def latest_scores(self, panel: KlinePanel, min_bars: int = 0) -> pd.DataFrame:
+        """
+        全部股票最新一根K线的评分 (看板、选股、定时扫描只关心最新一根)，评分规则只对最后一行计算。
+
+        :param panel: 按交易日对齐的面板 (KlineRepository.get_panel)
+        :param min_bars: 有效K线少于该数量的股票不参与
+        :return: DataFrame['code', 'time', 'close', 'score', 'signal', 'signal_desc', 'bars']，
+                 time 为该股票自己的最新K线日期，顺序与 panel.codes 一致
+        """
+        bars = panel.lengths
+        keep = bars >= max(min_bars, 1)
+        if not keep.any():
+            return pd.DataFrame(columns=['code', 'time', 'close', 'score', 'signal', 'signal_desc', 'bars'])
+        panel = _close_panel(panel).select([code for code, k in zip(panel.codes, keep) if k])
+        bars = bars[keep]
+
+        valid = ~np.isnan(panel['close'])
+        last_row = len(valid) - 1 - np.argmax(valid[::-1], axis=0)
+        fields = _panel_indicators(panel.bar_aligned())
+        score, signal, desc_id = score_rules(
+            prev_macd=fields['macd'][-2] if len(valid) > 1 else np.full(len(bars), np.nan),
+            prev_macd_signal=fields['macd_signal'][-2] if len(valid) > 1 else np.full(len(bars), np.nan),
+            **{k: fields[k][-1] for k in _RULE_INPUTS},
+        )
+        return pd.DataFrame({
+            'code': panel.codes,
+            'time': panel.index[last_row],
+            'close': fields['close'][-1],
+            'score': score,
+            'signal': signal,
+            'signal_desc': np.asarray(SIGNAL_DESCS, dtype=object)[desc_id],
+            'bars': bars,
+        })
+
+
+_RULE_INPUTS = ('close', 'macd', 'macd_signal', 'rsi', 'bb_lower', 'bb_mid', 'bb_upper')
+
+
+def _close_panel(panel: KlinePanel) -> KlinePanel:
+    """评分只用到收盘价，其余字段不参与对齐和选取"""
+    return KlinePanel(codes=panel.codes, index=panel.index, fields={'close': panel['close']},
+                      last_times=panel.last_times)
+
+
+def _series_indicator(df: pd.DataFrame, name: str, close: np.ndarray, *params):
+    """单只股票的指标，带 code / time 列时经过 indicator_cache"""
+    if {'code', 'time'}.issubset(df.columns) and df['close'].notna().all():
+        return indicator_cache.series(df['code'].iloc[-1], df['time'].iloc[-1], name, close, *params)
+    return INDICATORS[name](close, *params)
+
+
+def _panel_indicators(aligned: KlinePanel, use_cache: bool = True) -> dict:
+    """bar_aligned 面板上的 MACD(12,26,9) / RSI(14) / 布林带(20,2)，参数与 apply 一致，默认经过 indicator_cache"""
+    close = aligned['close']
+    codes, last_times = aligned.codes, aligned.last_bar_times()
+    if use_cache:
+        calc = lambda name, *params: indicator_cache.panel(codes, last_times, name, close, *params)
+    else:
+        calc = lambda name, *params: INDICATORS[name](close, *params)
+    macd, macd_signal, macd_hist = calc('macd', 12, 26, 9)
+    bb_lower, bb_mid, bb_upper = calc('bbands', 20, 2.0)
+    return {
+        'close': close,
+        'macd': macd,
+        'macd_signal': macd_signal,
+        'macd_hist': macd_hist,
+        'rsi': calc('rsi', 14),
+        'bb_lower': bb_lower,
+        'bb_mid': bb_mid,
+        'bb_upper': bb_upper,
+    }
+
+
+# signal_desc 的取值，score_rules 返回其下标
+SIGNAL_DESCS = (
+    'Wait (Neutral Trend)',
+    'Strong Buy (Multiple Bullish Signals)',
+    'Moderate Buy (Positive Trend)',
+    'Moderate Sell (Negative Trend)',
+    'Strong Sell (Multiple Bearish Signals)',
+    'Initializing Indicators...',
+)
+
+
+def score_rules(close, macd, macd_signal, prev_macd, prev_macd_signal, rsi, bb_lower, bb_mid, bb_upper):
+    """
+    综合评分规则，输入为形状相同的数组 (单只股票的一维序列或 (T, N) 面板均可)，NaN 参与比较时视为不满足。
+
+    :return: (score 整数数组, signal 浮点数组, signal_desc 在 SIGNAL_DESCS 中的下标)
+    """
+    # 初始化分数为 50 (中性)
+    score = np.full(np.shape(close), 50, dtype=np.int64)
+
+    # A. MACD 逻辑
+    # 1. 金叉/死叉 (强信号)
+    score += 20 * ((macd > macd_signal) & (prev_macd <= prev_macd_signal))
+    score -= 20 * ((macd < macd_signal) & (prev_macd >= prev_macd_signal))
+    # 2. 趋势持续 (弱信号): MACD > Signal 多头, MACD < Signal 空头
+    score += 5 * (macd > macd_signal)
+    score -= 5 * (macd < macd_signal)
+
+    # B. RSI 逻辑
+    # 超卖 (<30) 可能反弹加分；超买 (>70) 可能回调减分；强势区间 (50-70) 加分；弱势区间 (30-50) 减分
+    score += 15 * (rsi < 30)
+    score -= 15 * (rsi > 70)
+    score += 5 * ((rsi >= 50) & (rsi <= 70))
+    score -= 5 * ((rsi >= 30) & (rsi < 50))
+
+    # C. 布林带逻辑
+    # 触及下轨强支撑；突破上轨强阻力/超买；中轨之上多头；中轨之下空头
+    score += 10 * (close <= bb_lower)
+    score -= 10 * (close >= bb_upper)
+    score += 5 * (close > bb_mid)
+    score -= 5 * (close < bb_mid)
+
+    # --- 生成最终信号 ---
+    # 限制分数范围 0-100；>=80 强力买入，60-80 适度买入，20-40 适度卖出，<=20 强力卖出
+    score = np.clip(score, 0, 100)
+    conditions = [score >= 80, score >= 60, score <= 20, score <= 40]
+    signal = np.select(conditions, [1.0, 0.5, -1.0, -0.5], default=0.0)
+    desc_id = np.select(conditions, [1, 2, 4, 3], default=0)
+
+    # 前N行数据计算出的指标为 NaN，任意关键指标为 NaN 时 Score 为 50，Desc 为 "Initializing Indicators..."
+    mask_nan = np.isnan(macd) | np.isnan(rsi) | np.isnan(bb_upper)
+    score = np.where(mask_nan, 50, score)
+    signal = np.where(mask_nan, 0.0, signal)
+    desc_id = np.where(mask_nan, 5, desc_id)
+    return score, signal, desc_id
+
+
+class CompositeState:
+    """
+    单只股票的增量评分状态: 保存 EMA / RSI 平滑 / 最近 20 根收盘价，新K线或盘中新价格到来时 O(1) 得出最新评分，
+    不必用 apply 重算整段历史。结果与对同一序列调用 apply 的最后一行一致 (浮点误差内)。
+
+    用法:
+        state = CompositeState.from_history(df['close'])
+        state.update(close)     # 收盘确认的新K线，提交状态
+        state.preview(price)    # 盘中最新价当作今天的K线试算，不提交
+    """
+
+    def __init__(self):
+        self.fast, self.slow, self.signal = indicators.EmaState(12), indicators.EmaState(26), indicators.EmaState(9)
+        self.rsi_up, self.rsi_down = indicators.RmaState(14), indicators.RmaState(14)
+        self.window: Deque[float] = deque(maxlen=20)
+        self.prev_close = np.nan
+        self.macd = np.nan
+        self.macd_signal = np.nan
+        self.bars = 0
+
+    @classmethod
+    def from_history(cls, closes) -> 'CompositeState':
+        state = cls()
+        for close in np.asarray(closes, dtype=float):
+            # 历史K线只推进状态，不逐根评分
+            state._evaluate(float(close), commit=True, score=False)
+        return state
+
+    def _evaluate(self, close: float, commit: bool, score: bool = True) -> Optional[dict]:
+        op = 'push' if commit else 'next'
+        macd = getattr(self.fast, op)(close) - getattr(self.slow, op)(close)
+        macd_signal = getattr(self.signal, op)(macd)
+        if np.isnan(self.prev_close):
+            rsi = np.nan
+        else:
+            delta = close - self.prev_close
+            up = getattr(self.rsi_up, op)(max(delta, 0.0))
+            down = abs(getattr(self.rsi_down, op)(min(delta, 0.0)))
+            rsi = 100.0 * up / (up + down) if up + down else np.nan
+
+        if not score:
+            self.window.append(close)
+            self.prev_close, self.macd, self.macd_signal = close, macd, macd_signal
+            self.bars += 1
+            return None
+
+        window = list(self.window)[1:] if len(self.window) == self.window.maxlen else list(self.window)
+        window.append(close)
+        if len(window) < self.window.maxlen:
+            bb_mid = bb_std = np.nan
+        elif min(window) == max(window):
+            bb_mid, bb_std = close, 0.0
+        else:
+            bb_mid, bb_std = float(np.mean(window)), float(np.std(window))
+
+        score, signal, desc_id = score_rules(
+            close=np.float64(close), macd=np.float64(macd), macd_signal=np.float64(macd_signal),
+            prev_macd=np.float64(self.macd), prev_macd_signal=np.float64(self.macd_signal),
+            rsi=np.float64(rsi), bb_lower=np.float64(bb_mid - 2 * bb_std), bb_mid=np.float64(bb_mid),
+            bb_upper=np.float64(bb_mid + 2 * bb_std),
+        )
+        if commit:
+            self.window.append(close)
+            self.prev_close, self.macd, self.macd_signal = close, macd, macd_signal
+            self.bars += 1
+        return {
+            'close': close, 'macd': macd, 'macd_signal': macd_signal, 'macd_hist': macd - macd_signal,
+            'rsi': rsi, 'bb_lower': bb_mid - 2 * bb_std, 'bb_mid': bb_mid, 'bb_upper': bb_mid + 2 * bb_std,
+            'score': int(score), 'signal': float(signal), 'signal_desc': SIGNAL_DESCS[int(desc_id)],
+        }
+
+    def update(self, close: float) -> dict:
+        """追加一根收盘确认的K线并返回它的评分"""
+        return self._evaluate(float(close), commit=True)
+
+    def preview(self, price: float) -> dict:
+        """把盘中最新价当作下一根K线的收盘价试算评分，状态不变"""
+        return self._evaluate(float(price), commit=False)
+
+
+class CompositeStateCache:
+    """
+    按股票缓存 CompositeState，页面每次渲染、扫描每次运行不必用 from_history 重放整段历史。
+
+    键为 (首根K线时间, 最新K线时间, K线根数, 最新收盘价)，与 indicator_cache 一样由输入序列本身确定:
+    - 命中: 直接返回缓存的状态
+    - 输入只比缓存多出最后一根K线 (收盘后新增一根): 复制缓存的状态再 update 一根，O(1)
+    - 其余情况 (首次读取、读取区间变化、复权后历史改变): from_history 重放
+    按最近最少使用 (LRU) 淘汰，条目数上限 COMPOSITE_STATE_CACHE_MAX_ENTRIES。
+
+    用法:
+        live = composite_states.preview('sh600519', df['time'], df['close'], price)
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries if max_entries is not None else config.COMPOSITE_STATE_CACHE_MAX_ENTRIES
+        self._entries: 'OrderedDict[str, Tuple[Hashable, CompositeState]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.advances = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.advances = self.misses = 0
+
+    def get(self, code: str, times, closes) -> CompositeState:
+        """
+        收盘价序列 closes (时间为 times) 末尾的评分状态。
+
+        返回的状态在调用方之间共享，只能 preview，不要 update。
+        """
+        times, closes = pd.to_datetime(pd.Series(times)).to_numpy(), np.asarray(closes, dtype=float)
+        if not len(closes):
+            return CompositeState()
+        key = (time_key(times[0]), time_key(times[-1]), len(closes), float(closes[-1]))
+        prev_key = (key[0], time_key(times[-2]), len(closes) - 1, float(closes[-2])) if len(closes) > 1 else None
+        with self._lock:
+            cached_key, state = self._entries.get(code, (None, None))
+            if cached_key == key:
+                self._entries.move_to_end(code)
+                self.hits += 1
+                return state
+        if cached_key is not None and cached_key == prev_key:
+            state = copy.deepcopy(state)
+            state.update(closes[-1])
+            self.advances += 1
+        else:
+            state = CompositeState.from_history(closes)
+            self.misses += 1
+        with self._lock:
+            self._entries[code] = (key, state)
+            self._entries.move_to_end(code)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return state
+
+    def preview(self, code: str, times, closes, price: float) -> dict:
+        """把盘中最新价当作 closes 之后的一根K线试算评分 (见 CompositeState.preview)"""
+        return self.get(code, times, closes).preview(price)
+
+    def info(self) -> dict:
+        return {'entries': len(self._entries), 'hits': self.hits, 'advances': self.advances, 'misses': self.misses}
+
+
+# 全局共享实例
+composite_states = CompositeStateCache()
+
 
 if __name__ == '__main__':
     # 测试代码
@@ -1,6 +1,9 @@
+import numpy as np
 import pandas as pd
-import pandas_ta as ta
+from . import indicators
+from .indicator_cache import indicator_cache
 from .base_strategy import BaseStrategy
+from src.data_storage.kline_panel import KlinePanel
 from src.logger import logger
 
 class DmaStrategy(BaseStrategy):
@@ -9,6 +12,7 @@ class DmaStrategy(BaseStrategy):
     
     当短期移动均线上穿长期移动均线时，产生买入信号（金叉）。
     当短期移动均线下穿长期移动均线时，产生卖出信号（死叉）。
+    apply_panel() 对整个 KlinePanel 一次计算 (组合回测使用)。
     """
 
     def __init__(self, short_window: int = 10, long_window: int = 30):
@@ -41,31 +45,59 @@ class DmaStrategy(BaseStrategy):
         # 复制DataFrame以避免修改原始数据
         df = kline_data.copy()
 
-        # 1. 使用 pandas-ta 计算短期和长期简单移动均线(SMA)
-        df.ta.sma(length=self.short_window, append=True)
-        df.ta.sma(length=self.long_window, append=True)
-
-        # 字段名默认为 SMA_10, SMA_30 等
+        # 1. 计算短期和长期简单移动均线(SMA)
+        # 字段名沿用 SMA_10, SMA_30 等
         short_ma_col = f'SMA_{self.short_window}'
         long_ma_col = f'SMA_{self.long_window}'
+        close = df['close'].to_numpy(dtype=float)
+        df[short_ma_col] = indicators.sma(close, self.short_window)
+        df[long_ma_col] = indicators.sma(close, self.long_window)
         
         # 2. 识别交叉点
         #    - 'signal' 列：1 表示金叉（买入），-1 表示死叉（卖出），0 表示无信号
-        df['signal'] = 0
-        
-        # 金叉条件：短期均线从下方上穿长期均线
-        golden_cross_condition = (df[short_ma_col].shift(1) < df[long_ma_col].shift(1)) & \
-                                 (df[short_ma_col] > df[long_ma_col])
-        df.loc[golden_cross_condition, 'signal'] = 1 # 买入信号
-
-        # 死叉条件：短期均线从上方下穿长期均线
-        death_cross_condition = (df[short_ma_col].shift(1) > df[long_ma_col].shift(1)) & \
-                                (df[short_ma_col] < df[long_ma_col])
-        df.loc[death_cross_condition, 'signal'] = -1 # 卖出信号
+        df['signal'] = cross_signal(df[short_ma_col].to_numpy(), df[long_ma_col].to_numpy())
         
         logger.debug("DMA策略应用完成。")
         return df
 
+    def apply_panel(self, panel: KlinePanel, use_cache: bool = True) -> KlinePanel:
+        """
+        对面板中的全部股票一次性计算均线与交叉信号，结果与逐只调用 apply 一致。
+
+        :param use_cache: 均线是否经过 indicator_cache。组合回测的长历史面板只用一次，应传 False，
+                          避免挤掉实时路径的缓存
+        :return: bar_aligned 之后的面板，包含 close / SMA_{short} / SMA_{long} / signal 字段
+        """
+        aligned = panel.bar_aligned()
+        close = aligned['close']
+        if use_cache:
+            codes, last_times = aligned.codes, aligned.last_bar_times()
+            sma = lambda window: indicator_cache.panel(codes, last_times, 'sma', close, window)
+        else:
+            sma = lambda window: indicators.sma(close, window)
+        short_ma = sma(self.short_window)
+        long_ma = sma(self.long_window)
+        fields = {
+            'close': close,
+            f'SMA_{self.short_window}': short_ma,
+            f'SMA_{self.long_window}': long_ma,
+            'signal': np.where(np.isnan(close), np.nan, cross_signal(short_ma, long_ma)),
+        }
+        return KlinePanel(codes=aligned.codes, index=aligned.index, fields=fields, last_times=aligned.last_times)
+
+
+def cross_signal(short_ma: np.ndarray, long_ma: np.ndarray) -> np.ndarray:
+    """
+    均线交叉信号 (一维序列或 (T, N) 面板)。
+
+    :return: 整数数组，1 为金叉 (短期均线从下方上穿长期均线)，-1 为死叉，0 为无信号；均线为 NaN 时视为不满足
+    """
+    prev_short, prev_long = indicators.shift(short_ma), indicators.shift(long_ma)
+    signal = np.zeros(np.shape(short_ma), dtype=np.int64)
+    signal[(prev_short < prev_long) & (short_ma > long_ma)] = 1     # 金叉：买入信号
+    signal[(prev_short > prev_long) & (short_ma < long_ma)] = -1    # 死叉：卖出信号
+    return signal
+
 if __name__ == '__main__':
     # --- 测试代码 ---
     # 创建一个模拟的K线数据，用于演示策略如何工作
@@ -0,0 +1,164 @@
+"""
+技术指标结果缓存。
+
+同一只股票的 MACD(12,26,9) / RSI(14) 会在一次页面渲染或扫描中被反复计算: CompositeStrategy.apply (诊断面板)、
+latest_scores (精选、定时扫描)、多因子选股的 _macd_hist_slope / _rsi14 (且短/中/长三个期限各算一遍)。
+这里按 (股票, 最新K线时间, K线根数, 最新收盘价, 指标, 参数) 缓存每只股票的指标序列，各调用方共享:
+- 最新K线时间 + 根数确定了输入的历史区间；盘中当天的K线会随行情更新，所以最新收盘价也是键的一部分
+- 只缓存每只股票有效K线部分的序列，面板调用时未命中的股票合并成一块 (T, M) 数组一次计算
+- 按最近最少使用 (LRU) 淘汰，条目数和数组占用的内存都有上限 (INDICATOR_CACHE_MAX_ENTRIES / INDICATOR_CACHE_MAX_MB)
+
+指标函数取自 indicators 模块，2D 面板中的一列与单独对该列有效部分计算的结果逐位一致，命中与否不影响结果。
+"""
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.config import config
+from . import indicators
+
+# 可缓存的指标: 名称 -> 函数 (close, *params)，返回数组或数组元组
+INDICATORS: Dict[str, Callable] = {
+    'ema': indicators.ema,
+    'sma': indicators.sma,
+    'macd': indicators.macd,
+    'rsi': indicators.rsi,
+    'bbands': indicators.bbands,
+}
+
+
+def _as_tuple(result) -> Tuple[np.ndarray, ...]:
+    return tuple(result) if isinstance(result, tuple) else (result,)
+
+
+def time_key(t) -> Optional[int]:
+    """K线时间统一为纳秒整数 (Timestamp / datetime64 / 字符串作为键时哈希不一致)"""
+    t = pd.Timestamp(t)
+    return None if pd.isna(t) else t.value
+
+
+class IndicatorCache:
+    """
+    用法:
+        macd, signal, hist = indicator_cache.series('sh600519', df['time'].iloc[-1], 'macd', close, 12, 26, 9)
+        rsi = indicator_cache.panel(panel.codes, panel.last_bar_times(), 'rsi', panel['close'], 14)
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_mb: Optional[float] = None):
+        self.max_entries = max_entries if max_entries is not None else config.INDICATOR_CACHE_MAX_ENTRIES
+        self.max_bytes = int((max_mb if max_mb is not None else config.INDICATOR_CACHE_MAX_MB) * 1024 * 1024)
+        self._entries: 'OrderedDict[Hashable, Tuple[np.ndarray, ...]]' = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+            self.hits = self.misses = 0
+
+    def _get(self, key) -> Optional[Tuple[np.ndarray, ...]]:
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return value
+
+    def _put(self, key, value: Tuple[np.ndarray, ...]):
+        size = sum(a.nbytes for a in value)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._nbytes -= sum(a.nbytes for a in old)
+        self._entries[key] = value
+        self._nbytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._nbytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._nbytes -= sum(a.nbytes for a in evicted)
+
+    def series(self, code: str, last_time, name: str, close, *params):
+        """
+        单只股票的指标序列。
+
+        :param last_time: close 最后一根K线的时间
+        :param close: 该股票的有效收盘价序列 (一维，不含 NaN 空洞)
+        :return: 与 INDICATORS[name](close, *params) 相同 (数组或数组元组)，是缓存的副本，可以修改
+        """
+        fn = INDICATORS[name]
+        close = np.asarray(close, dtype=float)
+        if not len(close):
+            return fn(close, *params)
+        key = (code, time_key(last_time), len(close), float(close[-1]), name, params)
+        with self._lock:
+            value = self._get(key)
+        if value is None:
+            value = _as_tuple(fn(close, *params))
+            with self._lock:
+                self._put(key, value)
+        value = tuple(a.copy() for a in value)
+        return value if len(value) > 1 else value[0]
+
+    def panel(self, codes: Sequence[str], last_times: Sequence, name: str, close, *params):
+        """
+        bar_aligned 面板 (每列的有效K线压在底部) 上的指标，只对未命中的股票计算。
+
+        :param last_times: 每只股票最新K线的时间 (KlinePanel.last_bar_times)
+        :param close: (T, N) 收盘价，列与 codes 对应
+        :return: 与 INDICATORS[name](close, *params) 相同形状的 (T, N) 数组或数组元组
+        """
+        fn = INDICATORS[name]
+        close = np.asarray(close, dtype=float)
+        rows, n = close.shape
+        if not n:
+            return fn(close, *params)
+        bars = (~np.isnan(close)).sum(axis=0)
+        keys: List[Optional[Hashable]] = [
+            (code, time_key(t), int(b), float(close[-1, j]), name, params) if b else None
+            for j, (code, t, b) in enumerate(zip(codes, last_times, bars))
+        ]
+        with self._lock:
+            cached = [self._get(k) if k is not None else None for k in keys]
+        miss = [j for j, value in enumerate(cached) if value is None]
+
+        computed: Tuple[np.ndarray, ...] = ()
+        if miss:
+            computed = _as_tuple(fn(close[:, miss], *params))
+            with self._lock:
+                for m, j in enumerate(miss):
+                    if keys[j] is not None:
+                        # 只存有效部分的副本，不引用整块结果数组
+                        self._put(keys[j], tuple(a[rows - bars[j]:, m].copy() for a in computed))
+
+        n_out = len(computed) if computed else len(next(v for v in cached if v is not None))
+        out = tuple(np.full((rows, n), np.nan) for _ in range(n_out))
+        for o in range(n_out):
+            if miss:
+                out[o][:, miss] = computed[o]
+        for j, value in enumerate(cached):
+            if value is not None:
+                for o in range(n_out):
+                    out[o][rows - bars[j]:, j] = value[o]
+        return out if n_out > 1 else out[0]
+
+    def info(self) -> dict:
+        return {'entries': len(self._entries), 'mb': round(self._nbytes / 1024 / 1024, 1),
+                'hits': self.hits, 'misses': self.misses}
+
+
+# 全局共享实例
+indicator_cache = IndicatorCache()
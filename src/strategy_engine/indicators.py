@@ -0,0 +1,250 @@
+"""
+技术指标内核。
+
+输入输出都是 numpy 数组: 一维 (T,) 为单只股票的时间序列，二维 (T, N) 为 KlinePanel 中 N 只股票的同一字段，
+沿第 0 轴 (时间) 计算，各列同时递推，不构造中间 DataFrame、不改列名。
+每列的有效数据可以从不同的行开始 (前面是 NaN，如 bar_aligned 面板中的次新股)，但中间不应有空洞。
+
+计算口径与 pandas_ta 默认参数一致 (策略的评分阈值是按它调出来的):
+- ema: 首个值为前 length 根的简单均值 (presma)，之后 ewm(span=length, adjust=False)
+- rma: Wilder 平滑 ewm(alpha=1/length, adjust=True, min_periods=length)
+- macd: ema(fast) - ema(slow)，信号线为 macd 有效部分的 ema(signal)
+- rsi: 涨跌幅分别 rma 平滑
+- bbands: sma ± std * 总体标准差 (ddof=0)
+ewm 的递推步骤与 pandas 相同，ema / rma / macd / rsi 与 pandas_ta 逐位一致；滚动窗口用累计和计算，相对误差在 1e-9 以内。
+
+EmaState / RmaState 是同样口径的单值递推状态，供逐根K线增量更新 (CompositeState) 使用。
+"""
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+def _as_2d(x) -> Tuple[np.ndarray, bool]:
+    arr = np.asarray(x, dtype=float)
+    return (arr[:, None], True) if arr.ndim == 1 else (arr, False)
+
+
+def _restore(arr: np.ndarray, squeeze: bool) -> np.ndarray:
+    return arr[:, 0] if squeeze else arr
+
+
+def shift(x, n: int = 1) -> np.ndarray:
+    """沿时间轴后移 n 行 (同 DataFrame.shift(n))，空出的行为 NaN"""
+    x = np.asarray(x, dtype=float)
+    out = np.full_like(x, np.nan)
+    if 0 < n < len(x):
+        out[n:] = x[:-n]
+    elif n == 0:
+        out[:] = x
+    return out
+
+
+def ewm_mean(x, alpha: float, adjust: bool, min_periods: int = 0) -> np.ndarray:
+    """pandas ewm(alpha=..., adjust=..., min_periods=...).mean() (ignore_na=False) 的逐行递推"""
+    arr, squeeze = _as_2d(x)
+    out = np.full_like(arr, np.nan)
+    if not len(arr):
+        return _restore(out, squeeze)
+    minp = max(min_periods, 1)
+    new_wt, factor = (1.0 if adjust else alpha), 1.0 - alpha
+    if arr.shape[1] == 1:
+        # 单列逐个 float 递推，避免每行若干次 numpy 调用的开销
+        out[:, 0] = _ewm_mean_column(arr[:, 0].tolist(), new_wt, factor, adjust, minp)
+        return _restore(out, squeeze)
+    weighted = arr[0].copy()
+    nobs = (~np.isnan(weighted)).astype(np.int64)
+    old_wt = np.ones(arr.shape[1])
+    out[0] = np.where(nobs >= minp, weighted, np.nan)
+    for i in range(1, len(arr)):
+        cur = arr[i]
+        obs = ~np.isnan(cur)
+        nobs += obs
+        has = ~np.isnan(weighted)
+        old_wt = np.where(has, old_wt * factor, old_wt)
+        update = has & obs
+        blended = (old_wt * weighted + new_wt * cur) / (old_wt + new_wt)
+        weighted = np.where(update & (weighted != cur), blended, weighted)
+        old_wt = np.where(update, old_wt + new_wt if adjust else 1.0, old_wt)
+        weighted = np.where(~has & obs, cur, weighted)
+        out[i] = np.where(nobs >= minp, weighted, np.nan)
+    return _restore(out, squeeze)
+
+
+def _ewm_mean_column(values: List[float], new_wt: float, factor: float, adjust: bool, minp: int) -> List[float]:
+    """ewm_mean 的单列版本，递推步骤相同"""
+    out = []
+    weighted, old_wt, nobs = np.nan, 1.0, 0
+    for cur in values:
+        obs = cur == cur
+        nobs += obs
+        if weighted == weighted:
+            old_wt *= factor
+            if obs:
+                if weighted != cur:
+                    weighted = (old_wt * weighted + new_wt * cur) / (old_wt + new_wt)
+                old_wt = old_wt + new_wt if adjust else 1.0
+        elif obs:
+            weighted = cur
+        out.append(weighted if nobs >= minp else np.nan)
+    return out
+
+
+def ema(x, length: int) -> np.ndarray:
+    """EMA，首个值为前 length 根有效值的简单均值"""
+    arr, squeeze = _as_2d(x)
+    arr = arr.copy()
+    valid = ~np.isnan(arr)
+    first = np.where(valid.any(axis=0), valid.argmax(axis=0), len(arr))
+    seed_row = first + length - 1
+    cols = np.nonzero(seed_row < len(arr))[0]
+    # 种子按列连续存放后求和，与 pandas 对单列求均值的累加顺序一致
+    window = arr[first[cols] + np.arange(length)[:, None], cols]
+    seed = np.ascontiguousarray(window.T).sum(axis=1) / length
+    arr[np.arange(len(arr))[:, None] < seed_row] = np.nan
+    arr[seed_row[cols], cols] = seed
+    return _restore(ewm_mean(arr, 1.0 / (1.0 + (length - 1) / 2.0), adjust=False), squeeze)
+
+
+def rma(x, length: int) -> np.ndarray:
+    """Wilder 平滑"""
+    return ewm_mean(x, 1.0 / length, adjust=True, min_periods=length)
+
+
+def rolling_mean_std(x, length: int, ddof: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    滚动均值与标准差，窗口不满或含 NaN 时为 NaN。
+    用相对每列首个有效值的累计和计算；窗口内数值完全相同时 (一字板) 均值取该值、标准差取精确的 0
+    (pandas 的在线算法此时会留下 ~1e-7 的残差，使收盘价与布林带的比较结果取决于舍入)。
+    """
+    arr, squeeze = _as_2d(x)
+    ref = arr[np.argmax(~np.isnan(arr), axis=0), np.arange(arr.shape[1])]
+    y = np.nan_to_num(arr - ref)
+    zeros = np.zeros((1, arr.shape[1]))
+    s1 = np.vstack([zeros, np.cumsum(y, axis=0)])
+    s2 = np.vstack([zeros, np.cumsum(y * y, axis=0)])
+    gaps = np.vstack([zeros, np.cumsum(np.isnan(arr), axis=0)])
+    mean = np.full_like(arr, np.nan)
+    var = np.full_like(arr, np.nan)
+    if len(arr) >= length > ddof:
+        m1 = (s1[length:] - s1[:-length]) / length
+        m2 = (s2[length:] - s2[:-length]) / length
+        complete = gaps[length:] == gaps[:-length]
+        mean[length - 1:] = np.where(complete, m1 + ref, np.nan)
+        var[length - 1:] = np.where(complete, np.maximum(m2 - m1 * m1, 0.0) * length / (length - ddof), np.nan)
+    # 连续相同数值的根数 (当前行号 - 本段起始行号 + 1)，>= length 时整个窗口为同一数值
+    rows = np.arange(len(arr))[:, None]
+    changed = np.ones(arr.shape, dtype=bool)
+    changed[1:] = arr[1:] != arr[:-1]
+    start = np.maximum.accumulate(np.where(changed, rows, 0), axis=0)
+    flat = rows - start + 1 >= length
+    mean = np.where(flat, arr, mean)
+    var = np.where(flat, 0.0, var)
+    return _restore(mean, squeeze), _restore(np.sqrt(var), squeeze)
+
+
+def sma(x, length: int) -> np.ndarray:
+    """简单移动平均"""
+    return rolling_mean_std(x, length)[0]
+
+
+def rolling_std(x, length: int, ddof: int = 1) -> np.ndarray:
+    """滚动标准差 (默认 ddof=1，同 pandas rolling().std())"""
+    return rolling_mean_std(x, length, ddof=ddof)[1]
+
+
+def macd(close, fast: int = 12, slow: int = 26, signal: int = 9) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """:return: (macd, signal, histogram)"""
+    line = ema(close, fast) - ema(close, slow)
+    signal_line = ema(line, signal)
+    return line, signal_line, line - signal_line
+
+
+def rsi(close, length: int = 14) -> np.ndarray:
+    delta = np.asarray(close, dtype=float)
+    delta = delta - shift(delta)
+    up = rma(np.where(delta < 0, 0.0, delta), length)
+    down = np.abs(rma(np.where(delta > 0, 0.0, delta), length))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100.0 * up / (up + down)
+
+
+def bbands(close, length: int = 20, std: float = 2.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """:return: (下轨, 中轨, 上轨)"""
+    mid, dev = rolling_mean_std(close, length, ddof=0)
+    return mid - std * dev, mid, mid + std * dev
+
+
+def max_drawdown(close, length: Optional[int] = None) -> np.ndarray:
+    """
+    最近 length 行 (默认全部) 内的最大回撤 (负数，越接近 0 越好)，每列一个值；NaN 不参与。
+    """
+    arr, squeeze = _as_2d(close)
+    if length is not None:
+        arr = arr[-length:]
+    peak = np.fmax.accumulate(arr, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdown = arr / peak - 1.0
+    all_nan = np.isnan(drawdown).all(axis=0)
+    result = np.where(all_nan, np.nan, np.min(np.where(np.isnan(drawdown), np.inf, drawdown), axis=0))
+    return result[0] if squeeze else result
+
+
+class EmaState:
+    """ema() 的单值递推状态；输入 NaN (上游指标尚未产生) 时跳过"""
+
+    def __init__(self, length: int):
+        self.length = length
+        self.alpha = 1.0 / (1.0 + (length - 1) / 2.0)
+        self.warmup: List[float] = []
+        self.value = np.nan
+
+    def next(self, x: float) -> float:
+        """x 之后的 EMA 值 (不修改状态)"""
+        if np.isnan(x):
+            return self.value
+        if not np.isnan(self.value):
+            if self.value == x:
+                return x
+            old_wt = 1.0 - self.alpha
+            return (old_wt * self.value + self.alpha * x) / (old_wt + self.alpha)
+        if len(self.warmup) + 1 == self.length:
+            return float(np.mean(self.warmup + [x]))
+        return np.nan
+
+    def push(self, x: float) -> float:
+        value = self.next(x)
+        if np.isnan(self.value) and not np.isnan(x):
+            self.warmup.append(x)
+        self.value = value
+        return value
+
+
+class RmaState:
+    """rma() 的单值递推状态"""
+
+    def __init__(self, length: int):
+        self.length = length
+        self.factor = 1.0 - 1.0 / length
+        self.weighted = np.nan
+        self.old_wt = 1.0
+        self.nobs = 0
+
+    def _advance(self, x: float):
+        weighted, old_wt = self.weighted, self.old_wt
+        if np.isnan(weighted):
+            weighted = x
+        else:
+            old_wt *= self.factor
+            if weighted != x:
+                weighted = (old_wt * weighted + x) / (old_wt + 1.0)
+            old_wt += 1.0
+        return weighted, old_wt, self.nobs + 1
+
+    def next(self, x: float) -> float:
+        weighted, _, nobs = self._advance(x)
+        return weighted if nobs >= self.length else np.nan
+
+    def push(self, x: float) -> float:
+        self.weighted, self.old_wt, self.nobs = self._advance(x)
+        return self.weighted if self.nobs >= self.length else np.nan
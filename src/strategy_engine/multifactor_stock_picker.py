@@ -5,7 +5,10 @@ from typing import Callable, Iterable, Literal
 
 import numpy as np
 import pandas as pd
-import pandas_ta as ta
+
+from src.data_storage.kline_panel import KlinePanel
+from src.strategy_engine import indicators
+from src.strategy_engine.indicator_cache import indicator_cache
 
 
 Direction = Literal["higher_better", "lower_better"]
@@ -17,7 +20,8 @@ class FactorSpec:
     name: str
     weight: float
     direction: Direction
-    compute: Callable[[pd.DataFrame, dict], float]
+    # compute(panel, ctx) -> 每只股票一个值的数组；panel 已按 bar_aligned() 对齐，ctx 为按 panel.codes 对齐的实时数据表
+    compute: Callable[[KlinePanel, pd.DataFrame], np.ndarray]
 
 
 @dataclass(frozen=True)
@@ -29,181 +33,149 @@ class HorizonConfig:
     factors: tuple[FactorSpec, ...]
 
 
-def _safe_last(series: pd.Series) -> float:
-    if series is None or len(series) == 0:
-        return np.nan
-    try:
-        return float(series.iloc[-1])
-    except Exception:
-        return np.nan
+# 以下因子函数均对整块面板做向量化计算，返回长度为 N 的数组；
+# 历史长度不足的股票返回 NaN (与逐只计算时的长度门槛一致)。
+
+def _need(p: KlinePanel, n: int, values) -> np.ndarray:
+    """历史K线少于 n 根的股票置为 NaN"""
+    values = np.asarray(values, dtype=float)
+    return np.where(p.lengths >= n, values, np.nan)
 
 
-def _ret_n(df: pd.DataFrame, n: int) -> float:
-    if df is None or df.empty or "close" not in df.columns or len(df) <= n:
-        return np.nan
-    c = df["close"]
-    prev = c.iloc[-(n + 1)]
-    last = c.iloc[-1]
-    if prev == 0:
-        return np.nan
-    return float(last / prev - 1.0)
+def _ret_n(p: KlinePanel, n: int) -> np.ndarray:
+    c = p["close"]
+    if len(c) <= n:
+        return np.full(len(p.codes), np.nan)
+    prev, last = c[-(n + 1)], c[-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ret = np.where(prev == 0, np.nan, last / prev - 1.0)
+    return _need(p, n + 1, ret)
 
 
-def _vol_ratio_n(df: pd.DataFrame, n: int = 5) -> float:
-    if df is None or df.empty or "volume" not in df.columns or len(df) < n + 1:
-        return np.nan
-    v = df["volume"].astype(float)
-    base = float(v.iloc[-(n + 1) : -1].mean())
-    if base <= 0:
-        return np.nan
-    return float(v.iloc[-1] / base)
+def _vol_ratio_n(p: KlinePanel, n: int = 5) -> np.ndarray:
+    v = p["volume"]
+    if len(v) < n + 1:
+        return np.full(len(p.codes), np.nan)
+    base = v[-(n + 1) : -1].mean(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(base <= 0, np.nan, v[-1] / base)
+    return _need(p, n + 1, ratio)
 
 
-def _rsi14(df: pd.DataFrame) -> float:
-    if df is None or df.empty or "close" not in df.columns or len(df) < 20:
-        return np.nan
-    s = df["close"].astype(float)
-    rsi = ta.rsi(s, length=14)
-    return _safe_last(rsi)
+def _rsi14(p: KlinePanel) -> np.ndarray:
+    if not len(p.index):
+        return np.full(len(p.codes), np.nan)
+    r = indicator_cache.panel(p.codes, p.last_bar_times(), "rsi", p["close"], 14)
+    return _need(p, 20, r[-1])
 
 
-def _rsi_band_score(df: pd.DataFrame, low: float, high: float) -> float:
+def _rsi_band_score(p: KlinePanel, low: float, high: float) -> np.ndarray:
     """
     在目标区间内得分高，越偏离越低（0-1）。
     """
-    r = _rsi14(df)
-    if np.isnan(r):
-        return np.nan
-    if low <= r <= high:
-        return 1.0
-    # 简单的线性衰减
-    if r < low:
-        return float(max(0.0, 1.0 - (low - r) / 30.0))
-    return float(max(0.0, 1.0 - (r - high) / 30.0))
-
-
-def _macd_hist_slope(df: pd.DataFrame) -> float:
-    if df is None or df.empty or "close" not in df.columns or len(df) < 40:
-        return np.nan
-    s = df["close"].astype(float)
-    macd = ta.macd(s, fast=12, slow=26, signal=9)
-    if macd is None or macd.empty:
-        return np.nan
-    hist_col = [c for c in macd.columns if c.startswith("MACDh_")]
-    if not hist_col:
-        return np.nan
-    h = macd[hist_col[0]]
-    if len(h) < 2:
-        return np.nan
-    return float(h.iloc[-1] - h.iloc[-2])
-
-
-def _ma_gap(df: pd.DataFrame, n: int) -> float:
-    if df is None or df.empty or "close" not in df.columns or len(df) < n + 5:
-        return np.nan
-    c = df["close"].astype(float)
-    ma = c.rolling(n).mean()
-    last_ma = _safe_last(ma)
-    last = float(c.iloc[-1])
-    if last_ma == 0 or np.isnan(last_ma):
-        return np.nan
-    return float(last / last_ma - 1.0)
-
-
-def _ma_stack(df: pd.DataFrame, fast: int, slow: int) -> float:
+    r = _rsi14(p)
+    score = np.where(r < low, np.maximum(0.0, 1.0 - (low - r) / 30.0), np.maximum(0.0, 1.0 - (r - high) / 30.0))
+    return np.where((r >= low) & (r <= high), 1.0, score)
+
+
+def _macd_hist_slope(p: KlinePanel) -> np.ndarray:
+    c = p["close"]
+    if len(c) < 2:
+        return np.full(len(p.codes), np.nan)
+    _, _, h = indicator_cache.panel(p.codes, p.last_bar_times(), "macd", c, 12, 26, 9)
+    return _need(p, 40, h[-1] - h[-2])
+
+
+def _ma_gap(p: KlinePanel, n: int) -> np.ndarray:
+    c = p.frame("close")
+    if len(c) < n:
+        return np.full(len(p.codes), np.nan)
+    last_ma = c.rolling(n).mean().iloc[-1].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gap = np.where(last_ma == 0, np.nan, c.iloc[-1].to_numpy() / last_ma - 1.0)
+    return _need(p, n + 5, gap)
+
+
+def _ma_stack(p: KlinePanel, fast: int, slow: int) -> np.ndarray:
     """
     close > MA_fast > MA_slow 时为 1，否则 0
     """
-    if df is None or df.empty or "close" not in df.columns or len(df) < slow + 5:
-        return np.nan
-    c = df["close"].astype(float)
-    ma_fast = c.rolling(fast).mean()
-    ma_slow = c.rolling(slow).mean()
-    last = float(c.iloc[-1])
-    f = _safe_last(ma_fast)
-    s = _safe_last(ma_slow)
-    if np.isnan(f) or np.isnan(s):
-        return np.nan
-    return float(1.0 if (last > f and f > s) else 0.0)
-
-
-def _volatility(df: pd.DataFrame, n: int) -> float:
-    if df is None or df.empty or "close" not in df.columns or len(df) < n + 5:
-        return np.nan
-    r = df["close"].astype(float).pct_change()
-    return float(r.iloc[-n:].std())
-
-
-def _max_drawdown(df: pd.DataFrame, n: int) -> float:
-    if df is None or df.empty or "close" not in df.columns or len(df) < n + 5:
-        return np.nan
-    c = df["close"].astype(float).iloc[-n:]
-    peak = c.cummax()
-    dd = (c / peak) - 1.0
-    return float(dd.min())  # 负数，越接近 0 越好
-
-
-def _patv_lite(df: pd.DataFrame, window: int = 20, persist: int = 10) -> float:
+    c = p.frame("close")
+    if len(c) < slow:
+        return np.full(len(p.codes), np.nan)
+    last = c.iloc[-1].to_numpy()
+    f = c.rolling(fast).mean().iloc[-1].to_numpy()
+    s = c.rolling(slow).mean().iloc[-1].to_numpy()
+    stack = np.where(np.isnan(f) | np.isnan(s), np.nan, ((last > f) & (f > s)).astype(float))
+    return _need(p, slow + 5, stack)
+
+
+def _volatility(p: KlinePanel, n: int) -> np.ndarray:
+    c = p.frame("close")
+    r = c / c.shift(1) - 1.0
+    return _need(p, n + 5, r.iloc[-n:].std())
+
+
+def _max_drawdown(p: KlinePanel, n: int) -> np.ndarray:
+    return _need(p, n + 5, indicators.max_drawdown(p["close"], n))  # 负数，越接近 0 越好
+
+
+def _patv_lite(p: KlinePanel, window: int = 20, persist: int = 10) -> np.ndarray:
     """
     PATV(简化)：衡量“持续异常交易量”强度。
     - 用 volume / MA(volume, window) 作为异常量强度
     - 用最近 persist 天的异常比例作为“持续性”
     数值越大代表越“持续异常”，按研报逻辑更偏向未来下跌风险 -> 通常作为 lower_better 使用。
     """
-    if df is None or df.empty or "volume" not in df.columns or len(df) < window + persist + 2:
-        return np.nan
-    v = df["volume"].astype(float)
-    ma = v.rolling(window).mean()
-    vr = v / ma
-    vr = vr.replace([np.inf, -np.inf], np.nan)
-    last_vr = float(vr.iloc[-1]) if pd.notna(vr.iloc[-1]) else np.nan
+    v = p.frame("volume")
+    if len(v) < persist:
+        return np.full(len(p.codes), np.nan)
+    vr = (v / v.rolling(window).mean()).replace([np.inf, -np.inf], np.nan)
+    last_vr = vr.iloc[-1].to_numpy()
     recent = vr.iloc[-persist:]
-    if recent.isna().all():
-        return np.nan
     # 异常阈值：1.5 倍（可在 UI 侧做参数化，先保持 KISS）
-    persist_ratio = float((recent > 1.5).mean())
-    return float((np.nan_to_num(last_vr, nan=1.0)) * (0.5 + persist_ratio))
+    persist_ratio = (recent > 1.5).mean().to_numpy()
+    patv = np.nan_to_num(last_vr, nan=1.0) * (0.5 + persist_ratio)
+    patv = np.where(recent.isna().all().to_numpy(), np.nan, patv)
+    return _need(p, window + persist + 2, patv)
 
 
-def _illiq_proxy(df: pd.DataFrame, window: int = 20) -> float:
+def _illiq_proxy(p: KlinePanel, window: int = 20) -> np.ndarray:
     """
     Amihud ILLIQ 的简化代理：
       ILLIQ_proxy = mean( |ret| / volume )
     注：理想情况应使用“成交额”而非成交量；当前腾讯日K未提供 turnover，这里先用 volume 近似。
     数值越大越“非流动”（冲击成本更高）-> 通常 lower_better。
     """
-    if df is None or df.empty or "close" not in df.columns or "volume" not in df.columns or len(df) < window + 2:
-        return np.nan
-    c = df["close"].astype(float)
-    v = df["volume"].astype(float).replace(0, np.nan)
-    r = c.pct_change().abs()
-    x = (r / v).iloc[-window:]
-    return float(x.mean())
+    c = p.frame("close")
+    v = p.frame("volume").replace(0, np.nan)
+    r = (c / c.shift(1) - 1.0).abs()
+    return _need(p, window + 2, (r / v).iloc[-window:].mean())
 
 
 def _build_horizons() -> tuple[HorizonConfig, ...]:
     short_factors = (
-        FactorSpec("近3日动量", 0.28, "higher_better", lambda df, rt: _ret_n(df, 3)),
-        FactorSpec("MACD动能走强", 0.18, "higher_better", lambda df, rt: _macd_hist_slope(df)),
-        FactorSpec("量能放大(5日)", 0.18, "higher_better", lambda df, rt: _vol_ratio_n(df, 5)),
-        FactorSpec("RSI舒适区(45-70)", 0.18, "higher_better", lambda df, rt: _rsi_band_score(df, 45, 70)),
-        FactorSpec("近20日回撤更小", 0.18, "higher_better", lambda df, rt: 1.0 + _max_drawdown(df, 20)),
+        FactorSpec("近3日动量", 0.28, "higher_better", lambda p, ctx: _ret_n(p, 3)),
+        FactorSpec("MACD动能走强", 0.18, "higher_better", lambda p, ctx: _macd_hist_slope(p)),
+        FactorSpec("量能放大(5日)", 0.18, "higher_better", lambda p, ctx: _vol_ratio_n(p, 5)),
+        FactorSpec("RSI舒适区(45-70)", 0.18, "higher_better", lambda p, ctx: _rsi_band_score(p, 45, 70)),
+        FactorSpec("近20日回撤更小", 0.18, "higher_better", lambda p, ctx: 1.0 + _max_drawdown(p, 20)),
     )
 
     mid_factors = (
-        FactorSpec("近20日动量", 0.26, "higher_better", lambda df, rt: _ret_n(df, 20)),
-        FactorSpec("均线多头(20>60)", 0.22, "higher_better", lambda df, rt: _ma_stack(df, 20, 60)),
-        FactorSpec("价格强于MA20", 0.18, "higher_better", lambda df, rt: _ma_gap(df, 20)),
-        FactorSpec("波动更低(20日)", 0.18, "lower_better", lambda df, rt: _volatility(df, 20)),
-        FactorSpec("RSI舒适区(40-70)", 0.16, "higher_better", lambda df, rt: _rsi_band_score(df, 40, 70)),
+        FactorSpec("近20日动量", 0.26, "higher_better", lambda p, ctx: _ret_n(p, 20)),
+        FactorSpec("均线多头(20>60)", 0.22, "higher_better", lambda p, ctx: _ma_stack(p, 20, 60)),
+        FactorSpec("价格强于MA20", 0.18, "higher_better", lambda p, ctx: _ma_gap(p, 20)),
+        FactorSpec("波动更低(20日)", 0.18, "lower_better", lambda p, ctx: _volatility(p, 20)),
+        FactorSpec("RSI舒适区(40-70)", 0.16, "higher_better", lambda p, ctx: _rsi_band_score(p, 40, 70)),
     )
 
     long_factors = (
-        FactorSpec("近120日动量", 0.30, "higher_better", lambda df, rt: _ret_n(df, 120)),
-        FactorSpec("均线多头(60>120)", 0.22, "higher_better", lambda df, rt: _ma_stack(df, 60, 120)),
-        FactorSpec("近120日回撤更小", 0.20, "higher_better", lambda df, rt: 1.0 + _max_drawdown(df, 120)),
-        FactorSpec("波动更低(60日)", 0.18, "lower_better", lambda df, rt: _volatility(df, 60)),
-        FactorSpec("价格强于MA120", 0.10, "higher_better", lambda df, rt: _ma_gap(df, 120)),
+        FactorSpec("近120日动量", 0.30, "higher_better", lambda p, ctx: _ret_n(p, 120)),
+        FactorSpec("均线多头(60>120)", 0.22, "higher_better", lambda p, ctx: _ma_stack(p, 60, 120)),
+        FactorSpec("近120日回撤更小", 0.20, "higher_better", lambda p, ctx: 1.0 + _max_drawdown(p, 120)),
+        FactorSpec("波动更低(60日)", 0.18, "lower_better", lambda p, ctx: _volatility(p, 60)),
+        FactorSpec("价格强于MA120", 0.10, "higher_better", lambda p, ctx: _ma_gap(p, 120)),
     )
 
     return (
@@ -249,10 +221,10 @@ def build_horizon_config(
     extra: list[FactorSpec] = []
 
     if "volume_reversal" in prefs:
-        extra.append(FactorSpec("持续异常量PATV(简化)", 0.12, "lower_better", lambda df, ctx: _patv_lite(df)))
+        extra.append(FactorSpec("持续异常量PATV(简化)", 0.12, "lower_better", lambda p, ctx: _patv_lite(p)))
 
     if "liquidity_quality" in prefs:
-        extra.append(FactorSpec("非流动性ILLIQ(代理)", 0.10, "lower_better", lambda df, ctx: _illiq_proxy(df)))
+        extra.append(FactorSpec("非流动性ILLIQ(代理)", 0.10, "lower_better", lambda p, ctx: _illiq_proxy(p)))
 
     if "attention_spillover" in prefs:
         # 需要 ctx 里包含 neighbor_attention（0-1），缺失则记 NaN
@@ -261,7 +233,8 @@ def build_horizon_config(
                 "注意力溢出(邻居热度)",
                 0.10,
                 "higher_better",
-                lambda df, ctx: float(ctx.get("neighbor_attention")) if ctx.get("neighbor_attention") is not None else np.nan,
+                lambda p, ctx: pd.to_numeric(ctx.get("neighbor_attention"), errors="coerce").to_numpy(dtype=float)
+                if "neighbor_attention" in ctx.columns else np.full(len(p.codes), np.nan),
             )
         )
 
@@ -280,7 +253,7 @@ def build_horizon_config(
 
 def score_candidates(
     horizon: Literal["short", "mid", "long"],
-    klines: dict[str, pd.DataFrame],
+    klines: KlinePanel | dict[str, pd.DataFrame],
     realtime_rows: dict[str, dict],
     preferences: Iterable[PreferenceKey] | None = None,
     top_n: int = 5,
@@ -289,23 +262,21 @@ def score_candidates(
 ) -> list[dict]:
     """
     输入候选股票的 K 线与实时数据，输出该期限的推荐列表。
+    klines 可以是 KlinePanel (推荐，由 KlineRepository.get_panel 一次读出)，也可以是 {code: DataFrame}。
     """
     cfg = build_horizon_config(horizon, preferences)
 
-    rows: list[dict] = []
-    for code, df in klines.items():
-        if df is None or df.empty or len(df) < cfg.min_history_days:
-            continue
-        ctx = realtime_rows.get(code, {})  # ctx: realtime + 预计算字段
-        row = {"code": code, "name": ctx.get("name", code)}
-        for f in cfg.factors:
-            row[f.name] = f.compute(df, ctx)
-        rows.append(row)
-
-    if not rows:
+    panel = klines if isinstance(klines, KlinePanel) else KlinePanel.from_frames(klines)
+    panel = panel.bar_aligned()
+    eligible = [code for code, n in zip(panel.codes, panel.lengths) if n >= cfg.min_history_days]
+    if not eligible:
         return []
+    panel = panel.select(eligible)
 
-    factor_df = pd.DataFrame(rows).set_index("code")
+    # ctx: realtime + 预计算字段，按面板列顺序对齐
+    ctx = pd.DataFrame.from_dict({c: realtime_rows.get(c, {}) for c in panel.codes}, orient="index")
+    ctx = ctx.reindex(panel.codes)
+    factor_df = pd.DataFrame({f.name: f.compute(panel, ctx) for f in cfg.factors}, index=panel.codes)
 
     # 标准化到 [0,1]：rank percentile；对 lower_better 取反
     factor_scores = {}
@@ -0,0 +1,219 @@
+"""
+组合级多股票回测。
+
+backtest_engine.run_backtest 用 backtrader 逐只回测单只股票 (固定 1000 股)，全市场回测要跑上千次 Cerebro。
+这里把整个股票池 (或自选股) 放在一个账户里按交易日回放:
+1. 信号: 任意 BaseStrategy。有 apply_panel 的策略 (CompositeStrategy) 对整个 KlinePanel 一次计算，
+   其余策略逐只调用 apply，结果都放回 (T, N) 的 signal / rank 数组 (strategy_signals)。
+   回测面板的K线区间只用一次，apply_panel 不经过共享的 indicator_cache (use_cache=False)。
+2. 撮合: 第 t 日收盘的信号在第 t+1 日开盘价成交，只循环交易日，每一步对全部股票做向量化运算:
+   - 资金分配: 最多同时持有 max_positions 只，单只买入金额不超过总资产的 max_weight，按 100 股整手取整
+   - 同一天买入候选超过空余仓位时按 rank (策略的 score，没有则为 signal) 从高到低选
+   - T+1: 当天买入的股票当天不能卖出
+   - 卖出信号因停牌 / 跌停未能成交时保留，之后第一个可成交的交易日卖出
+   - 涨跌停: 开盘价在涨停价买不进、在跌停价卖不出 (主板 10%，创业板 / 科创板 20%，北交所 30%，不区分 ST)；停牌不成交
+   - 费用: 佣金 (双向，有最低收费) + 印花税 (卖出)
+3. 每日按收盘价 (停牌沿用最近收盘价) 计算总资产，输出净值曲线、成交记录和统计指标。
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .base_strategy import BaseStrategy
+from .composite_strategy import CompositeStrategy
+from src.data_storage.kline_panel import KlinePanel
+from src.data_storage.kline_repository import kline_repository
+from src.data_storage.stock_universe import parse_code
+from src.logger import logger
+
+TRADING_DAYS_PER_YEAR = 252
+
+
+@dataclass(frozen=True)
+class PortfolioConfig:
+    initial_cash: float = 1_000_000.0
+    max_positions: int = 10         # 最多同时持有的股票数
+    max_weight: float = 0.1         # 单只股票买入金额占总资产的上限
+    buy_threshold: float = 1.0      # signal >= 该值时买入 (CompositeStrategy 的强力买入 / DMA 的金叉)
+    sell_threshold: float = -0.5    # signal <= 该值时卖出 (CompositeStrategy 评分 <= 40 / DMA 的死叉)
+    commission: float = 0.0003      # 佣金费率 (双向)
+    min_commission: float = 5.0     # 单笔最低佣金 (元)
+    stamp_tax: float = 0.0005       # 印花税 (卖出)
+    lot_size: int = 100             # 每手股数
+
+
+@dataclass
+class BacktestResult:
+    equity: pd.Series       # 每日收盘后的总资产，索引为交易日
+    trades: pd.DataFrame    # ['time', 'code', 'side', 'price', 'shares', 'amount', 'fee']
+    stats: dict
+
+
+def price_limit_ratio(code: str) -> float:
+    """涨跌停幅度: 北交所 30%，创业板 / 科创板 20%，其余 10%"""
+    try:
+        market, digits = parse_code(code)
+    except ValueError:
+        return 0.10
+    if market == 'bj':
+        return 0.30
+    if digits.startswith(('300', '301', '688', '689')):
+        return 0.20
+    return 0.10
+
+
+def strategy_signals(strategy: BaseStrategy, panel: KlinePanel) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    在按交易日对齐的面板上运行策略。
+
+    :return: (signal, rank)，都是与 panel 同形状的 (T, N) 数组，停牌 / 未上市为 NaN。
+             rank 为策略输出的 score 列 (没有时等于 signal)，用于同一天多只股票争抢仓位时排序
+    """
+    apply_panel = getattr(strategy, 'apply_panel', None)
+    if callable(apply_panel):
+        result = apply_panel(panel, use_cache=False)
+        signal = panel.unalign(result['signal'])
+        rank = panel.unalign(result['score']) if 'score' in result.fields else signal
+        return signal, rank
+
+    signal = np.full(panel.shape, np.nan)
+    rank = np.full(panel.shape, np.nan)
+    valid = ~np.isnan(panel['close'])
+    columns = {code: j for j, code in enumerate(panel.codes)}
+    for code, frame in panel.to_frames().items():
+        df = strategy.apply(frame)
+        if 'signal' not in df.columns:
+            logger.warning(f"策略 {strategy.name} 没有输出 signal 列，跳过 {code}")
+            continue
+        j = columns[code]
+        signal[valid[:, j], j] = df['signal'].to_numpy(dtype=float)
+        rank[valid[:, j], j] = df['score' if 'score' in df.columns else 'signal'].to_numpy(dtype=float)
+    return signal, rank
+
+
+def _limit_prices(prev_close: np.ndarray, ratio: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """涨停价 / 跌停价 (四舍五入到分)"""
+    up = np.floor(prev_close * (1 + ratio) * 100 + 0.5) / 100
+    down = np.floor(prev_close * (1 - ratio) * 100 + 0.5) / 100
+    return up, down
+
+
+def backtest_panel(panel: KlinePanel, signal: np.ndarray, rank: Optional[np.ndarray] = None,
+                   cfg: PortfolioConfig = PortfolioConfig(), start=None) -> BacktestResult:
+    """
+    按交易日回放一个账户。
+
+    :param panel: 按交易日对齐的面板 (需要 open / close)
+    :param signal: (T, N) 信号，第 t 行的信号在第 t+1 行的开盘价执行
+    :param rank: (T, N) 买入排序依据，默认为 signal
+    :param start: 开始交易的日期，之前的行只用于指标预热 (前一交易日的信号在该日执行)
+    """
+    rank = signal if rank is None else rank
+    opens, close = panel['open'], panel['close']
+    rows, n = close.shape
+    close_ff = pd.DataFrame(close).ffill().to_numpy()
+    ratio = np.array([price_limit_ratio(code) for code in panel.codes])
+    first = int(panel.index.searchsorted(pd.Timestamp(start))) if start is not None else 0
+    codes = np.asarray(panel.codes, dtype=object)
+
+    cash = float(cfg.initial_cash)
+    shares = np.zeros(n)
+    bought_row = np.full(n, -1)
+    pending_sell = np.zeros(n, dtype=bool)
+    equity = np.full(rows, np.nan)
+    trades: List[dict] = []
+
+    for t in range(first, rows):
+        if t > 0:
+            prev_close = close_ff[t - 1]
+            price = opens[t]
+            limit_up, limit_down = _limit_prices(prev_close, ratio)
+            tradable = ~np.isnan(price) & ~np.isnan(prev_close)
+            sig = signal[t - 1]
+            when = panel.index[t]
+
+            # 卖出: 信号触发 (或之前未成交)、非当天买入 (T+1)、开盘不在跌停价
+            pending_sell = (pending_sell | (sig <= cfg.sell_threshold)) & (shares > 0)
+            sell = pending_sell & tradable & (price > limit_down + 1e-6) & (bought_row < t)
+            if sell.any():
+                idx = np.nonzero(sell)[0]
+                amount = shares[idx] * price[idx]
+                fee = np.maximum(amount * cfg.commission, cfg.min_commission) + amount * cfg.stamp_tax
+                cash += float((amount - fee).sum())
+                trades.extend({'time': when, 'code': codes[j], 'side': 'sell', 'price': price[j],
+                               'shares': shares[j], 'amount': a, 'fee': f} for j, a, f in zip(idx, amount, fee))
+                shares[idx] = 0.0
+                pending_sell[idx] = False
+
+            # 买入: 有空余仓位、信号触发、开盘不在涨停价，按 rank 从高到低分配资金
+            slots = cfg.max_positions - int((shares > 0).sum())
+            buy = (shares == 0) & (sig >= cfg.buy_threshold) & tradable & (price < limit_up - 1e-6)
+            if slots > 0 and buy.any():
+                idx = np.nonzero(buy)[0]
+                idx = idx[np.argsort(-np.nan_to_num(rank[t - 1, idx], nan=-np.inf), kind='stable')][:slots]
+                mark = np.where(np.isnan(price), prev_close, price)
+                total = cash + float(np.nansum(shares * mark))
+                for j in idx:
+                    budget = min(total * cfg.max_weight, cash)
+                    qty = np.floor(budget / (price[j] * (1 + cfg.commission)) / cfg.lot_size) * cfg.lot_size
+                    amount = qty * price[j]
+                    fee = max(amount * cfg.commission, cfg.min_commission)
+                    if qty > 0 and amount + fee > cash:
+                        qty -= cfg.lot_size
+                        amount = qty * price[j]
+                        fee = max(amount * cfg.commission, cfg.min_commission)
+                    if qty <= 0:
+                        continue
+                    cash -= amount + fee
+                    shares[j], bought_row[j] = qty, t
+                    trades.append({'time': when, 'code': codes[j], 'side': 'buy', 'price': price[j],
+                                   'shares': qty, 'amount': amount, 'fee': fee})
+        equity[t] = cash + float(np.nansum(shares * close_ff[t]))
+
+    curve = pd.Series(equity[first:], index=panel.index[first:], name='equity')
+    trade_df = pd.DataFrame(trades, columns=['time', 'code', 'side', 'price', 'shares', 'amount', 'fee'])
+    return BacktestResult(equity=curve, trades=trade_df, stats=_stats(curve, cfg.initial_cash, len(trade_df)))
+
+
+def _stats(equity: pd.Series, initial_cash: float, trade_count: int) -> dict:
+    """统计口径与 run_backtest 一致: 收益率、最大回撤为百分数，夏普比率按日收益年化 (无风险利率取 0)"""
+    final = float(equity.iloc[-1]) if len(equity) else initial_cash
+    returns = equity.pct_change().dropna()
+    std = returns.std()
+    years = len(equity) / TRADING_DAYS_PER_YEAR
+    return {
+        'initial_cash': initial_cash,
+        'final_value': final,
+        'return_pct': (final - initial_cash) / initial_cash * 100,
+        'annual_return_pct': ((final / initial_cash) ** (1 / years) - 1) * 100 if years > 0 and final > 0 else None,
+        'sharpe': float(returns.mean() / std * np.sqrt(TRADING_DAYS_PER_YEAR)) if std > 0 else None,
+        'max_drawdown': float(-(equity / equity.cummax() - 1).min() * 100) if len(equity) else 0.0,
+        'trade_count': trade_count,
+    }
+
+
+def run_portfolio_backtest(codes: List[str], start_date: str, end_date: str,
+                           strategy: Optional[BaseStrategy] = None,
+                           cfg: PortfolioConfig = PortfolioConfig(),
+                           warmup_days: int = 120) -> BacktestResult:
+    """
+    读取股票池的日K线并回测。
+
+    :param codes: 股票池 (全市场或自选股)
+    :param start_date: 'YYYYMMDD'，K线从其前 warmup_days 个自然日开始读取，供指标预热
+    :param strategy: 默认 CompositeStrategy
+    """
+    strategy = strategy or CompositeStrategy()
+    start = pd.to_datetime(start_date)
+    load_from = (start - timedelta(days=warmup_days)).strftime('%Y%m%d')
+    panel = kline_repository.get_panel(codes, start_date=load_from, end_date=end_date)
+
+    began = datetime.now()
+    signal, rank = strategy_signals(strategy, panel)
+    result = backtest_panel(panel, signal, rank, cfg, start=start)
+    logger.info(f"组合回测完成: {len(panel.codes)} 只 x {len(result.equity)} 个交易日, "
+                f"{result.stats['trade_count']} 笔成交, 耗时 {(datetime.now() - began).total_seconds():.1f}s")
+    return result
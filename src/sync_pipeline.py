@@ -0,0 +1,335 @@
+"""
+全市场日K线同步流水线。
+
+把原先 "逐只股票: 请求 -> 解析 -> 写库" 的串行流程拆成三个阶段，阶段之间用有界队列连接:
+
+    抓取 (线程池, 有界并发) -> 解析 (单线程) -> 写入 (单线程, 攒批后一次写库)
+
+- 抓取阶段只做网络 I/O，并发度由 SYNC_FETCH_WORKERS 控制，共用腾讯客户端 (http_clients.tencent) 的 keep-alive 连接池。
+- 写入阶段把多只股票的K线攒成一批 (SYNC_WRITE_BATCH_ROWS 行) 后一次写入，
+  避免每只股票一次往返 + 一次 commit。
+- 每批写入成功后更新断点文件，进程崩溃后重新运行会跳过已完成的股票。
+- 增量任务带上库中水位线附近的K线 (reference)。抓取结果与它的重叠部分收盘价不一致时说明发生了除权除息，
+  增量结果不写库，股票记入 SyncPipeline.rebased，由调用方改用 replace 任务全量重新拉取。
+"""
+import json
+import os
+import queue
+import threading
+import time
+import concurrent.futures
+from dataclasses import dataclass, field
+from datetime import date
+from typing import List, Optional
+
+import pandas as pd
+
+from src.config import config
+from src.logger import logger
+from src.data_storage import crud, database
+from src.data_acquisition import data_fetcher, http_clients
+from src.data_acquisition.kline_cache import prices_rebased
+
+# 阶段之间传递的结束标记
+_DONE = object()
+# 解析阶段检测到前复权价格基准变化的标记
+_REBASED = object()
+
+
+@dataclass
+class SyncTask:
+    """
+    单只股票的同步任务。
+
+    :param code: 股票代码
+    :param count: 需要请求的最近K线条数
+    :param start_date: 只保留该日期 (含) 之后的K线，格式 'YYYYMMDD'；None 表示不筛选
+    :param end_date: 只保留该日期 (含) 之前的K线，格式 'YYYYMMDD'；None 表示截止到流水线的目标日期
+    :param reference: 库中水位线附近已入库的K线 (time, close)，用于检测除权除息；None 表示不检测
+    :param replace: 写入前删除该股票在库中的全部K线 (价格基准已变化后的全量重新拉取)
+    """
+    code: str
+    count: int
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    reference: Optional[pd.DataFrame] = None
+    replace: bool = False
+
+
+@dataclass
+class SyncMetrics:
+    """流水线运行指标"""
+    total: int = 0
+    fetched: int = 0
+    failed: int = 0
+    empty: int = 0
+    resumed: int = 0
+    rebased: int = 0
+    bars_written: int = 0
+    batches: int = 0
+    fetch_seconds: float = 0.0
+    write_seconds: float = 0.0
+    started_at: float = field(default_factory=time.perf_counter)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def summary(self) -> str:
+        elapsed = max(self.elapsed, 1e-9)
+        done = self.fetched + self.failed
+        return (f"进度 {done}/{self.total} (续传跳过 {self.resumed}), 失败 {self.failed}, 无数据 {self.empty}, "
+                f"除权待重拉 {self.rebased}, "
+                f"写入 {self.bars_written} 条/{self.batches} 批, 耗时 {elapsed:.1f}s, "
+                f"吞吐 {done / elapsed:.1f} 只/s, {self.bars_written / elapsed:.0f} 条/s, "
+                f"累计请求耗时 {self.fetch_seconds:.1f}s, 累计写库耗时 {self.write_seconds:.1f}s")
+
+
+class SyncCheckpoint:
+    """
+    断点文件: 记录本轮同步 (以目标日期区分) 中已写入数据库的股票。
+    目标日期变化 (例如隔天再运行) 时旧断点自动失效。
+    """
+
+    def __init__(self, path: str, target: date):
+        self.path = path
+        self.target = target.isoformat()
+        self.done = set()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取同步断点文件失败，将从头开始: {e}")
+            return
+        if data.get('target') == self.target:
+            self.done = set(data.get('done', []))
+
+    def is_done(self, code: str) -> bool:
+        return code in self.done
+
+    def mark_done(self, codes: List[str]):
+        """标记一批股票已完成并立即落盘 (先写临时文件再替换，避免写到一半崩溃损坏断点)"""
+        self.done.update(codes)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'target': self.target, 'done': sorted(self.done)}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        """本轮全部完成后删除断点文件"""
+        self.done = set()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class SyncPipeline:
+    """
+    抓取 -> 解析 -> 写入 三阶段同步流水线。
+
+    用法:
+        pipeline = SyncPipeline(target=date(2025, 1, 2))
+        metrics = pipeline.run(tasks)
+    """
+
+    def __init__(self,
+                 target: date,
+                 fetch_workers: Optional[int] = None,
+                 write_batch_rows: Optional[int] = None,
+                 checkpoint_path: Optional[str] = None,
+                 progress_interval: Optional[float] = None):
+        """
+        :param target: 本轮同步的目标日期，只保留该日期 (含) 之前的K线，同时作为断点的标识
+        :param fetch_workers: 抓取阶段并发线程数
+        :param write_batch_rows: 写入阶段每批的行数
+        :param checkpoint_path: 断点文件路径
+        :param progress_interval: 进度日志间隔 (秒)
+        """
+        self.target = target
+        self.end_date = target.strftime('%Y%m%d')
+        self.fetch_workers = fetch_workers or config.SYNC_FETCH_WORKERS
+        self.write_batch_rows = write_batch_rows or config.SYNC_WRITE_BATCH_ROWS
+        self.progress_interval = config.SYNC_PROGRESS_INTERVAL if progress_interval is None else progress_interval
+        self.checkpoint = SyncCheckpoint(checkpoint_path or config.SYNC_CHECKPOINT_PATH, target)
+        self.metrics = SyncMetrics()
+        # 检测到前复权价格基准变化、增量结果未写库的股票
+        self.rebased: List[str] = []
+        self._lock = threading.Lock()
+        self._abort = threading.Event()
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        """向有界队列放入元素；写入阶段异常退出后不再阻塞上游线程"""
+        while not self._abort.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    # --- 阶段 1: 抓取 ---
+    def _fetch_stage(self, tasks: List[SyncTask], parse_queue: queue.Queue):
+        session = http_clients.tencent
+
+        def fetch(task: SyncTask):
+            if self._abort.is_set():
+                return
+            start = time.perf_counter()
+            try:
+                payload = data_fetcher.fetch_daily_kline_payload(task.code, count=task.count, session=session)
+            except Exception as e:
+                logger.warning(f"获取 {task.code} 的K线失败: {e}")
+                payload = None
+            with self._lock:
+                self.metrics.fetch_seconds += time.perf_counter() - start
+            # 有界队列: 下游处理不过来时阻塞抓取线程，形成背压
+            self._put(parse_queue, (task, payload))
+
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.fetch_workers) as executor:
+                list(executor.map(fetch, tasks))
+        finally:
+            self._put(parse_queue, _DONE)
+
+    # --- 阶段 2: 解析 ---
+    def _parse_stage(self, parse_queue: queue.Queue, write_queue: queue.Queue):
+        while not self._abort.is_set():
+            try:
+                item = parse_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                self._put(write_queue, _DONE)
+                return
+            task, payload = item
+            if payload is None:
+                self._put(write_queue, (task, None))
+                continue
+            start_date = task.start_date or "19900101"
+            try:
+                # 需要检测除权时先保留重叠部分，比对后再按 start_date 筛选
+                df = data_fetcher.parse_daily_kline_payload(
+                    payload, task.code, start_date="19900101" if task.reference is not None else start_date,
+                    end_date=min(task.end_date or self.end_date, self.end_date))
+            except Exception as e:
+                logger.warning(f"解析 {task.code} 的K线失败: {e}")
+                df = None
+            if df is not None and not df.empty and task.reference is not None:
+                if prices_rebased(task.reference, df):
+                    df = _REBASED
+                else:
+                    df = df[df['time'] >= pd.to_datetime(start_date)]
+            self._put(write_queue, (task, df))
+
+    # --- 阶段 3: 写入 ---
+    def _flush(self, db, frames: List[pd.DataFrame], codes: List[str], replace: List[str]):
+        """
+        写入一批K线并推进断点。写库失败时这批股票不计入断点，下次运行会重试。
+
+        :param replace: 这批中需要先删除库中全部旧K线的股票
+        """
+        if frames:
+            records = pd.concat(frames, ignore_index=True).to_dict(orient='records')
+            start = time.perf_counter()
+            try:
+                crud.delete_daily_klines(db, replace)
+                crud.bulk_save_daily_kline(db, kline_data=records)
+            except Exception as e:
+                logger.error(f"批量写入 {len(codes)} 只股票的K线失败，将在下次运行时重试: {e}")
+                self.metrics.failed += len(codes)
+                self.metrics.fetched -= len(codes)
+                return
+            finally:
+                self.metrics.write_seconds += time.perf_counter() - start
+            self.metrics.bars_written += len(records)
+            self.metrics.batches += 1
+        if codes:
+            self.checkpoint.mark_done(codes)
+
+    def _write_stage(self, write_queue: queue.Queue):
+        db = next(database.get_db())
+        frames, codes, replace, rows = [], [], [], 0
+        last_report = time.perf_counter()
+        try:
+            while True:
+                item = write_queue.get()
+                if item is _DONE:
+                    break
+                task, df = item
+                if df is None:
+                    self.metrics.failed += 1
+                    continue
+                if df is _REBASED:
+                    # 不计入断点: 全量重新拉取成功前，下次运行仍会检测到
+                    self.metrics.rebased += 1
+                    self.rebased.append(task.code)
+                    continue
+
+                self.metrics.fetched += 1
+                codes.append(task.code)
+                if df.empty:
+                    self.metrics.empty += 1
+                else:
+                    frames.append(df)
+                    rows += len(df)
+                    if task.replace:
+                        replace.append(task.code)
+
+                if rows >= self.write_batch_rows:
+                    self._flush(db, frames, codes, replace)
+                    frames, codes, replace, rows = [], [], [], 0
+
+                if self.progress_interval and time.perf_counter() - last_report >= self.progress_interval:
+                    logger.info(f"[同步流水线] {self.metrics.summary()}")
+                    last_report = time.perf_counter()
+
+            self._flush(db, frames, codes, replace)
+        finally:
+            db.close()
+
+    def run(self, tasks: List[SyncTask]) -> SyncMetrics:
+        """
+        执行同步。已在断点中的股票会被跳过。
+
+        :param tasks: 同步任务列表
+        :return: 运行指标
+        """
+        pending = [t for t in tasks if not self.checkpoint.is_done(t.code)]
+        self.metrics = SyncMetrics(total=len(tasks), resumed=len(tasks) - len(pending))
+        self.rebased = []
+        self._abort.clear()
+        if self.metrics.resumed:
+            logger.info(f"从断点恢复: 跳过已完成的 {self.metrics.resumed} 只股票。")
+
+        queue_size = self.fetch_workers * 4
+        parse_queue = queue.Queue(maxsize=queue_size)
+        write_queue = queue.Queue(maxsize=queue_size)
+
+        workers = [
+            threading.Thread(target=self._fetch_stage, args=(pending, parse_queue), name='sync-fetch', daemon=True),
+            threading.Thread(target=self._parse_stage, args=(parse_queue, write_queue), name='sync-parse', daemon=True),
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            self._write_stage(write_queue)
+        except BaseException:
+            # 写入阶段异常时通知上游尽快退出，避免线程阻塞在队列上
+            self._abort.set()
+            raise
+        finally:
+            for worker in workers:
+                worker.join()
+
+        logger.info(f"[同步流水线] 完成: {self.metrics.summary()}")
+        logger.info(f"[同步流水线] HTTP 耗时统计 {http_clients.tencent.latency_summary()}")
+        if self.metrics.failed == 0:
+            self.checkpoint.clear()
+        return self.metrics
@@ -0,0 +1,95 @@
+import unittest
+import sys
+import os
+from datetime import datetime
+
+import pandas as pd
+
+# 添加项目根目录到 sys.path
+sys.path.append(os.getcwd())
+
+from src.data_storage.bar_aggregator import (BarAggregator, trading_minute_keys, keys_to_times,
+                                             session_clock_key)
+
+def tick(code, time_str, price, cum_volume):
+    return pd.DataFrame({'code': [code], 'time': [pd.Timestamp(time_str)], 'price': [price], 'volume': [cum_volume]})
+
+class TestTradingMinutes(unittest.TestCase):
+
+    def test_keys_skip_lunch_and_clip_auction(self):
+        times = ['2024-01-05 09:25:00', '2024-01-05 09:30:59', '2024-01-05 11:30:03',
+                 '2024-01-05 13:00:00', '2024-01-05 15:00:02']
+        keys = trading_minute_keys(pd.to_datetime(times))
+        self.assertEqual((keys % 240).tolist(), [0, 0, 119, 120, 239])
+        self.assertEqual([t.strftime('%H:%M') for t in keys_to_times(keys)],
+                         ['09:30', '09:30', '11:29', '13:00', '14:59'])
+
+    def test_session_clock_after_close_passes_last_minute(self):
+        key = session_clock_key(datetime(2024, 1, 5, 15, 1))
+        last = trading_minute_keys(pd.to_datetime(['2024-01-05 14:59:30']))[0]
+        self.assertGreater(key, last)
+        # 午休时钟指向下午第一分钟
+        self.assertEqual(session_clock_key(datetime(2024, 1, 5, 12, 0)) % 240, 120)
+
+class TestBarAggregator(unittest.TestCase):
+
+    def setUp(self):
+        self.agg = BarAggregator(periods=(1, 5), capacity=240)
+
+    def test_ohlcv_and_completion(self):
+        feed = [('09:30:05', 10.0, 1000), ('09:30:40', 10.5, 1500), ('09:31:10', 9.8, 1800),
+                ('09:34:50', 10.2, 2000), ('09:35:01', 10.3, 2600)]
+        completed = [self.agg.update(tick('sh600519', f'2024-01-05 {t}', p, v)) for t, p, v in feed]
+        self.assertEqual(completed, [0, 0, 1, 1, 2])
+
+        bars = self.agg.drain()
+        one = bars[bars['period'] == 1].reset_index(drop=True)
+        self.assertEqual(one.loc[0, ['open', 'high', 'low', 'close']].tolist(), [10.0, 10.5, 10.0, 10.5])
+        # 首个 tick 之前的累计量未知，首根K线从首个 tick 开始计量
+        self.assertEqual(one.loc[0, 'volume'], 500)
+        self.assertEqual(one.loc[1, 'volume'], 300)
+
+        five = bars[bars['period'] == 5].iloc[0]
+        self.assertEqual(five['time'], pd.Timestamp('2024-01-05 09:30'))
+        self.assertEqual([five['open'], five['high'], five['low'], five['close']], [10.0, 10.5, 9.8, 10.2])
+        self.assertEqual(five['volume'], 1000)
+        self.assertEqual(five['code'], 'sh600519')
+
+        current = self.agg.bars('sh600519', period=5, include_current=True)
+        self.assertEqual(len(current), 2)
+        self.assertEqual(current.iloc[-1]['volume'], 600)
+
+    def test_quiet_symbol_closed_by_market_clock(self):
+        self.agg.update(pd.concat([tick('sh600000', '2024-01-05 09:30:10', 8.0, 100),
+                                   tick('sz000001', '2024-01-05 09:30:10', 12.0, 100)]))
+        # 只有 sz000001 有新 tick，sh600000 的 9:30 K线同样完成
+        self.agg.update(tick('sz000001', '2024-01-05 09:31:05', 12.1, 300))
+        bars = self.agg.drain()
+        self.assertEqual(sorted(bars[bars['period'] == 1]['code']), ['sh600000', 'sz000001'])
+
+        # 收盘后墙上时钟关闭最后一根K线
+        self.agg.update(tick('sz000001', '2024-01-05 14:59:30', 12.5, 900))
+        self.agg.drain()
+        self.agg.expire(session_clock_key(datetime(2024, 1, 5, 15, 1)))
+        last = self.agg.drain()
+        self.assertIn(pd.Timestamp('2024-01-05 14:59'), set(last['time']))
+
+    def test_volume_resets_on_new_day(self):
+        self.agg.update(tick('sh600519', '2024-01-04 14:59:00', 10.0, 5000))
+        self.agg.update(tick('sh600519', '2024-01-05 09:30:00', 10.0, 300))
+        self.agg.update(tick('sh600519', '2024-01-05 09:31:00', 10.0, 400))
+        bars = self.agg.drain()
+        first_bar = bars[(bars['period'] == 1) & (bars['time'] == pd.Timestamp('2024-01-05 09:30'))]
+        self.assertEqual(first_bar['volume'].tolist(), [300])
+
+    def test_ring_keeps_latest_bars(self):
+        agg = BarAggregator(periods=(1,), capacity=16)
+        for minute in range(20):
+            agg.update(tick('sh600519', f'2024-01-05 10:{minute:02d}:00', 10.0 + minute, minute * 100))
+        bars = agg.bars('sh600519', period=1)
+        self.assertEqual(len(bars), 16)
+        self.assertEqual(bars['close'].tolist(), [10.0 + m for m in range(3, 19)])
+        self.assertEqual(len(agg.bars('sh600519', period=1, n=3)), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+
+import pandas as pd
+
+# 添加项目根目录到 sys.path
+sys.path.append(os.getcwd())
+
+from src.data_storage import crud
+
+
+def make_rows(n, code='sh600519'):
+    return [{'time': pd.Timestamp('2024-01-02') + pd.Timedelta(days=i), 'code': code, 'open': 10.0, 'high': 11.0,
+             'low': 9.0, 'close': 10.5, 'volume': 1000.0, 'turnover': 10500.0} for i in range(n)]
+
+
+def mock_db(cursors):
+    """模拟 Session: 每个分块取一次 DBAPI 游标"""
+    db = MagicMock()
+    db.connection.return_value.connection.dbapi_connection.cursor.side_effect = cursors
+    return db
+
+
+def psycopg2_cursor(rowcount=0):
+    cursor = MagicMock(spec=['execute', 'copy_expert', 'close', 'rowcount'])
+    cursor.rowcount = rowcount
+    cursor.copy_expert.side_effect = lambda sql, buffer: setattr(cursor, 'copied', buffer.getvalue())
+    return cursor
+
+
+class TestCopyLoadDailyKline(unittest.TestCase):
+
+    def test_rows_are_staged_then_merged_with_do_nothing(self):
+        cursor = psycopg2_cursor(rowcount=2)
+        db = mock_db([cursor])
+        rows = make_rows(2) + [dict(make_rows(1)[0], close=12.0)]   # 重复主键保留最后一条
+
+        affected = crud.copy_load_daily_kline(db, rows, upsert=False)
+
+        self.assertEqual(affected, 2)
+        create_sql = cursor.execute.call_args_list[0].args[0]
+        self.assertIn(f"CREATE TEMP TABLE IF NOT EXISTS {crud.KLINE_STAGING_TABLE}", create_sql)
+        self.assertIn("ON COMMIT DELETE ROWS", create_sql)
+        copy_sql = cursor.copy_expert.call_args.args[0]
+        self.assertEqual(copy_sql, f"COPY {crud.KLINE_STAGING_TABLE} ({', '.join(crud.KLINE_COLUMNS)}) "
+                                   f"FROM STDIN WITH (FORMAT csv)")
+        lines = cursor.copied.strip().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('2024-01-02,sh600519,10.0,11.0,9.0,12.0,1000,10500.0', lines)   # volume 为整数
+        merge_sql = cursor.execute.call_args_list[1].args[0]
+        self.assertIn(f"SELECT {', '.join(crud.KLINE_COLUMNS)} FROM {crud.KLINE_STAGING_TABLE}", merge_sql)
+        self.assertTrue(merge_sql.endswith("ON CONFLICT (time, code) DO NOTHING"))
+        db.commit.assert_called_once()
+        cursor.close.assert_called_once()
+
+    def test_upsert_updates_price_and_volume_columns(self):
+        cursor = psycopg2_cursor(rowcount=1)
+        crud.copy_load_daily_kline(mock_db([cursor]), make_rows(1), upsert=True)
+
+        merge_sql = cursor.execute.call_args_list[1].args[0]
+        updates = ', '.join(f"{c} = EXCLUDED.{c}" for c in crud.KLINE_UPDATE_COLUMNS)
+        self.assertTrue(merge_sql.endswith(f"ON CONFLICT (time, code) DO UPDATE SET {updates}"))
+
+    def test_each_chunk_is_committed_separately(self):
+        cursors = [psycopg2_cursor(rowcount=2), psycopg2_cursor(rowcount=2), psycopg2_cursor(rowcount=1)]
+        db = mock_db(cursors)
+
+        affected = crud.copy_load_daily_kline(db, pd.DataFrame(make_rows(5)), chunk_rows=2)
+
+        self.assertEqual(affected, 5)
+        self.assertEqual(db.commit.call_count, 3)
+        self.assertEqual([len(c.copied.strip().splitlines()) for c in cursors], [2, 2, 1])
+
+    def test_psycopg3_cursor_uses_copy_context(self):
+        cursor = MagicMock(spec=['execute', 'copy', 'close', 'rowcount'])
+        cursor.rowcount = 1
+        crud.copy_load_daily_kline(mock_db([cursor]), make_rows(1))
+
+        cursor.copy.assert_called_once()
+        written = cursor.copy.return_value.__enter__.return_value.write.call_args.args[0]
+        self.assertIn('sh600519', written)
+
+    def test_failure_rolls_back(self):
+        cursor = psycopg2_cursor()
+        cursor.execute.side_effect = [None, RuntimeError('merge failed')]
+        db = mock_db([cursor])
+
+        with self.assertRaises(RuntimeError):
+            crud.copy_load_daily_kline(db, make_rows(1))
+        db.rollback.assert_called_once()
+        db.commit.assert_not_called()
+        cursor.close.assert_called_once()
+
+    def test_empty_input_is_a_no_op(self):
+        db = mock_db([])
+        self.assertEqual(crud.copy_load_daily_kline(db, []), 0)
+        db.connection.assert_not_called()
+
+
+@patch.object(crud.config, 'KLINE_COPY_THRESHOLD', 3)
+@patch('src.data_storage.crud.copy_load_daily_kline')
+class TestCopyThresholdDispatch(unittest.TestCase):
+
+    def test_save_below_threshold_uses_insert(self, mock_copy):
+        db = MagicMock()
+        crud.bulk_save_daily_kline(db, make_rows(2))
+        mock_copy.assert_not_called()
+        db.execute.assert_called_once()
+        db.commit.assert_called_once()
+
+    def test_save_at_threshold_uses_copy(self, mock_copy):
+        db = MagicMock()
+        rows = make_rows(3)
+        crud.bulk_save_daily_kline(db, rows)
+        mock_copy.assert_called_once_with(db, rows, upsert=False)
+        db.execute.assert_not_called()
+
+    def test_upsert_below_threshold_uses_insert(self, mock_copy):
+        db = MagicMock()
+        crud.bulk_upsert_daily_kline(db, make_rows(2))
+        mock_copy.assert_not_called()
+        db.execute.assert_called_once()
+
+    def test_upsert_over_threshold_uses_copy(self, mock_copy):
+        db = MagicMock()
+        rows = make_rows(4)
+        crud.bulk_upsert_daily_kline(db, rows)
+        mock_copy.assert_called_once_with(db, rows, upsert=True)
+        db.execute.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,11 +7,11 @@ import os
 # 添加项目根目录到 sys.path
 sys.path.append(os.getcwd())
 
-from src.data_acquisition import data_fetcher
+from src.data_acquisition import data_fetcher, deep_analysis_fetcher
 
 class TestDataFetcher(unittest.TestCase):
 
-    @patch('src.data_acquisition.data_fetcher.requests.get')
+    @patch('src.data_acquisition.data_fetcher.http_clients.eastmoney.get')
     def test_fetch_stock_money_flow_realtime(self, mock_get):
         # 模拟东财 fflow 接口返回
         mock_response = MagicMock()
@@ -34,7 +34,7 @@ class TestDataFetcher(unittest.TestCase):
         self.assertEqual(result['retail_net_inflow'], 30000) 
         self.assertEqual(result['super_large_net'], 970000)
 
-    @patch('src.data_acquisition.data_fetcher.requests.get')
+    @patch('src.data_acquisition.data_fetcher.http_clients.tencent.get')
     def test_fetch_stock_minute_data(self, mock_get):
         # 模拟腾讯分时接口返回
         mock_response = MagicMock()
@@ -76,5 +76,19 @@ class TestDataFetcher(unittest.TestCase):
         self.assertTrue('name' in df.columns)
         self.assertIn('600000', df['code'].values)
 
+class TestDeepAnalysisFetcher(unittest.TestCase):
+
+    @patch('src.data_acquisition.deep_analysis_fetcher.http_clients')
+    @patch('src.data_acquisition.deep_analysis_fetcher.bs')
+    @patch('src.data_acquisition.deep_analysis_fetcher.ak')
+    def test_unrecognized_code_returns_empty_results(self, mock_ak, mock_bs, mock_http):
+        self.assertEqual(deep_analysis_fetcher.get_clean_code('not-a-code'), '')
+        self.assertEqual(deep_analysis_fetcher.fetch_individual_info('not-a-code'), {})
+        self.assertEqual(deep_analysis_fetcher.fetch_stock_news('not-a-code'), [])
+        self.assertTrue(deep_analysis_fetcher.fetch_top_holders('not-a-code').empty)
+        self.assertTrue(deep_analysis_fetcher.fetch_capital_flow_history('not-a-code').empty)
+        # 无法识别的代码不发出任何请求
+        self.assertFalse(mock_ak.method_calls or mock_bs.method_calls or mock_http.method_calls)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,89 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+import sys
+
+# 添加项目根目录到 sys.path
+sys.path.append(os.getcwd())
+
+from src.data_acquisition import flow_control
+from src.data_acquisition.flow_control import AimdController, TuningStore
+from src.data_acquisition.quote_source import QuoteSource
+from tests.test_quote_source import make_vendor
+
+
+def make_controller(**kwargs):
+    params = dict(batch_size=80, concurrency=4, min_batch=20, max_batch=200, max_concurrency=16,
+                  target_latency_ms=500)
+    params.update(kwargs)
+    return AimdController('test', **params)
+
+
+class TestAimdController(unittest.TestCase):
+
+    def test_additive_increase_per_window(self):
+        ctrl = make_controller()
+        for _ in range(3):
+            ctrl.on_success(100, 80)
+        self.assertEqual((ctrl.batch, ctrl.limit), (80, 4))
+
+        # 满一个窗口 (4 个请求) 后并发 +1、批次 +BATCH_STEP
+        ctrl.on_success(100, 80)
+        self.assertEqual((ctrl.batch, ctrl.limit), (80 + flow_control.BATCH_STEP, 5))
+
+    def test_multiplicative_decrease_once_per_holdoff(self):
+        ctrl = make_controller(concurrency=10, batch_size=100)
+        ctrl.on_failure()
+        self.assertEqual((ctrl.batch, ctrl.limit), (70, 7))
+
+        # 同一拥塞内的其他失败请求不再重复缩减
+        ctrl.on_failure()
+        self.assertEqual((ctrl.batch, ctrl.limit), (70, 7))
+
+        with patch.object(flow_control.time, 'monotonic', return_value=time.monotonic() + 5):
+            ctrl.on_failure(throttled=True)
+        self.assertEqual((ctrl.batch, ctrl.limit), (24, 2))
+
+    def test_slow_requests_shrink_batch_only(self):
+        ctrl = make_controller(concurrency=6, batch_size=100)
+        ctrl.on_success(900, 100)
+        self.assertEqual((ctrl.batch, ctrl.limit), (70, 6))
+
+    def test_bounds(self):
+        ctrl = make_controller(concurrency=1, batch_size=20)
+        with patch.object(flow_control.time, 'monotonic', side_effect=[10.0, 20.0, 30.0]):
+            for _ in range(3):
+                ctrl.on_failure(throttled=True)
+        self.assertEqual((ctrl.batch, ctrl.limit), (20, 1))
+
+    def test_gate_limits_in_flight(self):
+        ctrl = make_controller(concurrency=1)
+        ctrl.acquire()
+        acquired = threading.Event()
+        worker = threading.Thread(target=lambda: (ctrl.acquire(), acquired.set()))
+        worker.start()
+        self.assertFalse(acquired.wait(0.1))
+        ctrl.release()
+        self.assertTrue(acquired.wait(1))
+        worker.join()
+
+
+class TestTuningStore(unittest.TestCase):
+
+    def test_learned_settings_survive_restart(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'tuning.json')
+            source = QuoteSource([make_vendor('a')], tuning_path=path)
+            ctrl = source.controllers['a']
+            ctrl.concurrency, ctrl.batch_size = 9, 150
+            source.fetch(['sh600519'])
+
+            self.assertEqual(TuningStore(path).load()['a']['batch_size'], 150)
+            restored = QuoteSource([make_vendor('a')], tuning_path=path).controllers['a']
+            self.assertEqual((restored.batch, restored.limit), (150, 9))
+
+if __name__ == '__main__':
+    unittest.main()
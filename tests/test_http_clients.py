@@ -0,0 +1,44 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+
+# 添加项目根目录到 sys.path
+sys.path.append(os.getcwd())
+
+from src.data_acquisition.http_clients import LatencyHistogram, VendorClient
+
+class TestLatencyHistogram(unittest.TestCase):
+
+    def test_percentiles_use_bucket_bounds(self):
+        hist = LatencyHistogram()
+        for ms in [3] * 90 + [150] * 9 + [7000]:
+            hist.observe(ms)
+
+        self.assertEqual(hist.percentile(50), 5)
+        self.assertEqual(hist.percentile(95), 200)
+        # 最后一个桶返回观测到的最大值
+        self.assertEqual(hist.percentile(100), 7000)
+        self.assertEqual(hist.snapshot()['count'], 100)
+
+class TestVendorClient(unittest.TestCase):
+
+    def test_records_latency_per_endpoint(self):
+        client = VendorClient('test', headers={'Referer': 'http://example.com/'}, timeout=2)
+        self.assertEqual(client.session.headers['Referer'], 'http://example.com/')
+
+        with patch.object(client.session, 'get', return_value=MagicMock(status_code=200)) as mock_get:
+            client.get("http://qt.gtimg.cn/q=sh600519")
+            client.get("http://qt.gtimg.cn/q=sz000001")
+            mock_get.return_value = MagicMock(status_code=502)
+            client.get("http://web.ifzq.gtimg.cn/appstock/app/minute/query?code=sh600519")
+
+        # 未显式传入 timeout 时使用客户端默认值
+        self.assertEqual(mock_get.call_args.kwargs['timeout'], 2)
+        stats = client.latency_stats()
+        self.assertEqual(stats['qt.gtimg.cn/q']['count'], 2)
+        self.assertEqual(stats['web.ifzq.gtimg.cn/appstock/app/minute/query']['errors'], 1)
+        client.close()
+
+if __name__ == '__main__':
+    unittest.main()
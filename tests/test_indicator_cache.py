@@ -0,0 +1,91 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到 sys.path
+sys.path.append(os.getcwd())
+
+from src.strategy_engine import indicators, indicator_cache as cache_module
+from src.strategy_engine.indicator_cache import IndicatorCache
+
+class TestIndicatorCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = IndicatorCache(max_entries=100, max_mb=16)
+        rng = np.random.default_rng(5)
+        self.close = 20 + np.cumsum(rng.normal(0, 0.5, (120, 3)), axis=0)
+        self.close[:50, 2] = np.nan   # 次新股，有效K线压在底部
+        self.codes = ['sh600000', 'sz000001', 'sz000002']
+        self.times = np.full(3, np.datetime64('2024-06-28'), dtype='datetime64[ns]')
+        self.calls = []
+
+        def counting_macd(close, *params):
+            self.calls.append(close.shape)
+            return indicators.macd(close, *params)
+        patcher = patch.dict(cache_module.INDICATORS, {'macd': counting_macd})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_panel_computes_each_symbol_once(self):
+        first = self.cache.panel(self.codes, self.times, 'macd', self.close, 12, 26, 9)
+        second = self.cache.panel(self.codes, self.times, 'macd', self.close, 12, 26, 9)
+
+        self.assertEqual(self.calls, [(120, 3)])
+        for a, b, expected in zip(first, second, indicators.macd(self.close, 12, 26, 9)):
+            np.testing.assert_array_equal(a, expected)
+            np.testing.assert_array_equal(b, expected)
+
+    def test_only_missing_symbols_are_computed(self):
+        self.cache.panel(self.codes[:2], self.times[:2], 'macd', self.close[:, :2], 12, 26, 9)
+        _, _, hist = self.cache.panel(self.codes, self.times, 'macd', self.close, 12, 26, 9)
+
+        self.assertEqual(self.calls, [(120, 2), (120, 1)])
+        np.testing.assert_array_equal(hist, indicators.macd(self.close, 12, 26, 9)[2])
+
+    def test_series_shares_entries_with_panel(self):
+        self.cache.panel(self.codes, self.times, 'macd', self.close, 12, 26, 9)
+        line, _, _ = self.cache.series('sz000002', pd.Timestamp('2024-06-28'), 'macd', self.close[50:, 2], 12, 26, 9)
+
+        self.assertEqual(len(self.calls), 1)
+        np.testing.assert_array_equal(line, indicators.macd(self.close[50:, 2], 12, 26, 9)[0])
+
+    def test_new_bar_or_updated_close_misses(self):
+        close = self.close[:, 0]
+        self.cache.series('sh600000', '2024-06-28', 'macd', close, 12, 26, 9)
+        intraday = close.copy()
+        intraday[-1] += 0.01   # 盘中当天K线的收盘价变化
+        self.cache.series('sh600000', '2024-06-28', 'macd', intraday, 12, 26, 9)
+        self.cache.series('sh600000', '2024-07-01', 'macd', np.r_[close, 21.0], 12, 26, 9)
+        self.cache.series('sh600000', '2024-06-28', 'macd', close, 12, 26, 9)
+
+        self.assertEqual(len(self.calls), 3)
+        self.assertEqual(self.cache.info()['hits'], 1)
+
+    def test_lru_eviction_by_entries_and_memory(self):
+        cache = IndicatorCache(max_entries=2, max_mb=1)
+        close = self.close[:, 0]
+        for code in ['a', 'b', 'a', 'c']:
+            cache.series(code, '2024-06-28', 'rsi', close, 14)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.info()['hits'], 1)
+        cache.series('a', '2024-06-28', 'rsi', close, 14)   # 'a' 最近用过，淘汰的是 'b'
+        self.assertEqual(cache.info()['hits'], 2)
+
+        small = IndicatorCache(max_entries=100, max_mb=2 * close.nbytes / 1024 / 1024)
+        for code in ['a', 'b', 'c']:
+            small.series(code, '2024-06-28', 'rsi', close, 14)
+        self.assertEqual(len(small), 2)
+        self.assertLessEqual(small.nbytes, small.max_bytes)
+
+    def test_returned_series_can_be_modified(self):
+        rsi = self.cache.series('sh600000', '2024-06-28', 'rsi', self.close[:, 0], 14)
+        rsi[:] = 0.0
+        again = self.cache.series('sh600000', '2024-06-28', 'rsi', self.close[:, 0], 14)
+        np.testing.assert_array_equal(again, indicators.rsi(self.close[:, 0], 14))
+
+if __name__ == '__main__':
+    unittest.main()
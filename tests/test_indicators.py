@@ -0,0 +1,82 @@
+import unittest
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到 sys.path
+sys.path.append(os.getcwd())
+
+from src.strategy_engine import indicators
+
+# pandas_ta 默认口径的 pandas 参考实现
+
+def ref_ema(s: pd.Series, length: int) -> pd.Series:
+    s = s.copy()
+    seed = s[:length].mean()
+    s[:length - 1] = np.nan
+    s.iloc[length - 1] = seed
+    return s.ewm(span=length, adjust=False).mean()
+
+def ref_rsi(s: pd.Series, length: int = 14) -> pd.Series:
+    delta = s.diff()
+    up = delta.clip(lower=0).ewm(alpha=1 / length, min_periods=length).mean()
+    down = delta.clip(upper=0).ewm(alpha=1 / length, min_periods=length).mean().abs()
+    return 100 * up / (up + down)
+
+def ref_macd(s: pd.Series):
+    line = ref_ema(s, 12) - ref_ema(s, 26)
+    signal = ref_ema(line.loc[line.first_valid_index():], 9).reindex(s.index)
+    return line, signal
+
+class TestIndicators(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.close = 20 + np.cumsum(rng.normal(0, 0.5, 250))
+        self.close[150:175] = self.close[149]   # 一字板
+        self.series = pd.Series(self.close)
+
+    def test_ewm_based_indicators_match_pandas_bit_for_bit(self):
+        np.testing.assert_array_equal(indicators.ema(self.close, 12), ref_ema(self.series, 12).to_numpy())
+        np.testing.assert_array_equal(indicators.rsi(self.close, 14), ref_rsi(self.series).to_numpy())
+        line, signal, hist = indicators.macd(self.close)
+        ref_line, ref_signal = ref_macd(self.series)
+        np.testing.assert_array_equal(line, ref_line.to_numpy())
+        np.testing.assert_array_equal(signal, ref_signal.to_numpy())
+        np.testing.assert_array_equal(hist, (ref_line - ref_signal).to_numpy())
+
+    def test_rolling_indicators_match_pandas(self):
+        # pandas 的在线方差在一字板窗口上会留下 ~1e-7 的残差，这里为精确的 0
+        np.testing.assert_allclose(indicators.sma(self.close, 20), self.series.rolling(20).mean(), rtol=1e-10)
+        np.testing.assert_allclose(indicators.rolling_std(self.close, 20), self.series.rolling(20).std(),
+                                   rtol=1e-8, atol=1e-6)
+        lower, mid, upper = indicators.bbands(self.close, 20, 2.0)
+        np.testing.assert_allclose(upper, mid + 2 * self.series.rolling(20).std(ddof=0), rtol=1e-10, atol=1e-6)
+        # 窗口内价格完全相同: 中轨等于价格、带宽为 0
+        self.assertEqual(mid[174], self.close[174])
+        self.assertEqual(upper[174], lower[174])
+
+    def test_2d_columns_match_1d_with_leading_nan(self):
+        panel = np.column_stack([self.close, np.r_[np.full(100, np.nan), self.close[:150]]])
+        for fn in (lambda x: indicators.ema(x, 26), indicators.rsi, lambda x: indicators.macd(x)[1],
+                   lambda x: indicators.bbands(x)[2]):
+            result = fn(panel)
+            np.testing.assert_array_equal(result[:, 0], fn(self.close))
+            np.testing.assert_allclose(result[100:, 1], fn(self.close[:150]), rtol=1e-9)
+            self.assertTrue(np.isnan(result[:100, 1]).all())
+
+    def test_max_drawdown(self):
+        close = np.array([10.0, 12.0, 9.0, 11.0, 6.0, 8.0])
+        self.assertAlmostEqual(indicators.max_drawdown(close), 6.0 / 12.0 - 1.0)
+        self.assertEqual(indicators.max_drawdown(close, 2), 0.0)
+        panel = np.column_stack([close, [np.nan, np.nan, 5.0, 4.0, 5.0, 2.0]])
+        np.testing.assert_allclose(indicators.max_drawdown(panel), [-0.5, -0.6])
+
+    def test_short_history_is_all_nan(self):
+        self.assertTrue(np.isnan(indicators.macd(self.close[:20])[0]).all())
+        self.assertTrue(np.isnan(indicators.ema(self.close[:5], 12)).all())
+
+if __name__ == '__main__':
+    unittest.main()
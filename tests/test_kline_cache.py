@@ -0,0 +1,75 @@
+import unittest
+from unittest.mock import MagicMock
+import tempfile
+import sys
+import os
+from datetime import datetime
+
+import pandas as pd
+
+# 添加项目根目录到 sys.path
+sys.path.append(os.getcwd())
+
+from src.data_acquisition.kline_cache import KlineCache
+
+def make_bars(days, close=10.0):
+    return pd.DataFrame({
+        'time': pd.to_datetime(days), 'code': 'sh600000',
+        'open': close, 'high': close, 'low': close, 'close': close,
+        'volume': 1000.0, 'turnover': 0.0,
+    })
+
+class TestKlineCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.fetch = MagicMock()
+        self.cache = KlineCache(fetch=self.fetch, cache_dir=self.tmpdir.name, ttl=60)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_serves_from_disk_after_close(self):
+        self.fetch.return_value = make_bars(['2024-01-02', '2024-01-03'])
+        first = self.cache.get('sh600000', count=10, now=datetime(2024, 1, 3, 16, 0))
+        # 收盘后到下一次开盘前不再请求; 新实例模拟另一个进程
+        other = KlineCache(fetch=self.fetch, cache_dir=self.tmpdir.name, ttl=60)
+        second = other.get('sh600000', start_date='20240103', count=10, now=datetime(2024, 1, 4, 8, 0))
+
+        self.assertEqual(self.fetch.call_count, 1)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(list(second['time']), [pd.Timestamp('2024-01-03')])
+
+    def test_appends_only_missing_bars(self):
+        self.fetch.return_value = make_bars(['2024-01-02', '2024-01-03'])
+        self.cache.get('sh600000', count=10, now=datetime(2024, 1, 3, 16, 0))
+
+        self.fetch.return_value = make_bars(['2024-01-02', '2024-01-03', '2024-01-04'])
+        df = self.cache.get('sh600000', count=10, now=datetime(2024, 1, 4, 10, 0))
+
+        # 缺口 1 根 + 重叠 2 根
+        self.assertEqual(self.fetch.call_args.args, ('sh600000', 3))
+        self.assertEqual(len(df), 3)
+
+    def test_price_rebase_triggers_full_refetch(self):
+        self.fetch.return_value = make_bars(['2024-01-02', '2024-01-03'])
+        self.cache.get('sh600000', count=10, now=datetime(2024, 1, 3, 16, 0))
+
+        # 除权后前复权价格整体变化
+        self.fetch.return_value = make_bars(['2024-01-02', '2024-01-03', '2024-01-04'], close=9.0)
+        df = self.cache.get('sh600000', count=10, now=datetime(2024, 1, 4, 16, 0))
+
+        self.assertEqual(self.fetch.call_count, 3)
+        self.assertEqual(self.fetch.call_args.args, ('sh600000', 10))
+        self.assertTrue((df['close'] == 9.0).all())
+
+    def test_falls_back_to_disk_when_fetch_fails(self):
+        self.fetch.return_value = make_bars(['2024-01-02', '2024-01-03'])
+        self.cache.get('sh600000', count=10, now=datetime(2024, 1, 3, 16, 0))
+
+        self.fetch.return_value = None
+        df = self.cache.get('sh600000', count=10, now=datetime(2024, 1, 4, 10, 0))
+        self.assertEqual(len(df), 2)
+
+if __name__ == '__main__':
+    unittest.main()
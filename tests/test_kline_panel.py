@@ -0,0 +1,57 @@
+import unittest
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到 sys.path
+sys.path.append(os.getcwd())
+
+from src.data_storage.kline_panel import KlinePanel
+
+def make_bars(code, days, closes):
+    return pd.DataFrame({
+        'time': pd.to_datetime(days), 'code': code,
+        'open': closes, 'high': closes, 'low': closes, 'close': closes,
+        'volume': 1000.0, 'turnover': 0.0,
+    })
+
+class TestKlinePanel(unittest.TestCase):
+
+    def setUp(self):
+        long_df = pd.concat([
+            make_bars('sh600000', ['2024-01-02', '2024-01-03', '2024-01-04'], [1.0, 2.0, 3.0]),
+            # 01-03 停牌
+            make_bars('sz000001', ['2024-01-02', '2024-01-04'], [10.0, 30.0]),
+        ], ignore_index=True)
+        self.panel = KlinePanel.from_long(long_df, codes=['sh600000', 'sz000001', 'sz000002'])
+
+    def test_aligns_on_trading_date(self):
+        self.assertEqual(self.panel.shape, (3, 3))
+        np.testing.assert_array_equal(self.panel['close'][:, 1], [10.0, np.nan, 30.0])
+        # 没有数据的股票整列为 NaN
+        self.assertTrue(np.isnan(self.panel['close'][:, 2]).all())
+        np.testing.assert_array_equal(self.panel.lengths, [3, 2, 0])
+
+    def test_bar_aligned_squeezes_suspensions(self):
+        aligned = self.panel.bar_aligned()
+        np.testing.assert_array_equal(aligned['close'][-1], [3.0, 30.0, np.nan])
+        np.testing.assert_array_equal(aligned['close'][-2], [2.0, 10.0, np.nan])
+
+    def test_last_bar_times_survive_alignment(self):
+        expected = np.array(['2024-01-04', '2024-01-04', 'NaT'], dtype='datetime64[ns]')
+        np.testing.assert_array_equal(self.panel.last_bar_times(), expected)
+        aligned = self.panel.bar_aligned()
+        np.testing.assert_array_equal(aligned.last_bar_times(), expected)
+        np.testing.assert_array_equal(aligned.select(['sz000001']).last_bar_times(), expected[1:2])
+
+    def test_select_and_round_trip(self):
+        sub = self.panel.select(['sz000001', 'unknown'])
+        self.assertEqual(sub.codes, ['sz000001'])
+        frames = self.panel.to_frames()
+        self.assertEqual(set(frames), {'sh600000', 'sz000001'})
+        self.assertEqual(list(frames['sz000001']['close']), [10.0, 30.0])
+
+if __name__ == '__main__':
+    unittest.main()
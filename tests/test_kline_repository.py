@@ -0,0 +1,122 @@
+import unittest
+from unittest.mock import patch, MagicMock, ANY
+import sys
+import os
+from datetime import datetime
+
+import pandas as pd
+
+# 添加项目根目录到 sys.path
+sys.path.append(os.getcwd())
+
+from src.data_storage.kline_repository import KlineRepository
+from src.main_sync import FULL_HISTORY_COUNT
+
+def make_bars(code, days):
+    return pd.DataFrame({
+        'time': pd.to_datetime(days), 'code': code,
+        'open': 10.0, 'high': 10.0, 'low': 10.0, 'close': 10.0,
+        'volume': 1000.0, 'turnover': 0.0,
+    })
+
+# 2024-01-05 (周五) 收盘后: 应当已有的最新交易日为 01-05
+NOW = datetime(2024, 1, 5, 16, 0)
+WEEK = ['2024-01-02', '2024-01-03', '2024-01-04', '2024-01-05']
+
+@patch('src.data_storage.kline_repository.crud.delete_daily_klines')
+@patch('src.data_storage.kline_repository.crud.get_stock_ipo_dates', return_value={})
+@patch('src.data_storage.kline_repository.crud.update_stock_ipo_dates')
+@patch('src.data_storage.kline_repository.crud.bulk_upsert_daily_kline')
+@patch('src.data_storage.kline_repository.data_fetcher.fetch_stock_daily_kline')
+@patch('src.data_storage.kline_repository.crud.get_daily_klines')
+class TestKlineRepository(unittest.TestCase):
+
+    def setUp(self):
+        self.repo = KlineRepository(session_factory=MagicMock(), fetch_workers=2)
+
+    def test_serves_covered_range_from_db(self, mock_query, mock_fetch, mock_upsert, *_):
+        mock_query.return_value = make_bars('sh600000', WEEK)
+
+        df = self.repo.get('sh600000', start_date='20240102', now=NOW)
+
+        self.assertEqual(len(df), 4)
+        mock_fetch.assert_not_called()
+        mock_upsert.assert_not_called()
+
+    def test_fetches_only_stale_codes_and_backfills(self, mock_query, mock_fetch, mock_upsert, *_):
+        mock_query.return_value = pd.concat([
+            make_bars('sh600000', WEEK),
+            make_bars('sz000001', WEEK[:2]),
+        ], ignore_index=True)
+        mock_fetch.return_value = make_bars('sz000001', WEEK[1:])
+
+        frames = self.repo.get_many(['sh600000', 'sz000001'], start_date='20240102', now=NOW)
+
+        # 一条查询覆盖全部股票，只有尾部缺口的股票请求网络
+        mock_query.assert_called_once()
+        self.assertEqual([call.args[0] for call in mock_fetch.call_args_list], ['sz000001'])
+        self.assertEqual(len(mock_upsert.call_args.args[1]), 3)
+        self.assertEqual(len(frames['sz000001']), 4)
+        self.assertEqual(len(frames['sh600000']), 4)
+
+    def test_intraday_bar_is_returned_but_not_persisted(self, mock_query, mock_fetch, mock_upsert, *_):
+        mock_query.return_value = make_bars('sh600000', WEEK[:3])
+        mock_fetch.return_value = make_bars('sh600000', WEEK[2:] + ['2024-01-08'])
+
+        # 01-08 (周一) 盘中: 应当已有的最新交易日为 01-05
+        df = self.repo.get('sh600000', start_date='20240102', now=datetime(2024, 1, 8, 10, 30))
+
+        self.assertEqual(df['time'].iloc[-1], pd.Timestamp('2024-01-08'))
+        saved = mock_upsert.call_args.args[1]
+        self.assertEqual(max(r['time'] for r in saved), pd.Timestamp('2024-01-05'))
+
+    def test_ex_rights_rebase_refetches_full_history(self, mock_query, mock_fetch, mock_upsert, *_):
+        mock_query.return_value = make_bars('sh600000', WEEK[:3])
+        rebased = make_bars('sh600000', WEEK).assign(close=9.0)   # 前复权后历史价格整体下移
+        mock_fetch.side_effect = [rebased.iloc[1:], rebased]
+
+        df = self.repo.get('sh600000', start_date='20240102', now=NOW)
+
+        self.assertEqual(mock_fetch.call_count, 2)
+        self.assertEqual(mock_fetch.call_args_list[1].kwargs['count'], FULL_HISTORY_COUNT)
+        self.assertTrue((df['close'] == 9.0).all())
+        self.assertEqual(len(df), 4)
+        self.assertEqual(len(mock_upsert.call_args.args[1]), 4)
+
+    def test_long_history_rebase_replaces_all_stored_bars(self, mock_query, mock_fetch, mock_upsert, *_):
+        days = pd.bdate_range(end='2024-01-05', periods=400)
+        mock_query.return_value = make_bars('sh600000', days[:-1])
+        rebased = make_bars('sh600000', days).assign(close=9.0)
+        mock_fetch.side_effect = [rebased.iloc[-3:], rebased]
+
+        with patch('src.data_storage.kline_repository.crud.delete_daily_klines') as mock_delete:
+            df = self.repo.get('sh600000', start_date=days[0].strftime('%Y%m%d'), now=NOW)
+
+        # 重新拉取覆盖到请求区间开头 (超过 FULL_HISTORY_COUNT)，写入前删除库中旧基准的K线
+        self.assertGreaterEqual(mock_fetch.call_args_list[1].kwargs['count'], 400)
+        mock_delete.assert_called_once_with(ANY, ['sh600000'])
+        self.assertEqual(len(df), 400)
+        self.assertTrue((df['close'] == 9.0).all())
+        self.assertEqual(len(mock_upsert.call_args.args[1]), 400)
+
+    def test_count_returns_latest_bars(self, mock_query, mock_fetch, *_):
+        mock_query.return_value = make_bars('sh600000', WEEK)
+
+        df = self.repo.get('sh600000', count=2, now=NOW)
+
+        self.assertEqual(list(df['time'].dt.day), [4, 5])
+        mock_fetch.assert_not_called()
+    def test_panel_keeps_requested_column_order(self, mock_query, mock_fetch, *_):
+        mock_query.return_value = pd.concat([
+            make_bars('sh600000', WEEK),
+            make_bars('sz000001', WEEK),
+        ], ignore_index=True)
+
+        panel = self.repo.get_panel(['sz000001', 'sh600000'], start_date='20240102', now=NOW)
+
+        self.assertEqual(panel.codes, ['sz000001', 'sh600000'])
+        self.assertEqual(panel.shape, (4, 2))
+        mock_fetch.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
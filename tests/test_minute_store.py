@@ -0,0 +1,93 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+from datetime import datetime
+
+import pandas as pd
+
+# 添加项目根目录到 sys.path
+sys.path.append(os.getcwd())
+
+from src.data_storage.minute_store import MinuteBarStore
+from src.data_acquisition import data_fetcher
+from src.data_acquisition.minute_collector import MinuteBarCollector
+
+def make_minutes(times, code=None):
+    df = pd.DataFrame({
+        'time': pd.to_datetime(times),
+        'open': 10.0, 'high': 10.0, 'low': 10.0, 'close': 10.0, 'volume': 100.0,
+    })
+    if code:
+        df.insert(1, 'code', code)
+    return df
+
+@patch('src.data_storage.minute_store.crud.bulk_upsert_minute_kline')
+@patch('src.data_storage.minute_store.data_fetcher.fetch_stock_minute_data')
+@patch('src.data_storage.minute_store.crud.get_minute_klines')
+class TestMinuteBarStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = MinuteBarStore(session_factory=MagicMock(), refresh_ttl=30)
+
+    def test_complete_day_is_served_from_db(self, mock_query, mock_fetch, mock_upsert):
+        mock_query.return_value = make_minutes(['2024-01-04 14:59', '2024-01-04 15:00',
+                                                '2024-01-05 14:59', '2024-01-05 15:00'], code='sh600519')
+
+        df = self.store.history('600519.SH', days=2, now=datetime(2024, 1, 5, 18, 0))
+
+        self.assertEqual(len(df), 4)
+        self.assertNotIn('code', df.columns)
+        mock_fetch.assert_not_called()
+        # 代码统一为腾讯格式，起点为两个交易日前的 0 点
+        args, kwargs = mock_query.call_args
+        self.assertEqual(args[1], 'sh600519')
+        self.assertEqual(kwargs['start'].tz_localize(None), pd.Timestamp('2024-01-04'))
+
+    def test_stale_day_appends_only_new_bars(self, mock_query, mock_fetch, mock_upsert):
+        mock_query.return_value = make_minutes(['2024-01-05 09:30', '2024-01-05 09:31'], code='sh600519')
+        mock_fetch.return_value = make_minutes(['2024-01-05 09:30', '2024-01-05 09:31',
+                                                '2024-01-05 09:32', '2024-01-05 09:33'])
+
+        df = self.store.history('sh600519', now=datetime(2024, 1, 5, 9, 33, 20))
+
+        self.assertEqual(len(df), 4)
+        records = mock_upsert.call_args[0][1]
+        # 库中最后一根 (09:31) 可能还在变化，连同之后的K线一起写入
+        self.assertEqual([str(r['time'].time()) for r in records], ['09:31:00', '09:32:00', '09:33:00'])
+        self.assertEqual(records[0]['code'], 'sh600519')
+        self.assertEqual(str(records[0]['time'].tz), 'Asia/Shanghai')
+
+        # TTL 内不重复请求网络
+        self.store.history('sh600519', now=datetime(2024, 1, 5, 9, 40))
+        self.assertEqual(mock_fetch.call_count, 1)
+
+    def test_db_failure_falls_back_to_network(self, mock_query, mock_fetch, mock_upsert):
+        mock_query.side_effect = Exception("connection refused")
+        mock_fetch.return_value = make_minutes(['2024-01-05 09:30'])
+
+        df = self.store.history('sh600519', now=datetime(2024, 1, 5, 9, 31))
+
+        self.assertEqual(len(df), 1)
+        mock_upsert.assert_not_called()
+
+class TestParseMinutePayload(unittest.TestCase):
+
+    def test_uses_trade_date_from_payload(self):
+        payload = {'data': {'sh600519': {'data': {'date': '20240105', 'data': ["0930 100.0 100 100.0",
+                                                                                 "0931 101.0 250 100.5"]}}}}
+        df = data_fetcher.parse_minute_payload(payload, 'sh600519')
+
+        self.assertEqual(df['time'].tolist(), [pd.Timestamp('2024-01-05 09:30'), pd.Timestamp('2024-01-05 09:31')])
+        self.assertEqual(df['volume'].tolist(), [10000, 15000])
+
+class TestMinuteBarCollector(unittest.TestCase):
+
+    @patch('src.data_acquisition.minute_collector.watchlist_manager')
+    def test_invalid_codes_are_skipped(self, mock_watchlist):
+        mock_watchlist.get_watchlist.return_value = ['600519', 'bad-code', 'sz000001']
+        collector = MinuteBarCollector(codes=['000001.SZ', '???'], store=MagicMock())
+        self.assertEqual(collector._codes(), ['sh600519', 'sz000001'])
+
+if __name__ == '__main__':
+    unittest.main()
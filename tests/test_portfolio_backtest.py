@@ -0,0 +1,149 @@
+import unittest
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到 sys.path
+sys.path.append(os.getcwd())
+
+from src.data_storage.kline_panel import KlinePanel
+from src.strategy_engine.base_strategy import BaseStrategy
+from src.strategy_engine.composite_strategy import CompositeStrategy
+from src.strategy_engine.dma_strategy import DmaStrategy
+from src.strategy_engine.indicator_cache import indicator_cache
+from src.strategy_engine.portfolio_backtest import (
+    PortfolioConfig, backtest_panel, price_limit_ratio, strategy_signals,
+)
+
+class MomentumStrategy(BaseStrategy):
+    """只实现 apply 的策略，回测逐只调用"""
+
+    def __init__(self):
+        super().__init__(name="Momentum", description="收盘价上涨买入、下跌卖出")
+
+    def apply(self, kline_data):
+        df = kline_data.copy()
+        df['signal'] = np.sign(df['close'].diff()).fillna(0.0)
+        return df
+
+DAYS = pd.bdate_range('2024-01-02', periods=5)
+
+def make_panel(opens, closes, codes):
+    """opens / closes: {code: 每日价格}，NaN 表示停牌"""
+    rows = []
+    for code in codes:
+        for day, o, c in zip(DAYS, opens[code], closes[code]):
+            if not np.isnan(c):
+                rows.append({'time': day, 'code': code, 'open': o, 'high': max(o, c), 'low': min(o, c),
+                             'close': c, 'volume': 1000.0, 'turnover': 0.0})
+    return KlinePanel.from_long(pd.DataFrame(rows), codes=codes)
+
+class TestPortfolioBacktest(unittest.TestCase):
+
+    def setUp(self):
+        self.cfg = PortfolioConfig(initial_cash=100_000, max_positions=2, max_weight=0.5, min_commission=0.0)
+        self.flat = [10.0] * 5
+
+    def signals(self, panel, **events):
+        signal = np.zeros(panel.shape)
+        for code, day_values in events.items():
+            for day, value in day_values.items():
+                signal[day, panel.codes.index(code)] = value
+        return signal
+
+    def test_signal_executes_next_open_with_lot_sizing(self):
+        panel = make_panel({'sh600000': [10.0, 10.0, 10.5, 11.0, 11.0]},
+                           {'sh600000': [10.0, 10.2, 10.8, 11.0, 11.0]}, ['sh600000'])
+        result = backtest_panel(panel, self.signals(panel, sh600000={0: 1.0, 2: -1.0}), cfg=self.cfg)
+
+        buy, sell = result.trades.iloc[0], result.trades.iloc[1]
+        self.assertEqual((buy['side'], buy['time'], buy['price'], buy['shares']), ('buy', DAYS[1], 10.0, 4900))
+        self.assertEqual((sell['side'], sell['time'], sell['price']), ('sell', DAYS[3], 11.0))
+        expected_cash = 100_000 - 49_000 * 1.0003 + 4900 * 11.0 * (1 - 0.0003 - 0.0005)
+        self.assertAlmostEqual(result.equity.iloc[-1], expected_cash, places=6)
+        self.assertAlmostEqual(result.stats['final_value'], expected_cash, places=6)
+
+    def test_price_limits_block_orders(self):
+        # 第 1 天开盘一字涨停买不进；第 3 天开盘跌停卖不出，卖出信号保留到第 4 天成交
+        panel = make_panel({'sh600000': [10.0, 11.0, 11.0, 9.9, 9.9], 'sz300001': [10.0, 10.0, 10.0, 10.0, 10.0]},
+                           {'sh600000': [10.0, 11.0, 11.0, 9.9, 9.9], 'sz300001': self.flat},
+                           ['sh600000', 'sz300001'])
+        result = backtest_panel(panel, self.signals(panel, sh600000={0: 1.0, 1: 1.0, 2: -1.0}),
+                                cfg=self.cfg)
+
+        self.assertEqual(result.trades['time'].tolist(), [DAYS[2], DAYS[4]])
+        self.assertEqual(result.trades['side'].tolist(), ['buy', 'sell'])
+        self.assertEqual(price_limit_ratio('sz300001'), 0.20)
+        self.assertEqual(price_limit_ratio('bj830799'), 0.30)
+
+    def test_position_limit_picks_highest_rank(self):
+        codes = ['sh600000', 'sh600001', 'sh600002']
+        panel = make_panel({c: self.flat for c in codes}, {c: self.flat for c in codes}, codes)
+        signal = self.signals(panel, sh600000={0: 1.0}, sh600001={0: 1.0}, sh600002={0: 1.0})
+        rank = self.signals(panel, sh600000={0: 80}, sh600001={0: 95}, sh600002={0: 90})
+        result = backtest_panel(panel, signal, rank, cfg=self.cfg)
+
+        self.assertEqual(result.trades['code'].tolist(), ['sh600001', 'sh600002'])
+        self.assertTrue((result.trades['amount'] <= 50_000).all())
+
+    def test_suspended_stock_is_not_traded_and_marked_at_last_close(self):
+        panel = make_panel({'sh600000': [10.0, 10.0, np.nan, 12.0, 12.0], 'sh600001': self.flat},
+                           {'sh600000': [10.0, 10.0, np.nan, 12.0, 12.0], 'sh600001': self.flat},
+                           ['sh600000', 'sh600001'])
+        result = backtest_panel(panel, self.signals(panel, sh600000={0: 1.0, 1: -1.0}), cfg=self.cfg)
+
+        self.assertEqual(result.trades['time'].tolist(), [DAYS[1], DAYS[3]])
+        self.assertEqual(result.equity.iloc[2], result.equity.iloc[1])
+
+class TestStrategySignals(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(11)
+        dates = pd.bdate_range('2023-01-02', periods=120)
+        self.frames = {}
+        for i, code in enumerate(['sh600000', 'sz000001', 'sz300001']):
+            close = 20 + np.cumsum(rng.normal(0, 0.5, len(dates)))
+            df = pd.DataFrame({'time': dates, 'open': close, 'high': close, 'low': close, 'close': close,
+                               'volume': 1000.0, 'turnover': 0.0})
+            if i == 1:
+                df = df.drop(index=range(50, 55)).reset_index(drop=True)   # 停牌
+            self.frames[code] = df
+        self.panel = KlinePanel.from_frames(self.frames)
+
+    def test_panel_and_per_stock_strategies_map_back_to_trading_days(self):
+        strategies = ((CompositeStrategy(), 'score'), (DmaStrategy(5, 20), 'signal'), (MomentumStrategy(), 'signal'))
+        for strategy, rank_column in strategies:
+            signal, rank = strategy_signals(strategy, self.panel)
+            valid = ~np.isnan(self.panel['close'])
+            for j, code in enumerate(self.panel.codes):
+                expected = strategy.apply(self.frames[code])
+                np.testing.assert_array_equal(signal[valid[:, j], j], expected['signal'].to_numpy(dtype=float))
+                np.testing.assert_array_equal(rank[valid[:, j], j], expected[rank_column].to_numpy(dtype=float))
+                self.assertTrue(np.isnan(signal[~valid[:, j], j]).all())
+
+    def test_backtest_signals_bypass_shared_indicator_cache(self):
+        indicator_cache.clear()
+        strategy_signals(CompositeStrategy(), self.panel)
+        strategy_signals(DmaStrategy(5, 20), self.panel)
+        self.assertEqual(len(indicator_cache), 0)
+
+    def test_dma_panel_reads_shared_indicator_cache(self):
+        indicator_cache.clear()
+        strategy = DmaStrategy(5, 20)
+        direct = strategy.apply_panel(self.panel, use_cache=False)
+        cached = strategy.apply_panel(self.panel)
+        # 两条均线、每只股票各一条缓存
+        self.assertEqual(len(indicator_cache), 2 * len(self.panel.codes))
+
+        hits = indicator_cache.hits
+        again = strategy.apply_panel(self.panel)
+        self.assertEqual(indicator_cache.hits - hits, 2 * len(self.panel.codes))
+        for result in (cached, again):
+            np.testing.assert_array_equal(result['SMA_20'], direct['SMA_20'])
+            np.testing.assert_array_equal(result['signal'], direct['signal'])
+        indicator_cache.clear()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+import sys
+import os
+
+# 添加项目根目录到 sys.path
+sys.path.append(os.getcwd())
+
+from src.data_acquisition.quote_source import QuoteSource, QuoteVendor, _parse_tencent
+
+
+def tencent_body(codes, price=10.0):
+    lines = []
+    for code in codes:
+        fields = ['1', '测试', code[2:], str(price), '9.90', '9.95'] + ['0'] * 24 + ['20240102150003', '0.10', '1.01']
+        fields += ['10.10', '9.80', '', '12345', '1234.5', '2.5', '20.1'] + ['0'] * 9 + ['1.8']
+        lines.append(f'v_{code}="{"~".join(fields)}";')
+    return '\n'.join(lines).encode('gbk')
+
+
+def make_vendor(name, delay=0.0, fail=False):
+    """构造一个假数据源: 延迟 delay 秒后返回行情，fail=True 时返回 502"""
+    def get(url, **kwargs):
+        time.sleep(delay)
+        if fail:
+            return MagicMock(status_code=502)
+        codes = url.split('=', 1)[1].split(',')
+        return MagicMock(status_code=200, content=tencent_body(codes))
+    client = MagicMock()
+    client.get.side_effect = get
+    return QuoteVendor(name, client, "http://fake/q=", _parse_tencent)
+
+
+class TestQuoteSource(unittest.TestCase):
+
+    def test_tencent_quotes_normalized(self):
+        df = _parse_tencent(tencent_body(['sh600519']))
+        row = df.iloc[0]
+        self.assertEqual(row['code'], 'sh600519')
+        self.assertEqual(row['time'], '2024-01-02 15:00:03')
+        self.assertAlmostEqual(row['change_pct'], 1.01)
+        self.assertAlmostEqual(row['volume'], 1234500.0)
+        self.assertAlmostEqual(row['volume_ratio'], 1.8)
+
+    def test_failed_chunks_fail_over_to_next_vendor(self):
+        source = QuoteSource([make_vendor('a', fail=True), make_vendor('b')], max_workers=1, hedge=False)
+        for controller in source.controllers.values():
+            controller.min_batch, controller.batch_size = 1, 2
+        df = source.fetch(['sh600000', 'sh600001', 'sz000001'])
+
+        self.assertEqual(sorted(df['code']), ['sh600000', 'sh600001', 'sz000001'])
+        # 失败后 a 的健康度下降，之后的批次直接由 b 处理
+        self.assertEqual(source.health['a'].consecutive_failures, 1)
+        self.assertEqual(source.vendors[1].client.get.call_count, 2)
+        self.assertLess(source.health['a'].success_rate, source.health['b'].success_rate)
+        self.assertEqual(source.ranked_vendors()[0].name, 'b')
+
+    def test_open_circuit_moves_vendor_last(self):
+        source = QuoteSource([make_vendor('a'), make_vendor('b')], hedge=False)
+        for _ in range(source.health['a'].failure_threshold):
+            source.health['a'].record(5, ok=False)
+        self.assertFalse(source.health['a'].available())
+        self.assertEqual([v.name for v in source.ranked_vendors()], ['b', 'a'])
+
+        # 熔断到期后重新参与排序，一次成功即恢复
+        source.health['a'].record(5, ok=True)
+        self.assertTrue(source.health['a'].available())
+
+    def test_slow_primary_is_hedged(self):
+        source = QuoteSource([make_vendor('slow', delay=1.0), make_vendor('fast')], hedge=True)
+        # 首选数据源历史耗时 p95 为 50ms
+        for _ in range(50):
+            source.health['slow'].latency.observe(30)
+
+        start = time.perf_counter()
+        df, vendor = source._fetch_chunk(['sh600519'])
+        self.assertEqual(vendor, 'fast')
+        self.assertEqual(df['code'].tolist(), ['sh600519'])
+        self.assertLess(time.perf_counter() - start, 0.5)
+
+    def test_queueing_at_flow_gate_does_not_trigger_hedge(self):
+        source = QuoteSource([make_vendor('a', delay=0.01), make_vendor('b')], hedge=True)
+        for _ in range(50):
+            source.health['a'].latency.observe(30)
+            source.health['b'].latency.observe(300)
+        self.assertEqual(source.ranked_vendors()[0].name, 'a')
+        controller = source.controllers['a']
+        for _ in range(controller.limit):
+            controller.acquire()   # 闸门已满，新请求需要排队
+        threading.Timer(0.3, lambda: [controller.release() for _ in range(controller.limit)]).start()
+
+        df, vendor = source._fetch_chunk(['sh600519'])
+        self.assertEqual(vendor, 'a')
+        source.vendors[1].client.get.assert_not_called()
+
+    def test_no_hedge_without_enough_samples(self):
+        source = QuoteSource([make_vendor('a', delay=0.1), make_vendor('b')], hedge=True)
+        df, vendor = source._fetch_chunk(['sh600519'])
+        self.assertEqual(vendor, 'a')
+        source.vendors[1].client.get.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
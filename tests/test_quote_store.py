@@ -0,0 +1,142 @@
+import unittest
+from unittest.mock import MagicMock
+import json
+import sys
+import os
+
+import pandas as pd
+
+# 添加项目根目录到 sys.path
+sys.path.append(os.getcwd())
+
+from src.data_storage.quote_store import QuoteStore, encode_snapshot
+
+def quote(code, price=10.0):
+    return {'code': code, 'name': code, 'price': price}
+
+class TestQuoteStore(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = MagicMock()
+        self.pipe = MagicMock()
+        self.redis.pipeline.return_value = self.pipe
+
+    def test_replace_all_is_transactional_and_never_scans(self):
+        store = QuoteStore(self.redis, key_prefix='q', shards=1, ttl=60, snapshot_format='none')
+        store.replace_all(pd.DataFrame([quote('600519.SH'), quote('000001.SZ')]))
+
+        self.redis.pipeline.assert_called_with(transaction=True)
+        self.pipe.delete.assert_called_once_with('q:0')
+        mapping = self.pipe.hset.call_args.kwargs['mapping']
+        self.assertEqual(sorted(mapping), ['000001.SZ', '600519.SH'])
+        self.pipe.expire.assert_called_once_with('q:0', 60)
+        self.redis.keys.assert_not_called()
+
+    def test_sharding_is_stable(self):
+        store = QuoteStore(self.redis, key_prefix='q', shards=8, snapshot_format='none')
+        codes = [f"{600000 + i}.SH" for i in range(200)]
+        store.upsert(pd.DataFrame([quote(c) for c in codes]))
+
+        written = {}
+        for call in self.pipe.hset.call_args_list:
+            for code in call.kwargs['mapping']:
+                written[code] = call.args[0]
+        self.assertEqual(len(written), 200)
+        self.assertTrue(all(store.key_for(c) == key for c, key in written.items()))
+        self.assertGreater(len(set(written.values())), 1)
+        # 所有分片都续期
+        self.assertEqual(self.pipe.expire.call_count, 8)
+
+    def test_large_batches_are_split_into_bounded_hset(self):
+        store = QuoteStore(self.redis, key_prefix='q', shards=1, snapshot_format='none', chunk_size=100)
+        df = pd.DataFrame([quote(f"{600000 + i}.SH", float(i)) for i in range(250)])
+        df.loc[3, 'price'] = float('nan')
+        store.upsert(df)
+
+        sizes = [len(call.kwargs['mapping']) for call in self.pipe.hset.call_args_list]
+        self.assertEqual(sizes, [100, 100, 50])
+        doc = json.loads(self.pipe.hset.call_args_list[0].kwargs['mapping']['600001.SH'])
+        self.assertEqual(doc, quote('600001.SH', 1.0))
+        # NaN 编码为 null，保证是合法 JSON
+        self.assertIsNone(json.loads(self.pipe.hset.call_args_list[0].kwargs['mapping']['600003.SH'])['price'])
+
+    def test_get_all_reads_every_shard_in_one_pipeline(self):
+        store = QuoteStore(self.redis, key_prefix='q', shards=2, snapshot_format='none')
+        self.pipe.execute.return_value = [{'600519.SH': json.dumps(quote('600519.SH', 1700.0))},
+                                          {'000001.SZ': json.dumps(quote('000001.SZ'))}]
+        df = store.get_all()
+
+        self.assertEqual(self.pipe.hgetall.call_count, 2)
+        self.pipe.execute.assert_called_once()
+        self.assertEqual(sorted(df['code']), ['000001.SZ', '600519.SH'])
+
+    def test_get_many_skips_missing_codes(self):
+        store = QuoteStore(self.redis, key_prefix='q', shards=1)
+        self.pipe.execute.return_value = [[json.dumps(quote('600519.SH')), None]]
+        result = store.get_many(['600519.SH', '688999.SH'])
+
+        self.pipe.hmget.assert_called_once_with('q:0', ['600519.SH', '688999.SH'])
+        self.assertEqual(list(result), ['600519.SH'])
+
+class TestQuoteSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = MagicMock()
+        self.pipe = MagicMock()
+        self.redis.pipeline.return_value = self.pipe
+        self.redis.mget.return_value = [None, None]
+        self.store = QuoteStore(self.redis, key_prefix='q', shards=1, ttl=60, snapshot_format='arrow')
+
+    def test_replace_all_writes_snapshot_in_same_transaction(self):
+        df = pd.DataFrame([quote('600519.SH', 1700.0), quote('000001.SZ')])
+        self.store.replace_all(df)
+
+        key, blob = self.pipe.set.call_args.args
+        self.assertEqual(key, 'q:snapshot')
+        self.assertIsInstance(blob, bytes)
+        self.assertEqual(self.pipe.set.call_args.kwargs['ex'], 60)
+        self.pipe.expire.assert_any_call('q:snapshot', 60)
+
+    def test_get_all_reads_snapshot_with_one_get(self):
+        df = pd.DataFrame([quote('600519.SH', 1700.0), quote('000001.SZ')])
+        df['unknown'] = 1
+        self.redis.execute_command.return_value = encode_snapshot(df)
+
+        result = self.store.get_all()
+
+        self.redis.pipeline.assert_not_called()
+        self.assertEqual(result['code'].tolist(), ['600519.SH', '000001.SZ'])
+        self.assertEqual(result['price'].tolist(), [1700.0, 10.0])
+        # 固定 schema: 缺少的字段为空值，多余的字段丢弃
+        self.assertTrue(result['turnover_rate'].isna().all())
+        self.assertNotIn('unknown', result.columns)
+
+    def test_missing_snapshot_falls_back_to_hash(self):
+        self.redis.execute_command.return_value = None
+        self.pipe.execute.return_value = [{'600519.SH': json.dumps(quote('600519.SH'))}]
+
+        result = self.store.get_all()
+
+        self.assertEqual(result['code'].tolist(), ['600519.SH'])
+
+    def test_replace_all_stamps_hash_before_snapshot(self):
+        self.store.replace_all(pd.DataFrame([quote('600519.SH')]))
+
+        stamps = {call.args[0]: float(call.args[1]) for call in self.pipe.set.call_args_list
+                  if call.args[0] in (self.store.updated_at_key, self.store.snapshot_at_key)}
+        self.assertGreaterEqual(stamps['q:snapshot_at'], stamps['q:updated_at'])
+
+    def test_stale_snapshot_falls_back_to_hash(self):
+        # 节流期间哈希已更新，快照落后
+        self.redis.mget.return_value = ['1002.0', '1000.0']
+        self.redis.execute_command.return_value = encode_snapshot(pd.DataFrame([quote('600519.SH', 1700.0)]))
+        self.pipe.execute.return_value = [{'600519.SH': json.dumps(quote('600519.SH', 1710.0))}]
+
+        result = self.store.get_all()
+
+        self.redis.mget.assert_called_once_with('q:updated_at', 'q:snapshot_at')
+        self.redis.execute_command.assert_not_called()
+        self.assertEqual(result['price'].tolist(), [1710.0])
+
+if __name__ == '__main__':
+    unittest.main()
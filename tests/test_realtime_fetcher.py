@@ -0,0 +1,96 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import pandas as pd
+import sys
+import os
+
+# 添加项目根目录到 sys.path
+sys.path.append(os.getcwd())
+
+from src.data_acquisition.realtime_fetcher import RealtimeDataFetcher
+from src.data_acquisition import quote_source
+
+class TestStreamingCollector(unittest.TestCase):
+
+    @patch('src.data_acquisition.realtime_fetcher.ak')
+    @patch('src.data_acquisition.realtime_fetcher.redis.Redis')
+    def setUp(self, mock_redis, mock_ak):
+        mock_ak.stock_info_a_code_name.return_value = pd.DataFrame({'code': ['600519', '000001']})
+        self.fetcher = RealtimeDataFetcher(streaming=True)
+        self.pipe = MagicMock()
+        self.fetcher.redis_client.pipeline.return_value = self.pipe
+
+    def make_tick(self, price_a, price_b, time_str='2024-01-02 10:00:00'):
+        return pd.DataFrame({
+            'code': ['600519.SH', '000001.SZ'],
+            'name': ['贵州茅台', '平安银行'],
+            'price': [price_a, price_b],
+            'volume': [1000.0, 2000.0],
+            'time': [time_str, time_str],
+        })
+
+    def snapshot_writes(self):
+        snapshot_key = self.fetcher.quote_store.snapshot_key
+        return sum(1 for call in self.pipe.set.call_args_list if call.args[0] == snapshot_key)
+
+    def test_first_tick_publishes_everything(self):
+        changed = self.fetcher._diff_snapshot(self.make_tick(1700.0, 10.0))
+        self.assertEqual(len(changed), 2)
+
+    def test_only_changed_symbols_are_published(self):
+        self.fetcher._diff_snapshot(self.make_tick(1700.0, 10.0))
+        # 仅时间刷新，不算变化
+        changed = self.fetcher._diff_snapshot(self.make_tick(1700.0, 10.0, '2024-01-02 10:00:03'))
+        self.assertTrue(changed.empty)
+
+        changed = self.fetcher._diff_snapshot(self.make_tick(1701.0, 10.0))
+        self.assertEqual(changed['code'].tolist(), ['600519.SH'])
+
+    def test_publish_deltas_writes_stream_and_channel(self):
+        self.fetcher._publish_deltas(self.make_tick(1700.0, 10.0))
+        self.pipe.reset_mock()
+
+        self.fetcher._publish_deltas(self.make_tick(1700.0, 10.5))
+        # 只重写行情哈希中变化的股票
+        self.assertEqual(self.pipe.hset.call_count, 1)
+        self.assertEqual(list(self.pipe.hset.call_args.kwargs['mapping']), ['000001.SZ'])
+        self.assertEqual(self.pipe.xadd.call_count, 1)
+        self.assertEqual(self.pipe.publish.call_count, 1)
+
+        # 无变化的 tick 不写 Stream
+        self.pipe.reset_mock()
+        self.fetcher._publish_deltas(self.make_tick(1700.0, 10.5))
+        self.pipe.hset.assert_not_called()
+        self.pipe.xadd.assert_not_called()
+
+    def test_snapshot_rewrite_is_throttled(self):
+        clock = [1000.0]
+        with patch('src.data_acquisition.realtime_fetcher.time.time', side_effect=lambda: clock[0]):
+            self.fetcher._publish_deltas(self.make_tick(1700.0, 10.0))   # 首个 tick 写快照
+            for price in (10.5, 11.0):
+                clock[0] += 1
+                self.fetcher._publish_deltas(self.make_tick(1700.0, price))
+            self.assertEqual(self.snapshot_writes(), 1)
+            # 超过 QUOTE_SNAPSHOT_INTERVAL 后把累积的变化一次写入
+            clock[0] += 20
+            self.fetcher._publish_deltas(self.make_tick(1700.0, 11.0))
+        self.assertEqual(self.snapshot_writes(), 2)
+
+    def test_sina_quotes_parse_columnar(self):
+        fields = ['贵州茅台', '1690.00', '1680.00', '1700.00', '1710.00', '1685.00', '1699.9', '1700.0',
+                  '12345', '20987654.00'] + ['100', '1699.00'] * 5 + ['200', '1701.00'] * 5 + ['2024-01-02', '10:00:00', '00']
+        body = (f'var hq_str_sh600519="{",".join(fields)}";\n'
+                'var hq_str_sz000002="";\n').encode('gbk')
+        df = self.fetcher._to_exchange_codes(quote_source._parse_sina(body))
+
+        self.assertEqual(df['code'].tolist(), ['600519.SH'])
+        row = df.iloc[0]
+        self.assertEqual(row['name'], '贵州茅台')
+        self.assertEqual(row['time'], '2024-01-02 10:00:00')
+        self.assertAlmostEqual(row['price'], 1700.0)
+        self.assertAlmostEqual(row['bid1'], 1699.0)
+        self.assertAlmostEqual(row['ask5_vol'], 200.0)
+        self.assertAlmostEqual(row['change_pct'], 1.19)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import tempfile
+from datetime import date
+
+# 添加项目根目录到 sys.path
+sys.path.append(os.getcwd())
+
+from src.data_storage import stock_universe
+from src.data_storage.stock_universe import StockUniverse, parse_code
+
+RECORDS = [
+    {'code': 'sh600519', 'name': '贵州茅台', 'ipo_date': date(2001, 8, 27)},
+    {'code': 'sz000001', 'name': '平安银行', 'ipo_date': date(1991, 4, 3)},
+    {'code': 'sh000001', 'name': '上证指数', 'ipo_date': None},
+    {'code': 'bj830799', 'name': '艾融软件', 'ipo_date': None},
+    {'code': 'bad', 'name': '无效', 'ipo_date': None},
+]
+
+class TestParseCode(unittest.TestCase):
+
+    def test_every_vendor_format(self):
+        for code in ['sh600519', 'SH600519', '600519.SH', '600519.sh', 'sh.600519', '1.600519', '600519']:
+            self.assertEqual(parse_code(code), ('sh', '600519'), code)
+        self.assertEqual(parse_code('0.000001'), ('sz', '000001'))
+        self.assertEqual(parse_code('830799'), ('bj', '830799'))
+
+    def test_formatters(self):
+        self.assertEqual(stock_universe.to_tencent('000001.SZ'), 'sz000001')
+        self.assertEqual(stock_universe.to_exchange('sh.600519'), '600519.SH')
+        self.assertEqual(stock_universe.to_baostock('SZ300434'), 'sz.300434')
+        self.assertEqual(stock_universe.to_secid('sh000001'), '1.000001')
+        self.assertEqual(stock_universe.to_em_web('300434'), 'SZ300434')
+
+    def test_invalid_code_raises(self):
+        for code in ['', 'bad', 'sh6005', '9.600519']:
+            with self.assertRaises(ValueError):
+                parse_code(code)
+
+class TestStockUniverse(unittest.TestCase):
+
+    def setUp(self):
+        self.universe = StockUniverse.from_records(RECORDS)
+
+    def test_lookup_in_any_format(self):
+        self.assertEqual(len(self.universe), 4)
+        sid = self.universe.id_of('600519.SH')
+        self.assertEqual(self.universe.id_of('sh.600519'), sid)
+        self.assertEqual(self.universe.tencent[sid], 'sh600519')
+        self.assertEqual(self.universe.secid[sid], '1.600519')
+        self.assertEqual(self.universe.name('SH600519'), '贵州茅台')
+        self.assertIsNone(self.universe.id_of('688999.SH'))
+        self.assertIsNone(self.universe.id_of('bad'))
+
+    def test_index_and_stock_with_same_digits_stay_distinct(self):
+        self.assertEqual(self.universe.name('sh000001'), '上证指数')
+        self.assertEqual(self.universe.name('000001.SZ'), '平安银行')
+        self.assertEqual(self.universe.names_for(['sz000001', '000001.SH', 'x']),
+                         {'sz000001': '平安银行', '000001.SH': '上证指数'})
+
+    def test_save_and_load_memory_mapped(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'universe.npy')
+            self.universe.save(path)
+            loaded = StockUniverse.load(path)
+
+            self.assertIsNotNone(getattr(loaded.table, 'filename', None))
+            self.assertEqual(loaded.names, self.universe.names)
+            self.assertEqual(loaded.name('bj830799'), '艾融软件')
+            self.assertEqual(str(loaded.table['ipo_date'][loaded.id_of('600519')]), '2001-08-27')
+
+    def test_get_universe_falls_back_to_file_when_db_unavailable(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'universe.npy')
+            self.universe.save(path)
+            os.utime(path, (0, 0))  # 已过期
+            with patch.object(StockUniverse, 'from_db', side_effect=RuntimeError('db down')), \
+                 patch.object(stock_universe, '_universe', None), \
+                 patch.object(stock_universe, '_retry_after', 0.0):
+                universe = stock_universe.get_universe(path)
+            self.assertEqual(universe.name('600519'), '贵州茅台')
+
+    def test_failed_rebuild_is_not_retried_within_interval(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'universe.npy')
+            with patch.object(StockUniverse, 'from_db', side_effect=RuntimeError('db down')) as from_db, \
+                 patch.object(stock_universe, '_universe', None), \
+                 patch.object(stock_universe, '_retry_after', 0.0):
+                for _ in range(3):
+                    self.assertEqual(len(stock_universe.get_universe(path)), 0)
+            self.assertEqual(from_db.call_count, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,7 +7,8 @@ import os
 # 添加项目根目录到 sys.path
 sys.path.append(os.getcwd())
 
-from src.strategy_engine.composite_strategy import CompositeStrategy
+from src.strategy_engine.composite_strategy import CompositeStrategy, CompositeState, CompositeStateCache
+from src.data_storage.kline_panel import KlinePanel
 
 class TestCompositeStrategy(unittest.TestCase):
 
@@ -96,5 +97,116 @@ class TestCompositeStrategy(unittest.TestCase):
         self.assertEqual(last_row['signal'], 0)
         self.assertTrue(40 <= last_row['score'] <= 60, f"Score {last_row['score']} should be neutral")
 
+class TestCompositePanel(unittest.TestCase):
+
+    def setUp(self):
+        self.strategy = CompositeStrategy()
+        rng = np.random.default_rng(7)
+        dates = pd.bdate_range('2023-01-02', periods=160)
+        self.frames = {}
+        for i in range(6):
+            close = 50 + np.cumsum(rng.normal(0, 1, len(dates)))
+            df = pd.DataFrame({'time': dates, 'close': close, 'high': close + 1, 'low': close - 1,
+                               'open': close, 'volume': 100000.0, 'turnover': 1e6})
+            if i == 1:
+                df = df.drop(index=range(60, 70))   # 停牌
+            if i == 2:
+                df = df.iloc[100:]                  # 次新股
+            if i == 3:
+                df = df.iloc[:40]                   # 历史较短
+            if i == 4:
+                df.loc[120:145, 'close'] = 60.0     # 连续一字板，布林带宽度为 0
+            self.frames[f"s{i}"] = df.reset_index(drop=True)
+
+    @staticmethod
+    def column(df, prefix):
+        return df[[c for c in df.columns if c.startswith(prefix)][0]].to_numpy()
+
+    def test_panel_matches_per_stock_apply(self):
+        result = self.strategy.apply_panel(KlinePanel.from_frames(self.frames))
+        for j, code in enumerate(result.codes):
+            expected = self.strategy.apply(self.frames[code])
+            n = len(expected)
+            np.testing.assert_array_equal(result['score'][-n:, j], expected['score'].to_numpy())
+            np.testing.assert_array_equal(result['signal'][-n:, j], expected['signal'].to_numpy())
+            np.testing.assert_allclose(result['rsi'][-n:, j], self.column(expected, 'RSI_'), rtol=1e-9)
+            np.testing.assert_allclose(result['macd'][-n:, j], self.column(expected, 'MACD_'), rtol=1e-9)
+            np.testing.assert_allclose(result['bb_upper'][-n:, j], self.column(expected, 'BBU_'), rtol=1e-9)
+
+    def test_latest_scores(self):
+        latest = self.strategy.latest_scores(KlinePanel.from_frames(self.frames), min_bars=45)
+
+        self.assertNotIn('s3', latest['code'].tolist())
+        for _, row in latest.iterrows():
+            expected = self.strategy.apply(self.frames[row['code']]).iloc[-1]
+            self.assertEqual(row['score'], expected['score'])
+            self.assertEqual(row['signal_desc'], expected['signal_desc'])
+            self.assertEqual(row['time'], expected['time'])
+
+class TestCompositeState(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(11)
+        close = 50 + np.cumsum(rng.normal(0, 1, 300))
+        close[200:230] = 60.0   # 连续一字板
+        self.df = pd.DataFrame({'time': pd.bdate_range('2023-01-02', periods=300), 'close': close})
+        self.full = CompositeStrategy().apply(self.df)
+
+    def test_incremental_updates_match_full_recomputation(self):
+        state = CompositeState()
+        rows = pd.DataFrame([state.update(c) for c in self.df['close']])
+
+        np.testing.assert_array_equal(rows['score'].to_numpy(), self.full['score'].to_numpy())
+        np.testing.assert_array_equal(rows['signal'].to_numpy(), self.full['signal'].to_numpy())
+        self.assertEqual(rows['signal_desc'].tolist(), self.full['signal_desc'].tolist())
+        for field, prefix in (('macd', 'MACD_'), ('macd_signal', 'MACDs_'), ('rsi', 'RSI_'), ('bb_lower', 'BBL_')):
+            expected = self.full[[c for c in self.full.columns if c.startswith(prefix)][0]].to_numpy()
+            np.testing.assert_allclose(rows[field].to_numpy(), expected, rtol=1e-9, atol=1e-9)
+
+    def test_preview_does_not_advance_state(self):
+        state = CompositeState.from_history(self.df['close'].iloc[:-1])
+        price = float(self.df['close'].iloc[-1])
+
+        first = state.preview(price)
+        second = state.preview(price)
+        self.assertEqual(first, second)
+        self.assertEqual(state.bars, 299)
+
+        confirmed = state.update(price)
+        self.assertEqual(confirmed['score'], self.full['score'].iloc[-1])
+        self.assertEqual(first['score'], confirmed['score'])
+
+class TestCompositeStateCache(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        self.times = pd.bdate_range('2023-01-02', periods=120)
+        self.close = 30 + np.cumsum(rng.normal(0, 0.5, 120))
+        self.cache = CompositeStateCache(max_entries=2)
+
+    def test_repeated_reads_hit_and_new_bar_advances(self):
+        first = self.cache.get('sh600000', self.times[:-1], self.close[:-1])
+        self.assertIs(self.cache.get('sh600000', self.times[:-1], self.close[:-1]), first)
+
+        advanced = self.cache.get('sh600000', self.times, self.close)
+        self.assertEqual(self.cache.info(), {'entries': 1, 'hits': 1, 'advances': 1, 'misses': 1})
+        self.assertEqual(first.bars, 119)   # 推进时复制状态，已返回的状态不变
+        expected = CompositeState.from_history(self.close)
+        self.assertEqual(advanced.preview(31.0), expected.preview(31.0))
+
+    def test_changed_history_rebuilds(self):
+        self.cache.get('sh600000', self.times, self.close)
+        rebased = self.close * 0.9
+        state = self.cache.get('sh600000', self.times, rebased)
+        self.assertEqual(self.cache.misses, 2)
+        self.assertEqual(state.preview(28.0), CompositeState.from_history(rebased).preview(28.0))
+
+    def test_lru_eviction(self):
+        for code in ('a', 'b', 'c'):
+            self.cache.get(code, self.times, self.close)
+        self.assertEqual(len(self.cache), 2)
+        self.cache.get('a', self.times, self.close)
+        self.assertEqual(self.cache.misses, 4)
+
 if __name__ == '__main__':
     unittest.main()
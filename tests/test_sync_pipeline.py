@@ -0,0 +1,169 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import tempfile
+import sys
+import os
+from datetime import date, datetime
+
+# 添加项目根目录到 sys.path
+sys.path.append(os.getcwd())
+
+import pandas as pd
+
+from src.sync_pipeline import SyncPipeline, SyncTask, SyncCheckpoint
+from src.main_sync import gap_ranges, plan_gap_repair, plan_rebase_refetch, INCREMENTAL_MARGIN, FULL_HISTORY_COUNT
+
+def make_payload(code, days):
+    return {'data': {code: {'qfqday': [[d, '10.0', '10.5', '11.0', '9.5', '1000'] for d in days]}}}
+
+class TestSyncPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.checkpoint_path = os.path.join(self.tmpdir.name, 'checkpoint.json')
+        self.target = date(2024, 1, 3)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def make_pipeline(self):
+        return SyncPipeline(target=self.target, fetch_workers=4, write_batch_rows=3,
+                            checkpoint_path=self.checkpoint_path, progress_interval=0)
+
+    @patch('src.sync_pipeline.database.get_db')
+    @patch('src.sync_pipeline.crud.bulk_save_daily_kline')
+    @patch('src.sync_pipeline.data_fetcher.fetch_daily_kline_payload')
+    def test_batches_writes_and_filters_gap(self, mock_fetch, mock_save, mock_get_db):
+        mock_get_db.side_effect = lambda: iter([MagicMock()])
+        mock_fetch.side_effect = lambda code, count, session: make_payload(
+            code, ['2024-01-01', '2024-01-02', '2024-01-03', '2024-01-04'])
+
+        tasks = [SyncTask(code=f"sh60000{i}", count=4, start_date='20240102') for i in range(4)]
+        metrics = self.make_pipeline().run(tasks)
+
+        # 每只股票只保留 [01-02, 01-03] 两条: 4 只 * 2 = 8 条，每批 >= 3 行触发写入
+        written = sum(len(call.kwargs['kline_data']) for call in mock_save.call_args_list)
+        self.assertEqual(written, 8)
+        self.assertEqual(metrics.bars_written, 8)
+        self.assertEqual(mock_save.call_count, 2)
+        # 全部成功后断点文件被清理
+        self.assertFalse(os.path.exists(self.checkpoint_path))
+
+    @patch('src.sync_pipeline.database.get_db')
+    @patch('src.sync_pipeline.crud.bulk_save_daily_kline')
+    @patch('src.sync_pipeline.data_fetcher.fetch_daily_kline_payload')
+    def test_resume_skips_completed_codes(self, mock_fetch, mock_save, mock_get_db):
+        mock_get_db.side_effect = lambda: iter([MagicMock()])
+        SyncCheckpoint(self.checkpoint_path, self.target).mark_done(['sh600000'])
+        # sh600001 请求失败: 不计入断点，下次重试
+        mock_fetch.side_effect = lambda code, count, session: (
+            None if code == 'sh600001' else make_payload(code, ['2024-01-03']))
+
+        tasks = [SyncTask(code=c, count=1) for c in ('sh600000', 'sh600001', 'sh600002')]
+        metrics = self.make_pipeline().run(tasks)
+
+        fetched_codes = {call.args[0] for call in mock_fetch.call_args_list}
+        self.assertEqual(fetched_codes, {'sh600001', 'sh600002'})
+        self.assertEqual(metrics.resumed, 1)
+        self.assertEqual(metrics.failed, 1)
+
+        checkpoint = SyncCheckpoint(self.checkpoint_path, self.target)
+        self.assertTrue(checkpoint.is_done('sh600002'))
+        self.assertFalse(checkpoint.is_done('sh600001'))
+
+    @patch('src.sync_pipeline.database.get_db')
+    @patch('src.sync_pipeline.crud.bulk_save_daily_kline')
+    @patch('src.sync_pipeline.data_fetcher.fetch_daily_kline_payload')
+    def test_task_end_date_limits_written_range(self, mock_fetch, mock_save, mock_get_db):
+        mock_get_db.side_effect = lambda: iter([MagicMock()])
+        mock_fetch.side_effect = lambda code, count, session: make_payload(
+            code, ['2024-01-01', '2024-01-02', '2024-01-03'])
+
+        self.make_pipeline().run([SyncTask(code='sh600000', count=3, start_date='20240102', end_date='20240102')])
+
+        rows = mock_save.call_args.kwargs['kline_data']
+        self.assertEqual([str(r['time'].date()) for r in rows], ['2024-01-02'])
+
+    @patch('src.sync_pipeline.database.get_db')
+    @patch('src.sync_pipeline.crud.bulk_save_daily_kline')
+    @patch('src.sync_pipeline.data_fetcher.fetch_daily_kline_payload')
+    def test_rebased_overlap_is_not_written(self, mock_fetch, mock_save, mock_get_db):
+        mock_get_db.side_effect = lambda: iter([MagicMock()])
+        mock_fetch.side_effect = lambda code, count, session: make_payload(
+            code, ['2023-12-29', '2024-01-02', '2024-01-03'])
+        # 抓取结果的收盘价为 10.5: sh600001 库中 12-29 的收盘价不同，说明前复权基准已变化
+        reference = lambda close: pd.DataFrame({'time': pd.to_datetime(['2023-12-29', '2024-01-02']),
+                                                'close': [close, 10.5]})
+        tasks = [SyncTask(code='sh600000', count=3, start_date='20240103', reference=reference(10.5)),
+                 SyncTask(code='sh600001', count=3, start_date='20240103', reference=reference(12.0))]
+
+        pipeline = self.make_pipeline()
+        metrics = pipeline.run(tasks)
+
+        rows = mock_save.call_args.kwargs['kline_data']
+        self.assertEqual([(r['code'], str(r['time'].date())) for r in rows], [('sh600000', '2024-01-03')])
+        self.assertEqual(pipeline.rebased, ['sh600001'])
+        self.assertEqual(metrics.rebased, 1)
+        self.assertEqual(metrics.failed, 0)
+
+    @patch('src.sync_pipeline.database.get_db')
+    @patch('src.sync_pipeline.crud.delete_daily_klines')
+    @patch('src.sync_pipeline.crud.bulk_save_daily_kline')
+    @patch('src.sync_pipeline.data_fetcher.fetch_daily_kline_payload')
+    def test_replace_task_deletes_old_bars_first(self, mock_fetch, mock_save, mock_delete, mock_get_db):
+        db = MagicMock()
+        mock_get_db.side_effect = lambda: iter([db])
+        mock_fetch.side_effect = lambda code, count, session: make_payload(code, ['2024-01-02', '2024-01-03'])
+        order = []
+        mock_delete.side_effect = lambda *args: order.append('delete')
+        mock_save.side_effect = lambda *args, **kwargs: order.append('save')
+
+        self.make_pipeline().run([SyncTask(code='sh600000', count=2, replace=True),
+                                  SyncTask(code='sh600001', count=2)])
+
+        mock_delete.assert_called_once_with(db, ['sh600000'])
+        self.assertEqual(order, ['delete', 'save'])
+
+class TestGapRepair(unittest.TestCase):
+
+    # 2025-09-29 ~ 2025-10-14 的交易日 (10/1 - 10/8 国庆休市)
+    TRADE_DAYS = [date(2025, 9, 29), date(2025, 9, 30), date(2025, 10, 9), date(2025, 10, 10),
+                  date(2025, 10, 13), date(2025, 10, 14)]
+
+    def missing(self, rows):
+        return pd.DataFrame({'code': [r[0] for r in rows], 'day': pd.to_datetime([r[1] for r in rows])})
+
+    def test_ranges_span_holidays(self):
+        missing = self.missing([('sh600000', '2025-09-30'), ('sh600000', '2025-10-09'),
+                                ('sh600000', '2025-10-13'), ('sz000001', '2025-10-14')])
+        ranges = gap_ranges(missing, self.TRADE_DAYS)
+
+        # 9/30 与 10/9 在交易日上连续，10/13 与它们之间隔了 10/10
+        self.assertEqual(ranges['code'].tolist(), ['sh600000', 'sh600000', 'sz000001'])
+        self.assertEqual(ranges['days'].tolist(), [2, 1, 1])
+        self.assertEqual(ranges.loc[0, 'end'], pd.Timestamp('2025-10-09'))
+
+    def test_plan_fetches_only_up_to_earliest_gap(self):
+        missing = self.missing([('sh600000', '2025-10-09'), ('sh600000', '2025-10-13'), ('sz000002', None)])
+        tasks = {t.code: t for t in plan_gap_repair(missing, self.TRADE_DAYS, now=datetime(2025, 10, 14, 18, 0))}
+
+        task = tasks['sh600000']
+        self.assertEqual((task.start_date, task.end_date), ('20251009', '20251013'))
+        # 10/9 ~ 10/14 共 4 个交易日，外加增量余量
+        self.assertEqual(task.count, 4 + INCREMENTAL_MARGIN)
+        # 库中没有任何K线的股票全量拉取
+        self.assertEqual(tasks['sz000002'].count, FULL_HISTORY_COUNT)
+        self.assertIsNone(tasks['sz000002'].start_date)
+
+    def test_rebase_refetch_covers_stored_history(self):
+        earliest = {'sh600000': pd.Timestamp('2024-01-02')}
+        tasks = {t.code: t for t in plan_rebase_refetch(['sh600000', 'sz000001'], earliest,
+                                                        now=datetime(2025, 10, 14, 18, 0))}
+
+        self.assertTrue(all(t.replace and t.start_date is None for t in tasks.values()))
+        # 库中已有约一年九个月的K线，超过 FULL_HISTORY_COUNT
+        self.assertGreater(tasks['sh600000'].count, FULL_HISTORY_COUNT)
+        self.assertEqual(tasks['sz000001'].count, FULL_HISTORY_COUNT)
+
+if __name__ == '__main__':
+    unittest.main()
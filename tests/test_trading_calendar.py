@@ -0,0 +1,64 @@
+import unittest
+import sys
+import os
+from datetime import date, datetime
+
+# 添加项目根目录到 sys.path
+sys.path.append(os.getcwd())
+
+from src.scheduling.trading_calendar import TradingCalendar
+
+# 2025 年国庆节休市 10/1 - 10/8
+HOLIDAYS = [date(2025, 10, d) for d in (1, 2, 3, 6, 7, 8)]
+
+class TestTradingDays(unittest.TestCase):
+
+    def setUp(self):
+        self.calendar = TradingCalendar(holidays=HOLIDAYS)
+
+    def test_holidays_and_weekends_are_skipped(self):
+        self.assertTrue(self.calendar.is_trading_day(date(2025, 9, 30)))
+        self.assertFalse(self.calendar.is_trading_day(date(2025, 10, 8)))
+        # 调休的周六也不开市
+        self.assertFalse(self.calendar.is_trading_day(date(2025, 10, 11)))
+        self.assertEqual(self.calendar.next_trading_day(date(2025, 9, 30)), date(2025, 10, 9))
+        self.assertEqual(self.calendar.previous_trading_day(date(2025, 10, 9)), date(2025, 9, 30))
+        self.assertEqual(self.calendar.offset(date(2025, 10, 9), -1), date(2025, 9, 30))
+        self.assertEqual(self.calendar.count(date(2025, 9, 29), date(2025, 10, 10)), 3)
+
+    def test_latest_session_end(self):
+        c = self.calendar
+        self.assertIsNone(c.latest_session_end(datetime(2024, 1, 5, 9, 20)))
+        self.assertEqual(c.latest_session_end(datetime(2024, 1, 5, 10, 15, 30)), datetime(2024, 1, 5, 10, 15))
+        self.assertEqual(c.latest_session_end(datetime(2024, 1, 5, 12, 0)), datetime(2024, 1, 5, 11, 30))
+        self.assertEqual(c.latest_session_end(datetime(2024, 1, 5, 18, 0)), datetime(2024, 1, 5, 15, 0))
+        # 周六、节假日
+        self.assertIsNone(c.latest_session_end(datetime(2024, 1, 6, 10, 0)))
+        self.assertIsNone(c.latest_session_end(datetime(2025, 10, 8, 10, 0)))
+
+class TestSleepSeconds(unittest.TestCase):
+
+    def setUp(self):
+        self.calendar = TradingCalendar(holidays=HOLIDAYS)
+
+    def sleep(self, now):
+        return self.calendar.sleep_seconds(now, interval=3, lead=60, grace=120, edge_interval=1)
+
+    def test_polls_during_session_and_tightens_near_edges(self):
+        self.assertEqual(self.sleep(datetime(2025, 10, 9, 10, 30)), 3)
+        self.assertEqual(self.sleep(datetime(2025, 10, 9, 9, 31)), 1)
+        self.assertEqual(self.sleep(datetime(2025, 10, 9, 14, 57)), 1)
+        # 收盘后 grace 窗口内仍在采集
+        self.assertTrue(self.calendar.is_trading_time(datetime(2025, 10, 9, 15, 1), grace=120))
+
+    def test_sleeps_until_next_session(self):
+        # 午休: 睡到 13:00 前 60 秒
+        self.assertEqual(self.sleep(datetime(2025, 10, 9, 12, 0)), 59 * 60)
+        # 节前收盘后: 直接睡到节后第一个交易日开盘前
+        expected = (datetime(2025, 10, 9, 9, 29) - datetime(2025, 9, 30, 15, 5)).total_seconds()
+        self.assertEqual(self.sleep(datetime(2025, 9, 30, 15, 5)), expected)
+        self.assertEqual(self.calendar.next_session_start(datetime(2025, 10, 11, 12, 0)),
+                         datetime(2025, 10, 13, 9, 30))
+
+if __name__ == '__main__':
+    unittest.main()